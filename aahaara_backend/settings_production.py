@@ -30,6 +30,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'corsheaders',
@@ -225,6 +226,67 @@ SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
 # Custom user model
 AUTH_USER_MODEL = 'authentication.User'
 
+# Food catalog engine
+# Serves food list filters from a memory-mapped columnar snapshot (requires numpy)
+FOOD_CATALOG_ENGINE_ENABLED = os.getenv('FOOD_CATALOG_ENGINE_ENABLED', 'False').lower() == 'true'
+FOOD_CATALOG_SNAPSHOT_DIR = os.getenv('FOOD_CATALOG_SNAPSHOT_DIR', str(BASE_DIR / 'var' / 'food_catalog'))
+FOOD_CATALOG_SNAPSHOTS_KEPT = 2
+
+# Food CSV import
+# Rows are validated and written in chunks, each in its own transaction
+FOOD_IMPORT_BATCH_SIZE = int(os.getenv('FOOD_IMPORT_BATCH_SIZE', '1000'))
+FOOD_IMPORT_METHOD = os.getenv('FOOD_IMPORT_METHOD', 'auto')  # 'auto', 'copy' (Postgres only, insert mode) or 'bulk'
+FOOD_IMPORT_MODE = os.getenv('FOOD_IMPORT_MODE', 'upsert')  # 'upsert' (match existing foods by fingerprint) or 'insert'
+FOOD_IMPORT_MAX_REPORTED_ERRORS = 100
+# Background imports (async=true) run in `manage.py process_food_imports` (Procfile worker), on this many threads
+FOOD_IMPORT_WORKERS = int(os.getenv('FOOD_IMPORT_WORKERS', '2'))
+FOOD_IMPORT_STALE_SECONDS = 300  # running jobs without a heartbeat this long are resumed
+FOOD_IMPORT_CHUNK_BYTES = 1024 * 1024  # uploads are stored for the worker as database rows of this size
+
+# Batch (cohort) diet chart generation: the generate_diet_charts command solves meal plans on up
+# to this many forked processes (API requests always solve them serially)
+DIET_CHART_BATCH_WORKERS = int(os.getenv('DIET_CHART_BATCH_WORKERS', '4'))
+DIET_CHART_BATCH_MAX_PATIENTS = 1000
+
+# Where new diet charts keep daily_meals: 'json' (the daily_meals column) or 'normalized'
+# (one diet_chart_meal_entries row per meal item, indexed by chart/day and by food).
+# Existing charts move with `manage.py convert_diet_chart_storage`
+DIET_CHART_STORAGE = os.getenv('DIET_CHART_STORAGE', 'json')
+
+# Meal plans shared by patients with equal inputs (dosha bucket, calories rounded to the step,
+# restrictions, chart length); entries also expire when the food catalog version changes
+DIET_PLAN_CACHE_SIZE = int(os.getenv('DIET_PLAN_CACHE_SIZE', '512'))  # 0 disables the cache
+DIET_PLAN_CACHE_TTL = 3600
+DIET_PLAN_CALORIE_STEP = 50
+
+# Background diet chart generation (async=true) runs in `manage.py process_diet_chart_jobs`
+# (Procfile worker); > 0 also runs jobs on this many threads in each web process, for development
+DIET_CHART_JOB_WORKERS = int(os.getenv('DIET_CHART_JOB_WORKERS', '0'))
+DIET_CHART_JOB_STALE_SECONDS = 120  # running jobs without a heartbeat this long are restarted
+DIET_CHART_JOB_POLL_INTERVAL = 0.25  # seconds between progress checks of an event stream
+DIET_CHART_JOB_KEEPALIVE_SECONDS = 15
+DIET_CHART_JOB_STREAM_TIMEOUT = 25  # below gunicorn's 30 s timeout; clients reconnect with last_event_id
+# An event stream holds a web worker thread for up to DIET_CHART_JOB_STREAM_TIMEOUT. Each process
+# serves at most this many at once and answers the rest with 503 and Retry-After, so streams never
+# take every thread of a gunicorn worker (Procfile runs 4 threads per worker)
+DIET_CHART_JOB_MAX_STREAMS = int(os.getenv('DIET_CHART_JOB_MAX_STREAMS', '2'))
+
+# Diet chart history: each version is stored as a JSON Patch from the previous one; a full snapshot
+# is taken once those patches add up to a chart's size, or after this many versions (bounds rebuilds)
+DIET_CHART_REVISION_SNAPSHOT_INTERVAL = 100
+
+# Food stats and facets are cached per catalog version, so timeouts only bound memory use
+FOOD_STATS_CACHE_TIMEOUT = 3600
+FOOD_FACETS_CACHE_TIMEOUT = 600
+FOOD_CATALOG_STATE_CACHE_TTL = 2  # seconds other processes may keep serving a previous catalog ETag
+# ETag hit/miss counts are added to the cache in per-process batches this often; they are
+# summed across web processes when CACHES is a shared backend (Redis, Memcached, database)
+FOOD_CACHE_METRICS_FLUSH_SECONDS = 10
+FOOD_SIMILARITY_WATERMARK_OVERLAP = 60  # seconds re-read behind the similarity index watermark
+FOOD_AUTOCOMPLETE_WATERMARK_OVERLAP = 60  # seconds re-read behind the autocomplete index watermark
+FOOD_AUTOCOMPLETE_USAGE_TTL = 600  # seconds between background reloads of diet chart meal usage for ranking
+FOOD_CHANGES_RETENTION_DAYS = 30  # days of food change log kept for delta sync; older clients get a full reset
+
 # Email configuration (for production)
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.gmail.com')
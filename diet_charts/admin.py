@@ -11,7 +11,10 @@ class DietChartAdmin(admin.ModelAdmin):
     list_display = ('chart_name', 'patient_name', 'chart_type', 'created_by_name', 'start_date', 'end_date', 'status', 'is_ai_generated')
     list_filter = ('chart_type', 'status', 'is_ai_generated', 'start_date', 'created_at')
     search_fields = ('chart_name', 'patient__user_name', 'created_by__user_name', 'notes')
-    readonly_fields = ('id', 'created_at', 'updated_at', 'version')
+    readonly_fields = (
+        'id', 'created_at', 'updated_at', 'version', 'storage', 'total_calories', 'meal_count', 'day_calories',
+        'total_protein_g', 'total_carbs_g', 'total_fat_g', 'total_fiber_g'
+    )
     
     fieldsets = (
         ('Basic Information', {
@@ -32,8 +35,12 @@ class DietChartAdmin(admin.ModelAdmin):
             'fields': ('daily_meals', 'notes'),
             'classes': ('collapse',)
         }),
+        ('Totals', {
+            'fields': ('total_calories', 'meal_count', 'day_calories', 'total_protein_g', 'total_carbs_g', 'total_fat_g', 'total_fiber_g'),
+            'classes': ('collapse',)
+        }),
         ('Metadata', {
-            'fields': ('is_ai_generated', 'generation_parameters', 'version', 'created_at', 'updated_at'),
+            'fields': ('is_ai_generated', 'generation_parameters', 'version', 'storage', 'created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
     )
\ No newline at end of file
@@ -1,5 +1,7 @@
 import django_filters
-from .models import DietChart
+from django.db.models import Q
+from .json_ops import JSONBPathExists
+from .models import DietChart, DietChartMealEntry
 
 
 class DietChartFilter(django_filters.FilterSet):
@@ -39,6 +41,14 @@ class DietChartFilter(django_filters.FilterSet):
     target_calories_min = django_filters.NumberFilter(field_name='target_calories', lookup_expr='gte')
     target_calories_max = django_filters.NumberFilter(field_name='target_calories', lookup_expr='lte')
     
+    total_calories = django_filters.NumberFilter()
+    total_calories_min = django_filters.NumberFilter(field_name='total_calories', lookup_expr='gte')
+    total_calories_max = django_filters.NumberFilter(field_name='total_calories', lookup_expr='lte')
+    
+    meal_count = django_filters.NumberFilter()
+    meal_count_min = django_filters.NumberFilter(field_name='meal_count', lookup_expr='gte')
+    meal_count_max = django_filters.NumberFilter(field_name='meal_count', lookup_expr='lte')
+    
     # Boolean filters
     is_ai_generated = django_filters.BooleanFilter()
     
@@ -49,13 +59,26 @@ class DietChartFilter(django_filters.FilterSet):
     # Version filter
     version = django_filters.NumberFilter()
     
+    # Charts planning a food
+    food_id = django_filters.UUIDFilter(method='filter_food_id')
+    
     class Meta:
         model = DietChart
         fields = [
             'chart_name', 'chart_type', 'status', 'start_date', 'end_date',
             'created_at', 'patient_id', 'patient_name', 'created_by_id', 'created_by_name',
-            'total_days', 'target_calories', 'is_ai_generated', 'dosha_focus',
-            'food_restrictions', 'version'
+            'total_days', 'target_calories', 'total_calories', 'meal_count', 'is_ai_generated',
+            'dosha_focus', 'food_restrictions', 'version', 'food_id'
         ]
+    
+    def filter_food_id(self, queryset, name, value):
+        """Normalized charts through the meal entry food index; JSON charts by a jsonpath scan"""
+        entries = DietChartMealEntry.objects.filter(food_id=value).values('diet_chart_id')
+        return queryset.filter(
+            Q(storage='normalized', pk__in=entries)
+            | Q(storage='json') & JSONBPathExists(
+                'daily_meals', '$.*.*.items[*] ? (@.food_id == $food)', {'food': str(value)}
+            )
+        )
 
 
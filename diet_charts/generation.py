@@ -0,0 +1,500 @@
+"""
+Diet Chart Generation for Aahaara Harmony
+Inputs shared by single and batch chart generation, and the batch (cohort) generator:
+bulk-loaded patient data, meal plans solved serially (or across a process pool from the
+generate_diet_charts command), one bulk insert
+"""
+import logging
+import multiprocessing
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from food_database.models import FoodItem
+from food_database.substitution import DOSHA_BUCKETS, bucket_for_analysis, food_substitutions
+from .json_ops import json_path, replace_path, update_json_path
+from .json_patch import diff_documents
+from .meal_entries import meal_entry_storage
+from .models import DietChart, chart_aggregates
+from .plan_cache import meal_plan_cache
+from .planner import (
+    DEFAULT_MEAL_DISTRIBUTION, DEFAULT_TARGET_CALORIES, estimate_target_calories, focus_bucket, meal_planner, parse_restrictions,
+    plan_parameters, vary_plan,
+)
+from .revisions import diet_chart_revisions
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CHART_DAYS = {'7_day': 7, '14_day': 14, '30_day': 30}
+# Custom charts are planned for a month
+DEFAULT_CHART_DAYS = 30
+
+MODEL_VERSION = '2.0'
+
+DAY_KEY_RE = re.compile(r'day(\d+)')
+
+
+def chart_days(chart_type: str) -> int:
+    return CHART_DAYS.get(chart_type, DEFAULT_CHART_DAYS)
+
+
+def prakriti_snapshot(analysis) -> Optional[Dict]:
+    """DietChart.prakriti_analysis for a PrakritiAnalysis"""
+    if analysis is None:
+        return None
+    return {
+        'vata_score': analysis.vata_score,
+        'pitta_score': analysis.pitta_score,
+        'kapha_score': analysis.kapha_score,
+        'dominant_dosha': analysis.primary_dosha,
+        'constitution_type': analysis.primary_dosha,
+        'analysis_date': analysis.analysis_date.isoformat(),
+    }
+
+
+def disease_snapshot(analyses) -> Optional[List[Dict]]:
+    """DietChart.disease_analysis for a patient's DiseaseAnalysis rows, newest first"""
+    if not analyses:
+        return None
+    return [
+        {
+            'disease_name': disease.disease_name,
+            'severity': disease.severity,
+            'symptoms': disease.symptoms,
+            'diagnosis_date': disease.diagnosis_date.isoformat(),
+        }
+        for disease in analyses
+    ]
+
+
+def generation_parameters(prakriti_analysis, disease_analysis, planner_parameters: Dict) -> Dict:
+    return {
+        'model_version': MODEL_VERSION,
+        'generated_at': date.today().isoformat(),
+        'patient_analysis_included': bool(prakriti_analysis or disease_analysis),
+        **planner_parameters,
+    }
+
+
+def generate_sample_meals(chart_type, target_calories, meal_distribution):
+    """Generate sample meals for the diet chart."""
+    
+    days = 7 if chart_type == '7_day' else 14 if chart_type == '14_day' else 30
+    daily_meals = {}
+    
+    # Sample meal templates
+    meal_templates = {
+        'breakfast': [
+            {'name': 'Warm Oatmeal with Ghee', 'calories': 350, 'description': 'Hearty breakfast with healthy fats'},
+            {'name': 'Almond Milk Porridge', 'calories': 320, 'description': 'Light and nutritious start to the day'},
+            {'name': 'Millet Porridge with Nuts', 'calories': 380, 'description': 'Protein-rich morning meal'},
+        ],
+        'brunch': [
+            {'name': 'Coconut Water & Dates', 'calories': 200, 'description': 'Refreshing mid-morning snack'},
+            {'name': 'Fresh Fruit Bowl', 'calories': 180, 'description': 'Natural sweetness and vitamins'},
+            {'name': 'Lassi with Honey', 'calories': 220, 'description': 'Probiotic-rich drink'},
+        ],
+        'lunch': [
+            {'name': 'Kitchari with Vegetables', 'calories': 450, 'description': 'Balanced one-pot meal'},
+            {'name': 'Quinoa & Vegetable Curry', 'calories': 420, 'description': 'Complete protein with vegetables'},
+            {'name': 'Sambar & Rice', 'calories': 480, 'description': 'Traditional South Indian meal'},
+        ],
+        'snack': [
+            {'name': 'Herbal Tea & Almonds', 'calories': 150, 'description': 'Antioxidant-rich afternoon snack'},
+            {'name': 'Mint Tea & Crackers', 'calories': 120, 'description': 'Light digestive aid'},
+            {'name': 'Cardamom Tea & Dates', 'calories': 140, 'description': 'Warming spice blend'},
+        ],
+        'dinner': [
+            {'name': 'Light Dal & Rice', 'calories': 400, 'description': 'Easy-to-digest evening meal'},
+            {'name': 'Steamed Vegetables & Roti', 'calories': 380, 'description': 'Simple and wholesome'},
+            {'name': 'Vegetable Khichdi', 'calories': 350, 'description': 'Comforting one-pot meal'},
+        ]
+    }
+    
+    # Generate meals for each day
+    for day in range(1, days + 1):
+        day_key = f'day{day}'
+        daily_meals[day_key] = {}
+        
+        for meal_type, percentage in meal_distribution.items():
+            meal_calories = int(target_calories * percentage)
+            meal_templates_for_type = meal_templates.get(meal_type, [])
+            
+            # Select a random meal template (for now, cycle through them)
+            template_index = (day - 1) % len(meal_templates_for_type)
+            selected_meal = meal_templates_for_type[template_index].copy()
+            selected_meal['calories'] = meal_calories
+            
+            daily_meals[day_key][meal_type] = selected_meal
+    
+    return daily_meals
+
+
+def chart_bucket(chart) -> str:
+    """Dosha bucket a chart is planned for: as generated, else its dosha focus, else the patient's prakriti"""
+    bucket = (chart.generation_parameters or {}).get('dosha_bucket')
+    if bucket in DOSHA_BUCKETS:
+        return bucket
+    return focus_bucket(chart.dosha_focus) or food_substitutions.prakriti_bucket(patient_id=chart.patient_id)[0]
+
+
+def day_number(day_key: str) -> Optional[int]:
+    """12 for 'day12'; None for keys that are not days"""
+    match = DAY_KEY_RE.fullmatch(str(day_key))
+    return int(match.group(1)) if match else None
+
+
+def chart_history(table, daily_meals: Dict, day: int) -> Dict[int, int]:
+    """Table rows of the foods already in a chart, for MealPlanner.solve's history when
+    replanning dayN (or one of its meals) as day 0
+
+    Other days count at their distance from dayN. All of dayN, the foods being replaced
+    included, counts as the same day, so the new slice avoids them whenever anything
+    else fits.
+    """
+    history = {}
+    for day_key, meals in (daily_meals or {}).items():
+        number = day_number(day_key)
+        if number is None or not isinstance(meals, dict):
+            continue
+        distance = abs(number - day)
+        for meal in meals.values():
+            if not isinstance(meal, dict):
+                continue
+            for item in meal.get('items') or []:
+                row = table.rows.get(str(item.get('food_id')))
+                if row is not None:
+                    history[row] = max(history.get(row, -distance), -distance)
+    return history
+
+
+def regenerate_slice(chart, day: int, meal_key: Optional[str] = None) -> Tuple[List[str], Dict, Dict]:
+    """Freshly planned dayN, or one of its meals, for a chart: (json path, value, planner parameters)
+
+    Raises ValueError when the slice cannot be planned.
+    """
+    if not meal_planner.is_available:
+        raise ValueError('Meal planning is not available (numpy not installed)')
+
+    target_calories = chart.target_calories or DEFAULT_TARGET_CALORIES
+    meal_distribution = chart.meal_distribution or DEFAULT_MEAL_DISTRIBUTION
+    if meal_key is not None:
+        share = meal_distribution.get(meal_key)
+        if share is None:
+            # A meal outside the distribution keeps its current share of the day
+            meal = chart.daily_meals[f'day{day}'][meal_key]
+            share = (meal.get('calories') or 0) / target_calories
+        meal_distribution = {meal_key: share}
+
+    table = food_substitutions.get_table()
+    restrictions, unrecognized = parse_restrictions(
+        chart.food_restrictions, table.tags, set(table.categories.tolist())
+    )
+    bucket = chart_bucket(chart)
+    history = chart_history(table, chart.daily_meals, day)
+
+    plan = meal_planner.solve(table, bucket, target_calories, meal_distribution, 1, restrictions, history)
+    foods = meal_planner.food_details(table, [plan])
+    daily_meals, miss = meal_planner.render(table, plan, foods, target_calories, meal_distribution)
+    value = daily_meals['day1']
+    if meal_key is not None:
+        if meal_key not in value:
+            raise ValueError(f'No foods could be planned for {meal_key}')
+        value = value[meal_key]
+
+    path = json_path(f'day{day}', meal_key) if meal_key is not None else json_path(f'day{day}')
+    parameters = {
+        **plan_parameters(table, bucket, restrictions, miss),
+        'unrecognized_restrictions': unrecognized,
+    }
+    return path, value, parameters
+
+
+def save_slice(chart, path: List[str], value, expected_version: Optional[int] = None,
+               user_id=None) -> Optional[int]:
+    """Write one daily_meals slice in place, bump the chart version and record the revision
+
+    The aggregate columns are recomputed from chart.daily_meals with the slice applied,
+    which the version guard keeps consistent. Returns the new version, or None when
+    expected_version no longer matches.
+    """
+    queryset = DietChart.objects.filter(pk=chart.pk)
+    if expected_version is not None:
+        queryset = queryset.filter(version=expected_version)
+    updates = {
+        **chart_aggregates(replace_path(chart.daily_meals, path, value)),
+        'version': F('version') + 1,
+        'updated_at': timezone.now(),
+    }
+    with transaction.atomic():
+        if chart.storage == 'normalized':
+            # Only the slice's meal entries are replaced
+            updated = queryset.update(**updates)
+            if updated:
+                meal_entry_storage.write_slice(chart.pk, path, value)
+        else:
+            updated = update_json_path(queryset, 'daily_meals', path, value, **updates)
+        if not updated:
+            return None
+        version = DietChart.objects.filter(pk=chart.pk).values_list('version', flat=True).first()
+        previous = chart.daily_meals
+        for key in path:
+            previous = (previous or {}).get(key)
+        diet_chart_revisions.record(
+            chart.pk, version, diff_documents(previous, value, ['daily_meals', *path]), 'regenerate', user_id
+        )
+    return version
+
+
+# Shared with forked pool workers: the substitution table and the batch-wide planning inputs
+_worker_state: Dict = {}
+
+
+def _solve(task):
+    """Pool task: (plan key, bucket, target calories) -> (plan key, plan or None, error)"""
+    key, bucket, target_calories = task
+    state = _worker_state
+    try:
+        plan = meal_planner.solve(
+            state['table'], bucket, target_calories, state['meal_distribution'], state['days'],
+            state['restrictions'],
+        )
+        return key, plan, None
+    except ValueError as e:
+        return key, None, str(e)
+
+
+class DietChartBatchResult:
+    """Created charts, per-patient failures and phase timings of a batch"""
+
+    def __init__(self):
+        self.charts: List[Dict] = []
+        self.failures: List[Dict] = []
+        self.timings: Dict[str, float] = {}
+        self.workers = 1
+        self.plans_solved = 0
+        self.plans_cached = 0
+        self.started_at = time.monotonic()
+        self.elapsed_seconds = 0.0
+
+    def add_failure(self, patient_id, error: str):
+        self.failures.append({'patient_id': str(patient_id), 'error': error})
+
+    def phase(self, name: str, started: float):
+        self.timings[name] = round((time.monotonic() - started) * 1000, 1)
+
+    @property
+    def charts_per_second(self) -> float:
+        if not self.elapsed_seconds:
+            return 0.0
+        return round(len(self.charts) / self.elapsed_seconds, 1)
+
+    def as_dict(self) -> Dict:
+        return {
+            'created_count': len(self.charts),
+            'failed_count': len(self.failures),
+            'charts': self.charts,
+            'failures': self.failures,
+            'elapsed_seconds': round(self.elapsed_seconds, 3),
+            'charts_per_second': self.charts_per_second,
+            'workers': self.workers,
+            'plans_solved': self.plans_solved,
+            'plans_cached': self.plans_cached,
+            'timings_ms': self.timings,
+        }
+
+
+class DietChartBatchGenerator:
+    """Generates one chart per patient for a cohort with a fixed number of queries"""
+
+    @property
+    def max_workers(self) -> int:
+        return getattr(settings, 'DIET_CHART_BATCH_WORKERS', 4)
+
+    @property
+    def max_patients(self) -> int:
+        return getattr(settings, 'DIET_CHART_BATCH_MAX_PATIENTS', 1000)
+
+    def _load(self, patient_ids):
+        """Patients with their latest prakriti analysis and disease analyses, in three queries"""
+        from authentication.models import UnifiedPatient
+        from patients.models import DiseaseAnalysis, PrakritiAnalysis
+
+        patients = UnifiedPatient.objects.in_bulk(patient_ids)
+        # DISTINCT ON keeps the newest analysis per patient
+        prakriti = {
+            analysis.patient_id: analysis
+            for analysis in PrakritiAnalysis.objects.filter(patient_id__in=patients)
+            .order_by('patient_id', '-analysis_date').distinct('patient_id')
+        }
+        diseases = {}
+        for disease in DiseaseAnalysis.objects.filter(patient_id__in=patients).order_by('-diagnosis_date'):
+            diseases.setdefault(disease.patient_id, []).append(disease)
+        return patients, prakriti, diseases
+
+    def _solve_all(self, table, tasks, meal_distribution, days, restrictions, workers, result):
+        """Solve every task, across a forked process pool when workers > 1 and there is enough work"""
+        _worker_state.update(
+            table=table, meal_distribution=meal_distribution, days=days, restrictions=restrictions,
+        )
+        workers = min(workers, os.cpu_count() or 1, len(tasks))
+        if workers > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+            logger.warning("Batch diet chart generation running serially: no fork start method")
+            workers = 1
+        result.workers = max(workers, 1)
+
+        try:
+            if workers <= 1:
+                return [_solve(task) for task in tasks]
+            # Forked workers inherit the table instead of unpickling a copy each
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+                return list(pool.map(_solve, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+        finally:
+            _worker_state.clear()
+
+    def generate(self, patient_ids, created_by, chart_type: str = '7_day', chart_name: Optional[str] = None,
+                 start_date: Optional[date] = None, food_restrictions=(), dosha_focus=(),
+                 meal_distribution: Optional[Dict[str, float]] = None,
+                 workers: int = 1) -> DietChartBatchResult:
+        """Create a draft chart per patient; patients that cannot be planned are reported, not raised
+
+        Plans are solved in this process unless workers > 1, which forks a process pool: only
+        do that outside web workers (the generate_diet_charts command), since forking a
+        threaded gunicorn worker with an open database connection is unsafe. Raises ValueError
+        when meal planning is unavailable altogether.
+        """
+        result = DietChartBatchResult()
+        if not meal_planner.is_available:
+            raise ValueError('Meal planning is not available (numpy not installed)')
+        if not FoodItem.objects.exists():
+            raise ValueError('The food catalog is empty')
+
+        days = chart_days(chart_type)
+        start_date = start_date or date.today()
+        meal_distribution = dict(meal_distribution or DEFAULT_MEAL_DISTRIBUTION)
+        chart_name = chart_name or 'Generated Diet Chart'
+
+        started = time.monotonic()
+        # in_bulk() keys patients by UUID, so ids given as strings must be converted to match
+        valid_ids = []
+        for patient_id in dict.fromkeys(patient_ids):
+            try:
+                valid_ids.append(patient_id if isinstance(patient_id, uuid.UUID) else uuid.UUID(str(patient_id)))
+            except ValueError:
+                result.add_failure(patient_id, 'Invalid patient id')
+        patient_ids = list(dict.fromkeys(valid_ids))
+        patients, prakriti, diseases = self._load(patient_ids)
+        table = food_substitutions.get_table()
+        restrictions, unrecognized = parse_restrictions(
+            food_restrictions, table.tags, set(table.categories.tolist())
+        )
+        bucket_override = focus_bucket(dosha_focus)
+        result.phase('load', started)
+
+        # Patients with equal planning inputs share one plan: from the cache, or solved once
+        inputs = {}
+        plans = {}
+        tasks = {}
+        for patient_id in patient_ids:
+            patient = patients.get(patient_id)
+            if patient is None:
+                result.add_failure(patient_id, 'Patient not found')
+                continue
+            analysis = prakriti.get(patient.pk)
+            bucket = bucket_override or (bucket_for_analysis(analysis) if analysis else 'tridosha')
+            target_calories = estimate_target_calories(patient)
+            plan_target = meal_plan_cache.plan_target(target_calories)
+            key = meal_plan_cache.plan_key(bucket, plan_target, days, meal_distribution, restrictions)
+            inputs[patient.pk] = (patient, analysis, target_calories, plan_target, key)
+            if key in plans or key in tasks:
+                continue
+            cached = meal_plan_cache.get(key, table.version)
+            if cached is not None:
+                plans[key] = [*cached, True]
+                result.plans_cached += 1
+            else:
+                tasks[key] = (key, bucket, plan_target)
+
+        started = time.monotonic()
+        solved = self._solve_all(table, list(tasks.values()), meal_distribution, days, restrictions, workers, result)
+        result.plans_solved = len(tasks)
+        result.phase('plan', started)
+
+        # One query for every planned food, then render each distinct plan once in this process
+        started = time.monotonic()
+        foods = meal_planner.food_details(table, [plan for _, plan, _ in solved if plan])
+        errors = {}
+        for key, plan, error in solved:
+            if error:
+                errors[key] = error
+                continue
+            _, bucket, plan_target = tasks[key]
+            daily_meals, miss = meal_planner.render(table, plan, foods, plan_target, meal_distribution)
+            parameters = plan_parameters(table, bucket, restrictions, miss)
+            meal_plan_cache.put(key, table.version, daily_meals, parameters)
+            plans[key] = [daily_meals, parameters, False]
+
+        charts = []
+        for patient_id, (patient, analysis, target_calories, plan_target, key) in inputs.items():
+            if key in errors:
+                result.add_failure(patient_id, errors[key])
+                continue
+            shared = plans[key]
+            daily_meals, planner_parameters = vary_plan(
+                shared[0], shared[1], patient_id, unrecognized, plan_target, cache_hit=shared[2]
+            )
+            # Later patients on a freshly solved plan reuse it like a cache hit
+            shared[2] = True
+            prakriti_analysis = prakriti_snapshot(analysis)
+            disease_analysis = disease_snapshot(diseases.get(patient_id))
+            charts.append(DietChart(
+                patient=patient,
+                created_by=created_by,
+                chart_name=chart_name,
+                chart_type=chart_type,
+                status='draft',
+                start_date=start_date,
+                end_date=start_date + timedelta(days=days - 1),
+                total_days=days,
+                prakriti_analysis=prakriti_analysis,
+                disease_analysis=disease_analysis,
+                target_calories=target_calories,
+                meal_distribution=meal_distribution,
+                dosha_focus=list(dosha_focus),
+                food_restrictions=list(food_restrictions),
+                daily_meals=daily_meals,
+                is_ai_generated=True,
+                generation_parameters=generation_parameters(
+                    prakriti_analysis, disease_analysis, {**planner_parameters, 'batch': True}
+                ),
+                **chart_aggregates(daily_meals),
+            ))
+        result.phase('render', started)
+
+        started = time.monotonic()
+        with transaction.atomic():
+            DietChart.objects.bulk_create(charts, batch_size=500)
+            meal_entry_storage.write_many(charts)
+            diet_chart_revisions.snapshot_many(charts, 'create', created_by.pk)
+        result.phase('write', started)
+
+        result.charts = [{'patient_id': str(chart.patient_id), 'chart_id': str(chart.id)} for chart in charts]
+        result.elapsed_seconds = time.monotonic() - result.started_at
+        logger.info(
+            f"Generated {len(charts)} diet charts ({len(result.failures)} failed) from {result.plans_solved} "
+            f"solved and {result.plans_cached} cached plans in "
+            f"{result.elapsed_seconds:.2f}s, {result.charts_per_second} charts/s on {result.workers} worker(s)"
+        )
+        return result
+
+
+# Global instance
+diet_chart_generator = DietChartBatchGenerator()
@@ -0,0 +1,334 @@
+"""
+Diet Chart Generation Job Service for Aahaara Harmony
+Generates diet charts in the background, storing each day as soon as it is planned so
+clients can stream the chart while later days are still being computed
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Dict, Optional
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.db.models.fields.json import KeyTransform
+from django.utils import timezone
+from food_database.models import FoodItem
+from food_database.substitution import food_substitutions
+from .generation import (
+    chart_days, disease_snapshot, generate_sample_meals, generation_parameters, prakriti_snapshot,
+)
+from .json_ops import json_path, update_json_path
+from .models import DietChart, DietChartGenerationJob
+from .planner import DEFAULT_MEAL_DISTRIBUTION, estimate_target_calories, focus_bucket, meal_planner
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def server_sent_event(event: str, data, event_id=None) -> str:
+    """One text/event-stream message"""
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data, default=str, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class EventStream:
+    """A job's event generator holding one of the process's stream slots until it is closed
+
+    Django closes a streaming response's content when the request ends, including when the
+    client disconnects or the stream never started, so the slot is always given back.
+    """
+
+    def __init__(self, events, release):
+        self._events = events
+        self._release = release
+
+    def __iter__(self):
+        return self._events
+
+    def close(self):
+        release, self._release = self._release, None
+        try:
+            self._events.close()
+        finally:
+            if release is not None:
+                release()
+
+
+class DietChartJobService:
+    """Persists generation requests as DietChartGenerationJob rows for the process_diet_chart_jobs
+    worker, or runs them on an in-process thread pool when DIET_CHART_JOB_WORKERS > 0"""
+
+    def __init__(self):
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._open_streams = 0
+
+    @property
+    def max_workers(self) -> int:
+        return getattr(settings, 'DIET_CHART_JOB_WORKERS', 0)
+
+    @property
+    def max_streams(self) -> int:
+        return getattr(settings, 'DIET_CHART_JOB_MAX_STREAMS', 2)
+
+    @property
+    def stale_after(self) -> timedelta:
+        return timedelta(seconds=getattr(settings, 'DIET_CHART_JOB_STALE_SECONDS', 120))
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='diet-chart-job'
+                )
+            return self._executor
+
+    def create_job(self, patient, user, parameters: Dict) -> DietChartGenerationJob:
+        """Persist a generation request and queue it once the transaction commits"""
+        job = DietChartGenerationJob.objects.create(
+            patient=patient,
+            created_by=user,
+            parameters=parameters,
+            total_days=chart_days(parameters.get('chart_type', '7_day')),
+        )
+        transaction.on_commit(lambda: self.dispatch(job.id))
+        return job
+
+    def dispatch(self, job_id):
+        """Hand a job to the in-process pool (no-op when only the worker command runs jobs)"""
+        if self.max_workers <= 0:
+            return
+        self._get_executor().submit(self._run_in_thread, job_id)
+
+    def _run_in_thread(self, job_id):
+        try:
+            self.run_job(job_id)
+        finally:
+            close_old_connections()
+
+    def reclaim_stale_jobs(self, job_id=None) -> int:
+        """Return running jobs (or the given one) whose worker stopped sending heartbeats to the queue"""
+        jobs = DietChartGenerationJob.objects.filter(
+            status='running', heartbeat_at__lt=timezone.now() - self.stale_after
+        )
+        if job_id is not None:
+            jobs = jobs.filter(pk=job_id)
+        reclaimed = jobs.update(status='pending')
+        if reclaimed:
+            logger.warning(f"Reclaimed {reclaimed} stale diet chart generation job(s)")
+        return reclaimed
+
+    def claim(self, job_id) -> Optional[DietChartGenerationJob]:
+        """Atomically move a pending job to running; None if another worker got it first
+
+        A reclaimed job starts over, so its partial days are dropped.
+        """
+        claimed = DietChartGenerationJob.objects.filter(pk=job_id, status='pending').update(
+            status='running',
+            attempts=F('attempts') + 1,
+            days_generated=0,
+            daily_meals={},
+            heartbeat_at=timezone.now(),
+        )
+        if not claimed:
+            return None
+        return DietChartGenerationJob.objects.select_related('patient', 'created_by').get(pk=job_id)
+
+    def run_job(self, job_id) -> Optional[DietChartGenerationJob]:
+        """Generate a job's chart, publishing each day, then create the DietChart"""
+        job = self.claim(job_id)
+        if job is None:
+            return None
+
+        def publish_day(day_key, meals):
+            # Only the new day is written; streaming clients read it back by key
+            update_json_path(
+                DietChartGenerationJob.objects.filter(pk=job.pk), 'daily_meals', json_path(day_key), meals,
+                days_generated=F('days_generated') + 1,
+                heartbeat_at=timezone.now(),
+            )
+
+        try:
+            chart = self.generate(job, publish_day)
+            # The chart and the job's completion commit together, and only while this run
+            # still owns the job, so a restarted job never leaves a second chart behind
+            with transaction.atomic():
+                chart.save()
+                completed = DietChartGenerationJob.objects.filter(
+                    pk=job.pk, status='running', attempts=job.attempts
+                ).update(status='completed', diet_chart=chart, finished_at=timezone.now(), heartbeat_at=timezone.now())
+                if not completed:
+                    transaction.set_rollback(True)
+                    logger.warning(f"Diet chart generation {job.pk} was reclaimed while running; result discarded")
+        except Exception as e:
+            logger.error(f"Diet chart generation {job.pk} failed: {e}")
+            DietChartGenerationJob.objects.filter(pk=job.pk).update(
+                status='failed', failure_message=str(e), finished_at=timezone.now()
+            )
+
+        job.refresh_from_db()
+        return job
+
+    def generate(self, job: DietChartGenerationJob, publish_day) -> DietChart:
+        """Plan the chart a job asks for, calling publish_day(day_key, meals) per day as it is ready
+
+        Returns the chart unsaved; run_job saves it along with the job's completion.
+        """
+        from patients.models import DiseaseAnalysis, PrakritiAnalysis
+
+        parameters = job.parameters
+        patient = job.patient
+        chart_type = parameters.get('chart_type', '7_day')
+        food_restrictions = parameters.get('food_restrictions') or []
+        dosha_focus = parameters.get('dosha_focus') or []
+
+        latest_prakriti = PrakritiAnalysis.objects.filter(patient=patient).order_by('-analysis_date').first()
+        prakriti_analysis = prakriti_snapshot(latest_prakriti)
+        disease_analysis = disease_snapshot(
+            list(DiseaseAnalysis.objects.filter(patient=patient).order_by('-diagnosis_date'))
+        )
+
+        target_calories = estimate_target_calories(patient)
+        meal_distribution = dict(DEFAULT_MEAL_DISTRIBUTION)
+        total_days = job.total_days
+
+        # Same planner as the synchronous endpoint; templates only when there is no catalog
+        planner_parameters = {'planner': 'templates'}
+        if meal_planner.is_available and FoodItem.objects.exists():
+            bucket = focus_bucket(dosha_focus) or food_substitutions.prakriti_bucket(patient_id=patient.id)[0]
+            daily_meals, planner_parameters = meal_planner.plan(
+                target_calories, total_days, meal_distribution,
+                bucket=bucket, food_restrictions=food_restrictions, variation_key=patient.id,
+                on_day=publish_day,
+            )
+        else:
+            daily_meals = generate_sample_meals(chart_type, target_calories, meal_distribution)
+            for day_key, meals in daily_meals.items():
+                publish_day(day_key, meals)
+
+        start_date = date.fromisoformat(parameters['start_date']) if parameters.get('start_date') else date.today()
+        end_date = (
+            date.fromisoformat(parameters['end_date']) if parameters.get('end_date')
+            else start_date + timedelta(days=total_days - 1)
+        )
+        return DietChart(
+            patient=patient,
+            created_by=job.created_by,
+            chart_name=parameters.get('chart_name') or 'Generated Diet Chart',
+            chart_type=chart_type,
+            status='draft',
+            start_date=start_date,
+            end_date=end_date,
+            total_days=total_days,
+            prakriti_analysis=prakriti_analysis,
+            disease_analysis=disease_analysis,
+            target_calories=target_calories,
+            meal_distribution=meal_distribution,
+            dosha_focus=list(dosha_focus),
+            food_restrictions=list(food_restrictions),
+            daily_meals=daily_meals,
+            is_ai_generated=True,
+            generation_parameters=generation_parameters(
+                prakriti_analysis, disease_analysis, {**planner_parameters, 'job_id': str(job.pk)}
+            ),
+        )
+
+    def open_stream(self, job_id, last_day: int = 0) -> Optional[EventStream]:
+        """Events for a job on one of this process's DIET_CHART_JOB_MAX_STREAMS slots; None when all are taken
+
+        A stream keeps its web worker thread busy while it polls, so the cap keeps streams
+        from starving ordinary requests.
+        """
+        with self._lock:
+            if self._open_streams >= self.max_streams:
+                return None
+            self._open_streams += 1
+        return EventStream(self.events(job_id, last_day), self._close_stream)
+
+    def _close_stream(self):
+        with self._lock:
+            self._open_streams -= 1
+
+    def events(self, job_id, last_day: int = 0):
+        """Server-Sent Events for a job: status changes, each day once it is stored, then
+        'completed' (with the chart id) or 'failed'
+
+        Day events carry the day number as their id, so a client reconnecting with
+        Last-Event-ID resumes after the days it already has; streams end with 'timeout' after
+        DIET_CHART_JOB_STREAM_TIMEOUT (kept below the web server's request timeout), and the
+        client reconnects. Polls the job row, so it works whichever process runs the job, and
+        first puts the job back in the queue if its worker died.
+        """
+        if self.reclaim_stale_jobs(job_id):
+            self.dispatch(job_id)
+        poll_interval = getattr(settings, 'DIET_CHART_JOB_POLL_INTERVAL', 0.25)
+        keepalive = getattr(settings, 'DIET_CHART_JOB_KEEPALIVE_SECONDS', 15)
+        deadline = time.monotonic() + getattr(settings, 'DIET_CHART_JOB_STREAM_TIMEOUT', 25)
+        jobs = DietChartGenerationJob.objects.filter(pk=job_id)
+        sent = last_day
+        status = None
+        last_message = time.monotonic()
+        try:
+            while True:
+                job = jobs.values(
+                    'status', 'days_generated', 'total_days', 'diet_chart_id', 'failure_message'
+                ).first()
+                if job is None:
+                    yield server_sent_event('failed', {'error': 'Diet chart generation job not found'})
+                    return
+
+                messages = []
+                if job['days_generated'] < sent:
+                    # Reclaimed and restarted from day 1: the client drops what it has
+                    sent = 0
+                    messages.append(server_sent_event('reset', {'days_generated': job['days_generated']}))
+                if job['status'] != status:
+                    status = job['status']
+                    messages.append(server_sent_event('status', {
+                        'status': status, 'days_generated': job['days_generated'], 'total_days': job['total_days'],
+                    }))
+                if job['days_generated'] > sent:
+                    # Read back only the days this client has not seen
+                    numbers = range(sent + 1, job['days_generated'] + 1)
+                    days = jobs.values(**{f'day{n}': KeyTransform(f'day{n}', 'daily_meals') for n in numbers}).first()
+                    for n in numbers:
+                        meals = (days or {}).get(f'day{n}')
+                        if meals is None:
+                            break
+                        messages.append(server_sent_event('day', {'day': n, 'meals': meals}, event_id=n))
+                        sent = n
+
+                if status == 'completed' and sent >= job['days_generated']:
+                    messages.append(server_sent_event('completed', {
+                        'chart_id': job['diet_chart_id'], 'days_generated': job['days_generated'],
+                    }))
+                elif status == 'failed':
+                    messages.append(server_sent_event('failed', {'error': job['failure_message']}))
+                elif time.monotonic() > deadline:
+                    messages.append(server_sent_event('timeout', {'days_generated': sent}))
+                elif not messages and time.monotonic() - last_message >= keepalive:
+                    messages.append(': keepalive\n\n')
+
+                if messages:
+                    last_message = time.monotonic()
+                    yield ''.join(messages)
+                if status in ('completed', 'failed') and sent >= job['days_generated'] or time.monotonic() > deadline:
+                    return
+                time.sleep(poll_interval)
+        finally:
+            close_old_connections()
+
+    def pending_job_ids(self):
+        return list(
+            DietChartGenerationJob.objects.filter(status='pending').order_by('created_at').values_list('id', flat=True)
+        )
+
+
+# Global instance
+diet_chart_jobs = DietChartJobService()
@@ -0,0 +1,74 @@
+"""
+JSON Path Updates for Aahaara Harmony
+Writes one slice of a JSONField with Postgres jsonb_set, so changing a day or a meal of
+a diet chart neither reads nor rewrites the rest of the document
+"""
+import json
+from typing import Dict, List, Optional, Sequence
+from django.contrib.postgres.fields import ArrayField
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models import F, Func, Value
+from django.db.models.functions import Cast
+
+
+class JSONBSet(Func):
+    """jsonb_set(expression, path, value, create_missing)"""
+
+    function = 'jsonb_set'
+    output_field = models.JSONField()
+
+    def __init__(self, expression, path: Sequence[str], value, create_missing: bool = True):
+        super().__init__(
+            expression,
+            Value(list(path), output_field=ArrayField(models.TextField())),
+            # Bound as JSON text: a None value must become JSON null, not SQL NULL (which
+            # would make the strict jsonb_set return NULL for the whole document)
+            Cast(Value(json.dumps(value, cls=DjangoJSONEncoder)), models.JSONField()),
+            Value(create_missing),
+        )
+
+
+class JSONBDeletePath(Func):
+    """expression #- path: the document without the key or array element at path"""
+
+    arg_joiner = ' #- '
+    template = '(%(expressions)s)'
+    output_field = models.JSONField()
+
+    def __init__(self, expression, path: Sequence[str]):
+        super().__init__(expression, Value(list(path), output_field=ArrayField(models.TextField())))
+
+
+class JSONBPathExists(Func):
+    """jsonb_path_exists(expression, jsonpath, vars), usable as a filter() condition"""
+
+    function = 'jsonb_path_exists'
+    output_field = models.BooleanField()
+
+    def __init__(self, expression, path: str, variables: Optional[Dict] = None):
+        super().__init__(expression, Value(path), Value(variables or {}, output_field=models.JSONField()))
+
+
+def json_path(*keys) -> List[str]:
+    """jsonb path for nested object keys, e.g. json_path('day3', 'lunch')"""
+    return [str(key) for key in keys]
+
+
+def replace_path(document: Dict, path: Sequence[str], value) -> Dict:
+    """document with document[path] = value, copying only the objects along the path"""
+    if not path:
+        return value
+    key = path[0]
+    updated = dict(document)
+    updated[key] = replace_path(document.get(key) or {}, path[1:], value)
+    return updated
+
+
+def update_json_path(queryset, field: str, path: Sequence[str], value, **updates) -> int:
+    """Set field[path] = value on every row of queryset, along with any plain column updates
+
+    Missing parents are not created: jsonb_set leaves the document unchanged when the
+    path's parent object does not exist. Returns the number of rows updated.
+    """
+    return queryset.update(**{field: JSONBSet(F(field), path, value)}, **updates)
@@ -0,0 +1,314 @@
+"""
+JSON Patch for Aahaara Harmony
+Applies RFC 6902 operations to a diet chart's daily_meals: only the days a patch touches
+are read and checked, and the changes are written with jsonb_set / #- in one UPDATE
+"""
+import copy
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+from django.db import transaction
+from django.db.models import F
+from django.db.models.fields.json import KeyTransform
+from django.db.models.functions import Round
+from django.utils import timezone
+from .json_ops import JSONBDeletePath, JSONBSet
+from .meal_entries import DAY_KEY_RE, meal_entry_storage
+from .models import AGGREGATE_MACROS, DietChart, DietChartMealEntry, day_aggregates
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+OPERATIONS = ('add', 'remove', 'replace', 'move', 'copy', 'test')
+
+
+def pointer_keys(pointer) -> List[str]:
+    """Keys of an RFC 6901 JSON Pointer"""
+    if not isinstance(pointer, str) or not pointer.startswith('/'):
+        raise ValueError(f'{pointer!r} is not a JSON Pointer')
+    return [key.replace('~1', '/').replace('~0', '~') for key in pointer[1:].split('/')]
+
+
+def to_pointer(keys: Sequence[str]) -> str:
+    """RFC 6901 JSON Pointer for a sequence of keys"""
+    return ''.join('/' + str(key).replace('~', '~0').replace('/', '~1') for key in keys)
+
+
+def parse_pointer(pointer) -> List[str]:
+    """Keys of a JSON Pointer that must address a dayN or something inside one"""
+    keys = pointer_keys(pointer)
+    if not DAY_KEY_RE.fullmatch(keys[0]):
+        raise ValueError(f'{pointer} is outside the chart days (paths start with /dayN)')
+    return keys
+
+
+def parse_patch(operations) -> List[Dict]:
+    """Checked operations with their pointers split into keys; ValueError when malformed"""
+    if not isinstance(operations, list) or not operations:
+        raise ValueError('A JSON Patch must be a non-empty array of operations')
+    parsed = []
+    for index, operation in enumerate(operations):
+        try:
+            if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+                raise ValueError(f'op must be one of {", ".join(OPERATIONS)}')
+            op = operation['op']
+            step = {'op': op, 'pointer': operation.get('path'), 'path': parse_pointer(operation.get('path'))}
+            if op in ('add', 'replace', 'test'):
+                if 'value' not in operation:
+                    raise ValueError(f'{op} needs a value')
+                step['value'] = operation['value']
+            if op in ('move', 'copy'):
+                step['from_pointer'] = operation.get('from')
+                step['from'] = parse_pointer(operation.get('from'))
+                if op == 'move' and len(step['path']) > len(step['from']) and \
+                        step['path'][:len(step['from'])] == step['from']:
+                    raise ValueError('cannot move a value into itself')
+        except ValueError as e:
+            raise ValueError(f'Operation {index}: {e}')
+        parsed.append(step)
+    return parsed
+
+
+def patch_days(operations: Sequence[Dict]) -> List[str]:
+    """Day keys a patch reads or writes, in first-use order"""
+    days = {}
+    for step in operations:
+        days[step['path'][0]] = True
+        if 'from' in step:
+            days[step['from'][0]] = True
+    return list(days)
+
+
+def touched_meals(operations: Sequence[Dict]) -> Dict[str, Optional[set]]:
+    """Days changed by a patch, each with the meals to re-check (None: the whole day)"""
+    touched: Dict[str, Optional[set]] = {}
+    for step in operations:
+        if step['op'] == 'test':
+            continue
+        path = step['path']
+        if len(path) == 1:
+            touched[path[0]] = None
+        elif touched.setdefault(path[0], set()) is not None:
+            touched[path[0]].add(path[1])
+    return touched
+
+
+def load_days(chart, day_keys: Sequence[str]) -> Dict:
+    """The given days of a chart's stored daily_meals, skipping days it does not have"""
+    if chart.storage == 'normalized':
+        numbers = [int(DAY_KEY_RE.fullmatch(key).group(1)) for key in day_keys]
+        entries = DietChartMealEntry.objects.filter(diet_chart_id=chart.pk, day__in=numbers)
+        return meal_entry_storage.materialize(entries)
+    days = DietChart.objects.filter(pk=chart.pk).values(
+        **{key: KeyTransform(key, 'daily_meals') for key in day_keys}
+    ).first() or {}
+    return {key: value for key, value in days.items() if value is not None}
+
+
+def _index(key: str, size: int, pointer: str, allow_end: bool = False) -> int:
+    if allow_end and key == '-':
+        return size
+    if not key.isdigit() or (len(key) > 1 and key.startswith('0')):
+        raise ValueError(f'{pointer}: {key!r} is not an array index')
+    index = int(key)
+    if index > size or (index == size and not allow_end):
+        raise ValueError(f'{pointer}: index {index} is out of range')
+    return index
+
+
+def _child(container, key: str, pointer: str):
+    if isinstance(container, dict):
+        if key not in container:
+            raise ValueError(f'{pointer} does not exist')
+        return container[key]
+    if isinstance(container, list):
+        return container[_index(key, len(container), pointer)]
+    raise ValueError(f'{pointer} does not exist')
+
+
+def _get(document: Dict, path: Sequence[str], pointer: str):
+    value = document
+    for key in path:
+        value = _child(value, key, pointer)
+    return value
+
+
+def _add(document: Dict, path: List[str], value, pointer: str, writes: List):
+    parent = _get(document, path[:-1], pointer)
+    key = path[-1]
+    if isinstance(parent, dict):
+        parent[key] = value
+        writes.append(('set', path, copy.deepcopy(value)))
+    elif isinstance(parent, list):
+        # jsonb_set can only replace elements, so an insert rewrites the (small) array
+        parent.insert(_index(key, len(parent), pointer, allow_end=True), value)
+        writes.append(('set', path[:-1], copy.deepcopy(parent)))
+    else:
+        raise ValueError(f'{pointer}: parent is not an object or array')
+
+
+def _remove(document: Dict, path: List[str], pointer: str, writes: List):
+    parent = _get(document, path[:-1], pointer)
+    key = path[-1]
+    if isinstance(parent, dict) and key in parent:
+        value = parent.pop(key)
+    elif isinstance(parent, list):
+        value = parent.pop(_index(key, len(parent), pointer))
+    else:
+        raise ValueError(f'{pointer} does not exist')
+    writes.append(('remove', path))
+    return value
+
+
+def apply_patch(days: Dict, operations: Sequence[Dict]) -> Tuple[Dict, List[Tuple]]:
+    """Apply parsed operations to a copy of the loaded days
+
+    Returns the patched days and the writes ('set', path, value) / ('remove', path) that
+    make the same change in the database. ValueError when an operation cannot be applied
+    or a test fails.
+    """
+    document = copy.deepcopy(days)
+    writes: List[Tuple] = []
+    for step in operations:
+        op, path, pointer = step['op'], step['path'], step['pointer']
+        if op == 'add':
+            _add(document, path, copy.deepcopy(step['value']), pointer, writes)
+        elif op == 'remove':
+            _remove(document, path, pointer, writes)
+        elif op == 'replace':
+            parent = _get(document, path[:-1], pointer)
+            _get(document, path, pointer)
+            if isinstance(parent, list):
+                parent[_index(path[-1], len(parent), pointer)] = copy.deepcopy(step['value'])
+            else:
+                parent[path[-1]] = copy.deepcopy(step['value'])
+            writes.append(('set', path, copy.deepcopy(step['value'])))
+        elif op == 'move':
+            if step['from'] == path:
+                _get(document, path, pointer)
+                continue
+            value = _remove(document, step['from'], step['from_pointer'], writes)
+            _add(document, path, value, pointer, writes)
+        elif op == 'copy':
+            value = copy.deepcopy(_get(document, step['from'], step['from_pointer']))
+            _add(document, path, value, pointer, writes)
+        elif _get(document, path, pointer) != step['value']:
+            raise ValueError(f'test failed at {pointer}')
+    return document, writes
+
+
+def apply_operations(document: Dict, operations: Sequence[Dict]) -> Dict:
+    """document with RFC 6902 operations (as stored, pointers unparsed) applied"""
+    steps = []
+    for operation in operations:
+        step = {**operation, 'pointer': operation['path'], 'path': pointer_keys(operation['path'])}
+        if 'from' in operation:
+            step['from_pointer'] = operation['from']
+            step['from'] = pointer_keys(operation['from'])
+        steps.append(step)
+    return apply_patch(document, steps)[0]
+
+
+def diff_documents(old, new, path: Sequence[str] = ()) -> List[Dict]:
+    """RFC 6902 operations turning old into new
+
+    Objects are compared key by key; arrays and scalars that differ are replaced whole.
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        operations = [
+            {'op': 'remove', 'path': to_pointer([*path, key])} for key in old if key not in new
+        ]
+        for key, value in new.items():
+            if key in old:
+                operations.extend(diff_documents(old[key], value, [*path, key]))
+            else:
+                operations.append({'op': 'add', 'path': to_pointer([*path, key]), 'value': value})
+        return operations
+    if type(old) is type(new) and old == new:
+        return []
+    return [{'op': 'replace', 'path': to_pointer(path), 'value': new}]
+
+
+def patch_expression(expression, writes: Sequence[Tuple]):
+    """The writes as one nested jsonb_set / #- expression over expression"""
+    for write in writes:
+        if write[0] == 'set':
+            expression = JSONBSet(expression, write[1], write[2])
+        else:
+            expression = JSONBDeletePath(expression, write[1])
+    return expression
+
+
+def changed_fragments(document: Dict, operations: Sequence[Dict]) -> List[Dict]:
+    """Current value at every path a patch changed, or removed=True where nothing is left"""
+    fragments = {}
+    for step in operations:
+        if step['op'] == 'test':
+            continue
+        pointers = [(step['pointer'], step['path'])]
+        if step['op'] == 'move':
+            pointers.insert(0, (step['from_pointer'], step['from']))
+        for pointer, path in pointers:
+            if path[-1] == '-':
+                # An append: report the array it went into
+                pointer, path = pointer[:-2], path[:-1]
+            try:
+                fragments[pointer] = {'path': pointer, 'value': _get(document, path, pointer)}
+            except ValueError:
+                fragments[pointer] = {'path': pointer, 'removed': True}
+    return list(fragments.values())
+
+
+def save_patch(chart, before: Dict, after: Dict, writes: Sequence[Tuple],
+               expected_version: Optional[int] = None, user_id=None) -> Optional[int]:
+    """Write a patch's changes, adjust the aggregate columns by the touched days' difference
+    and record the revision
+
+    Returns the new version, or None when expected_version no longer matches.
+    """
+    from .revisions import diet_chart_revisions
+    queryset = DietChart.objects.filter(pk=chart.pk)
+    if expected_version is not None:
+        queryset = queryset.filter(version=expected_version)
+
+    day_keys = list(dict.fromkeys([*before, *after]))
+    old = {key: day_aggregates(before.get(key)) for key in day_keys}
+    new = {key: day_aggregates(after.get(key)) for key in day_keys}
+    day_calories = F('day_calories')
+    for key in day_keys:
+        if isinstance(after.get(key), dict):
+            day_calories = JSONBSet(day_calories, [key], new[key]['calories'])
+        else:
+            day_calories = JSONBDeletePath(day_calories, [key])
+    updates = {
+        'day_calories': day_calories,
+        'total_calories': F('total_calories') + sum(new[key]['calories'] - old[key]['calories'] for key in day_keys),
+        'meal_count': F('meal_count') + sum(new[key]['meal_count'] - old[key]['meal_count'] for key in day_keys),
+        **{
+            f'total_{macro}': Round(
+                F(f'total_{macro}') + sum(new[key][macro] - old[key][macro] for key in day_keys), 1
+            )
+            for macro in AGGREGATE_MACROS
+        },
+        'version': F('version') + 1,
+        'updated_at': timezone.now(),
+    }
+
+    with transaction.atomic():
+        if chart.storage == 'normalized':
+            # Only the touched days' meal entries are replaced
+            updated = queryset.update(**updates)
+            if updated:
+                for key in day_keys:
+                    if key in after:
+                        meal_entry_storage.write_slice(chart.pk, [key], after[key])
+                    else:
+                        meal_entry_storage.remove_day(chart.pk, key)
+        else:
+            updated = queryset.update(daily_meals=patch_expression(F('daily_meals'), writes), **updates)
+        if not updated:
+            return None
+        version = DietChart.objects.filter(pk=chart.pk).values_list('version', flat=True).first()
+        diet_chart_revisions.record(
+            chart.pk, version, diff_documents(before, after, ['daily_meals']), 'patch', user_id
+        )
+    return version
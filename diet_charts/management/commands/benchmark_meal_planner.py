@@ -0,0 +1,91 @@
+"""
+Django management command measuring meal planner latency on a synthetic catalog
+"""
+import random
+import time
+import uuid
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from diet_charts.planner import DEFAULT_MEAL_DISTRIBUTION, meal_planner, parse_restrictions
+from food_database.substitution import BUCKET_NAMES, TABLE_FIELDS, SubstitutionTable, food_substitutions
+
+MEAL_TYPES = ['Breakfast', 'Brunch', 'Lunch', 'Snacks', 'Dinner']
+TAGS = ['Vegan', 'Vegetarian', 'Gluten-Free', 'Dairy', 'High-Protein', 'Low-Fat', 'Spicy', 'Fermented']
+CATEGORIES = ['Grains', 'Legumes', 'Dairy', 'Vegetables', 'Fruits', 'Nuts', 'Spices', 'Beverages']
+EFFECTS = ['pacifies', 'aggravates', 'neutral']
+VIRYA = ['Heating', 'Cooling', 'Neutral']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark meal planning (solve and render) for a diet chart, in memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000, help='Number of synthetic food items')
+        parser.add_argument('--days', type=int, default=30, help='Days per planned chart')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed plans')
+        parser.add_argument('--budget-ms', type=float, default=200.0, help='p99 latency budget per chart')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the synthetic catalog')
+
+    def handle(self, *args, **options):
+        if not meal_planner.is_available:
+            raise CommandError('Meal planner is not available (numpy not installed)')
+
+        rnd = random.Random(options['seed'])
+        rows, foods = [], {}
+        for i in range(options['count']):
+            food_id = uuid.UUID(int=rnd.getrandbits(128))
+            values = {
+                'id': food_id,
+                'calories': rnd.randint(40, 600),
+                'food_category': rnd.choice(CATEGORIES),
+                'virya': rnd.choice(VIRYA),
+                'meal_types': rnd.sample(MEAL_TYPES, rnd.randint(1, 3)),
+                'tags': rnd.sample(TAGS, rnd.randint(0, 3)),
+                'vata_effect': rnd.choice(EFFECTS),
+                'pitta_effect': rnd.choice(EFFECTS),
+                'kapha_effect': rnd.choice(EFFECTS),
+            }
+            rows.append(tuple(values[field] for field in TABLE_FIELDS))
+            foods[str(food_id)] = {
+                'name': f'Food {i}',
+                'serving_size': '100g',
+                'calories': values['calories'],
+                'protein_g': Decimal(rnd.randint(0, 300)) / 10,
+                'carbs_g': Decimal(rnd.randint(0, 800)) / 10,
+                'fat_g': Decimal(rnd.randint(0, 300)) / 10,
+                'fiber_g': Decimal(rnd.randint(0, 150)) / 10,
+                'food_category': values['food_category'],
+                'display': {'dosha_balance': 'Neutral'},
+            }
+
+        started = time.perf_counter()
+        table = SubstitutionTable(food_substitutions.np, rows)
+        self.stdout.write(f'Built table of {len(rows)} foods in {(time.perf_counter() - started) * 1000:.0f} ms')
+
+        scenarios = [
+            ('no restrictions', []),
+            ('vegan', ['vegan']),
+            ('gluten-free, no dairy', ['gluten-free', 'dairy-free']),
+        ]
+        for label, food_restrictions in scenarios:
+            restrictions, _ = parse_restrictions(food_restrictions, table.tags, set(CATEGORIES))
+            timings = []
+            for run in range(options['repeat']):
+                bucket = BUCKET_NAMES[run % len(BUCKET_NAMES)]
+                target_calories = rnd.randint(1400, 2800)
+                started = time.perf_counter()
+                plan = meal_planner.solve(
+                    table, bucket, target_calories, DEFAULT_MEAL_DISTRIBUTION, options['days'], restrictions
+                )
+                _, miss = meal_planner.render(table, plan, foods, target_calories, DEFAULT_MEAL_DISTRIBUTION)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            timings.sort()
+            p50 = timings[len(timings) // 2]
+            p99 = timings[min(int(len(timings) * 0.99), len(timings) - 1)]
+            distinct = len({row for day_plan in plan for picks in day_plan.values() for row, _ in picks})
+            line = (
+                f'{label:<24} p50={p50:7.1f} ms  p99={p99:7.1f} ms  '
+                f'calorie miss={miss:4.1f}%  distinct foods={distinct}'
+            )
+            self.stdout.write(self.style.SUCCESS(line) if p99 <= options['budget_ms'] else self.style.ERROR(line))
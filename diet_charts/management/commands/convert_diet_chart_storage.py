@@ -0,0 +1,50 @@
+"""
+Django management command moving diet charts between JSON and meal entry storage
+"""
+import time
+from django.core.management.base import BaseCommand, CommandError
+from diet_charts.models import DietChart
+
+
+class Command(BaseCommand):
+    help = 'Convert diet charts\' daily_meals between the JSON column and normalized meal entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('chart_ids', nargs='*', help='DietChart ids (default: every chart in the other storage)')
+        parser.add_argument('--to', required=True, choices=[choice for choice, _ in DietChart.STORAGE_CHOICES])
+        parser.add_argument('--batch-size', type=int, default=200, help='Charts loaded per query')
+
+    def handle(self, *args, **options):
+        target = options['to']
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive')
+
+        queryset = DietChart.objects.exclude(storage=target)
+        if options['chart_ids']:
+            queryset = queryset.filter(id__in=options['chart_ids'])
+
+        started = time.monotonic()
+        converted = kept = 0
+        last_id = None
+        while True:
+            # Keyset pagination: converted charts drop out of the queryset as we go
+            batch = queryset.order_by('id').prefetch_related('meal_entries')
+            if last_id is not None:
+                batch = batch.filter(id__gt=last_id)
+            charts = list(batch[:options['batch_size']])
+            if not charts:
+                break
+            for chart in charts:
+                chart.storage = target
+                chart.save(update_fields=['storage', 'daily_meals'])
+                if chart.storage == target:
+                    converted += 1
+                else:
+                    kept += 1
+                    self.stdout.write(self.style.WARNING(f'  {chart.id}: daily_meals layout kept as JSON'))
+            last_id = charts[-1].id
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Converted {converted} diet charts to {target} storage in {time.monotonic() - started:.2f}s'
+            + (f' ({kept} kept as JSON)' if kept else '')
+        ))
@@ -0,0 +1,61 @@
+"""
+Django management command generating diet charts for a cohort of patients
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from authentication.models import User, UnifiedPatient
+from diet_charts.generation import diet_chart_generator
+from diet_charts.models import DietChart
+
+
+class Command(BaseCommand):
+    help = 'Generate a draft diet chart per patient in one batch and report throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('patient_ids', nargs='*', help='UnifiedPatient ids (default: all active patients)')
+        parser.add_argument('--created-by', required=True, help='Username recorded as the charts\' creator')
+        parser.add_argument('--limit', type=int, help='Generate for at most this many patients')
+        parser.add_argument('--chart-type', default='7_day', choices=[choice for choice, _ in DietChart.CHART_TYPE_CHOICES])
+        parser.add_argument('--chart-name', default='Generated Diet Chart')
+        parser.add_argument('--restriction', action='append', default=[], help='Food restriction (repeatable)')
+        parser.add_argument('--workers', type=int, help='Planner processes (default: DIET_CHART_BATCH_WORKERS)')
+        parser.add_argument('--dry-run', action='store_true', help='Generate and roll back, to measure throughput')
+
+    def handle(self, *args, **options):
+        try:
+            created_by = User.objects.get(username=options['created_by'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['created_by']} not found")
+
+        patient_ids = options['patient_ids'] or list(
+            UnifiedPatient.objects.filter(status='active').order_by('created_at').values_list('id', flat=True)
+        )
+        if options['limit']:
+            patient_ids = patient_ids[:options['limit']]
+        if not patient_ids:
+            raise CommandError('No patients to generate charts for')
+
+        try:
+            with transaction.atomic():
+                result = diet_chart_generator.generate(
+                    patient_ids,
+                    created_by,
+                    chart_type=options['chart_type'],
+                    chart_name=options['chart_name'],
+                    food_restrictions=options['restriction'],
+                    workers=options['workers'] or diet_chart_generator.max_workers,
+                )
+                if options['dry_run']:
+                    transaction.set_rollback(True)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        summary = (
+            f"{'Would generate' if options['dry_run'] else 'Generated'} {len(result.charts)} diet charts "
+            f"in {result.elapsed_seconds:.2f}s: {result.charts_per_second} charts/s on {result.workers} worker(s), "
+            f"{result.plans_solved} plans solved, {result.plans_cached} from cache"
+        )
+        self.stdout.write(self.style.SUCCESS(summary))
+        self.stdout.write('  ' + '  '.join(f'{phase}={ms:.0f} ms' for phase, ms in result.timings.items()))
+        for failure in result.failures:
+            self.stdout.write(self.style.ERROR(f"  {failure['patient_id']}: {failure['error']}"))
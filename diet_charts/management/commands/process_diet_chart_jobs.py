@@ -0,0 +1,41 @@
+"""
+Django management command that processes queued diet chart generation jobs
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from diet_charts.jobs import diet_chart_jobs
+
+
+class Command(BaseCommand):
+    help = 'Process pending diet chart generation jobs, restarting jobs whose worker stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Jobs processed concurrently')
+        parser.add_argument('--poll-interval', type=float, default=5.0, help='Seconds between queue checks')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='diet-chart-job') as pool:
+            while True:
+                diet_chart_jobs.reclaim_stale_jobs()
+                job_ids = diet_chart_jobs.pending_job_ids()
+                for job in pool.map(self._run, job_ids):
+                    if job is not None:
+                        self.stdout.write(
+                            f'Diet chart generation {job.id} {job.status}: '
+                            f'{job.days_generated}/{job.total_days} days'
+                            + (f', chart {job.diet_chart_id}' if job.diet_chart_id else f': {job.failure_message}')
+                        )
+
+                if options['once']:
+                    break
+                close_old_connections()
+                time.sleep(options['poll_interval'])
+
+    def _run(self, job_id):
+        try:
+            return diet_chart_jobs.run_job(job_id)
+        finally:
+            close_old_connections()
@@ -0,0 +1,213 @@
+"""
+Meal Entry Storage for Aahaara Harmony
+Keeps a diet chart's daily_meals as one DietChartMealEntry row per meal item, so charts
+can be found by food and single days rewritten alone; the JSON shape is rebuilt on read
+"""
+import json
+import logging
+import re
+import uuid
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+from django.db.models import Max
+from food_database.models import FoodItem
+from .models import DietChartMealEntry
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DAY_KEY_RE = re.compile(r'day([1-9]\d*)')
+MEAL_KEY_MAX_LENGTH = DietChartMealEntry._meta.get_field('meal').max_length
+NAME_MAX_LENGTH = DietChartMealEntry._meta.get_field('food_name').max_length
+SERVING_SIZE_MAX_LENGTH = DietChartMealEntry._meta.get_field('serving_size').max_length
+
+# Entry with no meal: keeps a day that has no meals
+EMPTY_DAY = ''
+
+
+def meals_snapshot(daily_meals) -> str:
+    """Canonical text of daily_meals, to tell whether a loaded chart's meals were edited"""
+    return json.dumps(daily_meals, sort_keys=True, default=str)
+
+
+def canonical_uuid(value) -> Optional[str]:
+    """value when it is a UUID string in canonical form, else None"""
+    if not isinstance(value, str):
+        return None
+    try:
+        return value if str(uuid.UUID(value)) == value else None
+    except ValueError:
+        return None
+
+
+class MealEntryStorage:
+    """Converts between daily_meals JSON and DietChartMealEntry rows"""
+
+    def can_store(self, daily_meals) -> bool:
+        """Whether daily_meals follows the dayN -> meal -> {..., items: [...]} layout"""
+        if not isinstance(daily_meals, dict):
+            return False
+        for day_key, meals in daily_meals.items():
+            if not isinstance(day_key, str) or not DAY_KEY_RE.fullmatch(day_key) or not isinstance(meals, dict):
+                return False
+            for meal_key, meal in meals.items():
+                if not meal_key or len(meal_key) > MEAL_KEY_MAX_LENGTH or not isinstance(meal, dict):
+                    return False
+                items = meal.get('items', [])
+                if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                    return False
+        return True
+
+    def _catalog_ids(self, days: Iterable[Dict]) -> Set[str]:
+        """food_ids in the given days that match a catalog food, in one query"""
+        ids = {
+            food_id
+            for meals in days for meal in meals.values() for item in meal.get('items') or []
+            if (food_id := canonical_uuid(item.get('food_id'))) is not None
+        }
+        if not ids:
+            return set()
+        return {str(food_id) for food_id in FoodItem.objects.filter(id__in=ids).values_list('id', flat=True)}
+
+    @staticmethod
+    def _item_columns(item: Dict, catalog_ids: Set[str]) -> Dict:
+        """Entry columns for an item; values a column would not keep exactly stay in item_details"""
+        details = dict(item)
+        columns = {}
+        if details.get('food_id') in catalog_ids:
+            columns['food_id'] = details.pop('food_id')
+        name = details.get('name')
+        if isinstance(name, str) and len(name) <= NAME_MAX_LENGTH:
+            columns['food_name'] = details.pop('name')
+        serving_size = details.get('serving_size')
+        if isinstance(serving_size, str) and len(serving_size) <= SERVING_SIZE_MAX_LENGTH:
+            columns['serving_size'] = details.pop('serving_size')
+        if type(details.get('servings')) is float:
+            columns['servings'] = details.pop('servings')
+        if type(details.get('calories')) is int:
+            columns['calories'] = details.pop('calories')
+        columns['item_details'] = details
+        return columns
+
+    def _day_entries(self, chart_id, day: int, meals: Dict, catalog_ids: Set[str],
+                     first_meal_position: int = 0) -> List[DietChartMealEntry]:
+        if not meals:
+            return [DietChartMealEntry(diet_chart_id=chart_id, day=day, meal=EMPTY_DAY)]
+        entries = []
+        for meal_position, (meal_key, meal) in enumerate(meals.items(), first_meal_position):
+            items = meal.get('items')
+            details = {key: value for key, value in meal.items() if key != 'items' or not items}
+            rows = [self._item_columns(item, catalog_ids) for item in items] if items else [{}]
+            for position, columns in enumerate(rows):
+                entries.append(DietChartMealEntry(
+                    diet_chart_id=chart_id,
+                    day=day,
+                    meal=meal_key,
+                    meal_position=meal_position,
+                    position=position,
+                    meal_details=details if position == 0 else None,
+                    **columns,
+                ))
+        return entries
+
+    def entries(self, chart_id, daily_meals: Dict, catalog_ids: Optional[Set[str]] = None) -> List[DietChartMealEntry]:
+        """Unsaved entries for a whole chart"""
+        if catalog_ids is None:
+            catalog_ids = self._catalog_ids(daily_meals.values())
+        entries = []
+        for day_key, meals in daily_meals.items():
+            day = int(DAY_KEY_RE.fullmatch(day_key).group(1))
+            entries.extend(self._day_entries(chart_id, day, meals, catalog_ids))
+        return entries
+
+    @staticmethod
+    def _item(entry: DietChartMealEntry) -> Dict:
+        item = {}
+        if entry.food_id is not None:
+            item['food_id'] = str(entry.food_id)
+        if entry.food_name is not None:
+            item['name'] = entry.food_name
+        if entry.serving_size is not None:
+            item['serving_size'] = entry.serving_size
+        if entry.servings is not None:
+            item['servings'] = entry.servings
+        if entry.calories is not None:
+            item['calories'] = entry.calories
+        item.update(entry.item_details)
+        return item
+
+    def materialize(self, entries: Iterable[DietChartMealEntry]) -> Dict:
+        """daily_meals JSON from entries ordered by day, meal_position and position"""
+        daily_meals = {}
+        for entry in entries:
+            meals = daily_meals.setdefault(f'day{entry.day}', {})
+            if entry.meal == EMPTY_DAY:
+                continue
+            if entry.position == 0:
+                meals[entry.meal] = dict(entry.meal_details or {})
+            if entry.item_details is not None:
+                meals[entry.meal].setdefault('items', []).append(self._item(entry))
+        return daily_meals
+
+    def load(self, chart):
+        """Materialize a normalized chart's daily_meals, from prefetched meal_entries when available"""
+        if 'daily_meals' in chart.__dict__:
+            return
+        entries = getattr(chart, '_prefetched_objects_cache', {}).get('meal_entries')
+        if entries is None:
+            entries = DietChartMealEntry.objects.filter(diet_chart_id=chart.pk)
+        daily_meals = self.materialize(entries)
+        chart.__dict__['daily_meals'] = daily_meals
+        chart._meals_snapshot = meals_snapshot(daily_meals)
+
+    def has_changes(self, chart) -> bool:
+        """Whether a chart's daily_meals were set or edited since they were loaded"""
+        if 'daily_meals' not in chart.__dict__:
+            return False
+        return meals_snapshot(chart.__dict__['daily_meals']) != getattr(chart, '_meals_snapshot', None)
+
+    def write(self, chart, daily_meals: Dict):
+        """Replace a chart's entries (call inside the chart's save transaction)"""
+        DietChartMealEntry.objects.filter(diet_chart_id=chart.pk).delete()
+        DietChartMealEntry.objects.bulk_create(self.entries(chart.pk, daily_meals), batch_size=1000)
+        chart._meals_snapshot = meals_snapshot(daily_meals)
+
+    def write_many(self, charts: Sequence):
+        """Entries for freshly bulk-created normalized charts: one food lookup, one insert"""
+        charts = [chart for chart in charts if chart.storage == 'normalized']
+        if not charts:
+            return
+        catalog_ids = self._catalog_ids(
+            meals for chart in charts for meals in chart.daily_meals.values()
+        )
+        entries = []
+        for chart in charts:
+            entries.extend(self.entries(chart.pk, chart.daily_meals, catalog_ids))
+            chart._meals_snapshot = meals_snapshot(chart.daily_meals)
+        DietChartMealEntry.objects.bulk_create(entries, batch_size=1000)
+
+    def write_slice(self, chart_id, path: Sequence[str], value):
+        """Replace one day (path ['dayN']) or one meal (['dayN', meal]) of a normalized chart"""
+        day = int(DAY_KEY_RE.fullmatch(path[0]).group(1))
+        entries = DietChartMealEntry.objects.filter(diet_chart_id=chart_id, day=day)
+        if len(path) == 1:
+            meals, first_meal_position = value, 0
+            entries.delete()
+        else:
+            meals = {path[1]: value}
+            position = entries.filter(meal=path[1]).values_list('meal_position', flat=True).first()
+            if position is None:
+                position = (entries.aggregate(last=Max('meal_position'))['last'] or 0) + 1
+            first_meal_position = position
+            entries.filter(meal__in=[path[1], EMPTY_DAY]).delete()
+        DietChartMealEntry.objects.bulk_create(
+            self._day_entries(chart_id, day, meals, self._catalog_ids([meals]), first_meal_position)
+        )
+
+    def remove_day(self, chart_id, day_key: str):
+        """Drop dayN from a normalized chart"""
+        day = int(DAY_KEY_RE.fullmatch(day_key).group(1))
+        DietChartMealEntry.objects.filter(diet_chart_id=chart_id, day=day).delete()
+
+
+# Global instance
+meal_entry_storage = MealEntryStorage()
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.24 on 2026-10-17 02:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0002_alter_doctorprofile_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('diet_charts', '0003_remove_dietrecommendation_created_by_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DietChartGenerationJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('parameters', models.JSONField(default=dict, help_text='Chart name, type, dates, restrictions and dosha focus requested')),
+                ('total_days', models.IntegerField(default=7)),
+                ('days_generated', models.IntegerField(default=0)),
+                ('daily_meals', models.JSONField(blank=True, default=dict)),
+                ('failure_message', models.TextField(blank=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='diet_chart_generation_jobs', to=settings.AUTH_USER_MODEL)),
+                ('diet_chart', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='generation_jobs', to='diet_charts.dietchart')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='diet_chart_generation_jobs', to='authentication.unifiedpatient')),
+            ],
+            options={
+                'verbose_name': 'Diet Chart Generation Job',
+                'verbose_name_plural': 'Diet Chart Generation Jobs',
+                'db_table': 'diet_chart_generation_jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'heartbeat_at'], name='diet_chart_job_status_hb_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.24 on 2026-10-17 02:59
+
+import diet_charts.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('food_database', '0010_food_item_fingerprint'),
+        ('diet_charts', '0004_diet_chart_generation_job'),
+    ]
+
+    operations = [
+        # Existing charts keep their JSON column whatever DIET_CHART_STORAGE says
+        migrations.AddField(
+            model_name='dietchart',
+            name='storage',
+            field=models.CharField(choices=[('json', 'JSON document'), ('normalized', 'Meal entries')], default='json', help_text='Where daily_meals is kept: this JSON column or DietChartMealEntry rows', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='dietchart',
+            name='storage',
+            field=models.CharField(choices=[('json', 'JSON document'), ('normalized', 'Meal entries')], default=diet_charts.models.default_meal_storage, help_text='Where daily_meals is kept: this JSON column or DietChartMealEntry rows', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='dietchart',
+            name='daily_meals',
+            field=diet_charts.models.DailyMealsField(default=dict, help_text='The actual meal plan for each day'),
+        ),
+        migrations.CreateModel(
+            name='DietChartMealEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('day', models.PositiveSmallIntegerField()),
+                ('meal', models.CharField(max_length=50)),
+                ('meal_position', models.PositiveSmallIntegerField(default=0, help_text='Order of the meal within its day')),
+                ('position', models.PositiveSmallIntegerField(default=0, help_text='Order of the item within its meal')),
+                ('meal_details', models.JSONField(blank=True, help_text="The meal's fields other than items (first entry only)", null=True)),
+                ('food_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('serving_size', models.CharField(blank=True, max_length=100, null=True)),
+                ('servings', models.FloatField(blank=True, null=True)),
+                ('calories', models.IntegerField(blank=True, null=True)),
+                ('item_details', models.JSONField(blank=True, help_text='Other item fields; null for a meal without items', null=True)),
+                ('diet_chart', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='meal_entries', to='diet_charts.dietchart')),
+                ('food', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='diet_chart_entries', to='food_database.fooditem')),
+            ],
+            options={
+                'verbose_name': 'Diet Chart Meal Entry',
+                'verbose_name_plural': 'Diet Chart Meal Entries',
+                'db_table': 'diet_chart_meal_entries',
+                'ordering': ['day', 'meal_position', 'position'],
+                'indexes': [models.Index(fields=['diet_chart', 'day'], name='diet_meal_entry_chart_day_idx')],
+            },
+        ),
+    ]
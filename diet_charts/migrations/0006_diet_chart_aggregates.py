@@ -0,0 +1,120 @@
+# Generated by Django 4.2.24 on 2026-10-17 03:02
+
+from django.db import migrations, models
+
+
+MACROS = ['protein_g', 'carbs_g', 'fat_g', 'fiber_g']
+AGGREGATE_FIELDS = ['total_calories', 'meal_count', 'day_calories'] + [f'total_{macro}' for macro in MACROS]
+
+
+def number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def aggregates(daily_meals):
+    """Totals as the model computed them when this migration was written"""
+    meal_count = 0
+    day_calories = {}
+    macros = dict.fromkeys(MACROS, 0.0)
+    for day_key, day_data in (daily_meals or {}).items():
+        if not isinstance(day_data, dict):
+            continue
+        calories = 0
+        for meal_data in day_data.values():
+            if not isinstance(meal_data, dict):
+                continue
+            calories += number(meal_data.get('calories'))
+            for macro in MACROS:
+                macros[macro] += number(meal_data.get(macro))
+        day_calories[day_key] = round(calories)
+        meal_count += len(day_data)
+    return {
+        'total_calories': sum(day_calories.values()),
+        'meal_count': meal_count,
+        'day_calories': day_calories,
+        **{f'total_{macro}': round(value, 1) for macro, value in macros.items()},
+    }
+
+
+def stored_meals(DietChartMealEntry, chart_id):
+    """A normalized chart's days and meals from its entries; the totals only need the meal
+    fields kept on each meal's first entry, not the items"""
+    daily_meals = {}
+    entries = DietChartMealEntry.objects.filter(diet_chart_id=chart_id).order_by('day', 'meal_position', 'position')
+    for day, meal, position, details in entries.values_list('day', 'meal', 'position', 'meal_details'):
+        meals = daily_meals.setdefault(f'day{day}', {})
+        if meal and position == 0:
+            meals[meal] = details or {}
+    return daily_meals
+
+
+def fill_aggregates(apps, schema_editor):
+    DietChart = apps.get_model('diet_charts', 'DietChart')
+    DietChartMealEntry = apps.get_model('diet_charts', 'DietChartMealEntry')
+    batch = []
+    for chart in DietChart.objects.only('id', 'storage', 'daily_meals').iterator(chunk_size=500):
+        daily_meals = chart.daily_meals
+        if chart.storage == 'normalized':
+            daily_meals = stored_meals(DietChartMealEntry, chart.pk)
+        for field, value in aggregates(daily_meals).items():
+            setattr(chart, field, value)
+        batch.append(chart)
+        if len(batch) == 500:
+            DietChart.objects.bulk_update(batch, AGGREGATE_FIELDS)
+            batch = []
+    if batch:
+        DietChart.objects.bulk_update(batch, AGGREGATE_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diet_charts', '0005_diet_chart_meal_entries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dietchart',
+            name='day_calories',
+            field=models.JSONField(blank=True, default=dict, help_text='Calories per day, keyed like daily_meals'),
+        ),
+        migrations.AddField(
+            model_name='dietchart',
+            name='meal_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dietchart',
+            name='total_calories',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dietchart',
+            name='total_carbs_g',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dietchart',
+            name='total_fat_g',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dietchart',
+            name='total_fiber_g',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dietchart',
+            name='total_protein_g',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='dietchart',
+            index=models.Index(fields=['total_calories'], name='diet_charts_total_cal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dietchart',
+            index=models.Index(fields=['meal_count'], name='diet_charts_meal_count_idx'),
+        ),
+        migrations.RunPython(fill_aggregates, migrations.RunPython.noop),
+    ]
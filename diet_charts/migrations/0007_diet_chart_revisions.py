@@ -0,0 +1,110 @@
+# Generated by Django 4.2.24 on 2026-10-17 03:09
+
+import json
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+# Chart fields kept in history besides daily_meals, as of this migration
+REVISION_FIELDS = [
+    'chart_name', 'chart_type', 'status', 'start_date', 'end_date', 'total_days', 'target_calories',
+    'meal_distribution', 'dosha_focus', 'food_restrictions', 'patient_preferences', 'notes',
+]
+
+
+def json_value(value):
+    return json.loads(json.dumps(value, cls=DjangoJSONEncoder))
+
+
+def entry_item(entry):
+    item = {}
+    if entry.food_id is not None:
+        item['food_id'] = str(entry.food_id)
+    if entry.food_name is not None:
+        item['name'] = entry.food_name
+    if entry.serving_size is not None:
+        item['serving_size'] = entry.serving_size
+    if entry.servings is not None:
+        item['servings'] = entry.servings
+    if entry.calories is not None:
+        item['calories'] = entry.calories
+    item.update(entry.item_details)
+    return item
+
+
+def stored_meals(DietChartMealEntry, chart_id):
+    """A normalized chart's daily_meals rebuilt from its entries (an entry without a meal keeps an empty day)"""
+    daily_meals = {}
+    entries = DietChartMealEntry.objects.filter(diet_chart_id=chart_id).order_by('day', 'meal_position', 'position')
+    for entry in entries:
+        meals = daily_meals.setdefault(f'day{entry.day}', {})
+        if entry.meal == '':
+            continue
+        if entry.position == 0:
+            meals[entry.meal] = dict(entry.meal_details or {})
+        if entry.item_details is not None:
+            meals[entry.meal].setdefault('items', []).append(entry_item(entry))
+    return daily_meals
+
+
+def start_history(apps, schema_editor):
+    # Existing charts start their history with a snapshot of their current version
+    DietChart = apps.get_model('diet_charts', 'DietChart')
+    DietChartMealEntry = apps.get_model('diet_charts', 'DietChartMealEntry')
+    DietChartRevision = apps.get_model('diet_charts', 'DietChartRevision')
+    batch = []
+    for chart in DietChart.objects.only('id', 'version', 'storage', 'daily_meals', *REVISION_FIELDS).iterator(chunk_size=500):
+        daily_meals = chart.daily_meals
+        if chart.storage == 'normalized':
+            daily_meals = stored_meals(DietChartMealEntry, chart.pk)
+        metadata = {field: DietChart._meta.get_field(field).to_python(getattr(chart, field)) for field in REVISION_FIELDS}
+        state = {'daily_meals': json_value(daily_meals or {}), 'metadata': json_value(metadata)}
+        batch.append(DietChartRevision(
+            diet_chart_id=chart.pk, version=chart.version, kind='snapshot', source='baseline',
+            snapshot=state, size=len(json.dumps(state, cls=DjangoJSONEncoder, separators=(',', ':'))),
+        ))
+        if len(batch) == 500:
+            DietChartRevision.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        DietChartRevision.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('diet_charts', '0006_diet_chart_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DietChartRevision',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('version', models.IntegerField()),
+                ('kind', models.CharField(choices=[('snapshot', 'Snapshot'), ('delta', 'Delta')], max_length=10)),
+                ('source', models.CharField(choices=[('create', 'Created'), ('update', 'Updated'), ('regenerate', 'Regenerated'), ('patch', 'JSON Patch'), ('baseline', 'History started')], default='update', max_length=20)),
+                ('snapshot', models.JSONField(blank=True, null=True)),
+                ('operations', models.JSONField(blank=True, default=list)),
+                ('size', models.PositiveIntegerField(default=0, help_text='Bytes of JSON stored for this revision')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='diet_chart_revisions', to=settings.AUTH_USER_MODEL)),
+                ('diet_chart', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='diet_charts.dietchart')),
+            ],
+            options={
+                'verbose_name': 'Diet Chart Revision',
+                'verbose_name_plural': 'Diet Chart Revisions',
+                'db_table': 'diet_chart_revisions',
+                'ordering': ['diet_chart', '-version'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dietchartrevision',
+            constraint=models.UniqueConstraint(fields=('diet_chart', 'version'), name='diet_chart_revision_version_uniq'),
+        ),
+        migrations.RunPython(start_history, migrations.RunPython.noop),
+    ]
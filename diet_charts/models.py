@@ -1,7 +1,87 @@
 import uuid
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.query_utils import DeferredAttribute
 from django.contrib.postgres.fields import ArrayField
 from authentication.models import User, UnifiedPatient
+from food_database.models import FoodItem
+
+
+def default_meal_storage():
+    return getattr(settings, 'DIET_CHART_STORAGE', 'json')
+
+
+AGGREGATE_MACROS = ['protein_g', 'carbs_g', 'fat_g', 'fiber_g']
+AGGREGATE_FIELDS = ['total_calories', 'meal_count', 'day_calories'] + [f'total_{macro}' for macro in AGGREGATE_MACROS]
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def day_aggregates(day_data) -> dict:
+    """One day's share of the aggregates: rounded calories, meal count and unrounded macro sums"""
+    if not isinstance(day_data, dict):
+        return {'calories': 0, 'meal_count': 0, **dict.fromkeys(AGGREGATE_MACROS, 0.0)}
+    calories = 0
+    macros = dict.fromkeys(AGGREGATE_MACROS, 0.0)
+    for meal_data in day_data.values():
+        if not isinstance(meal_data, dict):
+            continue
+        calories += _number(meal_data.get('calories'))
+        for macro in AGGREGATE_MACROS:
+            macros[macro] += _number(meal_data.get(macro))
+    return {'calories': round(calories), 'meal_count': len(day_data), **macros}
+
+
+def chart_aggregates(daily_meals) -> dict:
+    """DietChart's denormalized totals (AGGREGATE_FIELDS) for a daily_meals document
+
+    total_calories is the sum of day_calories, so a one-day edit can adjust it exactly.
+    """
+    meal_count = 0
+    day_calories = {}
+    macros = dict.fromkeys(AGGREGATE_MACROS, 0.0)
+    for day_key, day_data in (daily_meals or {}).items():
+        if not isinstance(day_data, dict):
+            continue
+        day = day_aggregates(day_data)
+        day_calories[day_key] = day['calories']
+        meal_count += day['meal_count']
+        for macro in AGGREGATE_MACROS:
+            macros[macro] += day[macro]
+    return {
+        'total_calories': sum(day_calories.values()),
+        'meal_count': meal_count,
+        'day_calories': day_calories,
+        **{f'total_{macro}': round(value, 1) for macro, value in macros.items()},
+    }
+
+
+class DailyMealsAttribute(DeferredAttribute):
+    """Materializes a normalized chart's daily_meals from its meal entries on first access"""
+    
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        if self.field.attname not in instance.__dict__ and not instance._state.adding:
+            # As stored in the database, which a pending storage change does not alter yet
+            stored_as = instance.__dict__.get('_loaded_storage') or instance.storage
+            if stored_as == 'normalized':
+                from .meal_entries import meal_entry_storage
+                meal_entry_storage.load(instance)
+        return super().__get__(instance, cls)
+
+
+class DailyMealsField(models.JSONField):
+    """daily_meals JSON; left empty in the column for charts stored as meal entries"""
+    
+    descriptor_class = DailyMealsAttribute
+    
+    def pre_save(self, model_instance, add):
+        if model_instance.storage == 'normalized':
+            return {}
+        return super().pre_save(model_instance, add)
 
 
 class DietChart(models.Model):
@@ -24,6 +104,11 @@ class DietChart(models.Model):
         ('archived', 'Archived'),
     ]
     
+    STORAGE_CHOICES = [
+        ('json', 'JSON document'),
+        ('normalized', 'Meal entries'),
+    ]
+    
     # Basic Info
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     patient = models.ForeignKey(UnifiedPatient, on_delete=models.CASCADE, related_name='diet_charts')
@@ -51,7 +136,20 @@ class DietChart(models.Model):
     food_restrictions = ArrayField(models.CharField(max_length=50), blank=True, default=list, help_text="Dietary restrictions")
     
     # Chart Content
-    daily_meals = models.JSONField(default=dict, help_text="The actual meal plan for each day")
+    daily_meals = DailyMealsField(default=dict, help_text="The actual meal plan for each day")
+    storage = models.CharField(
+        max_length=20, choices=STORAGE_CHOICES, default=default_meal_storage,
+        help_text="Where daily_meals is kept: this JSON column or DietChartMealEntry rows"
+    )
+    
+    # Aggregates of daily_meals, recomputed whenever it is saved
+    total_calories = models.IntegerField(default=0)
+    meal_count = models.IntegerField(default=0)
+    day_calories = models.JSONField(default=dict, blank=True, help_text="Calories per day, keyed like daily_meals")
+    total_protein_g = models.FloatField(default=0)
+    total_carbs_g = models.FloatField(default=0)
+    total_fat_g = models.FloatField(default=0)
+    total_fiber_g = models.FloatField(default=0)
     
     # Metadata
     notes = models.TextField(blank=True, null=True)
@@ -82,10 +180,81 @@ class DietChart(models.Model):
                 name='check_date_order'
             ),
         ]
+        indexes = [
+            models.Index(fields=['total_calories'], name='diet_charts_total_cal_idx'),
+            models.Index(fields=['meal_count'], name='diet_charts_meal_count_idx'),
+        ]
     
     def __str__(self):
         return f"{self.chart_name} - {self.patient.user_name} ({self.chart_type})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_storage = instance.__dict__.get('storage')
+        if instance._loaded_storage == 'normalized':
+            # The column is empty; the meals are read from meal entries when first used
+            instance.__dict__.pop('daily_meals', None)
+        return instance
+    
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        """Reload the chart; meals cached from meal entries are dropped and read again on next use."""
+        if fields is None or 'daily_meals' in fields:
+            # A normalized reload leaves daily_meals unloaded, so Django would keep the cached meals
+            self.__dict__.pop('daily_meals', None)
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        if fields is None or 'storage' in fields:
+            self._loaded_storage = self.storage
+    
+    def save(self, *args, **kwargs):
+        """Save the chart, rewriting a normalized chart's meal entries only when its meals changed.
+        
+        Changes to the meals or the REVISION_FIELDS bump the version and are recorded as a
+        DietChartRevision (attributed to _revised_by when a view sets it). Raises
+        revisions.VersionConflict when the chart was saved elsewhere since it was loaded.
+        """
+        from .meal_entries import meal_entry_storage
+        from .revisions import diet_chart_revisions
+        update_fields = kwargs.get('update_fields')
+        meals_saved = update_fields is None or 'daily_meals' in update_fields
+        if meals_saved and 'daily_meals' in self.__dict__:
+            self.update_aggregates()
+            if update_fields is not None:
+                update_fields = kwargs['update_fields'] = {*update_fields, *AGGREGATE_FIELDS}
+        write_entries = self.storage == 'normalized' and meals_saved and meal_entry_storage.has_changes(self)
+        if write_entries and not meal_entry_storage.can_store(self.daily_meals):
+            # Meals that do not follow the dayN/meal/items layout stay a JSON document
+            self.storage = 'json'
+            write_entries = False
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'storage'}
+        leave_entries = (
+            meals_saved and self.storage == 'json' and getattr(self, '_loaded_storage', None) == 'normalized'
+        )
+        if leave_entries:
+            # Materialized before the entries go, so the column receives the meals
+            meal_entry_storage.load(self)
+        
+        adding = self._state.adding
+        
+        with transaction.atomic():
+            operations = None if adding else diet_chart_revisions.changes(self, kwargs.get('update_fields'))
+            if operations and kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+            super().save(*args, **kwargs)
+            if write_entries:
+                meal_entry_storage.write(self, self.daily_meals)
+            elif leave_entries:
+                self.meal_entries.all().delete()
+            revised_by = getattr(self, '_revised_by', None)
+            if adding:
+                diet_chart_revisions.snapshot(self, 'create', self.created_by_id)
+            elif operations:
+                diet_chart_revisions.record(
+                    self.pk, self.version, operations, 'update', revised_by.pk if revised_by else None
+                )
+        self._loaded_storage = self.storage
+    
     @property
     def patient_name(self):
         """Get the patient's name for easy access."""
@@ -96,29 +265,18 @@ class DietChart(models.Model):
         """Get the creator's name for easy access."""
         return self.created_by.user_name
     
+    def update_aggregates(self):
+        """Recompute the aggregate columns from daily_meals."""
+        for field, value in chart_aggregates(self.daily_meals).items():
+            setattr(self, field, value)
+    
     def get_total_calories(self):
-        """Calculate total calories for the entire chart."""
-        if not self.daily_meals:
-            return 0
-        
-        total = 0
-        for day_data in self.daily_meals.values():
-            if isinstance(day_data, dict):
-                for meal_data in day_data.values():
-                    if isinstance(meal_data, dict) and 'calories' in meal_data:
-                        total += meal_data.get('calories', 0)
-        return total
+        """Total calories for the entire chart (stored, maintained on save)."""
+        return self.total_calories
     
     def get_meal_count(self):
-        """Get the total number of meals in the chart."""
-        if not self.daily_meals:
-            return 0
-        
-        count = 0
-        for day_data in self.daily_meals.values():
-            if isinstance(day_data, dict):
-                count += len(day_data)
-        return count
+        """Total number of meals in the chart (stored, maintained on save)."""
+        return self.meal_count
     
     def is_active(self):
         """Check if the chart is currently active."""
@@ -126,4 +284,136 @@ class DietChart(models.Model):
     
     def can_be_modified(self):
         """Check if the chart can be modified."""
-        return self.status in ['draft', 'active']
\ No newline at end of file
+        return self.status in ['draft', 'active']
+
+
+class DietChartMealEntry(models.Model):
+    """
+    One food of one meal of a diet chart stored as meal entries (storage='normalized').
+    The meal's own fields (name, calories, macros...) sit on its first entry; a meal
+    without items is a single entry with no item fields.
+    """
+    
+    id = models.BigAutoField(primary_key=True)
+    diet_chart = models.ForeignKey(DietChart, on_delete=models.CASCADE, related_name='meal_entries', db_index=False)
+    day = models.PositiveSmallIntegerField()
+    meal = models.CharField(max_length=50)
+    meal_position = models.PositiveSmallIntegerField(default=0, help_text="Order of the meal within its day")
+    position = models.PositiveSmallIntegerField(default=0, help_text="Order of the item within its meal")
+    meal_details = models.JSONField(null=True, blank=True, help_text="The meal's fields other than items (first entry only)")
+    
+    # The item; food is set when its food_id matches the catalog
+    # No database constraint: like the JSON document, an entry keeps the id of a food deleted later
+    food = models.ForeignKey(
+        FoodItem, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True,
+        related_name='diet_chart_entries'
+    )
+    food_name = models.CharField(max_length=255, null=True, blank=True)
+    serving_size = models.CharField(max_length=100, null=True, blank=True)
+    servings = models.FloatField(null=True, blank=True)
+    calories = models.IntegerField(null=True, blank=True)
+    item_details = models.JSONField(null=True, blank=True, help_text="Other item fields; null for a meal without items")
+    
+    class Meta:
+        db_table = 'diet_chart_meal_entries'
+        verbose_name = "Diet Chart Meal Entry"
+        verbose_name_plural = "Diet Chart Meal Entries"
+        ordering = ['day', 'meal_position', 'position']
+        indexes = [
+            models.Index(fields=['diet_chart', 'day'], name='diet_meal_entry_chart_day_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.diet_chart_id} day{self.day} {self.meal} #{self.position}"
+
+
+class DietChartGenerationJob(models.Model):
+    """Background generation of one diet chart, with each day stored as soon as it is planned"""
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    patient = models.ForeignKey(UnifiedPatient, on_delete=models.CASCADE, related_name='diet_chart_generation_jobs')
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='diet_chart_generation_jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    parameters = models.JSONField(default=dict, help_text="Chart name, type, dates, restrictions and dosha focus requested")
+    
+    # Progress: days land in daily_meals one at a time, in order
+    total_days = models.IntegerField(default=7)
+    days_generated = models.IntegerField(default=0)
+    daily_meals = models.JSONField(default=dict, blank=True)
+    diet_chart = models.ForeignKey(DietChart, on_delete=models.SET_NULL, null=True, blank=True, related_name='generation_jobs')
+    failure_message = models.TextField(blank=True)
+    
+    # Worker bookkeeping
+    attempts = models.PositiveSmallIntegerField(default=0)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'diet_chart_generation_jobs'
+        verbose_name = "Diet Chart Generation Job"
+        verbose_name_plural = "Diet Chart Generation Jobs"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'heartbeat_at'], name='diet_chart_job_status_hb_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Diet chart generation {self.id} ({self.status})"
+    
+    def is_finished(self):
+        return self.status in ['completed', 'failed']
+
+
+class DietChartRevision(models.Model):
+    """One version of a diet chart: a JSON Patch from the previous version, or a full snapshot"""
+    
+    KIND_CHOICES = [
+        ('snapshot', 'Snapshot'),
+        ('delta', 'Delta'),
+    ]
+    
+    SOURCE_CHOICES = [
+        ('create', 'Created'),
+        ('update', 'Updated'),
+        ('regenerate', 'Regenerated'),
+        ('patch', 'JSON Patch'),
+        ('baseline', 'History started'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    diet_chart = models.ForeignKey(DietChart, on_delete=models.CASCADE, related_name='revisions', db_index=False)
+    version = models.IntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default='update')
+    
+    # snapshot: {'daily_meals': ..., 'metadata': {...}}; delta: RFC 6902 operations over that document
+    snapshot = models.JSONField(null=True, blank=True)
+    operations = models.JSONField(default=list, blank=True)
+    size = models.PositiveIntegerField(default=0, help_text="Bytes of JSON stored for this revision")
+    
+    created_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='diet_chart_revisions'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'diet_chart_revisions'
+        verbose_name = "Diet Chart Revision"
+        verbose_name_plural = "Diet Chart Revisions"
+        ordering = ['diet_chart', '-version']
+        constraints = [
+            models.UniqueConstraint(fields=['diet_chart', 'version'], name='diet_chart_revision_version_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.diet_chart_id} v{self.version} ({self.kind})"
@@ -0,0 +1,10 @@
+"""
+Parsers for the diet_charts API
+"""
+from rest_framework.parsers import JSONParser
+
+
+class JSONPatchParser(JSONParser):
+    """Reads application/json-patch+json bodies (RFC 6902) like plain JSON"""
+
+    media_type = 'application/json-patch+json'
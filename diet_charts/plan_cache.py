@@ -0,0 +1,129 @@
+"""
+Meal Plan Cache for Aahaara Harmony
+Rendered meal plans keyed by a canonical hash of their planning inputs, so patients with
+the same dosha bucket, rounded calorie target, restrictions and chart length share a plan
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from django.conf import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class MealPlanCache:
+    """In-process LRU with per-entry TTL, emptied whenever the food catalog version changes
+
+    Entries are stored as JSON text, so every hit hands out its own copy of the plan.
+    """
+
+    def __init__(self):
+        self._entries: 'OrderedDict[str, Tuple[float, str]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_entries(self) -> int:
+        return getattr(settings, 'DIET_PLAN_CACHE_SIZE', 512)
+
+    @property
+    def ttl(self) -> int:
+        return getattr(settings, 'DIET_PLAN_CACHE_TTL', 3600)
+
+    @property
+    def calorie_step(self) -> int:
+        return getattr(settings, 'DIET_PLAN_CALORIE_STEP', 50)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def plan_target(self, target_calories: int) -> int:
+        """Calorie target a plan is solved for: rounded to the step when plans are shared"""
+        if not self.enabled:
+            return target_calories
+        step = self.calorie_step
+        return max(step, int(round(target_calories / step)) * step)
+
+    @staticmethod
+    def plan_key(bucket: str, plan_target: int, days: int, meal_distribution: Dict[str, float],
+                 restrictions: Dict) -> str:
+        """Canonical hash of everything a plan depends on besides the catalog"""
+        canonical = {
+            'bucket': bucket,
+            'calories': plan_target,
+            'days': days,
+            'meals': {meal: round(float(share), 4) for meal, share in meal_distribution.items()},
+            'restrictions': {key: sorted(set(values)) for key, values in restrictions.items() if values},
+        }
+        return hashlib.sha1(json.dumps(canonical, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+    def _check_version(self, version) -> bool:
+        """Move to version, dropping every entry; False for a version older than the cache's"""
+        # Plans name foods by id and calories, so a catalog change invalidates all of them
+        if version == self.version:
+            return True
+        if self.version is not None and version < self.version:
+            # A request still working from an older catalog must not evict newer plans
+            return False
+        if self._entries:
+            logger.info(f"Meal plan cache cleared: catalog v{self.version} -> v{version}")
+        self._entries.clear()
+        self.version = version
+        return True
+
+    def get(self, key: str, version) -> Optional[Tuple[Dict, Dict]]:
+        """(daily_meals, planner parameters) for key under this catalog version, or None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key) if self._check_version(version) else None
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            payload = entry[1]
+        daily_meals, parameters = json.loads(payload)
+        return daily_meals, parameters
+
+    def put(self, key: str, version, daily_meals: Dict, parameters: Dict):
+        if not self.enabled:
+            return
+        payload = json.dumps([daily_meals, parameters], separators=(',', ':'))
+        with self._lock:
+            if not self._check_version(version):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'catalog_version': self.version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+# Global instance
+meal_plan_cache = MealPlanCache()
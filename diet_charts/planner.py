@@ -0,0 +1,333 @@
+"""
+Meal Planner for Aahaara Harmony
+Builds diet chart meals from the FoodItem catalog: every candidate food and portion
+is scored at once against the meal's calorie share, the patient's dosha bucket and
+recent use, and each meal is filled greedily from the best-scoring picks
+"""
+import hashlib
+import logging
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+from food_database.models import FoodItem
+from food_database.substitution import BUCKET_NAMES, DOSHAS, food_substitutions, normalize_meal_type
+from .plan_cache import meal_plan_cache
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEAL_DISTRIBUTION = {
+    'breakfast': 0.25,
+    'brunch': 0.15,
+    'lunch': 0.30,
+    'snack': 0.10,
+    'dinner': 0.20,
+}
+
+DEFAULT_TARGET_CALORIES = 2000
+LIGHT_ACTIVITY_FACTOR = 1.375
+
+# Serving multiples a food can be planned at; straying from one serving costs PORTION_PENALTY per serving
+PORTIONS = (0.5, 1.0, 1.5, 2.0)
+PORTION_PENALTY = 0.15
+# Most foods combined into one meal
+MAX_ITEMS_PER_MEAL = 3
+# A meal within this share of its calorie target gets no further items
+CALORIE_TOLERANCE = 0.08
+# Greedy objective: dosha compatibility minus the calorie miss as a share of the meal target
+DOSHA_WEIGHT = 1.0
+CALORIE_WEIGHT = 3.0
+# A food planned on day d costs VARIETY_WEIGHT the next day, fading to nothing after VARIETY_DAYS;
+# using it twice on the same day costs SAME_DAY_PENALTY, which rules it out whenever anything else fits
+VARIETY_WEIGHT = 1.0
+VARIETY_DAYS = 7
+SAME_DAY_PENALTY = 10.0
+
+DETAIL_FIELDS = ['id', 'name', 'serving_size', 'calories', 'protein_g', 'carbs_g', 'fat_g', 'fiber_g',
+                 'food_category', 'display']
+MACRO_FIELDS = ['protein_g', 'carbs_g', 'fat_g', 'fiber_g']
+
+MEAL_TYPES = {choice for choice, _ in FoodItem.MEAL_TYPE_CHOICES}
+
+
+def _restriction_key(value: str) -> str:
+    return re.sub(r'[\s_-]+', ' ', str(value)).strip().casefold()
+
+
+def parse_restrictions(food_restrictions, tags, categories) -> Tuple[Dict[str, List[str]], List[str]]:
+    """Map DietChart.food_restrictions onto substitution table restrictions
+
+    A restriction naming a food tag ("Vegan", "gluten-free") requires that tag; "no X",
+    "non X", "without X" or "X-free" excludes tag or category X. Anything else is
+    returned in the second list, unapplied.
+    """
+    tags = {_restriction_key(tag): tag for tag in tags}
+    categories = {_restriction_key(category): category for category in categories}
+    restrictions = {'require_tags': [], 'exclude_tags': [], 'exclude_categories': []}
+    unrecognized = []
+
+    for restriction in food_restrictions or []:
+        key = _restriction_key(restriction)
+        if key in tags:
+            restrictions['require_tags'].append(tags[key])
+            continue
+        match = re.fullmatch(r'(?:no|non|without) (.+)', key) or re.fullmatch(r'(.+) free', key)
+        subject = match.group(1) if match else None
+        if subject in tags or subject in categories:
+            if subject in tags:
+                restrictions['exclude_tags'].append(tags[subject])
+            if subject in categories:
+                restrictions['exclude_categories'].append(categories[subject])
+        else:
+            unrecognized.append(restriction)
+    return restrictions, unrecognized
+
+
+def focus_bucket(dosha_focus) -> Optional[str]:
+    """Dosha bucket for an explicit DietChart.dosha_focus list, or None when it names no dosha"""
+    doshas = sorted({str(d).lower() for d in dosha_focus or []} & set(DOSHAS), key=DOSHAS.index)
+    if not doshas:
+        return None
+    if len(doshas) == len(DOSHAS):
+        return 'tridosha'
+    return '-'.join(doshas)
+
+
+def estimate_target_calories(patient, default: int = DEFAULT_TARGET_CALORIES) -> int:
+    """Daily calories from the patient's medical_data: Harris-Benedict BMR at light activity"""
+    try:
+        weight = float(patient.get_medical_data('weight'))
+        height = float(patient.get_medical_data('height'))
+        age = patient.age
+    except (TypeError, ValueError):
+        return default
+    if not weight or not height or age is None:
+        return default
+
+    if str(patient.get_medical_data('gender', '')).lower() == 'male':
+        bmr = 88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age)
+    else:
+        bmr = 447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age)
+    return int(bmr * LIGHT_ACTIVITY_FACTOR) if bmr > 0 else default
+
+
+def plan_parameters(table, bucket: str, restrictions: Dict, miss: float) -> Dict:
+    """What a catalog plan was built from, for DietChart.generation_parameters"""
+    return {
+        'planner': 'catalog',
+        'catalog_version': table.version,
+        'dosha_bucket': bucket,
+        'restrictions': {key: values for key, values in restrictions.items() if values},
+        'calorie_miss_percent': miss,
+    }
+
+
+def day_offset(variation_key, days: int) -> int:
+    """Stable per-patient rotation of a shared plan's days"""
+    if variation_key is None or days <= 1:
+        return 0
+    return int(hashlib.sha1(str(variation_key).encode('utf-8')).hexdigest()[:8], 16) % days
+
+
+def vary_plan(daily_meals: Dict, parameters: Dict, variation_key, unrecognized: List[str], plan_target: int,
+              cache_hit: bool) -> Tuple[Dict, Dict]:
+    """A patient's copy of a (possibly shared) plan, with its days rotated and its parameters completed"""
+    days = len(daily_meals)
+    offset = day_offset(variation_key, days)
+    if offset:
+        daily_meals = {f'day{day}': daily_meals[f'day{(day - 1 + offset) % days + 1}'] for day in range(1, days + 1)}
+    return daily_meals, {
+        **parameters,
+        'unrecognized_restrictions': unrecognized,
+        'plan_target_calories': plan_target,
+        'plan_cache': 'hit' if cache_hit else 'miss',
+        'day_offset': offset,
+    }
+
+
+def meal_name(items: List[Dict]) -> str:
+    """"Main with side, side" from a meal's items, main first"""
+    names = [item['name'] for item in items]
+    if len(names) == 1:
+        return names[0]
+    return f"{names[0]} with {', '.join(names[1:])}"
+
+
+class MealPlanner:
+    """Plans daily_meals over the substitution table's columns and compatibility matrix"""
+
+    @property
+    def is_available(self) -> bool:
+        return food_substitutions.is_available
+
+    def solve(self, table, bucket: str, target_calories: int, meal_distribution: Dict[str, float],
+              days: int, restrictions: Optional[Dict] = None,
+              history: Optional[Dict[int, int]] = None,
+              on_day: Optional[Callable[[int, Dict], None]] = None) -> List[Dict[str, List[Tuple[int, float]]]]:
+        """Per day, each meal's picks as (table row, servings)
+
+        history maps table rows to the (0-based, possibly negative) day they were last
+        used, so a partial plan keeps its distance from foods already in the chart.
+        on_day(day, day_plan) is called as each day is solved.
+        Raises ValueError when restrictions leave a meal with no candidate foods.
+        """
+        np = table.np
+        b = BUCKET_NAMES.index(bucket)
+        portions = np.array(PORTIONS, dtype=np.float32)
+        portion_cost = PORTION_PENALTY * np.abs(portions - 1)
+
+        # Candidate rows, portion calories and the day-independent part of the score, per meal
+        meals = []
+        for meal_key, share in meal_distribution.items():
+            target = target_calories * float(share)
+            if target <= 0:
+                continue
+            meal_type = normalize_meal_type(meal_key)
+            mask = table.eligible(meal_type if meal_type in MEAL_TYPES else None, restrictions)
+            rows = np.flatnonzero(mask & (table.calories > 0))
+            if not len(rows):
+                raise ValueError(f"No foods in the catalog can be planned for {meal_key} with these restrictions")
+            calories = table.calories[rows].astype(np.float32)[:, None] * portions
+            base = DOSHA_WEIGHT * table.compatibility[rows, b][:, None] - portion_cost
+            meals.append((meal_key, target, rows, calories, base))
+
+        # Day each food was last planned, for the variety penalty
+        last_used = np.full(len(table.ids), -VARIETY_DAYS, dtype=np.float32)
+        for row, day in (history or {}).items():
+            last_used[row] = day
+        plan = []
+        for day in range(days):
+            day_plan = {}
+            for meal_key, target, rows, calories, base in meals:
+                since = day - last_used[rows]
+                penalty = VARIETY_WEIGHT * np.clip(1 - since / VARIETY_DAYS, 0, 1)
+                penalty[since == 0] = SAME_DAY_PENALTY
+                score = base - penalty[:, None]
+
+                remaining = target
+                picks = []
+                for _ in range(MAX_ITEMS_PER_MEAL):
+                    total = score - CALORIE_WEIGHT * np.abs(remaining - calories) / target
+                    i, p = divmod(int(np.argmax(total)), len(PORTIONS))
+                    if np.isneginf(total[i, p]):
+                        break
+                    left = remaining - float(calories[i, p])
+                    # Side items are only added while they bring the meal closer to its target
+                    if picks and abs(left) >= abs(remaining):
+                        break
+                    picks.append((int(rows[i]), float(portions[p])))
+                    last_used[rows[i]] = day
+                    score[i, :] = -np.inf
+                    remaining = left
+                    if abs(remaining) <= CALORIE_TOLERANCE * target:
+                        break
+                day_plan[meal_key] = picks
+            plan.append(day_plan)
+            if on_day is not None:
+                on_day(day, day_plan)
+        return plan
+
+    def render(self, table, plan, foods: Dict[str, Dict], target_calories: int,
+               meal_distribution: Dict[str, float]) -> Tuple[Dict, float]:
+        """daily_meals JSON for a solved plan, and its mean calorie miss per meal in percent"""
+        daily_meals = {}
+        misses = []
+        for day, day_plan in enumerate(plan, 1):
+            meals = {}
+            for meal_key, picks in day_plan.items():
+                items = []
+                macros = dict.fromkeys(MACRO_FIELDS, 0.0)
+                for row, servings in picks:
+                    food = foods.get(table.ids[row])
+                    if food is None:
+                        # Deleted since the table was built
+                        continue
+                    items.append({
+                        'food_id': table.ids[row],
+                        'name': food['name'],
+                        'serving_size': food['serving_size'],
+                        'servings': servings,
+                        'calories': round(food['calories'] * servings),
+                    })
+                    for field in MACRO_FIELDS:
+                        macros[field] += float(food[field]) * servings
+                if not items:
+                    continue
+
+                main = foods[items[0]['food_id']]
+                target = round(target_calories * float(meal_distribution[meal_key]))
+                calories = sum(item['calories'] for item in items)
+                misses.append(abs(calories - target) / target)
+                meals[meal_key] = {
+                    'name': meal_name(items),
+                    'calories': calories,
+                    'description': f"{main['food_category']} - {(main['display'] or {}).get('dosha_balance', 'Neutral')}",
+                    'target_calories': target,
+                    **{field: round(value, 1) for field, value in macros.items()},
+                    'items': items,
+                }
+            daily_meals[f'day{day}'] = meals
+        miss = round(100 * sum(misses) / len(misses), 1) if misses else 0.0
+        return daily_meals, miss
+
+    def food_details(self, table, plans) -> Dict[str, Dict]:
+        """DETAIL_FIELDS of every food in the solved plans, in one query"""
+        ids = {
+            table.ids[row]
+            for plan in plans for day_plan in plan for picks in day_plan.values() for row, _ in picks
+        }
+        return {str(food['id']): food for food in FoodItem.objects.filter(id__in=ids).values(*DETAIL_FIELDS)}
+
+    def plan(self, target_calories: int, days: int, meal_distribution: Optional[Dict[str, float]] = None,
+             bucket: str = 'tridosha', food_restrictions=(), variation_key=None,
+             on_day: Optional[Callable[[str, Dict], None]] = None) -> Tuple[Dict, Dict]:
+        """daily_meals for a chart, and the planning parameters to store with it
+
+        Plans are solved for the target rounded to DIET_PLAN_CALORIE_STEP and memoized in
+        meal_plan_cache. Given a variation_key (e.g. the patient id), the shared plan's days
+        are rotated by an offset derived from it so patients sharing a plan differ day to day.
+        on_day(day_key, meals) receives each day as soon as it is ready; a plan solved this
+        way keeps its solve order (no rotation), so day 1 is never waiting on later days.
+        Raises ValueError when the restrictions cannot be met by the catalog.
+        """
+        meal_distribution = meal_distribution or DEFAULT_MEAL_DISTRIBUTION
+        table = food_substitutions.get_table()
+        restrictions, unrecognized = parse_restrictions(
+            food_restrictions, table.tags, set(table.categories.tolist())
+        )
+
+        plan_target = meal_plan_cache.plan_target(target_calories)
+        key = meal_plan_cache.plan_key(bucket, plan_target, days, meal_distribution, restrictions)
+        cached = meal_plan_cache.get(key, table.version)
+        if cached is not None:
+            daily_meals, parameters = cached
+        elif on_day is not None:
+            foods = {}
+
+            def render_day(day, day_plan):
+                foods.update(self.food_details(table, [[day_plan]]))
+                day_meals, _ = self.render(table, [day_plan], foods, plan_target, meal_distribution)
+                on_day(f'day{day + 1}', day_meals['day1'])
+
+            plan = self.solve(table, bucket, plan_target, meal_distribution, days, restrictions, on_day=render_day)
+            daily_meals, miss = self.render(table, plan, foods, plan_target, meal_distribution)
+            parameters = plan_parameters(table, bucket, restrictions, miss)
+            meal_plan_cache.put(key, table.version, daily_meals, parameters)
+            return vary_plan(daily_meals, parameters, None, unrecognized, plan_target, False)
+        else:
+            plan = self.solve(table, bucket, plan_target, meal_distribution, days, restrictions)
+            foods = self.food_details(table, [plan])
+            daily_meals, miss = self.render(table, plan, foods, plan_target, meal_distribution)
+            parameters = plan_parameters(table, bucket, restrictions, miss)
+            meal_plan_cache.put(key, table.version, daily_meals, parameters)
+
+        daily_meals, parameters = vary_plan(
+            daily_meals, parameters, variation_key, unrecognized, plan_target, cached is not None
+        )
+        if on_day is not None:
+            for day_key, meals in daily_meals.items():
+                on_day(day_key, meals)
+        return daily_meals, parameters
+
+
+# Global instance
+meal_planner = MealPlanner()
@@ -0,0 +1,16 @@
+"""
+Renderers for the diet_charts API
+"""
+from rest_framework.renderers import BaseRenderer
+from .jobs import server_sent_event
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets views answer text/event-stream requests; regular responses (errors) become one 'failed' event"""
+
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return server_sent_event('failed', data).encode(self.charset)
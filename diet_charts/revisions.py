@@ -0,0 +1,176 @@
+"""
+Diet Chart Revisions for Aahaara Harmony
+Records every version of a diet chart as a JSON Patch from the version before, with a full
+snapshot only once the patches add up to a chart's size, so history grows with the edits
+"""
+import json
+import logging
+from typing import Dict, List, Optional, Sequence
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Sum
+from .json_patch import apply_operations, diff_documents
+from .meal_entries import meal_entry_storage
+from .models import DietChart, DietChartMealEntry, DietChartRevision
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Chart fields kept in history besides daily_meals
+REVISION_FIELDS = [
+    'chart_name', 'chart_type', 'status', 'start_date', 'end_date', 'total_days', 'target_calories',
+    'meal_distribution', 'dosha_focus', 'food_restrictions', 'patient_preferences', 'notes',
+]
+
+
+class VersionConflict(ValueError):
+    """Raised when a chart being saved was saved elsewhere since it was loaded"""
+
+    def __init__(self, version: int):
+        super().__init__(f'Diet chart is now at version {version}')
+        self.version = version
+
+
+def json_value(value):
+    """value as it reads back from a JSON column (dates become ISO strings)"""
+    return json.loads(json.dumps(value, cls=DjangoJSONEncoder))
+
+
+def payload_size(value) -> int:
+    return len(json.dumps(value, cls=DjangoJSONEncoder, separators=(',', ':')))
+
+
+def build_state(daily_meals, metadata: Dict) -> Dict:
+    """The versioned document of a chart: {'daily_meals': ..., 'metadata': {field: value}}"""
+    return {'daily_meals': json_value(daily_meals or {}), 'metadata': json_value(metadata)}
+
+
+class DietChartRevisionService:
+    """Writes DietChartRevision rows as charts change and rebuilds any recorded version"""
+
+    @property
+    def snapshot_interval(self) -> int:
+        return max(1, getattr(settings, 'DIET_CHART_REVISION_SNAPSHOT_INTERVAL', 100))
+
+    @staticmethod
+    def _metadata(chart, fields: Sequence[str] = REVISION_FIELDS) -> Dict:
+        return {
+            field: DietChart._meta.get_field(field).to_python(getattr(chart, field)) for field in fields
+        }
+
+    def chart_state(self, chart) -> Dict:
+        return build_state(chart.daily_meals, self._metadata(chart))
+
+    def changes(self, chart, update_fields=None) -> Optional[List[Dict]]:
+        """Operations from the stored version of an existing chart to the one being saved
+
+        Only the fields being saved are compared, and a normalized chart's meals only when
+        they were edited. None when nothing in the history changes. Call inside the save's
+        transaction: the chart row stays locked until it commits, so concurrent saves take
+        turns, and VersionConflict is raised when the stored version is no longer the one
+        the chart was loaded at.
+        """
+        fields = [field for field in REVISION_FIELDS if update_fields is None or field in update_fields]
+        meals = (update_fields is None or 'daily_meals' in update_fields) and 'daily_meals' in chart.__dict__
+        if meals and getattr(chart, '_loaded_storage', None) == 'normalized':
+            meals = meal_entry_storage.has_changes(chart)
+        if not fields and not meals:
+            return None
+
+        stored = DietChart.objects.select_for_update().filter(pk=chart.pk).values(
+            'version', 'storage', *fields, *(['daily_meals'] if meals else [])
+        ).first()
+        if stored is None:
+            return None
+        if stored['version'] != chart.version:
+            raise VersionConflict(stored['version'])
+        old = {'metadata': json_value({field: stored[field] for field in fields})}
+        new = {'metadata': json_value(self._metadata(chart, fields))}
+        if meals:
+            if stored['storage'] == 'normalized':
+                stored['daily_meals'] = meal_entry_storage.materialize(
+                    DietChartMealEntry.objects.filter(diet_chart_id=chart.pk)
+                )
+            old['daily_meals'] = json_value(stored['daily_meals'] or {})
+            new['daily_meals'] = json_value(chart.daily_meals or {})
+
+        operations = diff_documents(old, new)
+        if not operations:
+            return None
+        chart.version = stored['version'] + 1
+        return operations
+
+    def snapshot(self, chart, source: str = 'create', user_id=None) -> DietChartRevision:
+        """Record a chart's current version in full"""
+        state = self.chart_state(chart)
+        return DietChartRevision.objects.create(
+            diet_chart_id=chart.pk, version=chart.version, kind='snapshot', source=source,
+            snapshot=state, size=payload_size(state), created_by_id=user_id,
+        )
+
+    def snapshot_many(self, charts: Sequence, source: str = 'create', user_id=None):
+        """Snapshots for freshly bulk-created charts, in one insert"""
+        revisions = []
+        for chart in charts:
+            state = self.chart_state(chart)
+            revisions.append(DietChartRevision(
+                diet_chart_id=chart.pk, version=chart.version, kind='snapshot', source=source,
+                snapshot=state, size=payload_size(state), created_by_id=user_id,
+            ))
+        DietChartRevision.objects.bulk_create(revisions, batch_size=500)
+
+    def record(self, chart_id, version: int, operations: List[Dict], source: str,
+               user_id=None) -> DietChartRevision:
+        """Record version of a chart as the operations from the previous version
+
+        A snapshot is stored instead once the deltas since the last snapshot add up to its
+        size (so history stays proportional to the edits), after snapshot_interval versions
+        (bounding reconstruction), or when the chart has no snapshot yet. Call inside the
+        update's transaction.
+        """
+        revisions = DietChartRevision.objects.filter(diet_chart_id=chart_id)
+        size = payload_size(operations)
+        last_snapshot = revisions.filter(kind='snapshot').order_by('-version').values('version', 'size').first()
+        due = last_snapshot is None or version - last_snapshot['version'] >= self.snapshot_interval
+        if not due:
+            since = revisions.filter(version__gt=last_snapshot['version']).aggregate(total=Sum('size'))['total']
+            due = (since or 0) + size >= last_snapshot['size']
+        if due:
+            state = self.chart_state(DietChart.objects.get(pk=chart_id))
+            return DietChartRevision.objects.create(
+                diet_chart_id=chart_id, version=version, kind='snapshot', source=source,
+                snapshot=state, size=payload_size(state), created_by_id=user_id,
+            )
+        return DietChartRevision.objects.create(
+            diet_chart_id=chart_id, version=version, kind='delta', source=source,
+            operations=operations, size=size, created_by_id=user_id,
+        )
+
+    def reconstruct(self, chart_id, version: int) -> Dict:
+        """A chart's document at version: its latest snapshot up to there plus the deltas after it
+
+        Raises ValueError when the version is not in the recorded history.
+        """
+        snapshot = DietChartRevision.objects.filter(
+            diet_chart_id=chart_id, kind='snapshot', version__lte=version
+        ).order_by('-version').first()
+        if snapshot is None:
+            raise ValueError(f'Version {version} is not in the chart history')
+        deltas = list(DietChartRevision.objects.filter(
+            diet_chart_id=chart_id, version__gt=snapshot.version, version__lte=version
+        ).order_by('version').only('version', 'operations'))
+        if [delta.version for delta in deltas] != list(range(snapshot.version + 1, version + 1)):
+            raise ValueError(f'Version {version} is not in the chart history')
+
+        state = snapshot.snapshot
+        for delta in deltas:
+            state = apply_operations(state, delta.operations)
+        return state
+
+    def diff(self, chart_id, from_version: int, to_version: int) -> List[Dict]:
+        """Operations turning version from_version of a chart into to_version"""
+        return diff_documents(self.reconstruct(chart_id, from_version), self.reconstruct(chart_id, to_version))
+
+
+# Global instance
+diet_chart_revisions = DietChartRevisionService()
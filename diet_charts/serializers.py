@@ -1,5 +1,29 @@
 from rest_framework import serializers
-from .models import DietChart
+from .models import DietChart, DietChartGenerationJob, DietChartRevision
+from .generation import diet_chart_generator
+
+
+def validate_day_meals(day_key, day_data, meal_keys=None):
+    """Validate one day of daily_meals, or only the given meals of it."""
+    if not isinstance(day_data, dict):
+        raise serializers.ValidationError(f"Day {day_key} must be an object.")
+    
+    for meal_key in day_data if meal_keys is None else meal_keys:
+        if meal_key not in day_data:
+            continue
+        meal_data = day_data[meal_key]
+        if not isinstance(meal_data, dict):
+            raise serializers.ValidationError(f"Meal {meal_key} in {day_key} must be an object.")
+        
+        # Validate required meal fields
+        required_fields = ['name', 'calories']
+        for field in required_fields:
+            if field not in meal_data:
+                raise serializers.ValidationError(f"Meal {meal_key} in {day_key} must have {field}.")
+        
+        # Validate calories is positive
+        if meal_data.get('calories', 0) < 0:
+            raise serializers.ValidationError(f"Meal {meal_key} in {day_key} calories must be non-negative.")
 
 
 class DietChartSerializer(serializers.ModelSerializer):
@@ -8,8 +32,6 @@ class DietChartSerializer(serializers.ModelSerializer):
     # Computed fields
     patient_name = serializers.ReadOnlyField()
     created_by_name = serializers.ReadOnlyField()
-    total_calories = serializers.SerializerMethodField()
-    meal_count = serializers.SerializerMethodField()
     is_active = serializers.SerializerMethodField()
     can_be_modified = serializers.SerializerMethodField()
     
@@ -20,19 +42,15 @@ class DietChartSerializer(serializers.ModelSerializer):
             'start_date', 'end_date', 'total_days', 'prakriti_analysis', 'disease_analysis',
             'patient_preferences', 'target_calories', 'meal_distribution', 'dosha_focus',
             'food_restrictions', 'daily_meals', 'notes', 'is_ai_generated',
-            'generation_parameters', 'version', 'created_at', 'updated_at',
-            'patient_name', 'created_by_name', 'total_calories', 'meal_count',
+            'generation_parameters', 'version', 'storage', 'created_at', 'updated_at',
+            'patient_name', 'created_by_name', 'total_calories', 'meal_count', 'day_calories',
+            'total_protein_g', 'total_carbs_g', 'total_fat_g', 'total_fiber_g',
             'is_active', 'can_be_modified'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'version']
-    
-    def get_total_calories(self, obj):
-        """Get total calories for the entire chart."""
-        return obj.get_total_calories()
-    
-    def get_meal_count(self, obj):
-        """Get the total number of meals in the chart."""
-        return obj.get_meal_count()
+        read_only_fields = [
+            'id', 'created_at', 'updated_at', 'version', 'storage', 'total_calories', 'meal_count',
+            'day_calories', 'total_protein_g', 'total_carbs_g', 'total_fat_g', 'total_fiber_g'
+        ]
     
     def get_is_active(self, obj):
         """Check if the chart is currently active."""
@@ -84,22 +102,7 @@ class DietChartCreateSerializer(serializers.ModelSerializer):
         
         # Validate structure
         for day_key, day_data in value.items():
-            if not isinstance(day_data, dict):
-                raise serializers.ValidationError(f"Day {day_key} must be an object.")
-            
-            for meal_key, meal_data in day_data.items():
-                if not isinstance(meal_data, dict):
-                    raise serializers.ValidationError(f"Meal {meal_key} in {day_key} must be an object.")
-                
-                # Validate required meal fields
-                required_fields = ['name', 'calories']
-                for field in required_fields:
-                    if field not in meal_data:
-                        raise serializers.ValidationError(f"Meal {meal_key} in {day_key} must have {field}.")
-                
-                # Validate calories is positive
-                if meal_data.get('calories', 0) < 0:
-                    raise serializers.ValidationError(f"Meal {meal_key} in {day_key} calories must be non-negative.")
+            validate_day_meals(day_key, day_data)
         
         return value
     
@@ -159,8 +162,6 @@ class DietChartSummarySerializer(serializers.ModelSerializer):
     
     patient_name = serializers.ReadOnlyField()
     created_by_name = serializers.ReadOnlyField()
-    total_calories = serializers.SerializerMethodField()
-    meal_count = serializers.SerializerMethodField()
     
     class Meta:
         model = DietChart
@@ -169,9 +170,73 @@ class DietChartSummarySerializer(serializers.ModelSerializer):
             'total_days', 'target_calories', 'created_at', 'patient_name',
             'created_by_name', 'total_calories', 'meal_count'
         ]
+        read_only_fields = ['total_calories', 'meal_count']
+
+
+class DietChartBatchGenerateSerializer(serializers.Serializer):
+    """Validate a batch (cohort) diet chart generation request."""
+    
+    patient_ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+    chart_type = serializers.ChoiceField(choices=DietChart.CHART_TYPE_CHOICES, default='7_day')
+    chart_name = serializers.CharField(max_length=255, default='Generated Diet Chart')
+    start_date = serializers.DateField(required=False)
+    food_restrictions = serializers.ListField(child=serializers.CharField(max_length=50), default=list)
+    dosha_focus = serializers.ListField(child=serializers.CharField(max_length=50), default=list)
+    
+    def validate_patient_ids(self, value):
+        """Cap the cohort size so one request cannot hold a worker for too long."""
+        max_patients = diet_chart_generator.max_patients
+        if len(value) > max_patients:
+            raise serializers.ValidationError(f"At most {max_patients} patients per batch.")
+        return value
+
+
+class DietChartGenerationJobCreateSerializer(serializers.Serializer):
+    """Validate a background diet chart generation request."""
     
-    def get_total_calories(self, obj):
-        return obj.get_total_calories()
+    patient_id = serializers.UUIDField()
+    chart_type = serializers.ChoiceField(choices=DietChart.CHART_TYPE_CHOICES, default='7_day')
+    chart_name = serializers.CharField(max_length=255, default='Generated Diet Chart')
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    food_restrictions = serializers.ListField(child=serializers.CharField(max_length=50), default=list)
+    dosha_focus = serializers.ListField(child=serializers.CharField(max_length=50), default=list)
     
-    def get_meal_count(self, obj):
-        return obj.get_meal_count()
\ No newline at end of file
+    def validate(self, data):
+        if data.get('start_date') and data.get('end_date') and data['start_date'] > data['end_date']:
+            raise serializers.ValidationError("Start date must be before or equal to end date.")
+        return data
+
+
+class DietChartGenerationJobSerializer(serializers.ModelSerializer):
+    """Serializer for background diet chart generation progress"""
+    
+    progress_percent = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = DietChartGenerationJob
+        fields = [
+            'id', 'patient', 'status', 'parameters', 'total_days', 'days_generated', 'progress_percent',
+            'diet_chart', 'failure_message', 'attempts', 'created_at', 'heartbeat_at', 'finished_at'
+        ]
+        read_only_fields = fields
+    
+    def get_progress_percent(self, obj):
+        if obj.status == 'completed':
+            return 100.0
+        if not obj.total_days:
+            return 0.0
+        return round(min(obj.days_generated / obj.total_days, 1) * 100, 1)
+
+
+class DietChartRevisionSerializer(serializers.ModelSerializer):
+    """Serializer for diet chart history entries (snapshots are left out; see the version endpoint)"""
+    
+    created_by_name = serializers.CharField(source='created_by.full_name', read_only=True, default=None)
+    
+    class Meta:
+        model = DietChartRevision
+        fields = [
+            'id', 'version', 'kind', 'source', 'operations', 'size', 'created_by', 'created_by_name', 'created_at'
+        ]
+        read_only_fields = fields
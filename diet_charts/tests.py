@@ -1,3 +1,765 @@
-from django.test import TestCase
+import copy
+import datetime
+import io
+import json
+import uuid
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from authentication.models import User, UnifiedPatient
+from food_database.models import CATALOG_STATE_CACHE_KEY, FoodItem
+from food_database.substitution import food_substitutions, normalize_meal_type
+from .jobs import diet_chart_jobs
+from .json_patch import apply_operations
+from .models import DietChart, DietChartGenerationJob, DietChartRevision, chart_aggregates
+from .plan_cache import MealPlanCache, meal_plan_cache
+from .planner import CALORIE_TOLERANCE, DEFAULT_TARGET_CALORIES, day_offset, estimate_target_calories, meal_planner
+from .revisions import VersionConflict, diet_chart_revisions
+from .views import DietChartDetailView
 
-# Create your tests here.
+
+DAILY_MEALS = {
+    'day1': {
+        'breakfast': {'name': 'Oats Porridge', 'calories': 300, 'protein_g': 10, 'items': [{'name': 'Oats'}]},
+        'lunch': {'name': 'Rice and Dal', 'calories': 600, 'protein_g': 20, 'description': 'Light lunch',
+                  'items': [{'name': 'Rice'}, {'name': 'Moong Dal'}]},
+    },
+    'day2': {
+        'breakfast': {'name': 'Poha', 'calories': 350, 'protein_g': 8},
+        'dinner': {'name': 'Khichdi', 'calories': 450, 'protein_g': 15},
+    },
+}
+
+
+def make_chart(user, patient, daily_meals=None, **fields):
+    values = {
+        'chart_name': 'Test chart', 'start_date': datetime.date(2026, 1, 1),
+        'end_date': datetime.date(2026, 1, 7), 'daily_meals': copy.deepcopy(daily_meals or DAILY_MEALS),
+    }
+    values.update(fields)
+    return DietChart.objects.create(patient=patient, created_by=user, **values)
+
+
+class DietChartTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(username='doctor', email='doctor@example.com', password='x', role='doctor')
+        patient_user = User.objects.create_user(username='patient', email='patient@example.com', password='x')
+        cls.patient = UnifiedPatient.objects.create(user=patient_user, patient_id='P-1')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor)
+
+    def assertAggregatesMatch(self, chart):
+        chart.refresh_from_db()
+        for field, value in chart_aggregates(chart.daily_meals).items():
+            self.assertEqual(getattr(chart, field), value, field)
+
+
+class DietChartListTests(DietChartTestCase):
+
+    def test_patient_charts_come_from_the_aggregate_columns(self):
+        make_chart(self.doctor, self.patient)
+        with override_settings(DIET_CHART_STORAGE='normalized'):
+            make_chart(self.doctor, self.patient)
+        # One query: neither daily_meals nor meal entries are loaded
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/diet-charts/patient/{self.patient.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([chart['total_calories'] for chart in response.data], [1700, 1700])
+        self.assertEqual([chart['meal_count'] for chart in response.data], [4, 4])
+
+    def test_summaries_filter_and_order_by_totals(self):
+        light = make_chart(self.doctor, self.patient, {'day1': DAILY_MEALS['day2']})
+        full = make_chart(self.doctor, self.patient)
+        self.assertAggregatesMatch(light)
+        self.assertAggregatesMatch(full)
+
+        response = self.client.get('/api/diet-charts/summaries/', {'ordering': '-total_calories'})
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertEqual([chart['id'] for chart in results], [str(full.pk), str(light.pk)])
+
+        response = self.client.get('/api/diet-charts/summaries/', {'total_calories_max': 1000})
+        results = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertEqual([chart['id'] for chart in results], [str(light.pk)])
+
+    def test_saving_other_fields_keeps_the_totals(self):
+        chart = make_chart(self.doctor, self.patient)
+        chart.daily_meals['day1']['lunch']['calories'] = 900
+        chart.status = 'active'
+        chart.save(update_fields=['status'])
+        chart.refresh_from_db()
+        self.assertEqual(chart.total_calories, 1700)
+
+
+class JSONPatchTests(DietChartTestCase):
+    """PATCH /<id>/daily-meals/ against the stored document"""
+
+    def patch(self, chart, operations, query=''):
+        return self.client.generic(
+            'PATCH', f'/api/diet-charts/{chart.pk}/daily-meals/{query}',
+            json.dumps(operations), content_type='application/json-patch+json'
+        )
+
+    def assertStored(self, chart, expected):
+        chart.refresh_from_db()
+        self.assertEqual(chart.daily_meals, expected)
+        self.assertAggregatesMatch(chart)
+
+    def test_replace_with_null(self):
+        chart = make_chart(self.doctor, self.patient)
+        response = self.patch(chart, [{'op': 'replace', 'path': '/day1/lunch/description', 'value': None}])
+        self.assertEqual(response.status_code, 200)
+        expected = copy.deepcopy(DAILY_MEALS)
+        expected['day1']['lunch']['description'] = None
+        self.assertStored(chart, expected)
+
+    def test_array_insert_and_append(self):
+        chart = make_chart(self.doctor, self.patient)
+        response = self.patch(chart, [
+            {'op': 'add', 'path': '/day1/lunch/items/1', 'value': {'name': 'Ghee'}},
+            {'op': 'add', 'path': '/day1/lunch/items/-', 'value': {'name': 'Salt'}},
+        ])
+        self.assertEqual(response.status_code, 200)
+        expected = copy.deepcopy(DAILY_MEALS)
+        expected['day1']['lunch']['items'] = [{'name': 'Rice'}, {'name': 'Ghee'}, {'name': 'Moong Dal'}, {'name': 'Salt'}]
+        self.assertStored(chart, expected)
+
+    def test_move_between_days(self):
+        chart = make_chart(self.doctor, self.patient)
+        response = self.patch(chart, [{'op': 'move', 'from': '/day1/breakfast', 'path': '/day2/brunch'}])
+        self.assertEqual(response.status_code, 200)
+        expected = copy.deepcopy(DAILY_MEALS)
+        expected['day2']['brunch'] = expected['day1'].pop('breakfast')
+        self.assertStored(chart, expected)
+
+    def test_remove_day(self):
+        chart = make_chart(self.doctor, self.patient)
+        response = self.patch(chart, [{'op': 'remove', 'path': '/day2'}])
+        self.assertEqual(response.status_code, 200)
+        self.assertStored(chart, {'day1': DAILY_MEALS['day1']})
+        self.assertNotIn('day2', chart.day_calories)
+
+    def test_failed_test_leaves_chart_unchanged(self):
+        chart = make_chart(self.doctor, self.patient)
+        response = self.patch(chart, [
+            {'op': 'remove', 'path': '/day2'},
+            {'op': 'test', 'path': '/day1/lunch/calories', 'value': 1},
+        ])
+        self.assertEqual(response.status_code, 422)
+        self.assertStored(chart, DAILY_MEALS)
+
+    def test_stale_version_conflicts(self):
+        chart = make_chart(self.doctor, self.patient)
+        response = self.patch(chart, [{'op': 'remove', 'path': '/day2'}], f'?version={chart.version - 1}')
+        self.assertEqual(response.status_code, 409)
+        self.assertStored(chart, DAILY_MEALS)
+
+    def test_copy_after_passing_test(self):
+        chart = make_chart(self.doctor, self.patient)
+        response = self.patch(chart, [
+            {'op': 'test', 'path': '/day2/dinner/name', 'value': 'Khichdi'},
+            {'op': 'copy', 'from': '/day2/dinner', 'path': '/day1/dinner'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['version'], chart.version + 1)
+        expected = copy.deepcopy(DAILY_MEALS)
+        expected['day1']['dinner'] = expected['day2']['dinner']
+        self.assertStored(chart, expected)
+
+    def test_missing_targets_are_unprocessable(self):
+        chart = make_chart(self.doctor, self.patient)
+        for operation in [
+            {'op': 'replace', 'path': '/day1/dinner/calories', 'value': 1},
+            {'op': 'remove', 'path': '/day1/lunch/items/5'},
+            {'op': 'add', 'path': '/day1/lunch/items/x', 'value': {'name': 'Salt'}},
+        ]:
+            response = self.patch(chart, [operation])
+            self.assertEqual(response.status_code, 422, operation)
+        self.assertStored(chart, DAILY_MEALS)
+
+    def test_malformed_patches_are_bad_requests(self):
+        chart = make_chart(self.doctor, self.patient)
+        for operations in [[], [{'op': 'frobnicate', 'path': '/day1'}], [{'op': 'remove', 'path': '/notes'}]]:
+            response = self.patch(chart, operations)
+            self.assertEqual(response.status_code, 400, operations)
+        self.assertStored(chart, DAILY_MEALS)
+
+    @override_settings(DIET_CHART_STORAGE='normalized')
+    def test_normalized_chart_rewrites_only_touched_days(self):
+        chart = make_chart(self.doctor, self.patient)
+        day1_entries = list(chart.meal_entries.filter(day=1).values_list('id', flat=True))
+        response = self.patch(chart, [
+            {'op': 'replace', 'path': '/day2/dinner/calories', 'value': 500},
+            {'op': 'add', 'path': '/day3', 'value': {}},
+        ])
+        self.assertEqual(response.status_code, 200)
+        expected = copy.deepcopy(DAILY_MEALS)
+        expected['day2']['dinner']['calories'] = 500
+        expected['day3'] = {}
+        self.assertStored(chart, expected)
+        self.assertEqual(list(chart.meal_entries.filter(day=1).values_list('id', flat=True)), day1_entries)
+
+
+MEAL_DISTRIBUTION = {'breakfast': 0.3, 'lunch': 0.4, 'dinner': 0.3}
+
+CATALOG = [
+    # name, calories, meal types, category, tags
+    ('Poha', 250, ['Breakfast'], 'Grains', ['Vegan']),
+    ('Upma', 280, ['Breakfast'], 'Grains', ['Vegan']),
+    ('Idli', 180, ['Breakfast'], 'Grains', ['Vegan']),
+    ('Oats Porridge', 220, ['Breakfast'], 'Grains', ['Vegan']),
+    ('Banana', 100, ['Breakfast'], 'Fruits', ['Vegan']),
+    ('Paneer Paratha', 380, ['Breakfast'], 'Dairy', []),
+    ('Basmati Rice', 300, ['Lunch'], 'Grains', ['Vegan']),
+    ('Moong Dal', 220, ['Lunch', 'Dinner'], 'Legumes', ['Vegan']),
+    ('Paneer Curry', 360, ['Lunch'], 'Dairy', []),
+    ('Roti', 120, ['Lunch', 'Dinner'], 'Grains', ['Vegan']),
+    ('Mixed Sabzi', 160, ['Lunch', 'Dinner'], 'Vegetables', ['Vegan']),
+    ('Curd', 100, ['Lunch'], 'Dairy', []),
+    ('Khichdi', 380, ['Dinner'], 'Grains', ['Vegan']),
+    ('Vegetable Soup', 140, ['Dinner'], 'Vegetables', ['Vegan']),
+    ('Curd Rice', 320, ['Dinner'], 'Dairy', []),
+    ('Millet Roti', 130, ['Dinner'], 'Grains', ['Vegan']),
+]
+
+
+def make_food(user, name, calories, meal_types, food_category='Grains', tags=()):
+    return FoodItem.objects.create(
+        name=name, serving_size='1 bowl', calories=calories, protein_g=5, carbs_g=30, fat_g=5, fiber_g=2,
+        rasa=['Sweet'], guna=['Light'], virya='Neutral', vata_effect='pacifies', pitta_effect='pacifies',
+        kapha_effect='neutral', meal_types=meal_types, food_category=food_category, tags=list(tags),
+        created_by=user,
+    )
+
+
+class MealPlanningTestCase(DietChartTestCase):
+    """A small catalog, with the in-process planning caches emptied before each test"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for food in CATALOG:
+            make_food(cls.doctor, *food)
+        cls.foods = {food.name: food for food in FoodItem.objects.all()}
+        cls.foods_by_id = {str(food.id): food for food in cls.foods.values()}
+
+    def setUp(self):
+        super().setUp()
+        # Catalog versions repeat between rolled-back tests, so version-keyed caches would go stale
+        cache.delete(CATALOG_STATE_CACHE_KEY)
+        food_substitutions.table = None
+        meal_plan_cache.clear()
+        meal_plan_cache.version = None
+
+    def plan(self, days=7, target_calories=1800, **kwargs):
+        return meal_planner.plan(target_calories, days, MEAL_DISTRIBUTION, **kwargs)
+
+    def food_ids(self, meal):
+        return [item['food_id'] for item in meal['items']]
+
+
+class MealPlannerTests(MealPlanningTestCase):
+
+    def test_meals_come_within_tolerance_of_their_share(self):
+        daily_meals, parameters = self.plan()
+        self.assertEqual(list(daily_meals), [f'day{day}' for day in range(1, 8)])
+        for day_key, meals in daily_meals.items():
+            self.assertEqual(list(meals), list(MEAL_DISTRIBUTION))
+            for meal_key, meal in meals.items():
+                self.assertEqual(meal['target_calories'], 1800 * MEAL_DISTRIBUTION[meal_key])
+                self.assertEqual(meal['calories'], sum(item['calories'] for item in meal['items']))
+                self.assertLessEqual(
+                    abs(meal['calories'] - meal['target_calories']), CALORIE_TOLERANCE * meal['target_calories'],
+                    f'{day_key} {meal_key}'
+                )
+        self.assertLessEqual(parameters['calorie_miss_percent'], 100 * CALORIE_TOLERANCE)
+
+    def test_items_are_served_at_their_meal(self):
+        daily_meals, _ = self.plan()
+        for meals in daily_meals.values():
+            for meal_key, meal in meals.items():
+                for food_id in self.food_ids(meal):
+                    self.assertIn(normalize_meal_type(meal_key), self.foods_by_id[food_id].meal_types)
+
+    def test_restrictions_select_foods(self):
+        daily_meals, parameters = self.plan(food_restrictions=['Vegan', 'no dairy', 'low sodium'])
+        self.assertEqual(parameters['restrictions'], {'require_tags': ['Vegan'], 'exclude_categories': ['Dairy']})
+        self.assertEqual(parameters['unrecognized_restrictions'], ['low sodium'])
+        for meals in daily_meals.values():
+            for meal in meals.values():
+                for food_id in self.food_ids(meal):
+                    food = self.foods_by_id[food_id]
+                    self.assertIn('Vegan', food.tags)
+                    self.assertNotEqual(food.food_category, 'Dairy')
+
+    def test_restrictions_leaving_a_meal_empty_raise(self):
+        # Every vegan breakfast food is a grain or a fruit
+        with self.assertRaisesMessage(ValueError, 'breakfast'):
+            self.plan(food_restrictions=['Vegan', 'grains-free', 'no fruits'])
+
+    def test_foods_vary_within_and_across_days(self):
+        def meal_foods(daily_meals):
+            return {
+                meal_key: {food_id for meals in daily_meals.values() for food_id in self.food_ids(meals[meal_key])}
+                for meal_key in MEAL_DISTRIBUTION
+            }
+
+        daily_meals, _ = self.plan()
+        for meals in daily_meals.values():
+            food_ids = [food_id for meal in meals.values() for food_id in self.food_ids(meal)]
+            self.assertEqual(len(food_ids), len(set(food_ids)))
+        varied = meal_foods(daily_meals)
+
+        # Without the variety penalty every day repeats the best calorie match
+        meal_plan_cache.clear()
+        with mock.patch('diet_charts.planner.VARIETY_WEIGHT', 0):
+            repeated = meal_foods(self.plan()[0])
+        for meal_key in MEAL_DISTRIBUTION:
+            self.assertGreaterEqual(len(varied[meal_key]), 4, meal_key)
+            self.assertGreater(len(varied[meal_key]), len(repeated[meal_key]), meal_key)
+
+    def test_target_calories_come_from_medical_data(self):
+        self.assertEqual(estimate_target_calories(self.patient), DEFAULT_TARGET_CALORIES)
+        self.patient.medical_data = {'weight': 60, 'height': 165, 'gender': 'female', 'date_of_birth': '1990-05-01'}
+        self.assertNotEqual(estimate_target_calories(self.patient), DEFAULT_TARGET_CALORIES)
+
+    def test_generate_plans_from_the_catalog(self):
+        # The default distribution also plans a brunch and a snack
+        make_food(self.doctor, 'Fruit Chaat', 150, ['Brunch', 'Snacks'], 'Fruits', ['Vegan'])
+        make_food(self.doctor, 'Roasted Chana', 120, ['Brunch', 'Snacks'], 'Legumes', ['Vegan'])
+        response = self.client.post('/api/diet-charts/generate/', {
+            'patient_id': str(self.patient.id), 'dosha_focus': ['Vata'], 'food_restrictions': ['Vegan'],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        chart = DietChart.objects.get(id=response.data['id'])
+        self.assertEqual(chart.generation_parameters['planner'], 'catalog')
+        self.assertEqual(chart.generation_parameters['dosha_bucket'], 'vata')
+        self.assertEqual(len(chart.daily_meals), 7)
+        for meals in chart.daily_meals.values():
+            for meal in meals.values():
+                for food_id in self.food_ids(meal):
+                    self.assertIn('Vegan', FoodItem.objects.get(id=food_id).tags)
+
+
+class BatchGenerationTests(MealPlanningTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # The default distribution also plans a brunch and a snack
+        make_food(cls.doctor, 'Fruit Chaat', 150, ['Brunch', 'Snacks'], 'Fruits', ['Vegan'])
+        make_food(cls.doctor, 'Roasted Chana', 120, ['Brunch', 'Snacks'], 'Legumes', ['Vegan'])
+        patient_user = User.objects.create_user(username='patient2', email='patient2@example.com', password='x')
+        cls.other_patient = UnifiedPatient.objects.create(user=patient_user, patient_id='P-2')
+
+    def test_endpoint_creates_a_chart_per_patient(self):
+        missing = uuid.uuid4()
+        response = self.client.post('/api/diet-charts/generate/batch/', {
+            'patient_ids': [str(self.patient.id), str(self.other_patient.id), str(missing)],
+            'food_restrictions': ['Vegan'],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created_count'], response.data['failed_count']), (2, 1))
+        self.assertEqual(response.data['failures'], [{'patient_id': str(missing), 'error': 'Patient not found'}])
+        # Requests solve serially; only the command forks a pool
+        self.assertEqual(response.data['workers'], 1)
+
+        charts = DietChart.objects.order_by('patient__patient_id')
+        self.assertEqual([chart.patient_id for chart in charts], [self.patient.id, self.other_patient.id])
+        for chart in charts:
+            self.assertTrue(chart.generation_parameters['batch'])
+            self.assertEqual(len(chart.daily_meals), 7)
+            self.assertAggregatesMatch(chart)
+
+    def test_unplannable_cohorts_are_rejected(self):
+        response = self.client.post('/api/diet-charts/generate/batch/', {
+            'patient_ids': [str(self.patient.id)], 'food_restrictions': ['Vegan', 'grains-free', 'no fruits'],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['failed_count'], 1)
+        self.assertFalse(DietChart.objects.exists())
+
+    def test_command_accepts_string_ids(self):
+        out = io.StringIO()
+        call_command(
+            'generate_diet_charts', str(self.patient.id), 'not-a-uuid', '--created-by', 'doctor', '--workers', '1',
+            stdout=out,
+        )
+        self.assertEqual(list(DietChart.objects.values_list('patient_id', flat=True)), [self.patient.id])
+        self.assertIn('not-a-uuid: Invalid patient id', out.getvalue())
+
+
+class MealPlanCacheTests(MealPlanningTestCase):
+
+    def test_close_targets_share_a_plan(self):
+        first, parameters = self.plan(target_calories=1810)
+        self.assertEqual((parameters['plan_cache'], parameters['plan_target_calories']), ('miss', 1800))
+        second, parameters = self.plan(target_calories=1790)
+        self.assertEqual((parameters['plan_cache'], parameters['plan_target_calories']), ('hit', 1800))
+        self.assertEqual(second, first)
+
+        _, parameters = self.plan(food_restrictions=['Vegan'])
+        self.assertEqual(parameters['plan_cache'], 'miss')
+
+    def test_patients_get_the_shared_days_in_their_own_order(self):
+        shared, _ = self.plan()
+        for patient_key in ['patient-a', 'patient-b']:
+            daily_meals, parameters = self.plan(variation_key=patient_key)
+            offset = day_offset(patient_key, 7)
+            self.assertEqual(parameters['day_offset'], offset)
+            self.assertEqual(daily_meals['day1'], shared[f'day{offset + 1}'])
+            self.assertCountEqual(
+                [json.dumps(day, sort_keys=True) for day in daily_meals.values()],
+                [json.dumps(day, sort_keys=True) for day in shared.values()],
+            )
+
+    def test_catalog_change_invalidates_plans(self):
+        _, before = self.plan()
+        self.assertEqual(self.plan()[1]['plan_cache'], 'hit')
+        with self.captureOnCommitCallbacks(execute=True):
+            make_food(self.doctor, 'Dosa', 260, ['Breakfast'], tags=['Vegan'])
+        _, after = self.plan()
+        self.assertEqual(after['plan_cache'], 'miss')
+        self.assertGreater(after['catalog_version'], before['catalog_version'])
+
+    @override_settings(DIET_PLAN_CACHE_TTL=0)
+    def test_expired_plans_are_replanned(self):
+        self.plan()
+        self.assertEqual(self.plan()[1]['plan_cache'], 'miss')
+
+    def test_older_catalog_version_keeps_newer_plans(self):
+        plan_cache = MealPlanCache()
+        plan_cache.put('key', 2, {'day1': {}}, {'planner': 'catalog'})
+        # A request still planning from catalog v1 neither reads nor evicts v2 plans
+        self.assertIsNone(plan_cache.get('key', 1))
+        plan_cache.put('other', 1, {}, {})
+        self.assertEqual(plan_cache.get('key', 2), ({'day1': {}}, {'planner': 'catalog'}))
+        self.assertIsNone(plan_cache.get('other', 2))
+
+
+class SliceRegenerationTests(MealPlanningTestCase):
+    """POST /<id>/days/<n>/regenerate/ and /<id>/days/<n>/meals/<meal>/regenerate/"""
+
+    def setUp(self):
+        super().setUp()
+        daily_meals, parameters = self.plan(days=3)
+        self.chart = make_chart(
+            self.doctor, self.patient, daily_meals, target_calories=1800,
+            meal_distribution=MEAL_DISTRIBUTION, generation_parameters=parameters,
+        )
+        self.original = copy.deepcopy(self.chart.daily_meals)
+
+    def regenerate(self, path, data=None):
+        return self.client.post(f'/api/diet-charts/{self.chart.pk}/{path}/regenerate/', data or {}, format='json')
+
+    def test_day_replaces_only_that_day(self):
+        response = self.regenerate('days/2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['path'], response.data['version']), (['day2'], self.chart.version + 1))
+
+        self.chart.refresh_from_db()
+        self.assertEqual(self.chart.daily_meals['day2'], response.data['value'])
+        self.assertNotEqual(self.chart.daily_meals['day2'], self.original['day2'])
+        for day_key in ['day1', 'day3']:
+            self.assertEqual(self.chart.daily_meals[day_key], self.original[day_key])
+        self.assertAggregatesMatch(self.chart)
+
+        revision = DietChartRevision.objects.get(diet_chart=self.chart, version=self.chart.version)
+        self.assertEqual(revision.source, 'regenerate')
+        state = diet_chart_revisions.reconstruct(self.chart.pk, self.chart.version)
+        self.assertEqual(state['daily_meals'], self.chart.daily_meals)
+
+    def test_meal_differs_from_the_rest_of_its_day(self):
+        response = self.regenerate('days/1/meals/lunch')
+        self.assertEqual(response.status_code, 200)
+
+        self.chart.refresh_from_db()
+        day = self.chart.daily_meals['day1']
+        self.assertEqual(day['lunch'], response.data['value'])
+        self.assertNotEqual(day['lunch'], self.original['day1']['lunch'])
+        self.assertEqual({key: meal for key, meal in day.items() if key != 'lunch'},
+                         {key: meal for key, meal in self.original['day1'].items() if key != 'lunch'})
+        others = {food_id for key, meal in day.items() if key != 'lunch' for food_id in self.food_ids(meal)}
+        self.assertFalse(others & set(self.food_ids(day['lunch'])))
+        self.assertAggregatesMatch(self.chart)
+
+    def test_stale_version_conflicts(self):
+        response = self.regenerate('days/1', {'version': self.chart.version - 1})
+        self.assertEqual(response.status_code, 409)
+        self.chart.refresh_from_db()
+        self.assertEqual(self.chart.daily_meals, self.original)
+
+    def test_missing_slices_are_not_found(self):
+        self.assertEqual(self.regenerate('days/9').status_code, 404)
+        self.assertEqual(self.regenerate('days/1/meals/brunch').status_code, 404)
+
+
+class DietChartJobTests(DietChartTestCase):
+    """Background generation jobs, as run by the process_diet_chart_jobs worker"""
+
+    def create_job(self):
+        return DietChartGenerationJob.objects.create(
+            patient=self.patient, created_by=self.doctor, parameters={'chart_type': '7_day'}, total_days=7
+        )
+
+    def stream(self, job_id, last_day=0):
+        # The stream closes its connection when done, which would end the test's transaction
+        with self.settings(DIET_CHART_JOB_STREAM_TIMEOUT=0, DIET_CHART_JOB_POLL_INTERVAL=0), \
+                mock.patch('diet_charts.jobs.close_old_connections'):
+            return ''.join(diet_chart_jobs.events(job_id, last_day))
+
+    def test_run_job_creates_one_chart(self):
+        job = diet_chart_jobs.run_job(self.create_job().pk)
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.days_generated, 7)
+        self.assertEqual(DietChart.objects.filter(patient=self.patient).count(), 1)
+        self.assertEqual(job.diet_chart.daily_meals, job.daily_meals)
+
+    def test_reclaimed_job_discards_its_chart(self):
+        job = self.create_job()
+        generate = diet_chart_jobs.generate
+
+        def reclaimed_meanwhile(running_job, publish_day):
+            chart = generate(running_job, publish_day)
+            # Another worker reclaimed and restarted the job before this run finished
+            DietChartGenerationJob.objects.filter(pk=job.pk).update(attempts=F('attempts') + 1)
+            return chart
+
+        with mock.patch.object(diet_chart_jobs, 'generate', side_effect=reclaimed_meanwhile):
+            result = diet_chart_jobs.run_job(job.pk)
+        self.assertEqual(result.status, 'running')
+        self.assertFalse(DietChart.objects.filter(patient=self.patient).exists())
+
+    def test_stream_reclaims_a_dead_worker_job(self):
+        job = self.create_job()
+        DietChartGenerationJob.objects.filter(pk=job.pk).update(
+            status='running', heartbeat_at=timezone.now() - datetime.timedelta(hours=1)
+        )
+        events = self.stream(job.pk)
+        self.assertIn('"status":"pending"', events)
+        self.assertIn('event: timeout', events)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'pending')
+
+    def test_stream_resumes_after_the_last_event_id(self):
+        job = diet_chart_jobs.run_job(self.create_job().pk)
+        events = self.stream(job.pk, last_day=5)
+        self.assertNotIn('id: 5\n', events)
+        self.assertIn('id: 6\n', events)
+        self.assertIn('id: 7\n', events)
+        self.assertIn(f'"chart_id":"{job.diet_chart_id}"', events)
+
+    def test_restarted_job_resets_the_stream(self):
+        job = self.create_job()
+        DietChartGenerationJob.objects.filter(pk=job.pk).update(
+            status='running', heartbeat_at=timezone.now(), days_generated=1,
+            daily_meals={'day1': DAILY_MEALS['day1']},
+        )
+        events = self.stream(job.pk, last_day=5)
+        self.assertLess(events.index('event: reset'), events.index('id: 1\n'))
+
+    def test_view_reads_the_last_event_id_header(self):
+        job = diet_chart_jobs.run_job(self.create_job().pk)
+        with mock.patch('diet_charts.jobs.close_old_connections'):
+            response = self.client.get(
+                f'/api/diet-charts/jobs/{job.pk}/events/', HTTP_ACCEPT='text/event-stream', HTTP_LAST_EVENT_ID='6'
+            )
+            events = b''.join(response.streaming_content).decode()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('id: 6\n', events)
+        self.assertIn('id: 7\n', events)
+        self.assertIn('event: completed', events)
+
+    @override_settings(DIET_CHART_JOB_MAX_STREAMS=1)
+    def test_streams_beyond_the_cap_are_refused(self):
+        job = diet_chart_jobs.run_job(self.create_job().pk)
+        url = f'/api/diet-charts/jobs/{job.pk}/events/'
+        held = diet_chart_jobs.open_stream(job.pk)
+        try:
+            response = self.client.get(url, HTTP_ACCEPT='text/event-stream')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '2')
+        finally:
+            with mock.patch('diet_charts.jobs.close_old_connections'):
+                held.close()
+
+        # Closing a stream, even one that never ran, gives its slot back
+        with mock.patch('diet_charts.jobs.close_old_connections'):
+            response = self.client.get(url, HTTP_ACCEPT='text/event-stream')
+            self.assertEqual(response.status_code, 200)
+            # The test client closes the response once its content is consumed
+            b''.join(response.streaming_content)
+        stream = diet_chart_jobs.open_stream(job.pk)
+        self.assertIsNotNone(stream)
+        with mock.patch('diet_charts.jobs.close_old_connections'):
+            stream.close()
+
+
+@override_settings(DIET_CHART_STORAGE='normalized')
+class MealEntryStorageTests(MealPlanningTestCase):
+    """Charts whose daily_meals are kept as DietChartMealEntry rows"""
+
+    def setUp(self):
+        super().setUp()
+        self.daily_meals, parameters = self.plan(days=3)
+        self.chart = make_chart(self.doctor, self.patient, self.daily_meals, generation_parameters=parameters)
+
+    def entry_ids(self):
+        return list(self.chart.meal_entries.values_list('id', flat=True))
+
+    def test_meals_round_trip_through_entries(self):
+        self.assertEqual(self.chart.storage, 'normalized')
+        self.assertEqual(DietChart.objects.filter(pk=self.chart.pk).values_list('daily_meals', flat=True).get(), {})
+        items = sum(len(meal['items']) for meals in self.daily_meals.values() for meal in meals.values())
+        self.assertEqual(self.chart.meal_entries.count(), items)
+        self.assertEqual(self.chart.meal_entries.exclude(food=None).count(), items)
+        self.assertEqual(DietChart.objects.get(pk=self.chart.pk).daily_meals, self.daily_meals)
+
+    def test_refresh_reads_the_entries_again(self):
+        self.chart.meal_entries.filter(day=3).delete()
+        self.chart.refresh_from_db()
+        self.assertEqual(list(self.chart.daily_meals), ['day1', 'day2'])
+
+    def test_saving_other_fields_keeps_the_entries(self):
+        entry_ids = self.entry_ids()
+        response = self.client.patch(f'/api/diet-charts/{self.chart.pk}/', {'status': 'active'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['daily_meals'], self.daily_meals)
+        self.assertEqual(self.entry_ids(), entry_ids)
+
+    def test_other_layouts_stay_json(self):
+        chart = make_chart(self.doctor, self.patient, {'notes': 'Light dinners'})
+        self.assertEqual(chart.storage, 'json')
+        self.assertFalse(chart.meal_entries.exists())
+
+    def test_convert_command_moves_charts_both_ways(self):
+        call_command('convert_diet_chart_storage', '--to', 'json', stdout=io.StringIO())
+        chart = DietChart.objects.get(pk=self.chart.pk)
+        self.assertEqual((chart.storage, chart.daily_meals), ('json', self.daily_meals))
+        self.assertFalse(chart.meal_entries.exists())
+
+        call_command('convert_diet_chart_storage', '--to', 'normalized', stdout=io.StringIO())
+        chart = DietChart.objects.get(pk=self.chart.pk)
+        self.assertEqual((chart.storage, chart.daily_meals), ('normalized', self.daily_meals))
+        self.assertTrue(chart.meal_entries.exists())
+
+    def test_food_filter_finds_charts_in_either_storage(self):
+        with self.settings(DIET_CHART_STORAGE='json'):
+            json_chart = make_chart(self.doctor, self.patient, self.daily_meals)
+        make_chart(self.doctor, self.patient, {'day1': {'lunch': {'name': 'Fast', 'items': []}}})
+        food_id = self.daily_meals['day1']['lunch']['items'][0]['food_id']
+        response = self.client.get('/api/diet-charts/', {'food_id': food_id})
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertEqual({chart['id'] for chart in results}, {str(self.chart.pk), str(json_chart.pk)})
+
+    def test_regenerating_a_meal_replaces_only_its_entries(self):
+        others = list(self.chart.meal_entries.exclude(day=2, meal='lunch').values_list('id', flat=True))
+        response = self.client.post(f'/api/diet-charts/{self.chart.pk}/days/2/meals/lunch/regenerate/', {}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        chart = DietChart.objects.get(pk=self.chart.pk)
+        self.assertEqual(chart.daily_meals['day2']['lunch'], response.data['value'])
+        self.assertEqual(list(chart.daily_meals['day2']), list(self.daily_meals['day2']))
+        self.assertEqual(
+            list(chart.meal_entries.exclude(day=2, meal='lunch').values_list('id', flat=True)), others
+        )
+        self.assertAggregatesMatch(chart)
+
+
+class RevisionHistoryTests(DietChartTestCase):
+    """Rebuilding versions from snapshots and JSON Patch deltas"""
+
+    def edit_history(self):
+        """Make a chart through several versions, returning it and {version: state}"""
+        chart = make_chart(self.doctor, self.patient)
+        states = {chart.version: diet_chart_revisions.chart_state(chart)}
+        edits = [
+            [{'op': 'replace', 'path': '/day1/lunch/calories', 'value': 650}],
+            [{'op': 'add', 'path': '/day1/lunch/items/-', 'value': {'name': 'Ghee'}}],
+            [{'op': 'remove', 'path': '/day2/dinner'}],
+            [{'op': 'add', 'path': '/day3', 'value': {'lunch': {'name': 'Thali', 'calories': 700}}}],
+        ]
+        for operations in edits:
+            response = self.client.generic(
+                'PATCH', f'/api/diet-charts/{chart.pk}/daily-meals/', json.dumps(operations),
+                content_type='application/json-patch+json'
+            )
+            self.assertEqual(response.status_code, 200)
+            chart = DietChart.objects.get(pk=chart.pk)
+            states[chart.version] = diet_chart_revisions.chart_state(chart)
+        chart.chart_name = 'Renamed chart'
+        chart.notes = 'Less salt'
+        chart.save(update_fields=['chart_name', 'notes'])
+        states[chart.version] = diet_chart_revisions.chart_state(DietChart.objects.get(pk=chart.pk))
+        self.assertEqual(sorted(states), list(range(1, 7)))
+        return chart, states
+
+    def assertRoundTrips(self, chart, states):
+        for version, state in states.items():
+            self.assertEqual(diet_chart_revisions.reconstruct(chart.pk, version), state, version)
+        for old, new in [(1, 6), (6, 1), (2, 5), (3, 3)]:
+            operations = diet_chart_revisions.diff(chart.pk, old, new)
+            self.assertEqual(apply_operations(states[old], operations), states[new], (old, new))
+
+    def test_deltas_rebuild_every_version(self):
+        chart, states = self.edit_history()
+        kinds = DietChartRevision.objects.filter(diet_chart=chart).order_by('version').values_list('kind', flat=True)
+        self.assertEqual(list(kinds), ['snapshot'] + ['delta'] * 5)
+        self.assertRoundTrips(chart, states)
+
+    @override_settings(DIET_CHART_REVISION_SNAPSHOT_INTERVAL=2)
+    def test_interleaved_snapshots_rebuild_every_version(self):
+        chart, states = self.edit_history()
+        kinds = DietChartRevision.objects.filter(diet_chart=chart).order_by('version').values_list('kind', flat=True)
+        self.assertEqual(list(kinds), ['snapshot', 'delta'] * 3)
+        self.assertRoundTrips(chart, states)
+
+    def test_unrecorded_versions_are_not_found(self):
+        chart, _ = self.edit_history()
+        with self.assertRaisesMessage(ValueError, 'Version 7 is not in the chart history'):
+            diet_chart_revisions.reconstruct(chart.pk, 7)
+        DietChartRevision.objects.filter(diet_chart=chart, version=4).delete()
+        with self.assertRaises(ValueError):
+            diet_chart_revisions.reconstruct(chart.pk, 5)
+
+        response = self.client.get(f'/api/diet-charts/{chart.pk}/revisions/5/')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(f'/api/diet-charts/{chart.pk}/revisions/3/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['daily_meals'], diet_chart_revisions.reconstruct(chart.pk, 3)['daily_meals'])
+
+    def test_detail_updates_are_attributed(self):
+        chart = make_chart(self.doctor, self.patient)
+        response = self.client.patch(f'/api/diet-charts/{chart.pk}/', {'notes': 'Less salt'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        revision = DietChartRevision.objects.get(diet_chart=chart, version=2)
+        self.assertEqual((revision.source, revision.created_by), ('update', self.doctor))
+        self.assertEqual(revision.operations, [{'op': 'replace', 'path': '/metadata/notes', 'value': 'Less salt'}])
+
+    def test_stale_instances_conflict(self):
+        chart = make_chart(self.doctor, self.patient)
+        stale = DietChart.objects.get(pk=chart.pk)
+        chart.notes = 'Less salt'
+        chart.save()
+
+        stale.chart_name = 'Renamed chart'
+        with self.assertRaises(VersionConflict):
+            stale.save()
+        # The view answers a concurrent save with the current version instead of failing
+        with mock.patch.object(DietChartDetailView, 'get_object', return_value=stale):
+            response = self.client.patch(f'/api/diet-charts/{chart.pk}/', {'notes': 'No salt'}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['version'], 2)
+
+        chart.refresh_from_db()
+        self.assertEqual((chart.version, chart.chart_name, chart.notes), (2, 'Test chart', 'Less salt'))
+        self.assertEqual(DietChartRevision.objects.filter(diet_chart=chart).count(), 2)
@@ -6,6 +6,15 @@ from .views import (
     get_patient_diet_charts,
     get_patient_latest_diet_chart,
     generate_diet_chart,
+    generate_diet_charts_batch,
+    diet_chart_job_detail,
+    diet_chart_job_events,
+    regenerate_diet_chart_day,
+    regenerate_diet_chart_meal,
+    patch_diet_chart_meals,
+    DietChartRevisionListView,
+    get_diet_chart_revision,
+    diff_diet_chart_revisions,
     save_diet_chart,
     get_diet_chart_stats
 )
@@ -27,6 +36,21 @@ urlpatterns = [
     
     # Generation endpoint
     path('generate/', generate_diet_chart, name='generate-diet-chart'),
+    path('generate/batch/', generate_diet_charts_batch, name='generate-diet-charts-batch'),
+    path('jobs/<uuid:job_id>/', diet_chart_job_detail, name='diet-chart-job-detail'),
+    path('jobs/<uuid:job_id>/events/', diet_chart_job_events, name='diet-chart-job-events'),
+    
+    # Partial regeneration endpoints
+    path('<uuid:id>/days/<int:day>/regenerate/', regenerate_diet_chart_day, name='dietchart-regenerate-day'),
+    path('<uuid:id>/days/<int:day>/meals/<str:meal>/regenerate/', regenerate_diet_chart_meal, name='dietchart-regenerate-meal'),
+    
+    # Incremental edit endpoint (RFC 6902 JSON Patch)
+    path('<uuid:id>/daily-meals/', patch_diet_chart_meals, name='dietchart-patch-meals'),
+    
+    # Version history endpoints
+    path('<uuid:id>/revisions/', DietChartRevisionListView.as_view(), name='dietchart-revisions'),
+    path('<uuid:id>/revisions/diff/', diff_diet_chart_revisions, name='dietchart-revisions-diff'),
+    path('<uuid:id>/revisions/<int:version>/', get_diet_chart_revision, name='dietchart-revision'),
     
     # Save endpoint
     path('save/', save_diet_chart, name='save-diet-chart'),
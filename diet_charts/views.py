@@ -1,29 +1,71 @@
-from rest_framework import generics, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework import generics, serializers, status
+from rest_framework.decorators import api_view, parser_classes, permission_classes, renderer_classes
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
 from datetime import date, timedelta
+from food_database.models import FoodItem
 from .models import DietChart
 from .serializers import (
     DietChartSerializer,
     DietChartCreateSerializer,
     DietChartUpdateSerializer,
-    DietChartSummarySerializer
+    DietChartSummarySerializer,
+    DietChartBatchGenerateSerializer,
+    DietChartGenerationJobCreateSerializer,
+    DietChartGenerationJobSerializer,
+    DietChartRevisionSerializer,
+    validate_day_meals
 )
 from .filters import DietChartFilter
+from .generation import (
+    chart_days,
+    diet_chart_generator,
+    disease_snapshot,
+    generation_parameters,
+    prakriti_snapshot,
+    generate_sample_meals,
+    regenerate_slice,
+    save_slice
+)
+from .jobs import diet_chart_jobs
+from .json_patch import (
+    apply_patch,
+    changed_fragments,
+    load_days,
+    parse_patch,
+    patch_days,
+    save_patch,
+    touched_meals
+)
+from .meal_entries import meal_entry_storage
+from .models import DietChartGenerationJob, DietChartRevision
+from .plan_cache import meal_plan_cache
+from .planner import DEFAULT_MEAL_DISTRIBUTION, estimate_target_calories, focus_bucket, meal_planner
+from .parsers import JSONPatchParser
+from .renderers import EventStreamRenderer
+from .revisions import VersionConflict, diet_chart_revisions
+
+# Seconds a client waits before retrying a stream refused because this process has none free
+STREAM_RETRY_AFTER_SECONDS = 2
 
 
 class DietChartListCreateView(generics.ListCreateAPIView):
     """List and create diet charts."""
-    queryset = DietChart.objects.all()
+    queryset = DietChart.objects.prefetch_related('meal_entries')
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_class = DietChartFilter
     search_fields = ['chart_name', 'patient__user_name', 'notes']
-    ordering_fields = ['created_at', 'start_date', 'chart_name', 'status']
+    ordering_fields = [
+        'created_at', 'start_date', 'chart_name', 'status', 'total_calories', 'meal_count',
+        'total_protein_g', 'total_carbs_g', 'total_fat_g', 'total_fiber_g'
+    ]
     ordering = ['-created_at']
     
     def get_serializer_class(self):
@@ -62,17 +104,37 @@ class DietChartDetailView(generics.RetrieveUpdateDestroyAPIView):
         if self.request.method in ['PUT', 'PATCH']:
             return DietChartUpdateSerializer
         return DietChartSerializer
+    
+    def update(self, request, *args, **kwargs):
+        try:
+            return super().update(request, *args, **kwargs)
+        except VersionConflict as e:
+            # Another request saved the chart after this one loaded it
+            return Response(
+                {'error': 'Diet chart was modified since it was loaded', 'version': e.version}, 
+                status=status.HTTP_409_CONFLICT
+            )
+    
+    def perform_update(self, serializer):
+        serializer.instance._revised_by = self.request.user
+        serializer.save()
 
 
 class DietChartSummaryListView(generics.ListAPIView):
     """List diet chart summaries (lightweight)."""
-    queryset = DietChart.objects.all()
+    # Totals come from the aggregate columns, so the meal plan itself is never loaded
+    queryset = DietChart.objects.select_related('patient', 'created_by').defer(
+        'daily_meals', 'prakriti_analysis', 'disease_analysis', 'patient_preferences', 'generation_parameters'
+    )
     serializer_class = DietChartSummarySerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_class = DietChartFilter
     search_fields = ['chart_name', 'patient__user_name']
-    ordering_fields = ['created_at', 'start_date', 'chart_name', 'status']
+    ordering_fields = [
+        'created_at', 'start_date', 'chart_name', 'status', 'total_calories', 'meal_count',
+        'total_protein_g', 'total_carbs_g', 'total_fat_g', 'total_fiber_g'
+    ]
     ordering = ['-created_at']
 
 
@@ -81,7 +143,8 @@ class DietChartSummaryListView(generics.ListAPIView):
 def get_patient_diet_charts(request, patient_id):
     """Get all diet charts for a specific patient."""
     try:
-        charts = DietChart.objects.filter(patient_id=patient_id).order_by('-created_at')
+        # Same lightweight queryset as the summary list: totals come from the aggregate columns
+        charts = DietChartSummaryListView.queryset.filter(patient_id=patient_id).order_by('-created_at')
         serializer = DietChartSummarySerializer(charts, many=True)
         return Response(serializer.data)
     except Exception as e:
@@ -123,6 +186,8 @@ def generate_diet_chart(request):
         chart_type = request.data.get('chart_type', '7_day')
         start_date = request.data.get('start_date')
         end_date = request.data.get('end_date')
+        food_restrictions = request.data.get('food_restrictions') or []
+        dosha_focus = request.data.get('dosha_focus') or []
         
         if not patient_id:
             return Response(
@@ -134,6 +199,21 @@ def generate_diet_chart(request):
         from authentication.models import UnifiedPatient
         patient = get_object_or_404(UnifiedPatient, id=patient_id)
         
+        # Background generation: return a job whose days can be streamed as they are planned
+        if str(request.data.get('async', request.GET.get('async', ''))).lower() in ('true', '1'):
+            serializer = DietChartGenerationJobCreateSerializer(data=request.data)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            parameters = {
+                key: value.isoformat() if isinstance(value, date) else value
+                for key, value in serializer.validated_data.items() if key != 'patient_id'
+            }
+            job = diet_chart_jobs.create_job(patient, request.user, parameters)
+            return Response({
+                'message': 'Diet chart generation queued',
+                'job': DietChartGenerationJobSerializer(job).data,
+            }, status=status.HTTP_202_ACCEPTED)
+        
         # Get patient's analysis data
         prakriti_analysis = None
         disease_analysis = None
@@ -142,15 +222,7 @@ def generate_diet_chart(request):
         try:
             from patients.models import PrakritiAnalysis
             latest_prakriti = PrakritiAnalysis.objects.filter(patient=patient).order_by('-analysis_date').first()
-            if latest_prakriti:
-                prakriti_analysis = {
-                    'vata_score': latest_prakriti.vata_score,
-                    'pitta_score': latest_prakriti.pitta_score,
-                    'kapha_score': latest_prakriti.kapha_score,
-                    'dominant_dosha': latest_prakriti.primary_dosha,
-                    'constitution_type': latest_prakriti.primary_dosha,
-                    'analysis_date': latest_prakriti.analysis_date.isoformat()
-                }
+            prakriti_analysis = prakriti_snapshot(latest_prakriti)
         except Exception as e:
             print(f"Error fetching prakriti analysis: {e}")
         
@@ -158,45 +230,34 @@ def generate_diet_chart(request):
         try:
             from patients.models import DiseaseAnalysis
             latest_diseases = DiseaseAnalysis.objects.filter(patient=patient).order_by('-diagnosis_date')
-            if latest_diseases.exists():
-                disease_analysis = []
-                for disease in latest_diseases:
-                    disease_analysis.append({
-                        'disease_name': disease.disease_name,
-                        'severity': disease.severity,
-                        'symptoms': disease.symptoms,
-                        'diagnosis_date': disease.diagnosis_date.isoformat()
-                    })
+            disease_analysis = disease_snapshot(list(latest_diseases))
         except Exception as e:
             print(f"Error fetching disease analysis: {e}")
         
         # Calculate target calories
-        target_calories = 2000  # Default
-        if patient.weight and patient.height and patient.date_of_birth:
-            today = date.today()
-            age = today.year - patient.date_of_birth.year
-            if today.month < patient.date_of_birth.month or (today.month == patient.date_of_birth.month and today.day < patient.date_of_birth.day):
-                age -= 1
-            
-            # BMR calculation
-            if patient.gender == 'Male':
-                bmr = 88.362 + (13.397 * patient.weight) + (4.799 * patient.height) - (5.677 * age)
-            else:
-                bmr = 447.593 + (9.247 * patient.weight) + (3.098 * patient.height) - (4.330 * age)
-            
-            target_calories = int(bmr * 1.375)  # Light activity multiplier
+        target_calories = estimate_target_calories(patient)
         
         # Generate meal distribution
-        meal_distribution = {
-            'breakfast': 0.25,
-            'brunch': 0.15,
-            'lunch': 0.30,
-            'snack': 0.10,
-            'dinner': 0.20
-        }
+        meal_distribution = dict(DEFAULT_MEAL_DISTRIBUTION)
+        total_days = chart_days(chart_type)
         
-        # Generate daily meals (simplified for now)
-        daily_meals = generate_sample_meals(chart_type, target_calories, meal_distribution)
+        # Plan meals from the food catalog; templates only when there is no catalog to plan from
+        planner_parameters = {'planner': 'templates'}
+        if meal_planner.is_available and FoodItem.objects.exists():
+            from food_database.substitution import food_substitutions
+            bucket = focus_bucket(dosha_focus) or food_substitutions.prakriti_bucket(patient_id=patient.id)[0]
+            try:
+                daily_meals, planner_parameters = meal_planner.plan(
+                    target_calories, total_days, meal_distribution,
+                    bucket=bucket, food_restrictions=food_restrictions, variation_key=patient.id,
+                )
+            except ValueError as e:
+                return Response(
+                    {'error': str(e)}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        else:
+            daily_meals = generate_sample_meals(chart_type, target_calories, meal_distribution)
         
         # Create diet chart
         diet_chart_data = {
@@ -205,19 +266,17 @@ def generate_diet_chart(request):
             'chart_type': chart_type,
             'status': 'draft',
             'start_date': start_date or date.today().isoformat(),
-            'end_date': end_date or (date.today() + timedelta(days=6)).isoformat(),
-            'total_days': 7 if chart_type == '7_day' else 14 if chart_type == '14_day' else 30,
+            'end_date': end_date or (date.today() + timedelta(days=total_days - 1)).isoformat(),
+            'total_days': total_days,
             'prakriti_analysis': prakriti_analysis,
             'disease_analysis': disease_analysis,
             'target_calories': target_calories,
             'meal_distribution': meal_distribution,
+            'dosha_focus': dosha_focus,
+            'food_restrictions': food_restrictions,
             'daily_meals': daily_meals,
             'is_ai_generated': True,
-            'generation_parameters': {
-                'model_version': '1.0',
-                'generated_at': date.today().isoformat(),
-                'patient_analysis_included': bool(prakriti_analysis or disease_analysis)
-            }
+            'generation_parameters': generation_parameters(prakriti_analysis, disease_analysis, planner_parameters)
         }
         
         serializer = DietChartCreateSerializer(data=diet_chart_data)
@@ -234,6 +293,392 @@ def generate_diet_chart(request):
         )
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def generate_diet_charts_batch(request):
+    """Generate draft diet charts for a cohort of patients in one request."""
+    try:
+        serializer = DietChartBatchGenerateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        
+        try:
+            result = diet_chart_generator.generate(
+                data['patient_ids'],
+                request.user,
+                chart_type=data['chart_type'],
+                chart_name=data['chart_name'],
+                start_date=data.get('start_date'),
+                food_restrictions=data['food_restrictions'],
+                dosha_focus=data['dosha_focus'],
+            )
+        except ValueError as e:
+            return Response(
+                {'error': str(e)}, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        
+        return Response(
+            result.as_dict(),
+            status=status.HTTP_201_CREATED if result.charts else status.HTTP_400_BAD_REQUEST
+        )
+        
+    except Exception as e:
+        return Response(
+            {'error': f'Failed to generate diet charts: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def diet_chart_job_detail(request, job_id):
+    """Get progress of a background diet chart generation."""
+    try:
+        job = DietChartGenerationJob.objects.get(id=job_id, created_by=request.user)
+        # A job whose worker died goes back to the queue instead of staying running
+        if diet_chart_jobs.reclaim_stale_jobs(job.pk):
+            diet_chart_jobs.dispatch(job.pk)
+            job.refresh_from_db()
+        serializer = DietChartGenerationJobSerializer(job)
+        return Response(serializer.data)
+    except DietChartGenerationJob.DoesNotExist:
+        return Response(
+            {'error': 'Diet chart generation job not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    except Exception as e:
+        return Response(
+            {'error': f'Failed to fetch diet chart generation job: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([EventStreamRenderer, JSONRenderer])
+def diet_chart_job_events(request, job_id):
+    """Stream a background generation as Server-Sent Events: each day as soon as it is planned."""
+    try:
+        if not DietChartGenerationJob.objects.filter(id=job_id, created_by=request.user).exists():
+            return Response(
+                {'error': 'Diet chart generation job not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        # EventSource sends Last-Event-ID on reconnect; fetch-based clients may pass it as a parameter
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id') or 0
+        try:
+            last_day = max(int(last_event_id), 0)
+        except (TypeError, ValueError):
+            last_day = 0
+        
+        stream = diet_chart_jobs.open_stream(job_id, last_day)
+        if stream is None:
+            # Every stream slot of this process is busy; the job keeps running meanwhile
+            response = Response(
+                {'error': 'Too many diet chart generation streams open, retry shortly'}, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+            response['Retry-After'] = str(STREAM_RETRY_AFTER_SECONDS)
+            return response
+        
+        response = StreamingHttpResponse(stream, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+        
+    except Exception as e:
+        return Response(
+            {'error': f'Failed to stream diet chart generation job: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def regenerate_diet_chart_day(request, id, day):
+    """Replan one day of a diet chart, leaving every other day as it is."""
+    return regenerate_chart_slice(request, id, day)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def regenerate_diet_chart_meal(request, id, day, meal):
+    """Replan one meal of one day of a diet chart."""
+    return regenerate_chart_slice(request, id, day, meal)
+
+
+def regenerate_chart_slice(request, chart_id, day, meal=None):
+    """Plan and persist dayN (or dayN's meal) of a chart, returning only that slice."""
+    try:
+        try:
+            chart = DietChart.objects.get(id=chart_id)
+        except DietChart.DoesNotExist:
+            return Response(
+                {'error': 'Diet chart not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        if not chart.can_be_modified():
+            return Response(
+                {'error': f'Diet chart is {chart.status} and cannot be modified'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        day_meals = (chart.daily_meals or {}).get(f'day{day}')
+        if not isinstance(day_meals, dict):
+            return Response(
+                {'error': f'Diet chart has no day {day}'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if meal is not None and not isinstance(day_meals.get(meal), dict):
+            return Response(
+                {'error': f'Day {day} has no meal {meal}'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        # Optional optimistic lock: the version the client last saw
+        expected_version = request.data.get('version')
+        if expected_version is not None:
+            try:
+                expected_version = int(expected_version)
+            except (TypeError, ValueError):
+                return Response(
+                    {'error': 'version must be an integer'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if expected_version != chart.version:
+                return Response(
+                    {'error': 'Diet chart was modified since it was loaded', 'version': chart.version}, 
+                    status=status.HTTP_409_CONFLICT
+                )
+        
+        try:
+            path, value, parameters = regenerate_slice(chart, day, meal)
+        except ValueError as e:
+            return Response(
+                {'error': str(e)}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Guard on the version read above so a concurrent edit is never overwritten
+        version = save_slice(chart, path, value, expected_version=chart.version, user_id=request.user.pk)
+        if version is None:
+            return Response(
+                {'error': 'Diet chart was modified while regenerating'}, 
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        return Response({
+            'chart_id': str(chart.id),
+            'path': path,
+            'day': day,
+            'meal': meal,
+            'version': version,
+            'value': value,
+            'generation': parameters,
+        })
+        
+    except Exception as e:
+        return Response(
+            {'error': f'Failed to regenerate diet chart: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['PATCH'])
+@permission_classes([IsAuthenticated])
+@parser_classes([JSONPatchParser, JSONParser])
+def patch_diet_chart_meals(request, id):
+    """Apply an RFC 6902 JSON Patch to a chart's daily_meals, returning only what changed.
+    
+    Paths address days and meals, e.g. /day3/lunch/calories. Only the days the patch
+    touches are read and validated. With ?version= the patch fails with 409 when the
+    chart changed since the client loaded it.
+    """
+    try:
+        try:
+            operations = parse_patch(request.data)
+        except ValueError as e:
+            return Response(
+                {'error': str(e)}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            chart = DietChart.objects.only('id', 'status', 'version', 'storage').get(id=id)
+        except DietChart.DoesNotExist:
+            return Response(
+                {'error': 'Diet chart not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        if not chart.can_be_modified():
+            return Response(
+                {'error': f'Diet chart is {chart.status} and cannot be modified'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        expected_version = request.query_params.get('version')
+        if expected_version is not None:
+            try:
+                expected_version = int(expected_version)
+            except (TypeError, ValueError):
+                return Response(
+                    {'error': 'version must be an integer'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if expected_version != chart.version:
+                return Response(
+                    {'error': 'Diet chart was modified since it was loaded', 'version': chart.version}, 
+                    status=status.HTTP_409_CONFLICT
+                )
+        
+        before = load_days(chart, patch_days(operations))
+        try:
+            after, writes = apply_patch(before, operations)
+        except ValueError as e:
+            return Response(
+                {'error': str(e)}, 
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        
+        # Only the days and meals the patch changed are validated
+        try:
+            for day_key, meal_keys in touched_meals(operations).items():
+                if day_key in after:
+                    validate_day_meals(day_key, after[day_key], meal_keys)
+        except serializers.ValidationError as e:
+            return Response(
+                {'error': e.detail[0]}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if chart.storage == 'normalized' and not meal_entry_storage.can_store(after):
+            return Response(
+                {'error': 'Patched meals do not fit the chart\'s normalized storage'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Guard on the version read above so a concurrent edit is never overwritten
+        version = save_patch(
+            chart, before, after, writes, expected_version=chart.version, user_id=request.user.pk
+        )
+        if version is None:
+            return Response(
+                {'error': 'Diet chart was modified while patching'}, 
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        return Response({
+            'chart_id': str(chart.id),
+            'version': version,
+            'changes': changed_fragments(after, operations),
+        })
+        
+    except Exception as e:
+        return Response(
+            {'error': f'Failed to patch diet chart: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+class DietChartRevisionListView(generics.ListAPIView):
+    """List a diet chart's history, newest version first."""
+    serializer_class = DietChartRevisionSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        chart = get_object_or_404(DietChart.objects.only('id'), id=self.kwargs['id'])
+        return DietChartRevision.objects.filter(diet_chart=chart).select_related('created_by').defer(
+            'snapshot'
+        ).order_by('-version')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_diet_chart_revision(request, id, version):
+    """Rebuild a diet chart's meals and details as they were at a version."""
+    try:
+        try:
+            revision = DietChartRevision.objects.select_related('created_by').defer('snapshot').get(
+                diet_chart_id=id, version=version
+            )
+        except DietChartRevision.DoesNotExist:
+            return Response(
+                {'error': f'Diet chart has no version {version}'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        try:
+            state = diet_chart_revisions.reconstruct(id, version)
+        except ValueError as e:
+            return Response(
+                {'error': str(e)}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        return Response({
+            'chart_id': str(id),
+            'version': version,
+            'source': revision.source,
+            'created_by_name': revision.created_by.full_name if revision.created_by else None,
+            'created_at': revision.created_at,
+            **state,
+        })
+        
+    except Exception as e:
+        return Response(
+            {'error': f'Failed to fetch diet chart version: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def diff_diet_chart_revisions(request, id):
+    """JSON Patch between two versions of a diet chart (?from=, ?to= defaulting to the current version)."""
+    try:
+        try:
+            chart = DietChart.objects.only('id', 'version').get(id=id)
+        except DietChart.DoesNotExist:
+            return Response(
+                {'error': 'Diet chart not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        try:
+            from_version = int(request.query_params['from'])
+            to_version = int(request.query_params.get('to', chart.version))
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {'error': 'from (and optionally to) must be integer versions'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            operations = diet_chart_revisions.diff(chart.id, from_version, to_version)
+        except ValueError as e:
+            return Response(
+                {'error': str(e)}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        return Response({
+            'chart_id': str(chart.id),
+            'from': from_version,
+            'to': to_version,
+            'operations': operations,
+        })
+        
+    except Exception as e:
+        return Response(
+            {'error': f'Failed to diff diet chart versions: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def save_diet_chart(request):
@@ -251,6 +696,7 @@ def save_diet_chart(request):
         
         if serializer.is_valid():
             if chart_id:
+                chart._revised_by = request.user
                 chart = serializer.save()
             else:
                 chart = serializer.save(created_by=request.user)
@@ -265,60 +711,6 @@ def save_diet_chart(request):
         )
 
 
-def generate_sample_meals(chart_type, target_calories, meal_distribution):
-    """Generate sample meals for the diet chart."""
-    
-    days = 7 if chart_type == '7_day' else 14 if chart_type == '14_day' else 30
-    daily_meals = {}
-    
-    # Sample meal templates
-    meal_templates = {
-        'breakfast': [
-            {'name': 'Warm Oatmeal with Ghee', 'calories': 350, 'description': 'Hearty breakfast with healthy fats'},
-            {'name': 'Almond Milk Porridge', 'calories': 320, 'description': 'Light and nutritious start to the day'},
-            {'name': 'Millet Porridge with Nuts', 'calories': 380, 'description': 'Protein-rich morning meal'},
-        ],
-        'brunch': [
-            {'name': 'Coconut Water & Dates', 'calories': 200, 'description': 'Refreshing mid-morning snack'},
-            {'name': 'Fresh Fruit Bowl', 'calories': 180, 'description': 'Natural sweetness and vitamins'},
-            {'name': 'Lassi with Honey', 'calories': 220, 'description': 'Probiotic-rich drink'},
-        ],
-        'lunch': [
-            {'name': 'Kitchari with Vegetables', 'calories': 450, 'description': 'Balanced one-pot meal'},
-            {'name': 'Quinoa & Vegetable Curry', 'calories': 420, 'description': 'Complete protein with vegetables'},
-            {'name': 'Sambar & Rice', 'calories': 480, 'description': 'Traditional South Indian meal'},
-        ],
-        'snack': [
-            {'name': 'Herbal Tea & Almonds', 'calories': 150, 'description': 'Antioxidant-rich afternoon snack'},
-            {'name': 'Mint Tea & Crackers', 'calories': 120, 'description': 'Light digestive aid'},
-            {'name': 'Cardamom Tea & Dates', 'calories': 140, 'description': 'Warming spice blend'},
-        ],
-        'dinner': [
-            {'name': 'Light Dal & Rice', 'calories': 400, 'description': 'Easy-to-digest evening meal'},
-            {'name': 'Steamed Vegetables & Roti', 'calories': 380, 'description': 'Simple and wholesome'},
-            {'name': 'Vegetable Khichdi', 'calories': 350, 'description': 'Comforting one-pot meal'},
-        ]
-    }
-    
-    # Generate meals for each day
-    for day in range(1, days + 1):
-        day_key = f'day{day}'
-        daily_meals[day_key] = {}
-        
-        for meal_type, percentage in meal_distribution.items():
-            meal_calories = int(target_calories * percentage)
-            meal_templates_for_type = meal_templates.get(meal_type, [])
-            
-            # Select a random meal template (for now, cycle through them)
-            template_index = (day - 1) % len(meal_templates_for_type)
-            selected_meal = meal_templates_for_type[template_index].copy()
-            selected_meal['calories'] = meal_calories
-            
-            daily_meals[day_key][meal_type] = selected_meal
-    
-    return daily_meals
-
-
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_diet_chart_stats(request):
@@ -344,7 +736,8 @@ def get_diet_chart_stats(request):
             'completed_charts': completed_charts,
             'draft_charts': draft_charts,
             'charts_by_type': charts_by_type,
-            'recent_charts': recent_charts
+            'recent_charts': recent_charts,
+            'plan_cache': meal_plan_cache.stats()
         })
         
     except Exception as e:
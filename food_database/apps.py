@@ -6,3 +6,5 @@ class FoodDatabaseConfig(AppConfig):
     name = 'food_database'
     verbose_name = 'Food Database'
 
+    def ready(self):
+        from . import signals  # noqa: F401
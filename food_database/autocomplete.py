@@ -0,0 +1,334 @@
+"""
+Food Autocomplete Service for Aahaara Harmony
+Prefix completion over normalized food names from a sorted in-memory array, ranked
+by how often each food appears in diet chart meals
+"""
+import bisect
+import heapq
+import logging
+import threading
+import time
+import unicodedata
+from collections import Counter
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.db import connection
+from .models import FoodItem, FoodCatalogState
+from .search import tokenize
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+AUTOCOMPLETE_FIELDS = ['id', 'name', 'food_category', 'calories', 'updated_at']
+
+# Most results a request may ask for
+MAX_RESULTS = 25
+
+# Longest run of words in a meal name that is looked up as a food name
+MAX_MEAL_NAME_WORDS = 6
+
+
+def normalize(text: str) -> str:
+    """Lower-cased, accent-free words separated by single spaces"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(tokenize(text))
+
+
+def name_keys(name: str) -> List[str]:
+    """Keys a name is reachable by: the full name and every suffix starting at a later word,
+    so "moong dal khichdi" completes from "moo", "dal" and "khi"
+    """
+    words = normalize(name).split(' ')
+    if words == ['']:
+        return []
+    return sorted({' '.join(words[i:]) for i in range(len(words))})
+
+
+def meal_name_usage(meals) -> Counter:
+    """Count the normalized food names mentioned by diet chart meal names
+
+    meals is an iterable of daily_meals dicts; every run of up to MAX_MEAL_NAME_WORDS
+    words of a meal name counts once, so "Moong Dal Khichdi with Ghee" credits
+    "moong dal khichdi", "ghee" and so on.
+    """
+    usage = Counter()
+    for daily_meals in meals:
+        if not isinstance(daily_meals, dict):
+            continue
+        for day_data in daily_meals.values():
+            if not isinstance(day_data, dict):
+                continue
+            for meal_data in day_data.values():
+                if not isinstance(meal_data, dict):
+                    continue
+                words = normalize(str(meal_data.get('name') or '')).split(' ')
+                phrases = {
+                    ' '.join(words[i:j])
+                    for i in range(len(words))
+                    for j in range(i + 1, min(len(words), i + MAX_MEAL_NAME_WORDS) + 1)
+                }
+                phrases.discard('')
+                usage.update(phrases)
+    return usage
+
+
+def entry_rank(food: Dict, key: str) -> int:
+    """Sort value of a key entry: most used first, then matches at the start of the
+    name, then shorter names"""
+    return -food['popularity'] * 2 ** 20 + (key != food['normalized']) * 2 ** 19 + min(len(food['name']), 2 ** 19 - 1)
+
+
+class FoodAutocompleteIndex:
+    """Sorted (key, food id) array searched with bisect, with a parallel rank array
+    so the best entries of a prefix range are selected without sorting the range"""
+
+    def __init__(self, np, usage: Counter):
+        self.np = np
+        self.usage = usage
+        self.entries: List[Tuple[str, str]] = []
+        self.ranks = []
+        self.rank_list: List[int] = []
+        self.foods: Dict[str, Dict] = {}
+        self.version = None
+        self.watermark = None
+
+    @classmethod
+    def build(cls, np, rows: List[Tuple], usage: Counter) -> 'FoodAutocompleteIndex':
+        """Full build from AUTOCOMPLETE_FIELDS rows"""
+        index = cls(np, usage)
+        entries = []
+        for row in rows:
+            food = index._food(row)
+            entries.extend((key, food['id']) for key in food['keys'])
+            index._advance(row)
+        entries.sort()
+        index._publish(entries)
+        return index
+
+    def _food(self, row: Tuple) -> Dict:
+        values = dict(zip(AUTOCOMPLETE_FIELDS, row))
+        food = {
+            'id': str(values['id']),
+            'name': values['name'],
+            'food_category': values['food_category'],
+            'calories': values['calories'],
+            'keys': name_keys(values['name']),
+            'normalized': normalize(values['name']),
+        }
+        food['popularity'] = self.usage.get(food['normalized'], 0)
+        self.foods[food['id']] = food
+        return food
+
+    def _advance(self, row: Tuple):
+        updated_at = row[AUTOCOMPLETE_FIELDS.index('updated_at')]
+        if self.watermark is None or updated_at > self.watermark:
+            self.watermark = updated_at
+
+    def _publish(self, entries: List[Tuple[str, str]], ranks: Optional[List[int]] = None):
+        """Swap in a new entry array and its ranks, so readers never see a half-applied update"""
+        if ranks is None:
+            ranks = [entry_rank(self.foods[food_id], key) for key, food_id in entries]
+        self.rank_list = ranks
+        if self.np is not None:
+            ranks = self.np.array(ranks, dtype=self.np.int64)
+        self.entries, self.ranks = entries, ranks
+
+    def apply(self, rows: List[Tuple], live_ids=None):
+        """Apply added, renamed and (given live_ids) deleted foods without a full rebuild"""
+        removed = set()
+        added = []
+        for row in rows:
+            previous = self.foods.get(str(row[0]))
+            if previous is not None:
+                removed.update((key, previous['id']) for key in previous['keys'])
+            food = self._food(row)
+            added.extend((key, food['id']) for key in food['keys'])
+            self._advance(row)
+
+        if live_ids is not None:
+            live_ids = set(live_ids)
+            for food_id in [food_id for food_id in self.foods if food_id not in live_ids]:
+                food = self.foods.pop(food_id)
+                removed.update((key, food_id) for key in food['keys'])
+
+        entries = list(self.entries)
+        ranks = list(self.rank_list)
+        for entry in removed:
+            position = bisect.bisect_left(entries, entry)
+            if position < len(entries) and entries[position] == entry:
+                del entries[position]
+                del ranks[position]
+        for key, food_id in added:
+            position = bisect.bisect_left(entries, (key, food_id))
+            rank = entry_rank(self.foods[food_id], key)
+            if position < len(entries) and entries[position] == (key, food_id):
+                ranks[position] = rank
+            else:
+                entries.insert(position, (key, food_id))
+                ranks.insert(position, rank)
+        self._publish(entries, ranks)
+
+    def _best_positions(self, start: int, end: int, count: int) -> List[int]:
+        """Positions of the count lowest-ranked entries in [start, end), best first"""
+        if self.np is None:
+            return heapq.nsmallest(count, range(start, end), key=self.ranks.__getitem__)
+        np = self.np
+        ranks = self.ranks[start:end]
+        if count < len(ranks):
+            positions = np.argpartition(ranks, count)[:count]
+        else:
+            positions = np.arange(len(ranks))
+        positions = positions[np.argsort(ranks[positions], kind='stable')]
+        return (positions + start).tolist()
+
+    def complete(self, query: str, limit: int = 10) -> List[Dict]:
+        """Foods whose name, or a word of it, starts with query"""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        entries = self.entries
+        start = bisect.bisect_left(entries, (prefix,))
+        end = bisect.bisect_left(entries, (prefix + '\uffff',), start)
+
+        # A food can match through several of its keys, so over-fetch before de-duplicating
+        results = []
+        seen = set()
+        for position in self._best_positions(start, end, limit * 3):
+            food = self.foods.get(entries[position][1])
+            if food is None or food['id'] in seen:
+                continue
+            seen.add(food['id'])
+            results.append({
+                'id': food['id'],
+                'name': food['name'],
+                'food_category': food['food_category'],
+                'calories': food['calories'],
+                'popularity': food['popularity'],
+            })
+            if len(results) == limit:
+                break
+        return results
+
+
+class FoodAutocompleteService:
+    """Keeps a FoodAutocompleteIndex in step with the catalog version and chart usage"""
+
+    def __init__(self):
+        self.np = None
+        self.index: Optional[FoodAutocompleteIndex] = None
+        self.usage_loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._rebuild_thread: Optional[threading.Thread] = None
+        self._initialize()
+
+    def _initialize(self):
+        """Load numpy for fast top-k selection; without it ranking falls back to heapq"""
+        try:
+            import numpy
+            self.np = numpy
+        except ImportError as e:
+            logger.warning(f"Food autocomplete using pure Python ranking, numpy not installed: {e}")
+            self.np = None
+
+    @property
+    def usage_ttl(self) -> int:
+        return getattr(settings, 'FOOD_AUTOCOMPLETE_USAGE_TTL', 600)
+
+    def _rows(self, queryset) -> List[Tuple]:
+        return list(queryset.values_list(*AUTOCOMPLETE_FIELDS).iterator(chunk_size=2000))
+
+    def _usage(self) -> Counter:
+        """Food name usage across diet charts: meal names of charts stored as JSON, and the
+        food names of the meal entries of normalized charts (whose daily_meals column is empty)"""
+        from diet_charts.models import DietChart, DietChartMealEntry
+        usage = meal_name_usage(
+            DietChart.objects.exclude(storage='normalized').values_list('daily_meals', flat=True).iterator(chunk_size=500)
+        )
+        usage.update(
+            normalize(name) for name in DietChartMealEntry.objects.filter(
+                diet_chart__storage='normalized', food_name__isnull=False
+            ).values_list('food_name', flat=True).iterator(chunk_size=2000)
+        )
+        return usage
+
+    def get_index(self) -> FoodAutocompleteIndex:
+        """Get the index for the current catalog version, applying changes since the last one
+
+        Usage counts only drift as charts are written, so they are reloaded (with a full
+        rebuild, since every ranking may change) at most once per FOOD_AUTOCOMPLETE_USAGE_TTL.
+        That rebuild runs on a background thread while requests keep using the current
+        index; only the very first build happens on the request path.
+        """
+        version, _ = FoodCatalogState.cached_state()
+        index = self.index
+        if index is not None and time.monotonic() - self.usage_loaded_at >= self.usage_ttl:
+            self._start_rebuild()
+        if index is not None and index.version == version:
+            return index
+
+        with self._lock:
+            if self.index is None:
+                self.index = self._build()
+                self.usage_loaded_at = time.monotonic()
+            index = self.index
+            if index.version != version:
+                self._refresh(index)
+                index.version = version
+            return index
+
+    def _build(self) -> FoodAutocompleteIndex:
+        """A full index with fresh usage counts"""
+        # Read the version first: rows changed after it are applied by the next refresh
+        version, _ = FoodCatalogState.cached_state()
+        usage = self._usage()
+        index = FoodAutocompleteIndex.build(self.np, self._rows(FoodItem.objects.all()), usage)
+        index.version = version
+        logger.info(f"Built food autocomplete index v{version} ({len(index.foods)} foods)")
+        return index
+
+    def _start_rebuild(self):
+        with self._lock:
+            if time.monotonic() - self.usage_loaded_at < self.usage_ttl or (
+                    self._rebuild_thread is not None and self._rebuild_thread.is_alive()):
+                return
+            # Not retried until the TTL passes again, even if this rebuild fails
+            self.usage_loaded_at = time.monotonic()
+            self._rebuild_thread = threading.Thread(
+                target=self._rebuild, name='food-autocomplete-rebuild', daemon=True
+            )
+            self._rebuild_thread.start()
+
+    def _rebuild(self):
+        try:
+            index = self._build()
+            # Swapped under the lock so no request is refreshing the index being replaced
+            with self._lock:
+                self.index = index
+        except Exception as e:
+            logger.error(f"Food autocomplete index rebuild failed: {e}")
+        finally:
+            connection.close()
+
+    def _refresh(self, index: FoodAutocompleteIndex):
+        """Apply rows changed since the watermark"""
+        changed = FoodItem.objects.all()
+        if index.watermark is not None:
+            # Overlap the watermark so rows from transactions that committed late are not missed
+            overlap = timedelta(seconds=getattr(settings, 'FOOD_AUTOCOMPLETE_WATERMARK_OVERLAP', 60))
+            changed = changed.filter(updated_at__gte=index.watermark - overlap)
+        rows = self._rows(changed)
+
+        live_ids = None
+        # Deletes leave no trace in updated_at; a count mismatch means some rows are gone
+        if FoodItem.objects.count() != len(set(index.foods) | {str(row[0]) for row in rows}):
+            live_ids = [str(food_id) for food_id in FoodItem.objects.values_list('id', flat=True)]
+        index.apply(rows, live_ids)
+
+    def complete(self, query: str, limit: int = 10) -> List[Dict]:
+        return self.get_index().complete(query, limit)
+
+
+# Global instance
+food_autocomplete = FoodAutocompleteService()
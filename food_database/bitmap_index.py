@@ -0,0 +1,100 @@
+"""
+Bitmap index helpers for the food catalog engine
+Rows are packed 64 per uint64 word so filters run as word-wise AND/OR and totals as popcounts
+"""
+from collections.abc import Sequence
+import numpy as np
+
+# Bit counts for every byte value, used to popcount uint64 words viewed as bytes
+POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def word_count(row_count):
+    """Number of uint64 words needed to hold one bit per row"""
+    return (row_count + 63) // 64
+
+
+def empty(row_count):
+    """Bitset with no rows set"""
+    return np.zeros(word_count(row_count), dtype=np.uint64)
+
+
+def full(row_count):
+    """Bitset with every row set"""
+    return from_mask(np.ones(row_count, dtype=bool))
+
+
+def from_rows(rows, row_count):
+    """Bitset with the given row numbers set"""
+    mask = np.zeros(row_count, dtype=bool)
+    mask[rows] = True
+    return from_mask(mask)
+
+
+def from_mask(mask):
+    """Pack a boolean row mask into a bitset"""
+    packed = np.packbits(mask, bitorder='little')
+    padding = (-len(packed)) % 8
+    if padding:
+        packed = np.concatenate([packed, np.zeros(padding, dtype=np.uint8)])
+    return packed.view(np.uint64)
+
+
+def to_mask(bits, row_count):
+    """Unpack a bitset into a boolean row mask"""
+    return np.unpackbits(bits.view(np.uint8), count=row_count, bitorder='little').astype(bool)
+
+
+def union(bitmaps, row_count):
+    """OR together a list of bitsets"""
+    if not len(bitmaps):
+        return empty(row_count)
+    return np.bitwise_or.reduce(np.asarray(bitmaps), axis=0)
+
+
+def popcount(bits):
+    """Number of rows set in a bitset"""
+    return int(POPCOUNT_TABLE[bits.view(np.uint8)].sum(dtype=np.int64))
+
+
+def popcount_rows(matrix):
+    """Number of rows set in each bitset of a (bitsets, words) matrix"""
+    matrix = np.ascontiguousarray(matrix)
+    if not matrix.size:
+        return np.zeros(len(matrix), dtype=np.int64)
+    return POPCOUNT_TABLE[matrix.view(np.uint8)].sum(axis=1, dtype=np.int64)
+
+
+class BitmapResult(Sequence):
+    """Lazy, ordered sequence of food ids selected by a bitset
+
+    Paginator calls count() for totals (a popcount) and slices for pages, so the
+    id list is only materialized for the rows on the requested page.
+    """
+
+    def __init__(self, bits, ids, row_count):
+        self.bits = bits
+        self.ids = ids
+        self.row_count = row_count
+        self._count = None
+        self._rows = None
+
+    def count(self):
+        if self._count is None:
+            self._count = popcount(self.bits)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    @property
+    def rows(self):
+        """Row numbers of the selected foods, in snapshot order"""
+        if self._rows is None:
+            self._rows = np.flatnonzero(to_mask(self.bits, self.row_count))
+        return self._rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.ids[self.rows[index]].tolist()
+        return str(self.ids[self.rows[index]])
@@ -0,0 +1,468 @@
+"""
+Columnar Food Catalog Engine for Aahaara Harmony
+Answers food list filters from a versioned, memory-mapped snapshot of the catalog
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from decimal import Decimal, ROUND_CEILING, ROUND_FLOOR
+from typing import Optional, Dict, Any
+from django.conf import settings
+from django.db import connection
+from .filters import RANGE_FILTERS
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 5
+
+# Single-valued string columns stored as small-int codes
+CODED_FIELDS = ['virya', 'vata_effect', 'pitta_effect', 'kapha_effect']
+
+# JSON array columns
+MULTI_VALUED_FIELDS = ['rasa', 'guna', 'meal_types', 'tags']
+
+# Fields with one bitmap per distinct value
+BITMAP_FIELDS = CODED_FIELDS + MULTI_VALUED_FIELDS
+
+# Fields with per-value counts in the facets endpoint; food_category is filtered by
+# substring on its own column, so its bitmaps only serve facet counts
+FACET_FIELDS = ['food_category'] + BITMAP_FIELDS
+
+# Decimal columns stored as fixed-point hundredths so comparisons stay exact
+DECIMAL_FIELDS = ['protein_g', 'carbs_g', 'fat_g', 'fiber_g']
+
+# Derived float columns (NaN where undefined), computed like filters.ratio_expressions
+RATIO_FIELDS = ['calorie_density', 'protein_density', 'calories_per_protein']
+
+# Columns with a sorted index: row numbers ordered by value plus the sorted values,
+# so a range predicate is two binary searches instead of a column scan
+RANGE_COLUMNS = ['calories'] + DECIMAL_FIELDS + RATIO_FIELDS
+
+
+def _hundredths(value, rounding):
+    """Convert a Decimal threshold into the fixed-point integer used by the snapshot"""
+    return int((Decimal(value) * 100).to_integral_value(rounding=rounding))
+
+
+class CatalogSnapshot:
+    """Read-only view over one versioned snapshot directory"""
+
+    def __init__(self, path: str, np):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+
+        self.version = self.meta['version']
+        self.count = self.meta['count']
+        self.vocabularies = self.meta['vocabularies']
+        self._codes = {
+            field: {value: code for code, value in enumerate(values)}
+            for field, values in self.vocabularies.items()
+        }
+        self.columns = {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+            for name in self.meta['columns']
+        }
+
+    def code_for(self, field: str, value: str) -> Optional[int]:
+        """Get the small-int code of a value, or None if it never occurs"""
+        return self._codes[field].get(value)
+
+
+class FoodCatalogEngine:
+    """Memory-mapped columnar engine for food_items_list filtering"""
+
+    def __init__(self, snapshot_dir: Optional[str] = None):
+        self.np = None
+        self.bitmaps = None
+        self.is_available = False
+        self._snapshot_dir = snapshot_dir
+        self.snapshot = None
+        self._snapshot_dir = snapshot_dir
+        self._lock = threading.Lock()
+        self._build_thread: Optional[threading.Thread] = None
+        self._initialize()
+
+    def _initialize(self):
+        """Load numpy, which the engine needs for its column arrays"""
+        try:
+            import numpy
+            from . import bitmap_index
+            self.np = numpy
+            self.bitmaps = bitmap_index
+            self.is_available = True
+        except ImportError as e:
+            logger.warning(f"Food catalog engine disabled, numpy not installed: {e}")
+            self.is_available = False
+
+    @property
+    def is_enabled(self) -> bool:
+        return self.is_available and getattr(settings, 'FOOD_CATALOG_ENGINE_ENABLED', False)
+
+    @property
+    def snapshot_dir(self) -> str:
+        if self._snapshot_dir:
+            return self._snapshot_dir
+        return str(getattr(settings, 'FOOD_CATALOG_SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), 'food_catalog')))
+
+    def _snapshot_path(self, version: int) -> str:
+        return os.path.join(self.snapshot_dir, f'v{version}')
+
+    def get_snapshot(self, version: Optional[int] = None) -> CatalogSnapshot:
+        """Get the snapshot for a catalog version (the current one by default), building it if needed
+
+        Builds on the calling thread, so it is meant for management commands; requests use
+        current_snapshot, which never waits for a build.
+        """
+        from .models import FoodCatalogState
+
+        if version is None:
+            version = FoodCatalogState.current_version()
+
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+
+        if not self._is_built(version):
+            self.build_snapshot(version)
+        return self._load(version)
+
+    def current_snapshot(self) -> Optional[CatalogSnapshot]:
+        """Get the snapshot for the current catalog version, or None while it is being built
+
+        A missing snapshot is built on a background thread; until it is ready requests are
+        answered by the database, so a catalog write never stalls the request that follows it.
+        """
+        from .models import FoodCatalogState
+
+        version = FoodCatalogState.current_version()
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+
+        # Another worker on this host may already have built it
+        if self._is_built(version):
+            return self._load(version)
+
+        self._start_build(version)
+        return None
+
+    def _is_built(self, version: int) -> bool:
+        """Whether a complete snapshot in this code's format exists for a version"""
+        try:
+            with open(os.path.join(self._snapshot_path(version), 'meta.json'), 'r', encoding='utf-8') as f:
+                return json.load(f).get('format') == SNAPSHOT_FORMAT
+        except (OSError, ValueError):
+            return False
+
+    def _load(self, version: int) -> CatalogSnapshot:
+        with self._lock:
+            if self.snapshot is None or self.snapshot.version != version:
+                self.snapshot = CatalogSnapshot(self._snapshot_path(version), self.np)
+            return self.snapshot
+
+    def _start_build(self, version: int):
+        with self._lock:
+            if self._build_thread is not None and self._build_thread.is_alive():
+                return
+            self._build_thread = threading.Thread(
+                target=self._build, args=(version,), name='food-catalog-snapshot', daemon=True
+            )
+            self._build_thread.start()
+
+    def _build(self, version: int):
+        try:
+            self.build_snapshot(version)
+            self._load(version)
+        except Exception as e:
+            logger.error(f"Food catalog snapshot v{version} build failed: {e}")
+        finally:
+            connection.close()
+
+    def build_snapshot(self, version: int) -> str:
+        """Write the snapshot for a catalog version, once per host across all workers"""
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        path = self._snapshot_path(version)
+
+        with open(os.path.join(self.snapshot_dir, '.lock'), 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Another worker may have finished the build while we waited
+                if self._is_built(version):
+                    return path
+
+                tmp_path = tempfile.mkdtemp(prefix=f'.v{version}-', dir=self.snapshot_dir)
+                try:
+                    self._write_snapshot(tmp_path, version)
+                    # Replace a snapshot left behind by an older format
+                    shutil.rmtree(path, ignore_errors=True)
+                    os.rename(tmp_path, path)
+                except Exception:
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+                    raise
+
+                self._prune_snapshots(version)
+                logger.info(f"Built food catalog snapshot v{version} at {path}")
+                return path
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_snapshot(self, path: str, version: int):
+        """Load the catalog and save it as one .npy file per column"""
+        from .models import FoodItem
+
+        np = self.np
+        columns = {
+            'id': [], 'created_at': [], 'calories': [], 'food_category': [],
+        }
+        for field in DECIMAL_FIELDS + CODED_FIELDS:
+            columns[field] = []
+
+        vocabularies = {field: {} for field in FACET_FIELDS}
+        value_rows = {field: [] for field in FACET_FIELDS}
+
+        def code(field, value, row_num):
+            value_code = vocabularies[field].setdefault(value, len(vocabularies[field]))
+            if value_code == len(value_rows[field]):
+                value_rows[field].append([])
+            value_rows[field][value_code].append(row_num)
+            return value_code
+
+        rows = FoodItem.objects.order_by('-created_at', '-id').values_list(
+            'id', 'created_at', 'food_category', 'calories', 'serving_grams', *DECIMAL_FIELDS,
+            *CODED_FIELDS, *MULTI_VALUED_FIELDS
+        )
+        serving_grams = []
+
+        for row_num, row in enumerate(rows.iterator(chunk_size=2000)):
+            (food_id, created_at, food_category, calories, grams, *rest) = row
+            decimals = rest[:len(DECIMAL_FIELDS)]
+            coded = rest[len(DECIMAL_FIELDS):len(DECIMAL_FIELDS) + len(CODED_FIELDS)]
+            multi = rest[len(DECIMAL_FIELDS) + len(CODED_FIELDS):]
+
+            columns['id'].append(str(food_id))
+            columns['created_at'].append(int(created_at.timestamp() * 1_000_000))
+            columns['calories'].append(calories)
+            serving_grams.append(float(grams) if grams else np.nan)
+            # icontains compares upper-cased text, so the snapshot does too
+            columns['food_category'].append(food_category.upper())
+            code('food_category', food_category, row_num)
+
+            for field, value in zip(DECIMAL_FIELDS, decimals):
+                columns[field].append(_hundredths(value, ROUND_FLOOR))
+            for field, value in zip(CODED_FIELDS, coded):
+                columns[field].append(code(field, value, row_num))
+            for field, values in zip(MULTI_VALUED_FIELDS, multi):
+                for value in set(values or []):
+                    code(field, value, row_num)
+
+        dtypes = {
+            'id': 'U36', 'created_at': np.int64, 'calories': np.int32, 'food_category': str,
+        }
+        for field in DECIMAL_FIELDS:
+            dtypes[field] = np.int32
+        for field in CODED_FIELDS:
+            dtypes[field] = np.int8
+
+        arrays = {name: np.array(values, dtype=dtypes[name]) for name, values in columns.items()}
+
+        # Ratios from the exact stored values; NaN never satisfies a range, like SQL NULL
+        calories = arrays['calories'].astype(np.float64)
+        protein = arrays['protein_g'] / 100.0
+        grams = np.array(serving_grams, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            arrays['calorie_density'] = calories * 100 / grams
+            arrays['protein_density'] = protein * 100 / grams
+            arrays['calories_per_protein'] = np.where(protein > 0, calories / protein, np.nan)
+
+        for name in RANGE_COLUMNS:
+            values = arrays[name]
+            order = np.argsort(values, kind='stable')
+            if values.dtype.kind == 'f':
+                order = order[~np.isnan(values[order])]
+            arrays[f'{name}_order'] = order.astype(np.int32)
+            arrays[f'{name}_sorted'] = values[order]
+
+        for name, values in arrays.items():
+            np.save(os.path.join(path, f'{name}.npy'), values)
+
+        # One bitset per distinct value, stacked into a (values, words) matrix per field
+        count = len(columns['id'])
+        for field in FACET_FIELDS:
+            matrix = np.zeros((len(value_rows[field]), self.bitmaps.word_count(count)), dtype=np.uint64)
+            for value_code, rows in enumerate(value_rows[field]):
+                matrix[value_code] = self.bitmaps.from_rows(rows, count)
+            np.save(os.path.join(path, f'{field}_bitmaps.npy'), matrix)
+
+        meta = {
+            'format': SNAPSHOT_FORMAT,
+            'version': version,
+            'count': count,
+            'columns': list(arrays.keys()) + [f'{field}_bitmaps' for field in FACET_FIELDS],
+            'vocabularies': {
+                field: sorted(values, key=values.get) for field, values in vocabularies.items()
+            },
+        }
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+    def _prune_snapshots(self, current_version: int):
+        """Remove snapshots older than the ones we keep around for in-flight workers"""
+        keep = getattr(settings, 'FOOD_CATALOG_SNAPSHOTS_KEPT', 2)
+        versions = []
+        for entry in os.listdir(self.snapshot_dir):
+            if entry.startswith('v') and entry[1:].isdigit():
+                versions.append(int(entry[1:]))
+
+        for version in sorted(versions)[:-keep]:
+            if version != current_version:
+                shutil.rmtree(self._snapshot_path(version), ignore_errors=True)
+
+    def _bits(self, snapshot: CatalogSnapshot, filter_data: Dict[str, Any]):
+        """Build the bitset of rows matching validated FoodItemFilterSerializer data"""
+        np = self.np
+        bitmaps = self.bitmaps
+        cols = snapshot.columns
+        bits = bitmaps.full(snapshot.count)
+
+        # Virya and dosha effects (exact match)
+        for field in CODED_FIELDS:
+            if filter_data.get(field):
+                code = snapshot.code_for(field, filter_data[field])
+                if code is None:
+                    return bitmaps.empty(snapshot.count)
+                bits &= cols[f'{field}_bitmaps'][code]
+
+        # Meal types, tags, rasa, guna (any of the requested values)
+        for field in MULTI_VALUED_FIELDS:
+            if filter_data.get(field):
+                codes = [snapshot.code_for(field, value) for value in filter_data[field]]
+                codes = [c for c in codes if c is not None]
+                bits &= bitmaps.union(cols[f'{field}_bitmaps'][codes], snapshot.count)
+
+        # Text predicates are evaluated on the column, then packed
+        mask = None
+
+        def restrict(condition):
+            nonlocal mask
+            mask = condition if mask is None else mask & condition
+
+        # Food category
+        if filter_data.get('food_category'):
+            restrict(np.char.find(cols['food_category'], filter_data['food_category'].upper()) >= 0)
+
+        if mask is not None:
+            bits &= bitmaps.from_mask(mask)
+
+        # Nutritional ranges
+        rows = self._range_rows(snapshot, filter_data)
+        if rows is not None:
+            bits &= bitmaps.from_rows(rows, snapshot.count)
+        return bits
+
+    def _range_bounds(self, column: str, low, high):
+        """Convert validated thresholds into the column's stored representation"""
+        if column in DECIMAL_FIELDS:
+            low = None if low is None else _hundredths(low, ROUND_CEILING)
+            high = None if high is None else _hundredths(high, ROUND_FLOOR)
+        elif column in RATIO_FIELDS:
+            low = None if low is None else float(low)
+            high = None if high is None else float(high)
+        return low, high
+
+    def _range_rows(self, snapshot: CatalogSnapshot, filter_data: Dict[str, Any]):
+        """Row numbers satisfying every range filter, or None when there are none
+
+        Each range is located in its sorted index by binary search. Rows of the narrowest
+        range are then checked against the other ranges by looking up just those rows,
+        so the cost follows the most selective predicate rather than the catalog size.
+        """
+        np = self.np
+        cols = snapshot.columns
+        ranges = []
+        for name, column in RANGE_FILTERS.items():
+            low, high = filter_data.get(f'min_{name}'), filter_data.get(f'max_{name}')
+            if low is None and high is None:
+                continue
+            low, high = self._range_bounds(column, low, high)
+            values = cols[f'{column}_sorted']
+            start = 0 if low is None else int(np.searchsorted(values, low, side='left'))
+            end = len(values) if high is None else int(np.searchsorted(values, high, side='right'))
+            ranges.append((max(end - start, 0), column, start, end, low, high))
+
+        if not ranges:
+            return None
+        ranges.sort(key=lambda r: r[0])
+        _, column, start, end, _, _ = ranges[0]
+        rows = np.asarray(cols[f'{column}_order'][start:max(start, end)])
+        for _, column, _, _, low, high in ranges[1:]:
+            if not len(rows):
+                break
+            values = cols[column][rows]
+            keep = np.ones(len(rows), dtype=bool)
+            if low is not None:
+                keep &= values >= low
+            if high is not None:
+                keep &= values <= high
+            rows = rows[keep]
+        return rows
+
+    def filter_ids(self, filter_data: Dict[str, Any]):
+        """Get the ids of matching foods, newest first, or None to fall back to the ORM
+
+        The result is a lazy sequence: its count is a popcount and only sliced
+        pages are turned into id lists. Search requests are left to the ranked
+        search service.
+        """
+        if not self.is_enabled or filter_data.get('search'):
+            return None
+
+        try:
+            snapshot = self.current_snapshot()
+            if snapshot is None:
+                return None
+            bits = self._bits(snapshot, filter_data)
+            return self.bitmaps.BitmapResult(bits, snapshot.columns['id'], snapshot.count)
+        except Exception as e:
+            logger.error(f"Food catalog engine failed, falling back to the database: {e}")
+            return None
+
+    def facet_counts(self, filter_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Per-value counts of every facet field among matching foods, or None to fall back
+
+        Each count is a popcount of the value's bitmap ANDed with the filter bitset.
+        """
+        if not self.is_enabled or filter_data.get('search'):
+            return None
+
+        try:
+            snapshot = self.current_snapshot()
+            if snapshot is None:
+                return None
+            bits = self._bits(snapshot, filter_data)
+            facets = {}
+            for field in FACET_FIELDS:
+                counts = self.bitmaps.popcount_rows(snapshot.columns[f'{field}_bitmaps'] & bits)
+                facets[field] = {
+                    value: int(count)
+                    for value, count in zip(snapshot.vocabularies[field], counts) if count and value
+                }
+            return {'total': self.bitmaps.popcount(bits), 'facets': facets}
+        except Exception as e:
+            logger.error(f"Food catalog engine failed, falling back to the database: {e}")
+            return None
+
+
+# Global instance
+catalog_engine = FoodCatalogEngine()
@@ -0,0 +1,148 @@
+"""
+Food Catalog Changes Feed for Aahaara Harmony
+Deltas since a catalog version, from the FoodChange log, so clients can keep a
+local catalog and sync only what changed
+"""
+import logging
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework import serializers
+from .models import FoodItem, FoodCatalogState, FoodChange
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Columns of each upserted row, sent once per response as the header of a row array
+SYNC_FIELDS = [
+    'id', 'name', 'serving_size', 'calories', 'protein_g', 'carbs_g', 'fat_g', 'fiber_g',
+    'serving_grams', 'rasa', 'guna', 'virya', 'vata_effect', 'pitta_effect', 'kapha_effect',
+    'meal_types', 'food_category', 'tags', 'updated_at',
+]
+DECIMAL_FIELDS = {'protein_g', 'carbs_g', 'fat_g', 'fiber_g', 'serving_grams'}
+
+MAX_CHANGES = 5000
+
+_datetime = serializers.DateTimeField()
+
+
+def compact_row(row) -> List[Any]:
+    """One SYNC_FIELDS row as a JSON-ready list: decimals as numbers, ids and times as strings"""
+    values = []
+    for field, value in zip(SYNC_FIELDS, row):
+        if field == 'id':
+            value = str(value)
+        elif field in DECIMAL_FIELDS:
+            value = float(value) if value is not None else None
+        elif field == 'updated_at':
+            value = _datetime.to_representation(value)
+        values.append(value)
+    return values
+
+
+class FoodChangeFeed:
+    """Builds catalog deltas from the change log, or a full snapshot when a delta is impossible"""
+
+    @property
+    def retention_days(self) -> int:
+        return getattr(settings, 'FOOD_CHANGES_RETENTION_DAYS', 30)
+
+    def changes(self, since: Optional[int], limit: int = 1000) -> Dict[str, Any]:
+        """Upserts and tombstones after version since, up to about limit logged changes
+
+        The returned version is the sync token for the next request. When has_more is
+        set, the client should ask again straight away from that version. A reset
+        response carries the whole catalog and replaces the client's copy.
+        """
+        # Read the version before any rows: a row written later then shows up again
+        # in the next delta, which is harmless, instead of being missed
+        state = FoodCatalogState.objects.filter(pk=1).values_list('version', 'changes_horizon').first()
+        version, horizon = state or (0, 0)
+
+        if since is None or since < horizon or since > version:
+            return self._snapshot(version, since)
+
+        changes = list(
+            FoodChange.objects.filter(version__gt=since, version__lte=version)
+            .order_by('version', 'id')
+            .values_list('food_id', 'operation', 'version')[:limit + 1]
+        )
+        has_more = len(changes) > limit
+        if has_more:
+            changes = changes[:limit]
+            last_version = changes[-1][2]
+            complete = [change for change in changes if change[2] < last_version]
+            if complete:
+                # Pages end on a version boundary, so no version is ever half-applied
+                changes = complete
+                version = last_version - 1
+            else:
+                # One version (e.g. an import chunk) larger than a page is sent whole
+                changes = list(
+                    FoodChange.objects.filter(version=last_version)
+                    .order_by('id').values_list('food_id', 'operation', 'version')
+                )
+                version = last_version
+
+        # A prune that committed while we read may have removed part of the range
+        if FoodCatalogState.objects.filter(pk=1, changes_horizon__gt=since).exists():
+            return self._snapshot(version, since)
+
+        # The last logged operation per food wins
+        operations = {}
+        for food_id, operation, _ in changes:
+            operations[food_id] = operation
+
+        upsert_ids = [food_id for food_id, operation in operations.items() if operation == 'upsert']
+        rows = list(FoodItem.objects.filter(id__in=upsert_ids).values_list(*SYNC_FIELDS)) if upsert_ids else []
+        found = {row[0] for row in rows}
+        # A food deleted after this version's upsert has no row but a later tombstone;
+        # sending the tombstone now keeps the client from holding on to it
+        deletes = [
+            str(food_id) for food_id, operation in operations.items()
+            if operation == 'delete' or food_id not in found
+        ]
+
+        return {
+            'version': version,
+            'since': since,
+            'reset': False,
+            'has_more': has_more,
+            'fields': SYNC_FIELDS,
+            'upserts': [compact_row(row) for row in rows],
+            'deletes': deletes,
+        }
+
+    def _snapshot(self, version: int, since: Optional[int]) -> Dict[str, Any]:
+        """The whole catalog as of at least version"""
+        rows = FoodItem.objects.order_by('id').values_list(*SYNC_FIELDS).iterator(chunk_size=2000)
+        return {
+            'version': version,
+            'since': since,
+            'reset': True,
+            'has_more': False,
+            'fields': SYNC_FIELDS,
+            'upserts': [compact_row(row) for row in rows],
+            'deletes': [],
+        }
+
+    def prune(self, days: Optional[int] = None) -> int:
+        """Delete log entries older than the retention window and move the horizon past them"""
+        cutoff = timezone.now() - timedelta(days=self.retention_days if days is None else days)
+        with transaction.atomic():
+            expired = FoodChange.objects.filter(changed_at__lt=cutoff)
+            newest = expired.aggregate(newest=Max('version'))['newest']
+            if newest is None:
+                return 0
+            # Clients behind the horizon get a reset instead of a delta with holes in it
+            FoodCatalogState.objects.filter(pk=1, changes_horizon__lt=newest).update(changes_horizon=newest)
+            deleted, _ = FoodChange.objects.filter(version__lte=newest).delete()
+        logger.info(f"Pruned {deleted} food changes up to v{newest}")
+        return deleted
+
+
+# Global instance
+food_changes = FoodChangeFeed()
@@ -0,0 +1,144 @@
+"""
+Conditional GET support for food catalog endpoints
+ETag and Last-Modified come from the catalog version, so unchanged data is answered
+with 304 Not Modified before the view runs any catalog query
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+from .models import FoodCatalogState
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+METRIC_COUNTERS = ['requests', 'not_modified']
+
+METRICS_KEY = 'food_http_cache:{endpoint}:{counter}'
+METRICS_SINCE_KEY = 'food_http_cache:since'
+
+# Counts of this process not yet added to the shared counters in the cache. They are
+# flushed in one batch every FOOD_CACHE_METRICS_FLUSH_SECONDS, so a 304 does not pay
+# for a cache write of its own.
+_pending = Counter()
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+# Endpoints with recorded metrics, in registration order
+ENDPOINTS = []
+
+
+def catalog_etag(request, *args, **kwargs):
+    """Strong ETag for the catalog version and the negotiated representation"""
+    version, _ = FoodCatalogState.cached_state()
+    # The same URL renders differently for JSON and browsable-API clients
+    variant = hashlib.md5(request.META.get('HTTP_ACCEPT', '').encode('utf-8')).hexdigest()[:8]
+    return f'"food-catalog-v{version}-{variant}"'
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    _, updated_at = FoodCatalogState.cached_state()
+    return updated_at
+
+
+def record_request(endpoint, not_modified):
+    """Count a conditional-GET outcome, flushing this process's batch when it is due"""
+    with _pending_lock:
+        _pending[(endpoint, 'requests')] += 1
+        if not_modified:
+            _pending[(endpoint, 'not_modified')] += 1
+        due = time.monotonic() - _last_flush >= getattr(settings, 'FOOD_CACHE_METRICS_FLUSH_SECONDS', 10)
+    if due:
+        flush_metrics()
+
+
+def flush_metrics():
+    """Add this process's pending counts to the shared counters"""
+    global _last_flush
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+
+    try:
+        cache.add(METRICS_SINCE_KEY, timezone.now().isoformat(), None)
+        for (endpoint, counter), count in pending.items():
+            key = METRICS_KEY.format(endpoint=endpoint, counter=counter)
+            cache.add(key, 0, None)
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                # Evicted between add() and incr()
+                cache.set(key, count, None)
+    except Exception as e:
+        logger.warning(f"Could not flush food cache metrics: {e}")
+
+
+def get_metrics():
+    """Requests, 304 responses and hit ratio per endpoint, summed over the processes that
+    share the cache (only this process with the default local-memory cache)"""
+    flush_metrics()
+    keys = {
+        (endpoint, counter): METRICS_KEY.format(endpoint=endpoint, counter=counter)
+        for endpoint in ENDPOINTS for counter in METRIC_COUNTERS
+    }
+    stored = cache.get_many(list(keys.values()) + [METRICS_SINCE_KEY])
+
+    metrics = {}
+    for endpoint in ENDPOINTS:
+        counts = {counter: stored.get(keys[(endpoint, counter)], 0) for counter in METRIC_COUNTERS}
+        counts['hit_ratio'] = round(counts['not_modified'] / counts['requests'], 4) if counts['requests'] else None
+        metrics[endpoint] = counts
+
+    requests = sum(m['requests'] for m in metrics.values())
+    not_modified = sum(m['not_modified'] for m in metrics.values())
+    return {
+        'scope': 'process' if isinstance(cache, LocMemCache) else 'shared',
+        'since': stored.get(METRICS_SINCE_KEY),
+        'endpoints': metrics,
+        'total': {
+            'requests': requests,
+            'not_modified': not_modified,
+            'hit_ratio': round(not_modified / requests, 4) if requests else None,
+        },
+    }
+
+
+def catalog_conditional(endpoint):
+    """Decorator for catalog read views, applied below @api_view so authentication runs first"""
+    ENDPOINTS.append(endpoint)
+
+    def decorator(view_func):
+        conditional_view = condition(
+            etag_func=catalog_etag, last_modified_func=catalog_last_modified
+        )(view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code == 304:
+                record_request(endpoint, True)
+            elif response.status_code == 200:
+                record_request(endpoint, False)
+                # Let clients keep the body but revalidate it on every use
+                patch_cache_control(response, private=True, no_cache=True)
+            else:
+                # Errors must not be cached under a catalog version
+                for header in ('ETag', 'Last-Modified'):
+                    if response.has_header(header):
+                        del response.headers[header]
+            return response
+
+        return wrapper
+
+    return decorator
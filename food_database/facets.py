@@ -0,0 +1,90 @@
+"""
+Food Facet Service for Aahaara Harmony
+Per-value counts of every food filter dimension under the current filter set
+"""
+import hashlib
+import json
+import logging
+from collections import Counter
+from typing import Any, Dict
+from django.conf import settings
+from django.core.cache import cache
+from .catalog_engine import catalog_engine, FACET_FIELDS, MULTI_VALUED_FIELDS
+from .filters import apply_food_filters
+from .models import FoodItem, FoodCatalogState
+from .search import food_search
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'food_facets:v{version}:{filters}'
+
+
+def normalize_filters(filter_data: Dict[str, Any]) -> str:
+    """Canonical text form of validated filters, so equivalent requests share a cache entry"""
+    normalized = {}
+    for key, value in filter_data.items():
+        if value in (None, '', []):
+            continue
+        if isinstance(value, list):
+            value = sorted(set(value))
+        elif not isinstance(value, (int, str)):
+            value = str(value)
+        normalized[key] = value
+    return json.dumps(normalized, sort_keys=True, separators=(',', ':'))
+
+
+class FoodFacetService:
+    """Facet counts from the bitmap indexes, or from one pass over the filtered rows"""
+
+    @property
+    def cache_timeout(self) -> int:
+        return getattr(settings, 'FOOD_FACETS_CACHE_TIMEOUT', 600)
+
+    def get_facets(self, filter_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Facet counts for validated FoodItemFilterSerializer data, cached per catalog version"""
+        version = FoodCatalogState.current_version()
+        filters_hash = hashlib.md5(normalize_filters(filter_data).encode('utf-8')).hexdigest()
+        key = CACHE_KEY.format(version=version, filters=filters_hash)
+
+        result = cache.get(key)
+        if result is None:
+            result = catalog_engine.facet_counts(filter_data) or self._count_rows(filter_data)
+            result = {
+                'total': result['total'],
+                'facets': {
+                    field: [
+                        {'value': value, 'count': count}
+                        for value, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+                    ]
+                    for field, counts in result['facets'].items()
+                },
+                'catalog_version': version,
+            }
+            cache.set(key, result, self.cache_timeout)
+        return result
+
+    def _count_rows(self, filter_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Count facet values in a single pass over the matching rows"""
+        queryset = apply_food_filters(FoodItem.objects.all(), filter_data)
+        if filter_data.get('search'):
+            matches = food_search.search(queryset, filter_data['search'])
+            if isinstance(matches, list):
+                queryset = FoodItem.objects.filter(id__in=list(matches))
+            else:
+                queryset = matches
+
+        facets = {field: Counter() for field in FACET_FIELDS}
+        total = 0
+        for row in queryset.order_by().values_list(*FACET_FIELDS).iterator(chunk_size=2000):
+            total += 1
+            for field, value in zip(FACET_FIELDS, row):
+                if field in MULTI_VALUED_FIELDS:
+                    facets[field].update(set(value or []))
+                elif value:
+                    facets[field][value] += 1
+        return {'total': total, 'facets': {field: dict(counts) for field, counts in facets.items()}}
+
+
+# Global instance
+food_facets = FoodFacetService()
@@ -0,0 +1,86 @@
+from django.db.models import ExpressionWrapper, FloatField
+from django.db.models.functions import Cast, NullIf
+
+# Range filter name (min_<name>/max_<name>) -> column or derived ratio
+RANGE_FILTERS = {
+    'calories': 'calories',
+    'protein': 'protein_g',
+    'carbs': 'carbs_g',
+    'fat': 'fat_g',
+    'fiber': 'fiber_g',
+    'calorie_density': 'calorie_density',
+    'protein_density': 'protein_density',
+    'calories_per_protein': 'calories_per_protein',
+}
+
+
+def _ratio(numerator, denominator, scale=1):
+    """numerator * scale / denominator in floating point, NULL when the denominator is NULL or zero"""
+    return ExpressionWrapper(
+        Cast(numerator, FloatField()) * scale / NullIf(Cast(denominator, FloatField()), 0),
+        output_field=FloatField()
+    )
+
+
+def ratio_expressions():
+    """Derived ratio expressions, computed the same way as the catalog engine's ratio columns"""
+    return {
+        'calorie_density': _ratio('calories', 'serving_grams', 100),
+        'protein_density': _ratio('protein_g', 'serving_grams', 100),
+        'calories_per_protein': _ratio('calories', 'protein_g'),
+    }
+
+
+def apply_food_filters(queryset, filter_data):
+    """Apply validated FoodItemFilterSerializer data to a FoodItem queryset
+
+    The search term is not applied here; food_database.search ranks it.
+    """
+    
+    # Dosha effects
+    if filter_data.get('vata_effect'):
+        queryset = queryset.filter(vata_effect=filter_data['vata_effect'])
+    if filter_data.get('pitta_effect'):
+        queryset = queryset.filter(pitta_effect=filter_data['pitta_effect'])
+    if filter_data.get('kapha_effect'):
+        queryset = queryset.filter(kapha_effect=filter_data['kapha_effect'])
+    
+    # Meal types (JSON arrays have no overlap lookup; has_any_keys matches array elements)
+    if filter_data.get('meal_types'):
+        queryset = queryset.filter(meal_types__has_any_keys=filter_data['meal_types'])
+    
+    # Food category
+    if filter_data.get('food_category'):
+        queryset = queryset.filter(food_category__icontains=filter_data['food_category'])
+    
+    # Tags
+    if filter_data.get('tags'):
+        queryset = queryset.filter(tags__has_any_keys=filter_data['tags'])
+    
+    # Rasa
+    if filter_data.get('rasa'):
+        queryset = queryset.filter(rasa__has_any_keys=filter_data['rasa'])
+    
+    # Guna
+    if filter_data.get('guna'):
+        queryset = queryset.filter(guna__has_any_keys=filter_data['guna'])
+    
+    # Virya
+    if filter_data.get('virya'):
+        queryset = queryset.filter(virya=filter_data['virya'])
+    
+    # Nutritional ranges, including per-100g densities and calories per gram of protein
+    ratios = ratio_expressions()
+    for name, column in RANGE_FILTERS.items():
+        low = filter_data.get(f'min_{name}')
+        high = filter_data.get(f'max_{name}')
+        if low is None and high is None:
+            continue
+        if column in ratios:
+            queryset = queryset.alias(**{column: ratios[column]})
+        if low is not None:
+            queryset = queryset.filter(**{f'{column}__gte': low})
+        if high is not None:
+            queryset = queryset.filter(**{f'{column}__lte': high})
+    
+    return queryset
@@ -0,0 +1,154 @@
+"""
+Food Import Job Service for Aahaara Harmony
+Queues CSV food imports for the process_food_imports worker and resumes them after a worker dies
+"""
+import codecs
+import csv
+import logging
+from datetime import timedelta
+from typing import Iterable, Iterator, Optional
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .importer import FoodCSVImporter
+from .models import FoodImportChunk, FoodImportJob
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Decode UTF-8 byte chunks (dropping a BOM) into text lines for the csv module
+
+    Chunks are split at arbitrary byte offsets, so characters and lines cut at a chunk
+    boundary are carried over to the next one.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    pending = ''
+    for chunk in chunks:
+        lines = (pending + decoder.decode(chunk)).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+class FoodImportJobService:
+    """Persists uploads as FoodImportJob rows, which the process_food_imports worker runs"""
+
+    @property
+    def stale_after(self) -> timedelta:
+        return timedelta(seconds=getattr(settings, 'FOOD_IMPORT_STALE_SECONDS', 300))
+
+    @property
+    def chunk_bytes(self) -> int:
+        return getattr(settings, 'FOOD_IMPORT_CHUNK_BYTES', 1024 * 1024)
+
+    def create_job(self, csv_file, user, mode: Optional[str] = None) -> FoodImportJob:
+        """Persist an uploaded CSV as a pending job, its contents as FoodImportChunk rows"""
+        with transaction.atomic():
+            job = FoodImportJob.objects.create(
+                created_by=user,
+                original_filename=(csv_file.name or '')[:255],
+                mode=mode or getattr(settings, 'FOOD_IMPORT_MODE', 'upsert'),
+            )
+
+            def saved_chunks():
+                # read() rather than chunks(), which hands over in-memory uploads whole
+                for index, data in enumerate(iter(lambda: csv_file.read(self.chunk_bytes), b'')):
+                    FoodImportChunk.objects.create(job=job, index=index, data=data)
+                    yield data
+
+            # Storing the upload and counting its rows is one streamed pass; the count
+            # sizes the job for progress and ETA reporting
+            job.total_rows = max(sum(1 for _ in csv.reader(iter_lines(saved_chunks()))) - 1, 0)
+            job.save(update_fields=['total_rows', 'updated_at'])
+        return job
+
+    def stored_chunks(self, job_id):
+        """The upload of a job, read back one chunk row at a time"""
+        chunks = FoodImportChunk.objects.filter(job_id=job_id)
+        for index in list(chunks.values_list('index', flat=True)):
+            yield bytes(chunks.values_list('data', flat=True).get(index=index))
+
+    def reclaim_stale_jobs(self) -> int:
+        """Return running jobs whose worker stopped sending heartbeats to the queue"""
+        reclaimed = FoodImportJob.objects.filter(
+            status='running', heartbeat_at__lt=timezone.now() - self.stale_after
+        ).update(status='pending')
+        if reclaimed:
+            logger.warning(f"Reclaimed {reclaimed} stale food import job(s)")
+        return reclaimed
+
+    def claim(self, job_id) -> Optional[FoodImportJob]:
+        """Atomically move a pending job to running; None if another worker got it first"""
+        now = timezone.now()
+        claimed = FoodImportJob.objects.filter(pk=job_id, status='pending').update(
+            status='running',
+            attempts=F('attempts') + 1,
+            run_started_at=now,
+            run_start_rows=F('rows_processed'),
+            heartbeat_at=now,
+        )
+        if not claimed:
+            return None
+        return FoodImportJob.objects.get(pk=job_id)
+
+    def run_job(self, job_id) -> Optional[FoodImportJob]:
+        """Import a job's file, continuing after its last committed chunk"""
+        job = self.claim(job_id)
+        if job is None:
+            return None
+
+        max_errors = getattr(settings, 'FOOD_IMPORT_MAX_REPORTED_ERRORS', 100)
+        base_rows = job.rows_processed
+        base_imported = job.imported_count
+        base_updated = job.updated_count
+        base_unchanged = job.unchanged_count
+        base_errors = job.error_count
+        previous_errors = list(job.errors or [])
+
+        def record_progress(result, last_row):
+            # Runs inside the chunk's transaction, so progress and rows commit together
+            FoodImportJob.objects.filter(pk=job.pk).update(
+                rows_processed=base_rows + result.rows_processed,
+                imported_count=base_imported + result.imported_count,
+                updated_count=base_updated + result.updated_count,
+                unchanged_count=base_unchanged + result.unchanged_count,
+                error_count=base_errors + result.total_errors,
+                errors=(previous_errors + result.errors)[:max_errors],
+                last_committed_row=last_row,
+                heartbeat_at=timezone.now(),
+            )
+
+        if job.last_committed_row:
+            logger.info(f"Resuming food import {job.pk} after row {job.last_committed_row}")
+
+        try:
+            importer = FoodCSVImporter(created_by=job.created_by, on_chunk=record_progress, mode=job.mode)
+            importer.import_file(iter_lines(self.stored_chunks(job.pk)), start_row=job.last_committed_row)
+            with transaction.atomic():
+                FoodImportJob.objects.filter(pk=job.pk).update(
+                    status='completed', finished_at=timezone.now(), heartbeat_at=timezone.now()
+                )
+                # The upload is only needed until the job completes
+                FoodImportChunk.objects.filter(job_id=job.pk).delete()
+        except Exception as e:
+            logger.error(f"Food import {job.pk} failed: {e}")
+            FoodImportJob.objects.filter(pk=job.pk).update(
+                status='failed', failure_message=str(e), finished_at=timezone.now()
+            )
+
+        return FoodImportJob.objects.get(pk=job.pk)
+
+    def pending_job_ids(self):
+        return list(
+            FoodImportJob.objects.filter(status='pending').order_by('created_at').values_list('id', flat=True)
+        )
+
+
+# Global instance
+food_import_jobs = FoodImportJobService()
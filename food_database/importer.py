@@ -0,0 +1,286 @@
+"""
+Bulk CSV import engine for the food catalog
+Shared by the import_csv_foods view and the import_food_data.py script
+"""
+import csv
+import io
+import json
+import logging
+import time
+import uuid
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from .models import FoodItem, FoodCatalogState, FoodChange, CONTENT_FIELDS, DERIVED_FIELDS
+from .serializers import FoodItemCreateSerializer
+from .stats import food_stats_service, stats_keys
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Columns written by COPY, in order
+COPY_COLUMNS = [
+    'id', 'name', 'serving_size', 'calories', 'protein_g', 'carbs_g', 'fat_g', 'fiber_g', 'serving_grams',
+    'rasa', 'guna', 'virya', 'vata_effect', 'pitta_effect', 'kapha_effect', 'meal_types',
+    'food_category', 'tags', 'search_document', 'display', 'fingerprint', 'content_hash',
+    'created_at', 'updated_at', 'created_by_id',
+]
+
+IMPORT_MODES = ['insert', 'upsert']
+
+# Columns rewritten when an upsert import changes an existing food
+UPDATE_COLUMNS = CONTENT_FIELDS + DERIVED_FIELDS + ['updated_at']
+DUPLICATE_FOOD_ERROR = 'A food with this name, serving size and category already exists'
+JSON_COLUMNS = {'rasa', 'guna', 'meal_types', 'tags', 'display'}
+
+
+def split_list(value):
+    """Split a semicolon-separated CSV cell into a list"""
+    return [item.strip() for item in (value or '').split(';') if item.strip()]
+
+
+def parse_food_row(row: Dict[str, str]) -> Dict:
+    """Map one CSV row onto FoodItemCreateSerializer input"""
+    return {
+        'name': row['name'].strip(),
+        'serving_size': row['serving_size'].strip(),
+        'calories': int(float(row['calories'])),
+        'protein_g': row['protein_g'].strip(),
+        'carbs_g': row['carbs_g'].strip(),
+        'fat_g': row['fat_g'].strip(),
+        'fiber_g': row['fiber_g'].strip(),
+        'rasa': split_list(row['rasa']),
+        'guna': split_list(row['guna']),
+        'virya': row['virya'].strip(),
+        'vata_effect': row['vata_effect'].strip(),
+        'pitta_effect': row['pitta_effect'].strip(),
+        'kapha_effect': row['kapha_effect'].strip(),
+        'meal_types': split_list(row['meal_type']),
+        'food_category': row['food_category'].strip(),
+        'tags': split_list(row['tags']),
+    }
+
+
+class FoodImportResult:
+    """Counters and per-row errors collected during an import"""
+
+    def __init__(self, max_errors: int):
+        self.rows_processed = 0
+        self.imported_count = 0
+        self.updated_count = 0
+        self.unchanged_count = 0
+        self.total_errors = 0
+        self.errors: List[Dict] = []
+        self.max_errors = max_errors
+        self.started_at = time.monotonic()
+
+    def add_error(self, row_num: int, errors):
+        self.total_errors += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row_num, 'errors': errors})
+
+    @property
+    def elapsed_seconds(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def error_messages(self, limit: int = 10) -> List[str]:
+        """Errors in the 'Row N: ...' form returned by the import endpoint"""
+        return [f"Row {error['row']}: {error['errors']}" for error in self.errors[:limit]]
+
+
+class FoodCSVImporter:
+    """Streams CSV rows into FoodItem in validated, transactional chunks"""
+
+    def __init__(
+        self,
+        created_by,
+        batch_size: Optional[int] = None,
+        method: Optional[str] = None,
+        on_chunk: Optional[Callable] = None,
+        mode: Optional[str] = None,
+    ):
+        self.created_by = created_by
+        self.batch_size = batch_size or getattr(settings, 'FOOD_IMPORT_BATCH_SIZE', 1000)
+        self.method = method or getattr(settings, 'FOOD_IMPORT_METHOD', 'auto')
+        # Called inside each chunk's transaction with (result, last_row_num)
+        self.on_chunk = on_chunk
+        self.validator = FoodItemCreateSerializer()
+        if self.method == 'auto':
+            self.method = 'copy' if connection.vendor == 'postgresql' else 'bulk'
+        if self.method not in ('copy', 'bulk'):
+            raise ValueError(f"Invalid import method: {self.method}. Must be 'auto', 'copy' or 'bulk'")
+        # insert: every valid row for a food not yet in the catalog becomes a new food, others
+        # are row errors; upsert: rows matching a stored fingerprint update that food, or are
+        # skipped when their content is unchanged
+        self.mode = mode or getattr(settings, 'FOOD_IMPORT_MODE', 'upsert')
+        if self.mode not in IMPORT_MODES:
+            raise ValueError(f"Invalid import mode: {self.mode}. Must be 'insert' or 'upsert'")
+
+    def import_file(self, lines: Iterable[str], start_row: int = 0) -> FoodImportResult:
+        """Import CSV text lines, skipping data rows up to start_row (already committed)"""
+        result = FoodImportResult(getattr(settings, 'FOOD_IMPORT_MAX_REPORTED_ERRORS', 100))
+        reader = csv.DictReader(lines)
+
+        chunk = []
+        for row_num, row in enumerate(reader, start=2):  # Start from 2 because of header
+            if row_num <= start_row:
+                continue
+            chunk.append((row_num, row))
+            if len(chunk) >= self.batch_size:
+                self._import_chunk(chunk, result)
+                chunk = []
+        if chunk:
+            self._import_chunk(chunk, result)
+
+        logger.info(
+            f"Food import finished: {result.imported_count} imported, {result.updated_count} updated, "
+            f"{result.unchanged_count} unchanged, {result.total_errors} errors in {result.elapsed_seconds:.2f}s"
+        )
+        return result
+
+    def _validate(self, chunk, result):
+        """Parse and validate a chunk, returning (row_num, unsaved FoodItem) pairs
+
+        One serializer instance validates the whole chunk, so its fields are
+        built once rather than per row, and a bad row only rejects itself.
+        """
+        foods = []
+        for row_num, row in chunk:
+            try:
+                validated = self.validator.run_validation(parse_food_row(row))
+            except ValidationError as e:
+                result.add_error(row_num, e.detail)
+                continue
+            except Exception as e:
+                result.add_error(row_num, str(e))
+                continue
+
+            food = FoodItem(**validated, created_by=self.created_by)
+            food.refresh_derived_fields()
+            foods.append((row_num, food))
+        return foods
+
+    def _import_chunk(self, chunk, result):
+        rows = self._validate(chunk, result)
+
+        with transaction.atomic():
+            updates = []
+            if self.mode == 'upsert':
+                foods, updates, unchanged = self._classify(rows)
+                result.unchanged_count += unchanged
+            else:
+                foods = self._new_foods(rows, result)
+
+            if foods or updates:
+                # Stats keys of the stored rows being replaced, read before they change
+                previous = Counter()
+                if updates:
+                    for row in FoodItem.objects.filter(id__in=[food.id for food in updates]).values_list(
+                        'vata_effect', 'pitta_effect', 'kapha_effect', 'meal_types', 'tags'
+                    ):
+                        previous.update(stats_keys(*row))
+
+                if self.mode == 'upsert':
+                    self._upsert(foods + updates)
+                elif self.method == 'copy':
+                    self._copy(foods)
+                else:
+                    FoodItem.objects.bulk_create(foods, batch_size=self.batch_size)
+
+                # bulk writes skip post_save, so version, change log and stats counters are updated once per chunk
+                FoodChange.record([food.id for food in foods + updates], 'upsert', FoodCatalogState.bump())
+                delta = Counter(food_stats_service.count_foods(foods + updates))
+                delta.subtract(previous)
+                food_stats_service.apply_delta(delta)
+
+            result.imported_count += len(foods)
+            result.updated_count += len(updates)
+            result.rows_processed += len(chunk)
+            if self.on_chunk:
+                self.on_chunk(result, chunk[-1][0])
+
+    def _classify(self, rows):
+        """Split validated foods into (new, changed, unchanged count) by fingerprint
+
+        One unique-index lookup per chunk. A fingerprint repeated within the file
+        keeps its last row.
+        """
+        latest = {}
+        for _, food in rows:
+            latest[food.fingerprint] = food
+        duplicates = len(rows) - len(latest)
+
+        stored = {
+            fingerprint: (food_id, content_hash)
+            for fingerprint, food_id, content_hash in FoodItem.objects.filter(
+                fingerprint__in=list(latest)
+            ).values_list('fingerprint', 'id', 'content_hash')
+        }
+
+        new, changed = [], []
+        unchanged = duplicates
+        for fingerprint, food in latest.items():
+            if fingerprint not in stored:
+                new.append(food)
+                continue
+            food_id, content_hash = stored[fingerprint]
+            if content_hash == food.content_hash:
+                unchanged += 1
+                continue
+            food.id = food_id
+            food._state.adding = False
+            changed.append(food)
+        return new, changed, unchanged
+
+    def _new_foods(self, rows, result):
+        """Foods for an insert import; a row matching a stored food or an earlier row is an error"""
+        seen = set(FoodItem.objects.filter(
+            fingerprint__in=[food.fingerprint for _, food in rows]
+        ).values_list('fingerprint', flat=True))
+        foods = []
+        for row_num, food in rows:
+            if food.fingerprint in seen:
+                result.add_error(row_num, DUPLICATE_FOOD_ERROR)
+                continue
+            seen.add(food.fingerprint)
+            foods.append(food)
+        return foods
+
+    def _upsert(self, foods):
+        """Write new and changed foods with INSERT ... ON CONFLICT (fingerprint) DO UPDATE
+
+        The unique fingerprint is the conflict target, so a food another import inserted
+        since _classify looked it up is updated in place rather than duplicated.
+        """
+        FoodItem.objects.bulk_create(
+            foods, batch_size=self.batch_size, update_conflicts=True,
+            unique_fields=['fingerprint'], update_fields=UPDATE_COLUMNS,
+        )
+
+    def _copy(self, foods):
+        """Write a chunk with Postgres COPY"""
+        now = timezone.now()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for food in foods:
+            food.id = food.id or uuid.uuid4()
+            food.created_at = food.updated_at = now
+            values = []
+            for column in COPY_COLUMNS:
+                value = getattr(food, column)
+                if column in JSON_COLUMNS:
+                    value = json.dumps(value)
+                elif column in ('created_at', 'updated_at'):
+                    value = value.isoformat()
+                values.append(value)
+            writer.writerow(values)
+        buffer.seek(0)
+
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(
+                f"COPY {FoodItem._meta.db_table} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
@@ -0,0 +1,78 @@
+"""
+Django management command measuring food autocomplete latency on a synthetic catalog
+"""
+import random
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand
+from food_database.autocomplete import FoodAutocompleteIndex, food_autocomplete, normalize
+
+WORDS = [
+    'Moong', 'Dal', 'Rice', 'Ghee', 'Kitchari', 'Paneer', 'Millet', 'Ragi', 'Amla', 'Jaggery',
+    'Sabzi', 'Roti', 'Poha', 'Upma', 'Idli', 'Dosa', 'Lassi', 'Chaas', 'Khichdi', 'Halwa',
+]
+CATEGORIES = ['Grains', 'Legumes', 'Dairy', 'Vegetables', 'Fruits', 'Nuts', 'Spices', 'Beverages']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark food autocomplete latency (p50/p99) and incremental updates, in memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=50000, help='Number of synthetic food items')
+        parser.add_argument('--queries', type=int, default=20000, help='Number of timed completions')
+        parser.add_argument('--budget-ms', type=float, default=2.0, help='p99 latency budget')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the synthetic catalog')
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        now = datetime.now()
+        rows = [
+            (
+                uuid.UUID(int=rnd.getrandbits(128)),
+                f'{rnd.choice(WORDS)} {rnd.choice(WORDS)} {rnd.choice(WORDS)} {i}',
+                rnd.choice(CATEGORIES),
+                rnd.randint(10, 800),
+                now,
+            )
+            for i in range(options['count'])
+        ]
+        # Skewed usage, as a few foods dominate real diet charts
+        usage = Counter({normalize(row[1]): int(rnd.paretovariate(1.2)) for row in rnd.sample(rows, len(rows) // 10)})
+
+        started = time.perf_counter()
+        index = FoodAutocompleteIndex.build(food_autocomplete.np, rows, usage)
+        self.stdout.write(
+            f'Built index of {len(index.foods)} foods, {len(index.entries)} keys '
+            f'in {(time.perf_counter() - started) * 1000:.0f} ms'
+        )
+
+        prefixes = []
+        for _ in range(options['queries']):
+            word = normalize(rnd.choice(WORDS))
+            prefixes.append(word[:rnd.randint(1, len(word))])
+
+        timings = []
+        for prefix in prefixes:
+            started = time.perf_counter()
+            index.complete(prefix, 10)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        p50 = timings[len(timings) // 2]
+        p99 = timings[int(len(timings) * 0.99)]
+        line = f'complete  p50={p50:.3f} ms  p99={p99:.3f} ms  max={timings[-1]:.3f} ms'
+        self.stdout.write(self.style.SUCCESS(line) if p99 <= options['budget_ms'] else self.style.ERROR(line))
+
+        # Incremental update: rename a batch of foods and add new ones
+        changed = [
+            (row[0], f'Renamed {rnd.choice(WORDS)} {i}', row[2], row[3], now + timedelta(seconds=1))
+            for i, row in enumerate(rnd.sample(rows, 100))
+        ]
+        changed += [
+            (uuid.uuid4(), f'New {rnd.choice(WORDS)} {i}', rnd.choice(CATEGORIES), rnd.randint(10, 800), now)
+            for i in range(100)
+        ]
+        started = time.perf_counter()
+        index.apply(changed)
+        self.stdout.write(f'apply     {len(changed)} changed foods in {(time.perf_counter() - started) * 1000:.1f} ms')
@@ -0,0 +1,147 @@
+"""
+Django management command comparing the ORM and bitmap-index paths of food_items_list
+"""
+import random
+import shutil
+import tempfile
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from food_database.catalog_engine import FoodCatalogEngine
+from food_database.filters import apply_food_filters
+from food_database.models import FoodItem
+from authentication.models import User
+
+RASA = ['Sweet', 'Sour', 'Salty', 'Pungent', 'Bitter', 'Astringent']
+GUNA = ['Heavy', 'Light', 'Hot', 'Cold', 'Oily', 'Dry', 'Smooth', 'Rough', 'Soft', 'Hard']
+MEAL_TYPES = ['Breakfast', 'Brunch', 'Lunch', 'Snacks', 'Dinner']
+TAGS = ['Vegan', 'Vegetarian', 'Gluten-Free', 'Dairy', 'High-Protein', 'Low-Fat', 'Spicy', 'Fermented', 'Raw', 'Seasonal']
+CATEGORIES = ['Grains', 'Legumes', 'Dairy', 'Vegetables', 'Fruits', 'Nuts', 'Spices', 'Beverages']
+EFFECTS = ['pacifies', 'aggravates', 'neutral']
+
+# Filter combinations exercised by the benchmark (validated FoodItemFilterSerializer shape)
+SCENARIOS = [
+    ('vata pacifying', {'vata_effect': 'pacifies'}),
+    ('lunch or dinner', {'meal_types': ['Lunch', 'Dinner']}),
+    ('sweet + heavy', {'rasa': ['Sweet'], 'guna': ['Heavy']}),
+    ('tridoshic breakfast', {
+        'vata_effect': 'pacifies', 'pitta_effect': 'pacifies', 'kapha_effect': 'pacifies',
+        'meal_types': ['Breakfast'],
+    }),
+    ('vegan cooling, 100-400 kcal', {
+        'tags': ['Vegan'], 'virya': 'Cooling', 'min_calories': 100, 'max_calories': 400,
+    }),
+    ('high protein snacks', {'meal_types': ['Snacks'], 'min_protein': Decimal('15.00')}),
+    ('category + calories', {'food_category': 'gra', 'max_calories': 300}),
+    ('low fat, high fiber', {'max_fat': Decimal('5.00'), 'min_fiber': Decimal('8.00')}),
+    ('macro window', {
+        'min_carbs': Decimal('20.00'), 'max_carbs': Decimal('45.00'),
+        'min_protein': Decimal('10.00'), 'max_fat': Decimal('15.00'),
+    }),
+    ('dense protein, per 100g', {'min_protein_density': Decimal('10.00'), 'max_calorie_density': Decimal('250.00')}),
+    ('lean kapha lunch', {
+        'kapha_effect': 'pacifies', 'meal_types': ['Lunch'], 'max_calories_per_protein': Decimal('20.00'),
+    }),
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark food list filters on a synthetic catalog: ORM vs bitmap indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=50000, help='Number of synthetic food items')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per scenario')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the synthetic catalog')
+
+    def handle(self, *args, **options):
+        engine = FoodCatalogEngine(snapshot_dir=tempfile.mkdtemp(prefix='food_catalog_bench_'))
+        if not engine.is_available:
+            raise CommandError('Food catalog engine is not available (numpy not installed)')
+
+        try:
+            # Everything runs in a transaction that is rolled back, leaving the catalog untouched
+            with transaction.atomic():
+                self._run(engine, options)
+                transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(engine.snapshot_dir, ignore_errors=True)
+
+    def _run(self, engine, options):
+        count = options['count']
+        self.stdout.write(f'Creating {count} synthetic food items...')
+        self._create_catalog(count, options['seed'])
+
+        started = time.perf_counter()
+        engine.build_snapshot(0)
+        snapshot = engine.get_snapshot(0)
+        self.stdout.write(f'Snapshot built in {(time.perf_counter() - started) * 1000:.0f} ms\n')
+
+        self.stdout.write(f"{'scenario':<30} {'matches':>8} {'orm ms':>10} {'bitmap ms':>10} {'speedup':>8}  same")
+        for label, filter_data in SCENARIOS:
+            orm_ids, orm_ms = self._time(options['repeat'], lambda: self._orm_ids(filter_data))
+            bitmap_ids, bitmap_ms = self._time(
+                options['repeat'], lambda: self._bitmap_ids(engine, snapshot, filter_data)
+            )
+            same = orm_ids == bitmap_ids
+            speedup = orm_ms / bitmap_ms if bitmap_ms else float('inf')
+            line = f'{label:<30} {len(orm_ids):>8} {orm_ms:>10.2f} {bitmap_ms:>10.3f} {speedup:>7.0f}x  {same}'
+            self.stdout.write(line if same else self.style.ERROR(line))
+
+    def _time(self, repeat, func):
+        """Run func repeat times, returning its result and the best time in ms"""
+        best = None
+        result = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = func()
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return result, best
+
+    def _orm_ids(self, filter_data):
+        queryset = apply_food_filters(FoodItem.objects.order_by('-created_at', '-id'), filter_data)
+        return [str(food_id) for food_id in queryset.values_list('id', flat=True)]
+
+    def _bitmap_ids(self, engine, snapshot, filter_data):
+        bits = engine._bits(snapshot, filter_data)
+        result = engine.bitmaps.BitmapResult(bits, snapshot.columns['id'], snapshot.count)
+        result.count()
+        return result[:]
+
+    def _create_catalog(self, count, seed):
+        rnd = random.Random(seed)
+        user, _ = User.objects.get_or_create(
+            username='benchmark_food_filters',
+            defaults={'email': 'benchmark@aahaara.com', 'role': 'doctor'}
+        )
+        words = ['Moong', 'Dal', 'Rice', 'Ghee', 'Kitchari', 'Paneer', 'Millet', 'Ragi', 'Amla', 'Jaggery']
+
+        batch = []
+        for i in range(count):
+            food = FoodItem(
+                name=f'{rnd.choice(words)} {rnd.choice(words)} {i}',
+                serving_size=rnd.choice(['100g', '150g', '1 cup (240 ml)', '1 bowl', '2 pieces', '30 g']),
+                calories=rnd.randint(10, 800),
+                protein_g=Decimal(rnd.randint(0, 4000)) / 100,
+                carbs_g=Decimal(rnd.randint(0, 9000)) / 100,
+                fat_g=Decimal(rnd.randint(0, 5000)) / 100,
+                fiber_g=Decimal(rnd.randint(0, 2000)) / 100,
+                rasa=rnd.sample(RASA, rnd.randint(1, 3)),
+                guna=rnd.sample(GUNA, rnd.randint(1, 4)),
+                virya=rnd.choice(['Heating', 'Cooling', 'Neutral']),
+                vata_effect=rnd.choice(EFFECTS),
+                pitta_effect=rnd.choice(EFFECTS),
+                kapha_effect=rnd.choice(EFFECTS),
+                meal_types=rnd.sample(MEAL_TYPES, rnd.randint(1, 3)),
+                food_category=rnd.choice(CATEGORIES),
+                tags=rnd.sample(TAGS, rnd.randint(0, 3)),
+                created_by=user,
+            )
+            food.refresh_derived_fields()
+            batch.append(food)
+            if len(batch) == 5000:
+                FoodItem.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            FoodItem.objects.bulk_create(batch)
@@ -0,0 +1,21 @@
+"""
+Django management command to prebuild the food catalog snapshot
+"""
+from django.core.management.base import BaseCommand
+from food_database.catalog_engine import catalog_engine
+from food_database.models import FoodCatalogState
+
+
+class Command(BaseCommand):
+    help = 'Build the memory-mapped food catalog snapshot for the current catalog version'
+
+    def handle(self, *args, **options):
+        if not catalog_engine.is_available:
+            self.stdout.write(self.style.ERROR('Food catalog engine is not available (numpy not installed)'))
+            return
+        
+        version = FoodCatalogState.current_version()
+        snapshot = catalog_engine.get_snapshot(version)
+        self.stdout.write(self.style.SUCCESS(
+            f'Food catalog snapshot v{snapshot.version} ready: {snapshot.count} foods at {snapshot.path}'
+        ))
@@ -0,0 +1,42 @@
+"""
+Django management command that processes queued food import jobs
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from food_database.import_jobs import food_import_jobs
+
+
+class Command(BaseCommand):
+    help = 'Process pending food import jobs, resuming jobs whose worker stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Jobs processed concurrently (default: FOOD_IMPORT_WORKERS)')
+        parser.add_argument('--poll-interval', type=float, default=5.0, help='Seconds between queue checks')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+
+    def handle(self, *args, **options):
+        workers = options['workers'] or getattr(settings, 'FOOD_IMPORT_WORKERS', 2)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='food-import') as pool:
+            while True:
+                food_import_jobs.reclaim_stale_jobs()
+                job_ids = food_import_jobs.pending_job_ids()
+                for job in pool.map(self._run, job_ids):
+                    if job is not None:
+                        self.stdout.write(
+                            f'Food import {job.id} {job.status}: {job.imported_count} imported, '
+                            f'{job.error_count} errors'
+                        )
+
+                if options['once']:
+                    break
+                close_old_connections()
+                time.sleep(options['poll_interval'])
+
+    def _run(self, job_id):
+        try:
+            return food_import_jobs.run_job(job_id)
+        finally:
+            close_old_connections()
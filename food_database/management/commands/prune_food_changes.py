@@ -0,0 +1,16 @@
+"""
+Django management command to trim the food change log behind the delta sync feed
+"""
+from django.core.management.base import BaseCommand
+from food_database.changes import food_changes
+
+
+class Command(BaseCommand):
+    help = 'Delete food change log entries older than the retention window (FOOD_CHANGES_RETENTION_DAYS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Retention window in days')
+
+    def handle(self, *args, **options):
+        deleted = food_changes.prune(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} food changes'))
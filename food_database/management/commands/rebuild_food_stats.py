@@ -0,0 +1,17 @@
+"""
+Django management command to recount the incrementally maintained food stats counters
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from food_database.stats import food_stats_service
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the food_stats counters from a full recount of the catalog'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            counts = food_stats_service.rebuild_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {len(counts)} food stats counters ({counts.get('total', 0)} foods)"
+        ))
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.24 on 2026-10-17 02:04
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def create_catalog_state(apps, schema_editor):
+    FoodCatalogState = apps.get_model('food_database', 'FoodCatalogState')
+    FoodCatalogState.objects.get_or_create(pk=1, defaults={'version': 1})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food_database', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodCatalogState',
+            fields=[
+                ('id', models.PositiveSmallIntegerField(default=1, editable=False, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Food Catalog State',
+                'verbose_name_plural': 'Food Catalog State',
+                'db_table': 'food_catalog_state',
+            },
+        ),
+        migrations.RunPython(create_catalog_state, migrations.RunPython.noop),
+    ]
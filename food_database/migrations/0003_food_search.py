@@ -0,0 +1,65 @@
+# Generated by Django 4.2.24 on 2026-10-17 02:09
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+def build_search_documents(apps, schema_editor):
+    FoodItem = apps.get_model('food_database', 'FoodItem')
+    batch = []
+    for food in FoodItem.objects.only('id', 'name', 'food_category', 'tags').iterator(chunk_size=2000):
+        parts = [food.name, food.food_category, *(food.tags or [])]
+        food.search_document = ' '.join(part for part in parts if part).lower()
+        batch.append(food)
+        if len(batch) == 2000:
+            FoodItem.objects.bulk_update(batch, ['search_document'])
+            batch = []
+    if batch:
+        FoodItem.objects.bulk_update(batch, ['search_document'])
+
+
+# Postgres full-text and trigram indexes; other databases search with the in-process index.
+# Created outside the migration state so SQLite table rebuilds never try to copy them.
+SEARCH_INDEXES = {
+    'food_items_search_vector_idx': (
+        "CREATE INDEX IF NOT EXISTS food_items_search_vector_idx ON food_items "
+        "USING gin ((to_tsvector('english'::regconfig, COALESCE(search_document, ''))))"
+    ),
+    'food_items_search_trgm_idx': (
+        "CREATE INDEX IF NOT EXISTS food_items_search_trgm_idx ON food_items "
+        "USING gin (search_document gin_trgm_ops)"
+    ),
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in SEARCH_INDEXES.values():
+        schema_editor.execute(sql)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in SEARCH_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food_database', '0002_food_catalog_state'),
+    ]
+
+    operations = [
+        # No-op on databases other than PostgreSQL
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='fooditem',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Lower-cased name, category and tags, maintained on save'),
+        ),
+        migrations.RunPython(build_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.24 on 2026-10-17 02:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food_database', '0003_food_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fooditem',
+            index=models.Index(fields=['created_at', 'id'], name='food_items_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fooditem',
+            index=models.Index(fields=['updated_at', 'id'], name='food_items_updated_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fooditem',
+            index=models.Index(fields=['name', 'id'], name='food_items_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fooditem',
+            index=models.Index(fields=['calories', 'id'], name='food_items_calories_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fooditem',
+            index=models.Index(fields=['protein_g', 'id'], name='food_items_protein_id_idx'),
+        ),
+    ]
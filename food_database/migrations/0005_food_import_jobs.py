@@ -0,0 +1,69 @@
+# Generated by Django 4.2.24 on 2026-10-17 02:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('food_database', '0004_food_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodImportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('original_filename', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('total_rows', models.PositiveIntegerField(default=0)),
+                ('rows_processed', models.PositiveIntegerField(default=0)),
+                ('imported_count', models.PositiveIntegerField(default=0)),
+                ('error_count', models.PositiveIntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list, help_text='First per-row errors ({row, errors})')),
+                ('last_committed_row', models.PositiveIntegerField(default=0, help_text='CSV row number of the last committed chunk')),
+                ('failure_message', models.TextField(blank=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('run_started_at', models.DateTimeField(blank=True, null=True)),
+                ('run_start_rows', models.PositiveIntegerField(default=0, help_text='rows_processed when the current run started')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='food_import_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Food Import Job',
+                'verbose_name_plural': 'Food Import Jobs',
+                'db_table': 'food_import_jobs',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FoodImportChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='food_database.foodimportjob')),
+            ],
+            options={
+                'verbose_name': 'Food Import Chunk',
+                'verbose_name_plural': 'Food Import Chunks',
+                'db_table': 'food_import_chunks',
+                'ordering': ['job', 'index'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='foodimportjob',
+            index=models.Index(fields=['status', 'heartbeat_at'], name='food_import_status_hb_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='foodimportchunk',
+            constraint=models.UniqueConstraint(fields=('job', 'index'), name='food_import_chunk_uniq'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.24 on 2026-10-17 02:19
+
+from collections import Counter
+from django.db import migrations, models
+
+
+def stats_keys(vata_effect, pitta_effect, kapha_effect, meal_types, tags):
+    # A copy of food_database.stats.stats_keys as it stood when this migration was written
+    keys = ['total']
+    effects = {'vata': vata_effect, 'pitta': pitta_effect, 'kapha': kapha_effect}
+    for dosha, effect in effects.items():
+        if effect == 'pacifies':
+            keys.append(f'dosha:{dosha}_pacifying')
+    if all(effect == 'pacifies' for effect in effects.values()):
+        keys.append('dosha:tridoshic')
+    keys.extend(f'meal_types:{value}' for value in set(meal_types or []))
+    keys.extend(f'tags:{value}' for value in set(tags or []))
+    return keys
+
+
+def seed_stats_counters(apps, schema_editor):
+    FoodItem = apps.get_model('food_database', 'FoodItem')
+    FoodStatsCounter = apps.get_model('food_database', 'FoodStatsCounter')
+
+    counts = Counter()
+    rows = FoodItem.objects.values_list('vata_effect', 'pitta_effect', 'kapha_effect', 'meal_types', 'tags')
+    for row in rows.iterator(chunk_size=2000):
+        counts.update(stats_keys(*row))
+    FoodStatsCounter.objects.bulk_create(
+        [FoodStatsCounter(key=key[:150], count=count) for key, count in counts.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food_database', '0005_food_import_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodStatsCounter',
+            fields=[
+                ('key', models.CharField(max_length=150, primary_key=True, serialize=False)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Food Stats Counter',
+                'verbose_name_plural': 'Food Stats Counters',
+                'db_table': 'food_stats_counters',
+            },
+        ),
+        migrations.RunPython(seed_stats_counters, migrations.RunPython.noop),
+    ]
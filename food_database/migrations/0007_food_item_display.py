@@ -0,0 +1,58 @@
+# Generated by Django 4.2.24 on 2026-10-17 02:23
+
+from django.db import migrations, models
+
+DISPLAY_SOURCE_FIELDS = ['vata_effect', 'pitta_effect', 'kapha_effect', 'meal_types', 'tags', 'rasa', 'guna']
+DOSHA_EFFECTS = [('vata_effect', 'Vata'), ('pitta_effect', 'Pitta'), ('kapha_effect', 'Kapha')]
+
+
+def joined(values, empty):
+    return ', '.join(values) if values else empty
+
+
+def display(food):
+    # FoodItem.build_display as of this migration, frozen so later model changes cannot alter it
+    effects = []
+    for field, dosha in DOSHA_EFFECTS:
+        effect = getattr(food, field)
+        if effect == 'pacifies':
+            effects.append(f'{dosha}+')
+        elif effect == 'aggravates':
+            effects.append(f'{dosha}-')
+    return {
+        'is_tridoshic': all(getattr(food, field) == 'pacifies' for field, _ in DOSHA_EFFECTS),
+        'dosha_balance': ', '.join(effects) if effects else 'Neutral',
+        'meal_types_display': joined(food.meal_types, 'Not specified'),
+        'tags_display': joined(food.tags, 'No tags'),
+        'rasa_display': joined(food.rasa, 'Not specified'),
+        'guna_display': joined(food.guna, 'Not specified'),
+    }
+
+
+def build_display(apps, schema_editor):
+    FoodItem = apps.get_model('food_database', 'FoodItem')
+    batch = []
+    for food in FoodItem.objects.only('id', *DISPLAY_SOURCE_FIELDS).iterator(chunk_size=2000):
+        food.display = display(food)
+        batch.append(food)
+        if len(batch) == 2000:
+            FoodItem.objects.bulk_update(batch, ['display'])
+            batch = []
+    if batch:
+        FoodItem.objects.bulk_update(batch, ['display'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food_database', '0006_food_stats_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fooditem',
+            name='display',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(build_display, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.24 on 2026-10-17 02:36
+
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+# parse_serving_grams from food_database.models, copied here as this migration was written
+SERVING_WEIGHT_RE = re.compile(r'(\d+(?:\.\d+)?)\s*(kg|g|gm|gms|grams?|ml|l|litres?|liters?)\b', re.IGNORECASE)
+SERVING_UNIT_GRAMS = {'kg': 1000, 'l': 1000, 'litre': 1000, 'litres': 1000, 'liter': 1000, 'liters': 1000}
+
+
+def parse(serving_size):
+    match = SERVING_WEIGHT_RE.search(serving_size or '')
+    if not match:
+        return None
+    try:
+        grams = Decimal(match.group(1)) * SERVING_UNIT_GRAMS.get(match.group(2).lower(), 1)
+    except InvalidOperation:
+        return None
+    if grams <= 0 or grams >= Decimal('1000000'):
+        return None
+    return grams.quantize(Decimal('0.01'))
+
+
+def parse_serving_grams(apps, schema_editor):
+    FoodItem = apps.get_model('food_database', 'FoodItem')
+    batch = []
+    for food in FoodItem.objects.only('id', 'serving_size').iterator(chunk_size=2000):
+        food.serving_grams = parse(food.serving_size)
+        batch.append(food)
+        if len(batch) == 2000:
+            FoodItem.objects.bulk_update(batch, ['serving_grams'])
+            batch = []
+    if batch:
+        FoodItem.objects.bulk_update(batch, ['serving_grams'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food_database', '0007_food_item_display'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fooditem',
+            name='serving_grams',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, help_text='Serving weight parsed from serving_size, maintained on save; null when it gives no weight', max_digits=8, null=True),
+        ),
+        migrations.RunPython(parse_serving_grams, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.24 on 2026-10-17 02:37
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def start_change_log(apps, schema_editor):
+    # Writes before this migration were never logged, so syncs from older versions need a reset
+    FoodCatalogState = apps.get_model('food_database', 'FoodCatalogState')
+    FoodCatalogState.objects.filter(pk=1).update(changes_horizon=models.F('version'))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food_database', '0008_food_item_serving_grams'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foodcatalogstate',
+            name='changes_horizon',
+            field=models.BigIntegerField(default=0, help_text='Versions up to this one are not (or no longer) in the change log'),
+        ),
+        migrations.CreateModel(
+            name='FoodChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('food_id', models.UUIDField()),
+                ('version', models.BigIntegerField()),
+                ('operation', models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete')], max_length=10)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Food Change',
+                'verbose_name_plural': 'Food Changes',
+                'db_table': 'food_changes',
+                'indexes': [models.Index(fields=['version', 'id'], name='food_changes_version_idx'), models.Index(fields=['changed_at'], name='food_changes_changed_at_idx')],
+            },
+        ),
+        migrations.RunPython(start_change_log, migrations.RunPython.noop),
+    ]
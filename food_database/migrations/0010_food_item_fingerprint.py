@@ -0,0 +1,100 @@
+# Generated by Django 4.2.24 on 2026-10-17 02:41
+
+import hashlib
+import json
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+# The digests as FoodItem.build_fingerprint and build_content_hash computed them when
+# this migration was written, frozen here so later model changes cannot alter them
+FINGERPRINT_FIELDS = ['name', 'serving_size', 'food_category']
+CONTENT_FIELDS = [
+    'name', 'serving_size', 'calories', 'protein_g', 'carbs_g', 'fat_g', 'fiber_g', 'rasa', 'guna',
+    'virya', 'vata_effect', 'pitta_effect', 'kapha_effect', 'meal_types', 'food_category', 'tags',
+]
+
+
+def fingerprint(food):
+    parts = [' '.join(str(getattr(food, field) or '').split()).casefold() for field in FINGERPRINT_FIELDS]
+    return hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def content_hash(food):
+    content = {}
+    for field in CONTENT_FIELDS:
+        value = getattr(food, field)
+        if field in ('protein_g', 'carbs_g', 'fat_g', 'fiber_g'):
+            value = f'{Decimal(value):.2f}'
+        content[field] = value
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def build_hashes(apps, schema_editor):
+    FoodItem = apps.get_model('food_database', 'FoodItem')
+    source_fields = sorted(set(CONTENT_FIELDS) | set(FINGERPRINT_FIELDS))
+    batch = []
+    for food in FoodItem.objects.only('id', *source_fields).iterator(chunk_size=2000):
+        food.fingerprint = fingerprint(food)
+        food.content_hash = content_hash(food)
+        batch.append(food)
+        if len(batch) == 2000:
+            FoodItem.objects.bulk_update(batch, ['fingerprint', 'content_hash'])
+            batch = []
+    if batch:
+        FoodItem.objects.bulk_update(batch, ['fingerprint', 'content_hash'])
+
+
+def release_duplicates(apps, schema_editor):
+    # The oldest food keeps a shared fingerprint, so upserts go on updating it; newer
+    # copies get NULL, which the unique constraint allows
+    FoodItem = apps.get_model('food_database', 'FoodItem')
+    duplicated = FoodItem.objects.exclude(fingerprint=None).values('fingerprint').annotate(
+        copies=Count('id')
+    ).filter(copies__gt=1).values_list('fingerprint', flat=True)
+    for fingerprint in list(duplicated):
+        ids = list(FoodItem.objects.filter(fingerprint=fingerprint).order_by('created_at', 'id').values_list('id', flat=True))
+        FoodItem.objects.filter(id__in=ids[1:]).update(fingerprint=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food_database', '0009_food_changes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foodimportjob',
+            name='mode',
+            field=models.CharField(choices=[('insert', 'Insert'), ('upsert', 'Upsert')], default='upsert', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='foodimportjob',
+            name='unchanged_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='foodimportjob',
+            name='updated_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fooditem',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', editable=False, help_text='SHA-1 of the imported content fields', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='fooditem',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, help_text='SHA-1 of normalized name, serving size and category', max_length=40, null=True),
+        ),
+        migrations.RunPython(build_hashes, migrations.RunPython.noop),
+        migrations.RunPython(release_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='fooditem',
+            constraint=models.UniqueConstraint(fields=('fingerprint',), name='food_items_fingerprint_uniq'),
+        ),
+    ]
@@ -1,7 +1,47 @@
+import hashlib
+import json
+import re
 import uuid
-from django.db import models
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
 from authentication.models import User
 
+CATALOG_STATE_CACHE_KEY = 'food_catalog_state'
+
+# A weight or volume in a serving size, e.g. "150g", "1 cup (240 ml)" or "0.5 kg"
+SERVING_WEIGHT_RE = re.compile(r'(\d+(?:\.\d+)?)\s*(kg|g|gm|gms|grams?|ml|l|litres?|liters?)\b', re.IGNORECASE)
+# Grams per unit; millilitres are counted as grams, as for water-based foods
+SERVING_UNIT_GRAMS = {'kg': 1000, 'l': 1000, 'litre': 1000, 'litres': 1000, 'liter': 1000, 'liters': 1000}
+
+
+# Fields identifying "the same food" across imports, and the fields whose change makes an update
+FINGERPRINT_FIELDS = ['name', 'serving_size', 'food_category']
+CONTENT_FIELDS = [
+    'name', 'serving_size', 'calories', 'protein_g', 'carbs_g', 'fat_g', 'fiber_g', 'rasa', 'guna',
+    'virya', 'vata_effect', 'pitta_effect', 'kapha_effect', 'meal_types', 'food_category', 'tags',
+]
+
+# Fields recomputed from the others on every save
+DERIVED_FIELDS = ['search_document', 'display', 'serving_grams', 'fingerprint', 'content_hash']
+
+
+def parse_serving_grams(serving_size):
+    """Serving weight in grams from a serving size, or None if it gives no weight"""
+    match = SERVING_WEIGHT_RE.search(serving_size or '')
+    if not match:
+        return None
+    try:
+        grams = Decimal(match.group(1)) * SERVING_UNIT_GRAMS.get(match.group(2).lower(), 1)
+    except InvalidOperation:
+        return None
+    if grams <= 0 or grams >= Decimal('1000000'):
+        return None
+    return grams.quantize(Decimal('0.01'))
+
 
 class FoodItem(models.Model):
     """Model for storing Ayurvedic food items with comprehensive properties"""
@@ -17,6 +57,10 @@ class FoodItem(models.Model):
     carbs_g = models.DecimalField(max_digits=5, decimal_places=2)
     fat_g = models.DecimalField(max_digits=5, decimal_places=2)
     fiber_g = models.DecimalField(max_digits=5, decimal_places=2)
+    serving_grams = models.DecimalField(
+        max_digits=8, decimal_places=2, null=True, blank=True, editable=False,
+        help_text="Serving weight parsed from serving_size, maintained on save; null when it gives no weight"
+    )
     
     # Ayurvedic Properties
     rasa = models.JSONField(default=list, help_text="Array of tastes (Sweet, Sour, Salty, Pungent, Bitter, Astringent)")
@@ -65,6 +109,16 @@ class FoodItem(models.Model):
     # Tags and Dietary Information
     tags = models.JSONField(default=list, help_text="Array of dietary tags")
     
+    # Search
+    search_document = models.TextField(blank=True, default='', editable=False, help_text="Lower-cased name, category and tags, maintained on save")
+    
+    # Display strings served by list responses, maintained on save
+    display = models.JSONField(default=dict, blank=True, editable=False)
+    
+    # Import deduplication, maintained on save: identity and content digests
+    fingerprint = models.CharField(max_length=40, null=True, blank=True, editable=False, help_text="SHA-1 of normalized name, serving size and category")
+    content_hash = models.CharField(max_length=40, blank=True, default='', editable=False, help_text="SHA-1 of the imported content fields")
+    
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -75,10 +129,74 @@ class FoodItem(models.Model):
         verbose_name = "Food Item"
         verbose_name_plural = "Food Items"
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination sort keys, each paired with the primary key
+            models.Index(fields=['created_at', 'id'], name='food_items_created_id_idx'),
+            models.Index(fields=['updated_at', 'id'], name='food_items_updated_id_idx'),
+            models.Index(fields=['name', 'id'], name='food_items_name_id_idx'),
+            models.Index(fields=['calories', 'id'], name='food_items_calories_id_idx'),
+            models.Index(fields=['protein_g', 'id'], name='food_items_protein_id_idx'),
+            # The search_document GIN indexes (full-text and trigram) are Postgres-only and
+            # created by migration 0003 outside the model state
+        ]
+        constraints = [
+            # One food per fingerprint, the conflict target of upsert imports; NULL (the
+            # newer copies of foods duplicated before the constraint) never conflicts
+            models.UniqueConstraint(fields=['fingerprint'], name='food_items_fingerprint_uniq'),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.food_category})"
     
+    def save(self, *args, **kwargs):
+        self.refresh_derived_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(DERIVED_FIELDS)
+        super().save(*args, **kwargs)
+    
+    def refresh_derived_fields(self):
+        """Recompute DERIVED_FIELDS; bulk writes that bypass save() call this themselves"""
+        self.search_document = self.build_search_document()
+        self.display = self.build_display()
+        self.serving_grams = parse_serving_grams(self.serving_size)
+        # Newer copies of a food duplicated before fingerprints were unique were released to
+        # NULL by migration 0010; they stay released so editing one cannot collide
+        if self._state.adding or self.fingerprint is not None:
+            self.fingerprint = self.build_fingerprint()
+        self.content_hash = self.build_content_hash()
+    
+    def build_fingerprint(self):
+        """Identity of a food for upsert imports: case- and whitespace-insensitive name, serving size and category"""
+        parts = [' '.join(str(getattr(self, field) or '').split()).casefold() for field in FINGERPRINT_FIELDS]
+        return hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()
+    
+    def build_content_hash(self):
+        """Digest of CONTENT_FIELDS, equal for a stored row and an unchanged CSV row"""
+        content = {}
+        for field in CONTENT_FIELDS:
+            value = getattr(self, field)
+            if field in ('protein_g', 'carbs_g', 'fat_g', 'fiber_g'):
+                value = f'{Decimal(value):.2f}'
+            content[field] = value
+        return hashlib.sha1(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+    
+    def build_search_document(self):
+        """Build the text indexed for full-text and trigram search"""
+        parts = [self.name, self.food_category, *(self.tags or [])]
+        return ' '.join(part for part in parts if part).lower()
+    
+    def build_display(self):
+        """Precompute the display fields so list responses don't derive them per row"""
+        return {
+            'is_tridoshic': self.is_tridoshic,
+            'dosha_balance': self.dosha_balance,
+            'meal_types_display': self.get_meal_types_display(),
+            'tags_display': self.get_tags_display(),
+            'rasa_display': self.get_rasa_display(),
+            'guna_display': self.get_guna_display(),
+        }
+    
     @property
     def is_tridoshic(self):
         """Check if the food is tridoshic (good for all doshas)"""
@@ -126,3 +244,195 @@ class FoodItem(models.Model):
         return ', '.join(self.guna) if self.guna else 'Not specified'
 
 
+class FoodCatalogState(models.Model):
+    """Single-row table holding the food catalog version, bumped on every FoodItem write"""
+    
+    id = models.PositiveSmallIntegerField(primary_key=True, default=1, editable=False)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+    changes_horizon = models.BigIntegerField(default=0, help_text="Versions up to this one are not (or no longer) in the change log")
+    
+    class Meta:
+        db_table = 'food_catalog_state'
+        verbose_name = "Food Catalog State"
+        verbose_name_plural = "Food Catalog State"
+    
+    def __str__(self):
+        return f"Food catalog v{self.version}"
+    
+    @classmethod
+    def current_version(cls):
+        """Get the current catalog version (0 before the first write)"""
+        version = cls.objects.filter(pk=1).values_list('version', flat=True).first()
+        return version or 0
+    
+    @classmethod
+    def cached_state(cls):
+        """(version, updated_at) from a short-lived cache entry, for conditional GETs
+
+        The entry is dropped when a bump commits; other processes may serve the
+        previous version for up to FOOD_CATALOG_STATE_CACHE_TTL seconds.
+        """
+        state = cache.get(CATALOG_STATE_CACHE_KEY)
+        if state is None:
+            state = cls.objects.filter(pk=1).values_list('version', 'updated_at').first() or (0, None)
+            ttl = getattr(settings, 'FOOD_CATALOG_STATE_CACHE_TTL', 2)
+            if ttl:
+                cache.set(CATALOG_STATE_CACHE_KEY, state, ttl)
+        return state
+    
+    @classmethod
+    def bump(cls):
+        """Increment the catalog version and return the new value"""
+        updated = cls.objects.filter(pk=1).update(version=F('version') + 1, updated_at=timezone.now())
+        if not updated:
+            _, created = cls.objects.get_or_create(pk=1, defaults={'version': 1})
+            if not created:
+                cls.objects.filter(pk=1).update(version=F('version') + 1, updated_at=timezone.now())
+        # Only after commit, so a cached version never runs ahead of the data it describes
+        transaction.on_commit(lambda: cache.delete(CATALOG_STATE_CACHE_KEY))
+        return cls.current_version()
+
+
+class FoodChange(models.Model):
+    """Append-only log of FoodItem writes, read by the catalog changes feed
+
+    Rows are written in the transaction that bumps the catalog version, and the bump
+    holds the FoodCatalogState row lock until commit, so versions become visible in
+    order and a client that has seen version N has seen every change up to N.
+    """
+    
+    OPERATION_CHOICES = [
+        ('upsert', 'Upsert'),
+        ('delete', 'Delete'),
+    ]
+    
+    id = models.BigAutoField(primary_key=True)
+    food_id = models.UUIDField()
+    version = models.BigIntegerField()
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    changed_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'food_changes'
+        verbose_name = "Food Change"
+        verbose_name_plural = "Food Changes"
+        indexes = [
+            models.Index(fields=['version', 'id'], name='food_changes_version_idx'),
+            models.Index(fields=['changed_at'], name='food_changes_changed_at_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.operation} {self.food_id} @ v{self.version}"
+    
+    @classmethod
+    def record(cls, food_ids, operation, version):
+        """Log writes to the given foods under a catalog version returned by bump()"""
+        cls.objects.bulk_create([
+            cls(food_id=food_id, version=version, operation=operation) for food_id in food_ids
+        ])
+
+
+class FoodStatsCounter(models.Model):
+    """Incrementally maintained food_stats counter (e.g. 'total', 'dosha:tridoshic', 'tags:Vegan')"""
+    
+    key = models.CharField(max_length=150, primary_key=True)
+    count = models.BigIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'food_stats_counters'
+        verbose_name = "Food Stats Counter"
+        verbose_name_plural = "Food Stats Counters"
+    
+    def __str__(self):
+        return f"{self.key}: {self.count}"
+
+
+class FoodImportJob(models.Model):
+    """Background CSV import of food items, resumable from its last committed chunk"""
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    IMPORT_MODE_CHOICES = [
+        ('insert', 'Insert'),
+        ('upsert', 'Upsert'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='food_import_jobs')
+    original_filename = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    mode = models.CharField(max_length=10, choices=IMPORT_MODE_CHOICES, default='upsert')
+    
+    # Progress, written in the same transaction as each imported chunk
+    total_rows = models.PositiveIntegerField(default=0)
+    rows_processed = models.PositiveIntegerField(default=0)
+    imported_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    unchanged_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True, help_text="First per-row errors ({row, errors})")
+    last_committed_row = models.PositiveIntegerField(default=0, help_text="CSV row number of the last committed chunk")
+    failure_message = models.TextField(blank=True)
+    
+    # Worker bookkeeping
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_started_at = models.DateTimeField(null=True, blank=True)
+    run_start_rows = models.PositiveIntegerField(default=0, help_text="rows_processed when the current run started")
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'food_import_jobs'
+        verbose_name = "Food Import Job"
+        verbose_name_plural = "Food Import Jobs"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'heartbeat_at'], name='food_import_status_hb_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Food import {self.original_filename} ({self.status})"
+    
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+    
+    def eta_seconds(self):
+        """Estimated seconds left, from the throughput of the current run"""
+        if self.status != 'running' or not self.run_started_at or not self.total_rows:
+            return None
+        done = self.rows_processed - self.run_start_rows
+        if done <= 0:
+            return None
+        elapsed = (timezone.now() - self.run_started_at).total_seconds()
+        remaining = max(self.total_rows - self.rows_processed, 0)
+        return round(remaining * elapsed / done, 1)
+
+
+class FoodImportChunk(models.Model):
+    """One slice of an import upload, stored in the database so any worker process can read it"""
+    
+    job = models.ForeignKey(FoodImportJob, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    data = models.BinaryField()
+    
+    class Meta:
+        db_table = 'food_import_chunks'
+        verbose_name = "Food Import Chunk"
+        verbose_name_plural = "Food Import Chunks"
+        ordering = ['job', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'index'], name='food_import_chunk_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"Food import {self.job_id} chunk {self.index}"
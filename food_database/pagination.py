@@ -0,0 +1,137 @@
+"""
+Keyset (cursor) pagination for the food catalog
+"""
+import base64
+import json
+import uuid
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+
+# Sort keys clients may request; the primary key breaks ties so every key is unique
+CURSOR_SORT_FIELDS = ['created_at', 'updated_at', 'name', 'calories', 'protein_g']
+DEFAULT_CURSOR_ORDERING = '-created_at'
+
+
+class InvalidCursor(ValueError):
+    """Raised for cursor tokens or orderings the paginator cannot use"""
+
+
+def encode_cursor(ordering, values, direction):
+    """Opaque token for the position after (or before) a row"""
+    payload = json.dumps({'o': ordering, 'k': values, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, model):
+    """Decode a token produced by encode_cursor into (ordering, (value, pk), direction)
+
+    The sort value is converted to the type of the model field it was issued for and the
+    primary key to a UUID, so a tampered token is rejected here instead of reaching SQL.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        ordering, (value, pk), direction = payload['o'], payload['k'], payload['d']
+        if direction not in ('next', 'previous'):
+            raise ValueError(direction)
+        if not isinstance(ordering, str) or ordering.lstrip('-') not in CURSOR_SORT_FIELDS:
+            raise ValueError(ordering)
+        if value is None:
+            raise ValueError('Missing sort value')
+        value = model._meta.get_field(ordering.lstrip('-')).to_python(value)
+        pk = uuid.UUID(str(pk))
+        return ordering, (value, pk), direction
+    except (ValueError, KeyError, TypeError, ValidationError) as e:
+        raise InvalidCursor(f'Invalid cursor: {token}') from e
+
+
+def estimate_count(queryset):
+    """Row estimate from the Postgres planner, or an exact count elsewhere"""
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class FoodCursorPaginator:
+    """Paginate a FoodItem queryset on (sort key, id) without OFFSET or COUNT(*)"""
+
+    def __init__(self, queryset, page_size, ordering=None, cursor=None):
+        self.cursor = decode_cursor(cursor, queryset.model) if cursor else None
+        if self.cursor:
+            if ordering and ordering != self.cursor[0]:
+                raise InvalidCursor('Cursor was issued for a different ordering')
+            ordering = self.cursor[0]
+
+        ordering = ordering or DEFAULT_CURSOR_ORDERING
+        field = ordering.lstrip('-')
+        if field not in CURSOR_SORT_FIELDS:
+            raise InvalidCursor(
+                f"Invalid ordering: {ordering}. Must be one of {CURSOR_SORT_FIELDS}, optionally prefixed with '-'"
+            )
+
+        self.queryset = queryset
+        self.page_size = page_size
+        self.ordering = ordering
+        self.field = field
+        self.descending = ordering.startswith('-')
+        self.model_field = queryset.model._meta.get_field(field)
+
+    def _order(self, reverse=False):
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        return [f'{prefix}{self.field}', f'{prefix}id']
+
+    def _after(self, value, pk, reverse=False):
+        """Rows strictly after (value, pk) in the (possibly reversed) sort order
+
+        Written as `field <= value AND (field < value OR id < pk)` (or the mirror
+        image) so the leading range condition can drive an index scan.
+        """
+        descending = self.descending != reverse
+        op = 'lt' if descending else 'gt'
+        bound = 'lte' if descending else 'gte'
+        return (
+            Q(**{f'{self.field}__{bound}': value}) &
+            (Q(**{f'{self.field}__{op}': value}) | Q(**{f'id__{op}': pk}))
+        )
+
+    def _key(self, item):
+        """Cursor key of a row, which may be a model instance or a values() dict"""
+        if isinstance(item, dict):
+            value = item[self.field]
+            value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+            return [value, str(item['id'])]
+        return [self.model_field.value_to_string(item), str(item.pk)]
+
+    def page(self):
+        """Get the page after the cursor plus the tokens of its neighbours"""
+        direction = 'next'
+        queryset = self.queryset
+
+        if self.cursor:
+            _, (value, pk), direction = self.cursor
+            queryset = queryset.filter(self._after(value, pk, reverse=direction == 'previous'))
+
+        reverse = direction == 'previous'
+        rows = list(queryset.order_by(*self._order(reverse))[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        items = rows[:self.page_size]
+        if reverse:
+            items.reverse()
+
+        if direction == 'next':
+            has_next, has_previous = has_more, self.cursor is not None
+        else:
+            has_next, has_previous = True, has_more
+
+        next_token = encode_cursor(self.ordering, self._key(items[-1]), 'next') if has_next and items else None
+        previous_token = encode_cursor(self.ordering, self._key(items[0]), 'previous') if has_previous and items else None
+        return items, next_token, previous_token
@@ -0,0 +1,90 @@
+"""
+Read projection for food list responses
+Fetches a page with one values() query (creator name joined in, display strings
+precomputed on write) and builds FoodItemSerializer-shaped dicts without DRF fields
+"""
+from typing import Dict, List, Optional
+from rest_framework import serializers
+from .models import FoodItem
+
+# Columns fetched per row; created_by's names come from the same query via a join
+PROJECTION_FIELDS = [
+    'id', 'name', 'serving_size', 'calories', 'protein_g', 'carbs_g', 'fat_g', 'fiber_g', 'serving_grams',
+    'rasa', 'guna', 'virya', 'vata_effect', 'pitta_effect', 'kapha_effect', 'meal_types',
+    'food_category', 'tags', 'created_at', 'updated_at', 'created_by',
+    'created_by__first_name', 'created_by__last_name', 'display',
+]
+
+DECIMAL_FIELDS = ['protein_g', 'carbs_g', 'fat_g', 'fiber_g']
+DATETIME_FIELDS = ['created_at', 'updated_at']
+SEARCH_FIELDS = ['search_rank', 'search_highlight']
+
+DISPLAY_FIELDS = [
+    'is_tridoshic', 'dosha_balance', 'meal_types_display', 'tags_display', 'rasa_display', 'guna_display'
+]
+DISPLAY_SOURCE_FIELDS = ['vata_effect', 'pitta_effect', 'kapha_effect', 'meal_types', 'tags', 'rasa', 'guna']
+
+# Reused for value formatting so output matches FoodItemSerializer exactly
+_decimal = serializers.DecimalField(max_digits=5, decimal_places=2)
+_serving_grams = serializers.DecimalField(max_digits=8, decimal_places=2, allow_null=True)
+_datetime = serializers.DateTimeField()
+
+
+def project(queryset):
+    """Turn a FoodItem queryset into the values() queryset used by list responses"""
+    fields = list(PROJECTION_FIELDS)
+    fields += [field for field in SEARCH_FIELDS if field in queryset.query.annotations]
+    return queryset.values(*fields)
+
+
+def to_representation(row: Dict, annotations: Optional[Dict] = None) -> Dict:
+    """Build one FoodItemSerializer-shaped dict from a projected row"""
+    display = row['display']
+    if not display:
+        # Rows written without save(), e.g. by raw SQL, get their display derived here
+        display = FoodItem(**{field: row[field] for field in DISPLAY_SOURCE_FIELDS}).build_display()
+
+    data = {
+        'id': str(row['id']),
+        'name': row['name'],
+        'serving_size': row['serving_size'],
+        'calories': row['calories'],
+    }
+    for field in DECIMAL_FIELDS:
+        data[field] = _decimal.to_representation(row[field])
+    serving_grams = row['serving_grams']
+    data['serving_grams'] = _serving_grams.to_representation(serving_grams) if serving_grams is not None else None
+    for field in ['rasa', 'guna', 'virya', 'vata_effect', 'pitta_effect', 'kapha_effect',
+                  'meal_types', 'food_category', 'tags']:
+        data[field] = row[field]
+    for field in DATETIME_FIELDS:
+        data[field] = _datetime.to_representation(row[field])
+    data['created_by'] = row['created_by']
+    data['created_by_name'] = f"{row['created_by__first_name']} {row['created_by__last_name']}".strip()
+    for field in DISPLAY_FIELDS:
+        data[field] = display.get(field)
+
+    extra = annotations if annotations is not None else row
+    if 'search_rank' in extra:
+        data['search_rank'] = float(extra['search_rank'])
+        data['search_highlight'] = extra['search_highlight']
+    return data
+
+
+def represent(rows) -> List[Dict]:
+    """Represent an iterable of projected rows (e.g. a page of project())"""
+    return [to_representation(row) for row in rows]
+
+
+def represent_ids(food_ids, ranked_ids=None) -> List[Dict]:
+    """Fetch and represent foods by id in one query, keeping the order of food_ids
+
+    ranked_ids is the RankedIds the ids came from, whose rank and highlight are
+    attached to each row.
+    """
+    rows = {str(row['id']): row for row in project(FoodItem.objects.filter(id__in=list(food_ids)))}
+    annotations = getattr(ranked_ids, 'annotations', None) or {}
+    return [
+        to_representation(rows[food_id], annotations.get(food_id))
+        for food_id in food_ids if food_id in rows
+    ]
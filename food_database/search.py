@@ -0,0 +1,274 @@
+"""
+Food Search Service for Aahaara Harmony
+Ranked full-text and trigram search over the food catalog, with an in-process
+inverted index for databases without Postgres search support
+"""
+import bisect
+import logging
+import math
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from django.db import connection
+from django.db.models import Q, F
+from django.utils.html import escape
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIG = 'english'
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+
+# Field weights for the fallback index (name matches outrank category and tag matches)
+FIELD_WEIGHTS = {'name': 3.0, 'food_category': 1.5, 'tags': 1.0}
+
+# Minimum trigram similarity for a misspelled query token to match an indexed token
+FUZZY_THRESHOLD = 0.3
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lower-cased word tokens"""
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def trigrams(token: str) -> set:
+    """Padded character trigrams of a token, as used by pg_trgm"""
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(token: str) -> int:
+    """Number of typos tolerated in a query token of this length"""
+    if len(token) < 4:
+        return 0
+    return 1 if len(token) < 8 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance between a and b, or limit + 1 once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def highlight(text: str, matched_tokens) -> str:
+    """Wrap matched words of text in highlight markers, escaping everything else"""
+    parts = []
+    last = 0
+    for match in TOKEN_RE.finditer(text or ''):
+        if match.group(0).lower() in matched_tokens:
+            parts.append(escape(text[last:match.start()]))
+            parts.append(f'{HIGHLIGHT_START}{escape(match.group(0))}{HIGHLIGHT_STOP}')
+            last = match.end()
+    parts.append(escape((text or '')[last:]))
+    return ''.join(parts)
+
+
+class InvertedFoodIndex:
+    """In-process inverted index over food names, categories and tags"""
+
+    def __init__(self, version: int):
+        self.version = version
+        self.postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self.names: Dict[str, str] = {}
+        self.vocabulary: List[str] = []
+        self.token_trigrams: Dict[str, set] = {}
+        self.trigram_tokens: Dict[str, set] = defaultdict(set)
+        self.document_count = 0
+
+    @classmethod
+    def build(cls, version: int) -> 'InvertedFoodIndex':
+        from .models import FoodItem
+
+        index = cls(version)
+        rows = FoodItem.objects.values_list('id', 'name', 'food_category', 'tags')
+        for food_id, name, food_category, tags in rows.iterator(chunk_size=2000):
+            food_id = str(food_id)
+            index.names[food_id] = name
+            fields = {'name': name, 'food_category': food_category, 'tags': ' '.join(tags or [])}
+            for field, text in fields.items():
+                for token in tokenize(text):
+                    postings = index.postings[token]
+                    postings[food_id] = postings.get(food_id, 0.0) + FIELD_WEIGHTS[field]
+            index.document_count += 1
+
+        index.vocabulary = sorted(index.postings)
+        for token in index.vocabulary:
+            grams = trigrams(token)
+            index.token_trigrams[token] = grams
+            for gram in grams:
+                index.trigram_tokens[gram].add(token)
+        return index
+
+    def _expand(self, query_token: str) -> List[Tuple[str, float]]:
+        """Indexed tokens matching a query token, with a match-quality factor"""
+        if query_token in self.postings:
+            matches = [(query_token, 1.0)]
+        else:
+            matches = []
+
+        # Prefix matches ("moo" finds "moong")
+        start = bisect.bisect_left(self.vocabulary, query_token)
+        for token in self.vocabulary[start:]:
+            if not token.startswith(query_token):
+                break
+            if token != query_token:
+                matches.append((token, 0.8))
+
+        # Typo tolerance: candidates share a trigram, then must be similar or a few edits away
+        if not matches:
+            query_grams = trigrams(query_token)
+            limit = max_edits(query_token)
+            candidates = set()
+            for gram in query_grams:
+                candidates |= self.trigram_tokens.get(gram, set())
+            for token in candidates:
+                grams = self.token_trigrams[token]
+                similarity = len(query_grams & grams) / len(query_grams | grams)
+                if similarity >= FUZZY_THRESHOLD or edit_distance(query_token, token, limit) <= limit:
+                    matches.append((token, max(similarity, 0.3) * 0.6))
+        return matches
+
+    def search(self, term: str) -> List[Tuple[str, float, set]]:
+        """Ranked (food id, score, matched tokens); every query word must match"""
+        scores: Optional[Dict[str, float]] = None
+        matched: Dict[str, set] = defaultdict(set)
+
+        for query_token in dict.fromkeys(tokenize(term)):
+            token_scores: Dict[str, float] = {}
+            for token, quality in self._expand(query_token):
+                postings = self.postings[token]
+                idf = math.log(1 + self.document_count / len(postings))
+                for food_id, weight in postings.items():
+                    token_scores[food_id] = token_scores.get(food_id, 0.0) + weight * idf * quality
+                    matched[food_id].add(token)
+
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {
+                    food_id: score + token_scores[food_id]
+                    for food_id, score in scores.items() if food_id in token_scores
+                }
+
+        if not scores:
+            return []
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [(food_id, score, matched[food_id]) for food_id, score in ranked]
+
+
+class RankedIds(list):
+    """Food ids in relevance order, carrying each id's rank and highlighted name"""
+
+    def __init__(self, ids, annotations):
+        super().__init__(ids)
+        self.annotations = annotations
+
+
+class FoodSearchService:
+    """Relevance-ranked food search with typo tolerance and highlighting"""
+
+    def __init__(self):
+        self.index: Optional[InvertedFoodIndex] = None
+        self._lock = threading.Lock()
+
+    @property
+    def uses_postgres(self) -> bool:
+        return connection.vendor == 'postgresql'
+
+    def search(self, queryset, term: str):
+        """Rank the foods of a filtered queryset that match term
+
+        Returns an ordered queryset annotated with search_rank and
+        search_highlight on Postgres, or RankedIds from the in-process index.
+        """
+        if self.uses_postgres:
+            return self._search_postgres(queryset, term)
+        return self._search_index(queryset, term)
+
+    def _search_postgres(self, queryset, term: str):
+        from django.contrib.postgres.search import (
+            SearchHeadline, SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+        )
+
+        query = SearchQuery(term, config=SEARCH_CONFIG, search_type='websearch')
+        # Same expressions as the GIN indexes on search_document, so the planner can use them
+        return queryset.alias(
+            search_vector=SearchVector('search_document', config=SEARCH_CONFIG),
+        ).filter(
+            Q(search_vector=query) |
+            Q(search_document__trigram_word_similar=term.lower()) |
+            Q(search_document__contains=term.lower())
+        ).annotate(
+            search_rank=SearchRank(F('search_vector'), query) + TrigramWordSimilarity(term, 'name'),
+            search_highlight=SearchHeadline(
+                'name', query, config=SEARCH_CONFIG,
+                start_sel=HIGHLIGHT_START, stop_sel=HIGHLIGHT_STOP, highlight_all=True
+            ),
+        ).order_by('-search_rank', '-created_at', '-id')
+
+    def get_index(self) -> InvertedFoodIndex:
+        """Get the fallback index for the current catalog version, rebuilding it if stale"""
+        from .models import FoodCatalogState
+
+        version = FoodCatalogState.current_version()
+        index = self.index
+        if index is not None and index.version == version:
+            return index
+
+        with self._lock:
+            if self.index is None or self.index.version != version:
+                self.index = InvertedFoodIndex.build(version)
+                logger.info(f"Built in-process food search index v{version}")
+            return self.index
+
+    def _search_index(self, queryset, term: str) -> RankedIds:
+        index = self.get_index()
+        ranked = index.search(term)
+        if not ranked:
+            return RankedIds([], {})
+
+        allowed = {str(food_id) for food_id in queryset.filter(
+            id__in=[food_id for food_id, _, _ in ranked]
+        ).values_list('id', flat=True)}
+
+        ids = []
+        annotations = {}
+        for food_id, score, matched_tokens in ranked:
+            if food_id in allowed:
+                ids.append(food_id)
+                annotations[food_id] = {
+                    'search_rank': round(score, 4),
+                    'search_highlight': highlight(index.names.get(food_id, ''), matched_tokens),
+                }
+        return RankedIds(ids, annotations)
+
+    def annotate(self, foods, ranked_ids):
+        """Copy rank and highlight from RankedIds onto fetched food items"""
+        annotations = getattr(ranked_ids, 'annotations', None)
+        if not annotations:
+            return foods
+        for food in foods:
+            for attr, value in annotations.get(str(food.id), {}).items():
+                setattr(food, attr, value)
+        return foods
+
+
+# Global instance
+food_search = FoodSearchService()
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import FoodItem
+from .models import FoodItem, FoodImportJob
 
 
 class FoodItemSerializer(serializers.ModelSerializer):
@@ -16,17 +16,22 @@ class FoodItemSerializer(serializers.ModelSerializer):
     # Creator information
     created_by_name = serializers.CharField(source='created_by.full_name', read_only=True)
     
+    # Only present on search results
+    search_rank = serializers.FloatField(read_only=True)
+    search_highlight = serializers.CharField(read_only=True)
+    
     class Meta:
         model = FoodItem
         fields = [
             'id', 'name', 'serving_size', 'calories', 'protein_g', 'carbs_g', 
-            'fat_g', 'fiber_g', 'rasa', 'guna', 'virya', 'vata_effect', 
+            'fat_g', 'fiber_g', 'serving_grams', 'rasa', 'guna', 'virya', 'vata_effect', 
             'pitta_effect', 'kapha_effect', 'meal_types', 'food_category', 
             'tags', 'created_at', 'updated_at', 'created_by', 'created_by_name',
             'is_tridoshic', 'dosha_balance', 'meal_types_display', 
-            'tags_display', 'rasa_display', 'guna_display'
+            'tags_display', 'rasa_display', 'guna_display', 'search_rank',
+            'search_highlight'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'created_by']
+        read_only_fields = ['id', 'serving_grams', 'created_at', 'updated_at', 'created_by']
 
 
 class FoodItemCreateSerializer(serializers.ModelSerializer):
@@ -104,5 +109,86 @@ class FoodItemFilterSerializer(serializers.Serializer):
     max_calories = serializers.IntegerField(required=False)
     min_protein = serializers.DecimalField(max_digits=5, decimal_places=2, required=False)
     max_protein = serializers.DecimalField(max_digits=5, decimal_places=2, required=False)
+    min_carbs = serializers.DecimalField(max_digits=5, decimal_places=2, required=False)
+    max_carbs = serializers.DecimalField(max_digits=5, decimal_places=2, required=False)
+    min_fat = serializers.DecimalField(max_digits=5, decimal_places=2, required=False)
+    max_fat = serializers.DecimalField(max_digits=5, decimal_places=2, required=False)
+    min_fiber = serializers.DecimalField(max_digits=5, decimal_places=2, required=False)
+    max_fiber = serializers.DecimalField(max_digits=5, decimal_places=2, required=False)
+    
+    # Density and ratio filters; foods whose serving size gives no weight (or with no
+    # protein, for calories per protein) never match them
+    min_calorie_density = serializers.DecimalField(max_digits=8, decimal_places=2, required=False, help_text="kcal per 100g")
+    max_calorie_density = serializers.DecimalField(max_digits=8, decimal_places=2, required=False, help_text="kcal per 100g")
+    min_protein_density = serializers.DecimalField(max_digits=8, decimal_places=2, required=False, help_text="g protein per 100g")
+    max_protein_density = serializers.DecimalField(max_digits=8, decimal_places=2, required=False, help_text="g protein per 100g")
+    min_calories_per_protein = serializers.DecimalField(max_digits=8, decimal_places=2, required=False, help_text="kcal per g protein")
+    max_calories_per_protein = serializers.DecimalField(max_digits=8, decimal_places=2, required=False, help_text="kcal per g protein")
 
 
+class FoodSubstitutionRequestSerializer(serializers.Serializer):
+    """Serializer for food substitution requests"""
+    
+    # What to replace: a catalog food, or a diet chart meal ({name, calories})
+    food_id = serializers.UUIDField(required=False)
+    meal = serializers.DictField(required=False)
+    meal_type = serializers.ChoiceField(
+        choices=['Breakfast', 'Brunch', 'Lunch', 'Snacks', 'Dinner',
+                 'breakfast', 'brunch', 'lunch', 'snack', 'dinner'],
+        required=False
+    )
+    
+    # Whose constitution: a patient's latest PrakritiAnalysis, or explicit scores
+    patient_id = serializers.UUIDField(required=False)
+    vata_score = serializers.IntegerField(required=False, min_value=0)
+    pitta_score = serializers.IntegerField(required=False, min_value=0)
+    kapha_score = serializers.IntegerField(required=False, min_value=0)
+    
+    # Restrictions
+    exclude_tags = serializers.ListField(child=serializers.CharField(), required=False)
+    require_tags = serializers.ListField(child=serializers.CharField(), required=False)
+    exclude_categories = serializers.ListField(child=serializers.CharField(), required=False)
+    exclude_food_ids = serializers.ListField(child=serializers.UUIDField(), required=False)
+    
+    calorie_tolerance = serializers.FloatField(required=False, default=0.2, min_value=0, max_value=1)
+    limit = serializers.IntegerField(required=False, default=10, min_value=1, max_value=50)
+    
+    def validate_meal(self, value):
+        """Validate the meal being replaced"""
+        try:
+            value['calories'] = int(float(value.get('calories')))
+        except (TypeError, ValueError):
+            raise serializers.ValidationError("Meal must include numeric calories")
+        return value
+    
+    def validate(self, data):
+        if not data.get('food_id') and not data.get('meal'):
+            raise serializers.ValidationError("Either food_id or meal is required")
+        return data
+
+
+class FoodImportJobSerializer(serializers.ModelSerializer):
+    """Serializer for background food import progress"""
+    
+    progress_percent = serializers.SerializerMethodField()
+    eta_seconds = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = FoodImportJob
+        fields = [
+            'id', 'status', 'mode', 'original_filename', 'total_rows', 'rows_processed',
+            'imported_count', 'updated_count', 'unchanged_count', 'error_count', 'errors', 'failure_message',
+            'progress_percent', 'eta_seconds', 'attempts', 'created_at',
+            'heartbeat_at', 'finished_at'
+        ]
+        read_only_fields = fields
+    
+    def get_progress_percent(self, obj):
+        if obj.status == 'completed':
+            return 100.0
+        if not obj.total_rows:
+            return 0.0
+        return round(min(obj.rows_processed / obj.total_rows, 1) * 100, 1)
+    
+    def get_eta_seconds(self, obj):
+        return obj.eta_seconds()
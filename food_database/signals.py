@@ -0,0 +1,34 @@
+"""
+Signal handlers keeping catalog-derived structures in sync with FoodItem writes
+"""
+from collections import Counter
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import FoodItem, FoodCatalogState, FoodChange
+from .stats import food_stats_service, food_stats_keys
+
+
+@receiver(pre_save, sender=FoodItem)
+def food_item_saving(sender, instance, **kwargs):
+    """Remember the stats keys of the stored row so an update can be counted as a delta"""
+    instance._previous_stats_keys = food_stats_service.previous_keys(instance)
+
+
+@receiver(post_save, sender=FoodItem)
+def food_item_saved(sender, instance, **kwargs):
+    """Bump the catalog version, change log and stats counters when a food item is created or updated"""
+    with transaction.atomic():
+        FoodChange.record([instance.id], 'upsert', FoodCatalogState.bump())
+
+    delta = Counter(food_stats_keys(instance))
+    delta.subtract(getattr(instance, '_previous_stats_keys', None) or [])
+    food_stats_service.apply_delta(delta)
+
+
+@receiver(post_delete, sender=FoodItem)
+def food_item_deleted(sender, instance, **kwargs):
+    """Bump the catalog version, change log and stats counters when a food item is deleted"""
+    with transaction.atomic():
+        FoodChange.record([instance.id], 'delete', FoodCatalogState.bump())
+    food_stats_service.apply_delta(food_stats_service.count_foods([instance], sign=-1))
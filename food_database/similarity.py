@@ -0,0 +1,226 @@
+"""
+Food Similarity Service for Aahaara Harmony
+"Foods like this": cosine k-NN over normalized nutrient and Ayurvedic feature vectors,
+kept in memory and updated incrementally as the catalog changes
+"""
+import logging
+import threading
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from .models import FoodItem, FoodCatalogState
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+NUTRIENT_FIELDS = ['calories', 'protein_g', 'carbs_g', 'fat_g', 'fiber_g']
+DOSHA_FIELDS = ['vata_effect', 'pitta_effect', 'kapha_effect']
+RASA_VALUES = ['Sweet', 'Sour', 'Salty', 'Pungent', 'Bitter', 'Astringent']
+VIRYA_VALUES = ['Heating', 'Cooling', 'Neutral']
+DOSHA_EFFECT_VALUES = {'pacifies': 1.0, 'neutral': 0.0, 'aggravates': -1.0}
+
+# Relative influence of each feature block on similarity
+FEATURE_WEIGHTS = {'nutrients': 1.0, 'rasa': 0.5, 'guna': 0.5, 'virya': 1.0, 'doshas': 1.5}
+
+VECTOR_FIELDS = ['id', 'updated_at', *NUTRIENT_FIELDS, 'rasa', 'guna', 'virya', *DOSHA_FIELDS]
+UPDATED_AT_COLUMN = VECTOR_FIELDS.index('updated_at')
+NUTRIENT_COLUMNS = slice(VECTOR_FIELDS.index(NUTRIENT_FIELDS[0]), VECTOR_FIELDS.index(NUTRIENT_FIELDS[-1]) + 1)
+GUNA_COLUMN = VECTOR_FIELDS.index('guna')
+
+
+class FoodVectorIndex:
+    """Row-major float32 matrix of unit-length food vectors with an id lookup"""
+
+    def __init__(self, np, guna_values: List[str], means, stds):
+        self.np = np
+        self.guna_values = guna_values
+        self.guna_codes = {value: code for code, value in enumerate(guna_values)}
+        self.means = means
+        self.stds = stds
+        self.dimensions = (
+            len(NUTRIENT_FIELDS) + len(RASA_VALUES) + len(guna_values) + len(VIRYA_VALUES) + len(DOSHA_FIELDS)
+        )
+        self.matrix = np.zeros((0, self.dimensions), dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.size = 0
+        self.version = None
+        self.watermark = None
+
+    @classmethod
+    def build(cls, np, foods: List[Tuple]) -> 'FoodVectorIndex':
+        """Full build: learns the guna vocabulary and nutrient scaling from the catalog"""
+        guna_values = sorted({value for food in foods for value in (food[GUNA_COLUMN] or [])})
+        nutrients = np.array(
+            [food[NUTRIENT_COLUMNS] for food in foods], dtype=np.float64
+        ).reshape(-1, len(NUTRIENT_FIELDS))
+        means = nutrients.mean(axis=0) if len(foods) else np.zeros(len(NUTRIENT_FIELDS))
+        stds = nutrients.std(axis=0) if len(foods) else np.ones(len(NUTRIENT_FIELDS))
+        stds[stds == 0] = 1.0
+
+        index = cls(np, guna_values, means, stds)
+        index.upsert(foods)
+        return index
+
+    def knows(self, food: Tuple) -> bool:
+        """Whether a row can be encoded without growing the feature space"""
+        return all(value in self.guna_codes for value in (food[GUNA_COLUMN] or []))
+
+    def encode(self, food: Tuple):
+        """Unit-length feature vector of a VECTOR_FIELDS row"""
+        np = self.np
+        values = dict(zip(VECTOR_FIELDS, food))
+        weights = FEATURE_WEIGHTS
+
+        vector = np.zeros(self.dimensions, dtype=np.float64)
+        nutrients = np.array([float(values[field]) for field in NUTRIENT_FIELDS])
+        vector[:len(NUTRIENT_FIELDS)] = (nutrients - self.means) / self.stds * weights['nutrients']
+        offset = len(NUTRIENT_FIELDS)
+
+        for value in set(values['rasa'] or []):
+            if value in RASA_VALUES:
+                vector[offset + RASA_VALUES.index(value)] = weights['rasa']
+        offset += len(RASA_VALUES)
+
+        for value in set(values['guna'] or []):
+            vector[offset + self.guna_codes[value]] = weights['guna']
+        offset += len(self.guna_values)
+
+        if values['virya'] in VIRYA_VALUES:
+            vector[offset + VIRYA_VALUES.index(values['virya'])] = weights['virya']
+        offset += len(VIRYA_VALUES)
+
+        for i, field in enumerate(DOSHA_FIELDS):
+            vector[offset + i] = DOSHA_EFFECT_VALUES.get(values[field], 0.0) * weights['doshas']
+
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).astype(np.float32)
+
+    def upsert(self, foods: List[Tuple]):
+        """Insert or replace rows in place, growing the matrix geometrically"""
+        np = self.np
+        for food in foods:
+            food_id = str(food[0])
+            row = self.rows.get(food_id)
+            if row is None:
+                if self.size == len(self.matrix):
+                    capacity = max(1024, len(self.matrix) * 2)
+                    matrix = np.zeros((capacity, self.dimensions), dtype=np.float32)
+                    matrix[:self.size] = self.matrix[:self.size]
+                    alive = np.zeros(capacity, dtype=bool)
+                    alive[:self.size] = self.alive[:self.size]
+                    self.matrix, self.alive = matrix, alive
+                # Readers only look at rows below size, so publish the row before counting it
+                row = self.size
+                self.ids.append(food_id)
+                self.rows[food_id] = row
+                self.matrix[row] = self.encode(food)
+                self.alive[row] = True
+                self.size += 1
+            else:
+                self.matrix[row] = self.encode(food)
+                self.alive[row] = True
+            updated_at = food[UPDATED_AT_COLUMN]
+            if self.watermark is None or updated_at > self.watermark:
+                self.watermark = updated_at
+
+    def remove_missing(self, live_ids):
+        """Drop rows whose foods no longer exist"""
+        live_ids = set(live_ids)
+        for food_id, row in self.rows.items():
+            if self.alive[row] and food_id not in live_ids:
+                self.alive[row] = False
+
+    @property
+    def live_count(self) -> int:
+        return int(self.alive[:self.size].sum())
+
+    def nearest(self, food_id: str, k: int) -> List[Tuple[str, float]]:
+        """Top-k (id, cosine similarity) for a food, excluding itself"""
+        np = self.np
+        row = self.rows.get(food_id)
+        if row is None or not self.alive[row]:
+            return []
+
+        scores = self.matrix[:self.size] @ self.matrix[row]
+        scores[~self.alive[:self.size]] = -np.inf
+        scores[row] = -np.inf
+
+        k = min(k, self.live_count - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.ids[i], round(float(scores[i]), 4)) for i in top]
+
+
+class FoodSimilarityService:
+    """Keeps a FoodVectorIndex in step with the catalog version"""
+
+    def __init__(self):
+        self.np = None
+        self.is_available = False
+        self.index: Optional[FoodVectorIndex] = None
+        self._lock = threading.Lock()
+        self._initialize()
+
+    def _initialize(self):
+        """Load numpy, which the index needs for its vector matrix"""
+        try:
+            import numpy
+            self.np = numpy
+            self.is_available = True
+        except ImportError as e:
+            logger.warning(f"Food similarity search disabled, numpy not installed: {e}")
+            self.is_available = False
+
+    def _rows(self, queryset) -> List[Tuple]:
+        return list(queryset.values_list(*VECTOR_FIELDS).iterator(chunk_size=2000))
+
+    def get_index(self) -> FoodVectorIndex:
+        """Get the index for the current catalog version, applying changes since the last one"""
+        version, _ = FoodCatalogState.cached_state()
+        index = self.index
+        if index is not None and index.version == version:
+            return index
+
+        with self._lock:
+            if self.index is None:
+                self.index = FoodVectorIndex.build(self.np, self._rows(FoodItem.objects.all()))
+                logger.info(f"Built food similarity index v{version} ({self.index.live_count} foods)")
+            elif self.index.version != version:
+                self._refresh(self.index)
+            self.index.version = version
+            return self.index
+
+    def _refresh(self, index: FoodVectorIndex):
+        """Apply rows changed since the watermark; rebuild when the feature space must grow"""
+        changed = FoodItem.objects.all()
+        if index.watermark is not None:
+            # Overlap the watermark so rows from transactions that committed late are not missed
+            overlap = timedelta(seconds=getattr(settings, 'FOOD_SIMILARITY_WATERMARK_OVERLAP', 60))
+            changed = changed.filter(updated_at__gte=index.watermark - overlap)
+        rows = self._rows(changed)
+
+        if not all(index.knows(row) for row in rows):
+            self.index = FoodVectorIndex.build(self.np, self._rows(FoodItem.objects.all()))
+            logger.info(f"Rebuilt food similarity index for new feature values ({self.index.live_count} foods)")
+            return
+
+        index.upsert(rows)
+        # Deletes leave no trace in updated_at; a count mismatch means some rows are gone
+        if FoodItem.objects.count() != index.live_count:
+            index.remove_missing(str(food_id) for food_id in FoodItem.objects.values_list('id', flat=True))
+
+    def similar(self, food_id: str, k: int = 10) -> Optional[List[Tuple[str, float]]]:
+        """Top-k similar foods, or None if the food is not in the catalog"""
+        index = self.get_index()
+        food_id = str(food_id)
+        if food_id not in index.rows or not index.alive[index.rows[food_id]]:
+            return None
+        return index.nearest(food_id, k)
+
+
+# Global instance
+food_similarity = FoodSimilarityService()
@@ -0,0 +1,181 @@
+"""
+Food Stats Service for Aahaara Harmony
+Computes food_stats in one pass over the catalog, caches it per catalog version
+and maintains incremental counters as foods are written
+"""
+import json
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from .models import FoodItem, FoodCatalogState, FoodStatsCounter
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DOSHAS = ['vata', 'pitta', 'kapha']
+
+# Meal types always reported, even before any food uses them
+DEFAULT_MEAL_TYPES = [choice for choice, _ in FoodItem.MEAL_TYPE_CHOICES]
+
+CACHE_KEY = 'food_stats:v{version}'
+
+
+def stats_keys(vata_effect, pitta_effect, kapha_effect, meal_types, tags) -> List[str]:
+    """Counter keys a single food contributes to"""
+    keys = ['total']
+    effects = dict(zip(DOSHAS, [vata_effect, pitta_effect, kapha_effect]))
+    for dosha, effect in effects.items():
+        if effect == 'pacifies':
+            keys.append(f'dosha:{dosha}_pacifying')
+    if all(effect == 'pacifies' for effect in effects.values()):
+        keys.append('dosha:tridoshic')
+    keys.extend(f'meal_types:{value}' for value in set(meal_types or []))
+    keys.extend(f'tags:{value}' for value in set(tags or []))
+    return keys
+
+
+def food_stats_keys(food: FoodItem) -> List[str]:
+    return stats_keys(food.vata_effect, food.pitta_effect, food.kapha_effect, food.meal_types, food.tags)
+
+
+def stats_from_counts(counts: Dict[str, int]) -> Dict:
+    """Build the food_stats response body from counter values"""
+    meal_stats = {meal_type: 0 for meal_type in DEFAULT_MEAL_TYPES}
+    tag_stats = {}
+    for key, count in counts.items():
+        group, _, value = key.partition(':')
+        if group == 'meal_types' and (count or value in meal_stats):
+            meal_stats[value] = count
+        elif group == 'tags' and count:
+            tag_stats[value] = count
+
+    return {
+        'total_foods': counts.get('total', 0),
+        'dosha_stats': {
+            'vata_pacifying': counts.get('dosha:vata_pacifying', 0),
+            'pitta_pacifying': counts.get('dosha:pitta_pacifying', 0),
+            'kapha_pacifying': counts.get('dosha:kapha_pacifying', 0),
+            'tridoshic': counts.get('dosha:tridoshic', 0),
+        },
+        'meal_stats': meal_stats,
+        'tag_stats': dict(sorted(tag_stats.items())),
+    }
+
+
+class FoodStatsService:
+    """Single-query food statistics with a versioned cache and incremental counters"""
+
+    @property
+    def cache_timeout(self) -> int:
+        return getattr(settings, 'FOOD_STATS_CACHE_TIMEOUT', 3600)
+
+    def get_stats(self) -> Dict:
+        """Stats for the current catalog version, computed at most once per version"""
+        version = FoodCatalogState.current_version()
+        key = CACHE_KEY.format(version=version)
+        stats = cache.get(key)
+        if stats is None:
+            stats = stats_from_counts(self.compute_counts())
+            stats['catalog_version'] = version
+            cache.set(key, stats, self.cache_timeout)
+        return stats
+
+    def get_counter_stats(self) -> Dict:
+        """Stats read from the incrementally maintained counters"""
+        counts = dict(FoodStatsCounter.objects.values_list('key', 'count'))
+        return stats_from_counts(counts)
+
+    def compute_counts(self) -> Dict[str, int]:
+        """Count every stats key in one query"""
+        if connection.vendor == 'postgresql':
+            return self._compute_postgres()
+
+        counts = Counter()
+        rows = FoodItem.objects.values_list('vata_effect', 'pitta_effect', 'kapha_effect', 'meal_types', 'tags')
+        for row in rows.iterator(chunk_size=2000):
+            counts.update(stats_keys(*row))
+        return dict(counts)
+
+    def _compute_postgres(self) -> Dict[str, int]:
+        table = FoodItem._meta.db_table
+        # Meal types and tags are grouped from the JSON arrays, so new values need no new queries
+        array_counts = (
+            "(SELECT COALESCE(jsonb_object_agg(value, n), '{{}}'::jsonb) FROM ("
+            "SELECT element AS value, COUNT(DISTINCT f.id) AS n "
+            "FROM {table} f, jsonb_array_elements_text(f.{field}) AS element GROUP BY element) counts)"
+        )
+        sql = f"""
+            SELECT
+                COUNT(*),
+                COUNT(*) FILTER (WHERE vata_effect = 'pacifies'),
+                COUNT(*) FILTER (WHERE pitta_effect = 'pacifies'),
+                COUNT(*) FILTER (WHERE kapha_effect = 'pacifies'),
+                COUNT(*) FILTER (
+                    WHERE vata_effect = 'pacifies' AND pitta_effect = 'pacifies' AND kapha_effect = 'pacifies'
+                ),
+                {array_counts.format(table=table, field='meal_types')},
+                {array_counts.format(table=table, field='tags')}
+            FROM {table}
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            total, vata, pitta, kapha, tridoshic, meal_types, tags = cursor.fetchone()
+        # Django leaves jsonb results undecoded
+        meal_types, tags = [json.loads(value) if isinstance(value, str) else value for value in (meal_types, tags)]
+
+        counts = {
+            'total': total,
+            'dosha:vata_pacifying': vata,
+            'dosha:pitta_pacifying': pitta,
+            'dosha:kapha_pacifying': kapha,
+            'dosha:tridoshic': tridoshic,
+        }
+        counts.update({f'meal_types:{value}': n for value, n in (meal_types or {}).items()})
+        counts.update({f'tags:{value}': n for value, n in (tags or {}).items()})
+        return counts
+
+    def apply_delta(self, delta: Dict[str, int]):
+        """Add a {key: change} delta to the counters (call inside the writing transaction)"""
+        delta = {key: change for key, change in delta.items() if change}
+        if not delta:
+            return
+        FoodStatsCounter.objects.bulk_create(
+            [FoodStatsCounter(key=key[:150], count=0) for key in delta], ignore_conflicts=True
+        )
+        # Fixed key order so concurrent writers lock counter rows in the same order
+        for key, change in sorted(delta.items()):
+            FoodStatsCounter.objects.filter(key=key[:150]).update(count=F('count') + change)
+
+    def count_foods(self, foods: Iterable[FoodItem], sign: int = 1) -> Dict[str, int]:
+        """Counter delta for adding (sign=1) or removing (sign=-1) foods"""
+        delta = Counter()
+        for food in foods:
+            for key in food_stats_keys(food):
+                delta[key] += sign
+        return dict(delta)
+
+    def rebuild_counters(self) -> Dict[str, int]:
+        """Reset the counters from a full recount"""
+        counts = self.compute_counts()
+        FoodStatsCounter.objects.all().delete()
+        FoodStatsCounter.objects.bulk_create(
+            [FoodStatsCounter(key=key[:150], count=count) for key, count in counts.items()]
+        )
+        return counts
+
+    def previous_keys(self, food: FoodItem) -> Optional[List[str]]:
+        """Stats keys of the stored version of a food, before an update"""
+        if food._state.adding:
+            return None
+        row = FoodItem.objects.filter(pk=food.pk).values_list(
+            'vata_effect', 'pitta_effect', 'kapha_effect', 'meal_types', 'tags'
+        ).first()
+        return stats_keys(*row) if row else None
+
+
+# Global instance
+food_stats_service = FoodStatsService()
@@ -0,0 +1,298 @@
+"""
+Food Substitution Service for Aahaara Harmony
+Dosha-aware swaps for a food or diet chart meal: compatibility is precomputed for every
+food and prakriti bucket, and foods are kept sorted by calories per meal type, so a ranking
+looks up the calorie window and merges it with the bucket order, never scanning the catalog
+"""
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+from .models import FoodItem, FoodCatalogState
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DOSHAS = ['vata', 'pitta', 'kapha']
+
+# One bucket per PrakritiAnalysis.DOSHA_CHOICES value, weighting how much each dosha's
+# balance matters for that constitution
+DOSHA_BUCKETS = {
+    'vata': (0.6, 0.2, 0.2),
+    'pitta': (0.2, 0.6, 0.2),
+    'kapha': (0.2, 0.2, 0.6),
+    'vata-pitta': (0.4, 0.4, 0.2),
+    'vata-kapha': (0.4, 0.2, 0.4),
+    'pitta-kapha': (0.2, 0.4, 0.4),
+    'tridosha': (1 / 3, 1 / 3, 1 / 3),
+}
+BUCKET_NAMES = list(DOSHA_BUCKETS)
+
+# Share difference below which two doshas count as co-dominant
+CO_DOMINANT_SHARE = 0.1
+
+DOSHA_EFFECT_VALUES = {'pacifies': 1.0, 'neutral': 0.0, 'aggravates': -1.0}
+# Heating foods calm vata and kapha but provoke pitta; cooling foods the reverse
+VIRYA_EFFECTS = {
+    'Heating': (0.5, -0.5, 0.5),
+    'Cooling': (-0.5, 0.5, -0.5),
+    'Neutral': (0.0, 0.0, 0.0),
+}
+
+# Diet chart meal keys to FoodItem.MEAL_TYPE_CHOICES
+MEAL_TYPE_ALIASES = {
+    'breakfast': 'Breakfast',
+    'brunch': 'Brunch',
+    'lunch': 'Lunch',
+    'snack': 'Snacks',
+    'snacks': 'Snacks',
+    'dinner': 'Dinner',
+}
+
+# Smallest calorie window, so low-calorie targets still have candidates
+MIN_CALORIE_WINDOW = 25
+# How much calorie closeness can reorder foods of similar compatibility
+CALORIE_CLOSENESS_WEIGHT = 0.25
+# Compatibility-ranked candidates considered per requested result when re-ranking
+CANDIDATE_FACTOR = 4
+
+TABLE_FIELDS = ['id', 'calories', 'food_category', 'virya', 'meal_types', 'tags', *[f'{d}_effect' for d in DOSHAS]]
+
+
+def bucket_for_scores(vata: int, pitta: int, kapha: int) -> str:
+    """Map prakriti scores to a dosha bucket by each dosha's share of the total"""
+    total = vata + pitta + kapha
+    if total <= 0:
+        return 'tridosha'
+    shares = sorted(zip((vata / total, pitta / total, kapha / total), DOSHAS), reverse=True)
+    if shares[0][0] - shares[2][0] < CO_DOMINANT_SHARE:
+        return 'tridosha'
+    if shares[0][0] - shares[1][0] < CO_DOMINANT_SHARE:
+        pair = sorted([shares[0][1], shares[1][1]], key=DOSHAS.index)
+        return '-'.join(pair)
+    return shares[0][1]
+
+
+def bucket_for_analysis(analysis) -> str:
+    """Dosha bucket of a PrakritiAnalysis: from its scores, or its primary dosha when unscored"""
+    if analysis.vata_score or analysis.pitta_score or analysis.kapha_score:
+        return bucket_for_scores(analysis.vata_score, analysis.pitta_score, analysis.kapha_score)
+    return analysis.primary_dosha if analysis.primary_dosha in DOSHA_BUCKETS else 'tridosha'
+
+
+def normalize_meal_type(meal_type: Optional[str]) -> Optional[str]:
+    if not meal_type:
+        return None
+    return MEAL_TYPE_ALIASES.get(meal_type.lower(), meal_type)
+
+
+class SubstitutionTable:
+    """Column arrays of the catalog with per-bucket compatibility and pre-sorted rankings"""
+
+    def __init__(self, np, rows: List[Tuple]):
+        self.np = np
+        columns = dict(zip(TABLE_FIELDS, zip(*rows))) if rows else {field: () for field in TABLE_FIELDS}
+        size = len(rows)
+
+        self.ids = [str(food_id) for food_id in columns['id']]
+        self.rows = {food_id: row for row, food_id in enumerate(self.ids)}
+        self.calories = np.array(columns['calories'], dtype=np.int32).reshape(size)
+        self.categories = np.array(columns['food_category'], dtype=object).reshape(size)
+        self.meal_types = self._value_columns(columns['meal_types'], size)
+        self.tags = self._value_columns(columns['tags'], size)
+
+        # compatibility[row, bucket]: weighted sum of dosha effects plus the virya adjustment
+        effects = np.array(
+            [[DOSHA_EFFECT_VALUES.get(value, 0.0) for value in columns[f'{d}_effect']] for d in DOSHAS],
+            dtype=np.float32
+        ).reshape(len(DOSHAS), size).T
+        effects += np.array(
+            [VIRYA_EFFECTS.get(value, VIRYA_EFFECTS['Neutral']) for value in columns['virya']],
+            dtype=np.float32
+        ).reshape(size, len(DOSHAS))
+        weights = np.array([DOSHA_BUCKETS[name] for name in BUCKET_NAMES], dtype=np.float32)
+        self.compatibility = effects @ weights.T
+
+        # Best-first row order per bucket; stable so ties keep catalog order
+        self.orders = {
+            name: np.argsort(-self.compatibility[:, b], kind='stable').astype(np.int32)
+            for b, name in enumerate(BUCKET_NAMES)
+        }
+        # Each row's place in those orders, to merge a calorie window back into bucket order
+        self.positions = {}
+        for name, order in self.orders.items():
+            positions = np.empty(size, dtype=np.int32)
+            positions[order] = np.arange(size, dtype=np.int32)
+            self.positions[name] = positions
+
+        # Rows sorted by calories, for the whole catalog (None) and per meal type, with the
+        # sorted calories alongside so a calorie window is two binary searches
+        self.by_calories = {None: self._calorie_sorted(np.arange(size, dtype=np.int32))}
+        for meal_type, column in self.meal_types.items():
+            self.by_calories[meal_type] = self._calorie_sorted(np.flatnonzero(column).astype(np.int32))
+        self.version = None
+
+    def _calorie_sorted(self, rows):
+        rows = rows[self.np.argsort(self.calories[rows], kind='stable')]
+        return rows, self.calories[rows]
+
+    def _value_columns(self, lists, size) -> Dict[str, object]:
+        """One boolean column per distinct value of a multi-valued field"""
+        columns = {}
+        for row, values in enumerate(lists):
+            for value in values or []:
+                if value not in columns:
+                    columns[value] = self.np.zeros(size, dtype=bool)
+                columns[value][row] = True
+        return columns
+
+    def _column(self, columns, value):
+        column = columns.get(value)
+        return column if column is not None else self.np.zeros(len(self.ids), dtype=bool)
+
+    def eligible(self, meal_type: Optional[str] = None, restrictions: Optional[Dict] = None, exclude_ids=()):
+        """Boolean mask of rows served at meal_type that pass every restriction"""
+        np = self.np
+        restrictions = restrictions or {}
+        mask = np.ones(len(self.ids), dtype=bool)
+
+        if meal_type:
+            mask &= self._column(self.meal_types, meal_type)
+        for tag in restrictions.get('require_tags') or []:
+            mask &= self._column(self.tags, tag)
+        for tag in restrictions.get('exclude_tags') or []:
+            mask &= ~self._column(self.tags, tag)
+        if restrictions.get('exclude_categories'):
+            mask &= ~np.isin(self.categories, list(restrictions['exclude_categories']))
+        for food_id in exclude_ids:
+            row = self.rows.get(str(food_id))
+            if row is not None:
+                mask[row] = False
+        return mask
+
+    def candidates(self, target_calories: int, calorie_tolerance: float, meal_types: Sequence[str] = (),
+                   restrictions: Optional[Dict] = None, exclude_ids=()):
+        """Rows within the calorie window, served at any of meal_types, that pass every
+        restriction; only the rows inside the window are examined"""
+        np = self.np
+        restrictions = restrictions or {}
+        window = max(target_calories * calorie_tolerance, MIN_CALORIE_WINDOW)
+        lists = [self.by_calories.get(meal_type) for meal_type in meal_types] if meal_types else [self.by_calories[None]]
+        slices = []
+        for sorted_list in lists:
+            if sorted_list is None:
+                continue
+            rows, calories = sorted_list
+            start = np.searchsorted(calories, target_calories - window, side='left')
+            end = np.searchsorted(calories, target_calories + window, side='right')
+            slices.append(rows[start:end])
+        if not slices:
+            return np.empty(0, dtype=np.int32), window
+        rows = slices[0] if len(slices) == 1 else np.unique(np.concatenate(slices))
+
+        keep = np.ones(len(rows), dtype=bool)
+        for tag in restrictions.get('require_tags') or []:
+            keep &= self._column(self.tags, tag)[rows]
+        for tag in restrictions.get('exclude_tags') or []:
+            keep &= ~self._column(self.tags, tag)[rows]
+        if restrictions.get('exclude_categories'):
+            keep &= ~np.isin(self.categories[rows], list(restrictions['exclude_categories']))
+        excluded = [self.rows[str(food_id)] for food_id in exclude_ids if str(food_id) in self.rows]
+        if excluded:
+            keep &= ~np.isin(rows, excluded)
+        return rows[keep], window
+
+    def rank(self, bucket: str, target_calories: int, calorie_tolerance: float, limit: int, **filters) -> List[Dict]:
+        """Top foods for a bucket: take the calorie window's candidates in the bucket's
+        pre-sorted order, then re-rank the leading ones by compatibility plus calorie closeness"""
+        np = self.np
+        rows, window = self.candidates(target_calories, calorie_tolerance, **filters)
+        positions = self.positions[bucket][rows]
+        count = min(limit * CANDIDATE_FACTOR, len(rows))
+        if count < len(rows):
+            leading = np.argpartition(positions, count)[:count]
+            rows, positions = rows[leading], positions[leading]
+        candidates = rows[np.argsort(positions, kind='stable')]
+
+        b = BUCKET_NAMES.index(bucket)
+        compatibility = self.compatibility[candidates, b]
+        difference = self.calories[candidates] - target_calories
+        scores = compatibility + CALORIE_CLOSENESS_WEIGHT * (1 - np.abs(difference) / window)
+        best = np.argsort(-scores, kind='stable')[:limit]
+
+        return [
+            {
+                'id': self.ids[candidates[i]],
+                'compatibility': round(float(compatibility[i]), 4),
+                'calorie_difference': int(difference[i]),
+                'score': round(float(scores[i]), 4),
+            }
+            for i in best
+        ]
+
+
+class FoodSubstitutionService:
+    """Keeps a SubstitutionTable in step with the catalog version"""
+
+    def __init__(self):
+        self.np = None
+        self.is_available = False
+        self.table: Optional[SubstitutionTable] = None
+        self._lock = threading.Lock()
+        self._initialize()
+
+    def _initialize(self):
+        """Load numpy, which the table needs for its columns"""
+        try:
+            import numpy
+            self.np = numpy
+            self.is_available = True
+        except ImportError as e:
+            logger.warning(f"Food substitutions disabled, numpy not installed: {e}")
+            self.is_available = False
+
+    def get_table(self) -> SubstitutionTable:
+        """Get the table for the current catalog version, rebuilding it after catalog changes"""
+        version, _ = FoodCatalogState.cached_state()
+        table = self.table
+        if table is not None and table.version == version:
+            return table
+
+        with self._lock:
+            if self.table is None or self.table.version != version:
+                rows = list(FoodItem.objects.values_list(*TABLE_FIELDS).iterator(chunk_size=2000))
+                table = SubstitutionTable(self.np, rows)
+                table.version = version
+                self.table = table
+                logger.info(f"Built food substitution table v{version} ({len(rows)} foods)")
+            return self.table
+
+    def prakriti_bucket(self, patient_id=None, scores: Optional[Dict[str, int]] = None) -> Tuple[str, str]:
+        """Dosha bucket and where it came from: explicit scores, the patient's latest
+        PrakritiAnalysis, or the balanced default"""
+        if scores and any(scores.get(f'{d}_score') is not None for d in DOSHAS):
+            return bucket_for_scores(*(scores.get(f'{d}_score') or 0 for d in DOSHAS)), 'scores'
+
+        if patient_id:
+            from patients.models import PrakritiAnalysis
+            analysis = PrakritiAnalysis.objects.filter(patient_id=patient_id).order_by('-analysis_date').first()
+            if analysis:
+                return bucket_for_analysis(analysis), 'prakriti_analysis'
+
+        return 'tridosha', 'default'
+
+    def substitutes(self, target_calories: int, bucket: str, meal_types: Sequence[str] = (),
+                    restrictions: Optional[Dict] = None, exclude_ids=(), calorie_tolerance: float = 0.2,
+                    limit: int = 10) -> List[Dict]:
+        """Ranked substitutes with their compatibility, calorie difference and combined score
+
+        Substitutes are served at one of meal_types (any meal when empty).
+        """
+        return self.get_table().rank(
+            bucket, target_calories, calorie_tolerance, limit,
+            meal_types=[normalize_meal_type(meal_type) for meal_type in meal_types],
+            restrictions=restrictions, exclude_ids=exclude_ids,
+        )
+
+
+# Global instance
+food_substitutions = FoodSubstitutionService()
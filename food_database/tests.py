@@ -0,0 +1,805 @@
+import base64
+import datetime
+import io
+import json
+import shutil
+import tempfile
+import uuid
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from authentication.models import User, UnifiedPatient
+from diet_charts.models import DietChart
+from . import bitmap_index
+from .autocomplete import FoodAutocompleteService
+from .catalog_engine import FoodCatalogEngine
+from .changes import food_changes
+from .conditional import get_metrics
+from .facets import food_facets
+from .filters import apply_food_filters
+from .import_jobs import food_import_jobs, iter_lines
+from .importer import DUPLICATE_FOOD_ERROR, FoodCSVImporter
+from .models import (
+    CATALOG_STATE_CACHE_KEY, FoodCatalogState, FoodChange, FoodImportChunk, FoodImportJob, FoodItem,
+    parse_serving_grams,
+)
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+from .projection import project, represent
+from .search import FoodSearchService, RankedIds, food_search
+from .serializers import FoodItemSerializer
+from .similarity import food_similarity
+from .stats import food_stats_service
+
+
+def make_food(user, name, **fields):
+    values = {
+        'serving_size': '1 cup (200g)', 'calories': 200, 'protein_g': 5, 'carbs_g': 30,
+        'fat_g': 5, 'fiber_g': 2, 'rasa': ['Sweet'], 'guna': ['Light'], 'virya': 'Cooling',
+        'vata_effect': 'pacifies', 'pitta_effect': 'pacifies', 'kapha_effect': 'neutral',
+        'meal_types': ['Lunch'], 'food_category': 'Grains', 'tags': [],
+    }
+    values.update(fields)
+    return FoodItem.objects.create(name=name, created_by=user, **values)
+
+
+def make_user(username='doctor', role='doctor'):
+    return User.objects.create_user(username=username, email=f'{username}@example.com', password='x', role=role)
+
+
+CSV_HEADER = (
+    'name,serving_size,calories,protein_g,carbs_g,fat_g,fiber_g,rasa,guna,virya,'
+    'vata_effect,pitta_effect,kapha_effect,meal_type,food_category,tags\n'
+)
+
+
+def csv_rows(count, start=0):
+    return ''.join(
+        f'Food {i},100g,{100 + i},1.5,2,3,4,Sweet,Heavy,Cooling,pacifies,neutral,aggravates,Lunch,Grains,Vegan\n'
+        for i in range(start, start + count)
+    )
+
+
+# One filter per dimension, plus values the catalog never uses and a combination
+ENGINE_FILTERS = [
+    {},
+    {'vata_effect': 'aggravates'},
+    {'pitta_effect': 'neutral'},
+    {'kapha_effect': 'pacifies'},
+    {'virya': 'Heating'},
+    {'meal_types': ['Breakfast', 'Dinner']},
+    {'meal_types': ['Brunch']},
+    {'tags': ['gluten-free']},
+    {'rasa': ['Sour', 'Pungent']},
+    {'guna': ['Heavy']},
+    {'guna': ['Unknown']},
+    {'food_category': 'legum'},
+    {'min_calories': 150},
+    {'max_calories': 150},
+    {'min_protein': '7.5'},
+    {'max_protein': '7.49'},
+    {'max_calories': 0},
+    {'min_carbs': 30},
+    {'max_fat': '4.99'},
+    {'min_fiber': 3, 'max_fiber': 6},
+    {'min_calorie_density': 60},
+    {'max_protein_density': '3.5'},
+    {'max_calories_per_protein': 20},
+    {'kapha_effect': 'aggravates', 'meal_types': ['Lunch'], 'min_calories': 100, 'rasa': ['Sweet']},
+    {'food_category': 'legumes', 'min_calorie_density': 50, 'max_carbs': 30},
+]
+
+
+@override_settings(FOOD_CATALOG_ENGINE_ENABLED=True)
+class FoodCatalogEngineTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        make_food(cls.user, 'Basmati Rice', tags=['gluten-free'], calories=130, protein_g='2.70',
+                  carbs_g='28.00', fat_g='0.30', fiber_g='0.40')
+        make_food(cls.user, 'Moong Dal', food_category='Legumes', calories=105, protein_g='7.50',
+                  rasa=['Sweet', 'Astringent'], meal_types=['Lunch', 'Dinner'], kapha_effect='pacifies',
+                  serving_size='1 bowl (150 g)', fiber_g='7.60')
+        make_food(cls.user, 'Masala Chai', food_category='Beverages', virya='Heating', rasa=['Pungent'],
+                  guna=['Hot'], meal_types=['Breakfast'], pitta_effect='aggravates', calories=90, protein_g='3.10',
+                  serving_size='1 cup', carbs_g='12.00')
+        make_food(cls.user, 'Paneer Tikka', food_category='Dairy', calories=265, protein_g='18.30',
+                  guna=['Heavy', 'Oily'], kapha_effect='aggravates', rasa=['Sweet', 'Sour'], tags=['high-protein'],
+                  serving_size='100g', carbs_g='6.00', fat_g='20.80', fiber_g='0.00')
+        make_food(cls.user, 'Rajma', food_category='Legumes', calories=140, protein_g='7.49', guna=['Heavy'],
+                  vata_effect='aggravates', pitta_effect='neutral', tags=['gluten-free', 'vegan'],
+                  fiber_g='6.00')
+
+    def setUp(self):
+        snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, snapshot_dir, ignore_errors=True)
+        self.engine = FoodCatalogEngine(snapshot_dir=snapshot_dir)
+
+    def build(self):
+        # Built here rather than on the engine's thread, which cannot see the test transaction
+        self.engine.build_snapshot(FoodCatalogState.current_version())
+
+    def database_ids(self, filter_data):
+        queryset = apply_food_filters(FoodItem.objects.order_by('-created_at', '-id'), filter_data)
+        return [str(pk) for pk in queryset.values_list('id', flat=True)]
+
+    def test_filters_match_the_database(self):
+        self.build()
+        for filter_data in ENGINE_FILTERS:
+            with self.subTest(filter_data=filter_data):
+                result = self.engine.filter_ids(filter_data)
+                expected = self.database_ids(filter_data)
+                self.assertEqual(list(result), expected)
+                self.assertEqual(result.count(), len(expected))
+
+    def test_bitmap_result_pages_match_the_database(self):
+        self.build()
+        result = self.engine.filter_ids({'meal_types': ['Lunch', 'Dinner']})
+        expected = self.database_ids({'meal_types': ['Lunch', 'Dinner']})
+        self.assertEqual(len(result), 4)
+        self.assertEqual(result[1:3], expected[1:3])
+        self.assertEqual(result[-1], expected[-1])
+
+    def test_bitsets_round_trip_row_masks(self):
+        mask = [i % 3 == 0 for i in range(130)]
+        bits = bitmap_index.from_mask(mask)
+        self.assertEqual(len(bits), bitmap_index.word_count(130))
+        self.assertEqual(bitmap_index.to_mask(bits, 130).tolist(), mask)
+        self.assertEqual(bitmap_index.popcount(bits), sum(mask))
+
+    def test_facet_counts_match_the_database(self):
+        self.build()
+        for filter_data in ENGINE_FILTERS:
+            with self.subTest(filter_data=filter_data):
+                self.assertEqual(self.engine.facet_counts(filter_data), food_facets._count_rows(filter_data))
+
+    def test_search_is_left_to_the_search_service(self):
+        self.build()
+        self.assertIsNone(self.engine.filter_ids({'search': 'dal'}))
+
+    def test_requests_fall_back_while_the_snapshot_builds(self):
+        with mock.patch.object(self.engine, '_start_build') as start_build:
+            self.assertIsNone(self.engine.filter_ids({}))
+        start_build.assert_called_once_with(FoodCatalogState.current_version())
+
+    def test_background_build_serves_later_requests(self):
+        # The build thread closes its own connection, which this test still needs
+        with mock.patch('food_database.catalog_engine.connection'):
+            self.engine._build(FoodCatalogState.current_version())
+        self.assertEqual(list(self.engine.filter_ids({'guna': ['Heavy']})), self.database_ids({'guna': ['Heavy']}))
+
+    def test_catalog_writes_retire_the_snapshot(self):
+        self.build()
+        self.assertEqual(self.engine.filter_ids({}).count(), 5)
+        make_food(self.user, 'Rolled Oats')
+        with mock.patch.object(self.engine, '_start_build') as start_build:
+            self.assertIsNone(self.engine.filter_ids({}))
+        start_build.assert_called_once_with(FoodCatalogState.current_version())
+
+
+class FoodSearchFallbackTests(TestCase):
+    """The in-process index used on databases without Postgres search"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.rice = make_food(cls.user, 'Basmati Rice', tags=['gluten-free'])
+        cls.dal = make_food(cls.user, 'Moong Dal', food_category='Legumes')
+        cls.milk = make_food(cls.user, 'Almond Milk', food_category='Dairy Alternatives')
+
+    def setUp(self):
+        food_search.index = None
+        patcher = mock.patch.object(FoodSearchService, 'uses_postgres', new_callable=mock.PropertyMock, return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_ranks_matches_from_the_index(self):
+        result = food_search.search(FoodItem.objects.all(), 'rice')
+        self.assertIsInstance(result, RankedIds)
+        self.assertEqual(result, [str(self.rice.id)])
+        self.assertEqual(result.annotations[str(self.rice.id)]['search_highlight'], 'Basmati <mark>Rice</mark>')
+
+    def test_tolerates_typos(self):
+        self.assertEqual(food_search.search(FoodItem.objects.all(), 'basmti'), [str(self.rice.id)])
+
+    def test_respects_the_filtered_queryset(self):
+        queryset = FoodItem.objects.exclude(id=self.rice.id)
+        self.assertEqual(food_search.search(queryset, 'rice'), [])
+
+    def test_index_follows_catalog_changes(self):
+        food_search.search(FoodItem.objects.all(), 'rice')
+        oats = make_food(self.user, 'Rolled Oats', food_category='Grains')
+        self.assertEqual(food_search.search(FoodItem.objects.all(), 'oats'), [str(oats.id)])
+
+
+class FoodCursorPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        # Repeated calories so pages have to break ties on the primary key
+        for i, calories in enumerate([100, 120, 120, 120, 150, 90, 120]):
+            make_food(cls.user, f'Food {i}', calories=calories)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def page(self, **params):
+        response = self.client.get('/api/foods/', {'pagination': 'cursor', 'page_size': 3, **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_pages_walk_the_ordering_in_both_directions(self):
+        expected = [str(pk) for pk in FoodItem.objects.order_by('-calories', '-id').values_list('id', flat=True)]
+
+        pages, data = [], self.page(ordering='-calories')
+        pages.append([food['id'] for food in data['results']])
+        while data['next_page']:
+            data = self.page(cursor=data['next_page'])
+            pages.append([food['id'] for food in data['results']])
+        self.assertEqual(sum(pages, []), expected)
+        self.assertFalse(data['next'])
+
+        data = self.page(cursor=data['previous_page'])
+        self.assertEqual([food['id'] for food in data['results']], pages[-2])
+
+    def test_tampered_cursors_are_rejected(self):
+        food = FoodItem.objects.first()
+        tokens = [
+            'not-a-cursor',
+            encode_cursor('-calories', ['120', 'not-a-uuid'], 'next'),
+            encode_cursor('-calories', ['lots', str(food.pk)], 'next'),
+            encode_cursor('-calories', [None, str(food.pk)], 'next'),
+            encode_cursor('-created_at', ['yesterday', str(food.pk)], 'next'),
+            encode_cursor('-fat_g', ['5', str(food.pk)], 'next'),
+            encode_cursor('-calories', ['120', str(food.pk)], 'sideways'),
+            base64.urlsafe_b64encode(json.dumps({'o': '-calories', 'k': 5, 'd': 'next'}).encode()).decode(),
+        ]
+        for token in tokens:
+            with self.subTest(token=token):
+                with self.assertRaises(InvalidCursor):
+                    decode_cursor(token, FoodItem)
+                response = self.client.get('/api/foods/', {'cursor': token})
+                self.assertEqual(response.status_code, 400)
+
+    def test_cursor_values_are_typed(self):
+        food = FoodItem.objects.first()
+        ordering, (value, pk), direction = decode_cursor(
+            encode_cursor('-calories', ['120', str(food.pk)], 'next'), FoodItem
+        )
+        self.assertEqual((ordering, value, pk, direction), ('-calories', 120, food.pk, 'next'))
+
+
+class FoodCSVImportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+
+    def lines(self, content):
+        return io.StringIO(content)
+
+    def test_chunks_are_written_with_each_method(self):
+        for method in ('bulk', 'copy'):
+            with self.subTest(method=method):
+                FoodItem.objects.all().delete()
+                version = FoodCatalogState.current_version()
+                chunks = []
+                importer = FoodCSVImporter(
+                    self.user, batch_size=2, method=method,
+                    on_chunk=lambda result, last_row: chunks.append((result.imported_count, last_row)),
+                )
+                result = importer.import_file(self.lines(CSV_HEADER + csv_rows(5)))
+
+                self.assertEqual((result.rows_processed, result.imported_count, result.total_errors), (5, 5, 0))
+                self.assertEqual(chunks, [(2, 3), (4, 5), (5, 6)])
+                # One catalog version bump per chunk instead of one per row
+                self.assertEqual(FoodCatalogState.current_version(), version + 3)
+                food = FoodItem.objects.get(name='Food 3')
+                self.assertEqual((food.calories, food.rasa, food.meal_types), (103, ['Sweet'], ['Lunch']))
+                self.assertEqual(food.search_document, 'food 3 grains vegan')
+
+    def test_bad_rows_are_reported_without_failing_their_chunk(self):
+        content = CSV_HEADER + csv_rows(1) + csv_rows(1, 1).replace('Cooling', 'Lukewarm') + 'Broken,100g,lots\n'
+        result = FoodCSVImporter(self.user, method='bulk').import_file(self.lines(content))
+
+        self.assertEqual((result.imported_count, result.total_errors), (1, 2))
+        self.assertEqual([error['row'] for error in result.errors], [3, 4])
+        self.assertIn('virya', result.errors[0]['errors'])
+        self.assertEqual(list(FoodItem.objects.values_list('name', flat=True)), ['Food 0'])
+
+    def test_resumes_after_the_committed_rows(self):
+        result = FoodCSVImporter(self.user, method='bulk').import_file(
+            self.lines(CSV_HEADER + csv_rows(4)), start_row=3
+        )
+        self.assertEqual(result.imported_count, 2)
+        self.assertEqual(sorted(FoodItem.objects.values_list('name', flat=True)), ['Food 2', 'Food 3'])
+
+    def test_upload_endpoint_streams_the_file(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        upload = SimpleUploadedFile('foods.csv', ('\ufeff' + CSV_HEADER + csv_rows(3)).encode('utf-8'))
+        response = client.post('/api/foods/import-csv/', {'csv_file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['imported_count'], response.data['total_errors']), (3, 0))
+        self.assertEqual(FoodItem.objects.count(), 3)
+
+
+class FoodImportJobTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def queue(self, content):
+        upload = SimpleUploadedFile('foods.csv', content.encode('utf-8'), content_type='text/csv')
+        response = self.client.post('/api/foods/import-csv/', {'csv_file': upload, 'async': 'true'}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        return response.data['job']
+
+    @override_settings(FOOD_IMPORT_CHUNK_BYTES=64)
+    def test_upload_is_stored_in_chunks_for_the_worker(self):
+        content = CSV_HEADER + csv_rows(5).replace('Food', 'Bhindi Masālā')
+        job = self.queue(content)
+        self.assertEqual((job['status'], job['total_rows']), ('pending', 5))
+        chunks = list(FoodImportChunk.objects.filter(job_id=job['id']).values_list('data', flat=True))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b''.join(bytes(chunk) for chunk in chunks), content.encode('utf-8'))
+        # Queued only: the web process never runs imports itself
+        self.assertFalse(FoodItem.objects.exists())
+
+        finished = food_import_jobs.run_job(job['id'])
+        self.assertEqual((finished.status, finished.imported_count, finished.error_count), ('completed', 5, 0))
+        self.assertTrue(FoodItem.objects.filter(name='Bhindi Masālā 4').exists())
+        self.assertFalse(FoodImportChunk.objects.filter(job_id=job['id']).exists())
+
+        response = self.client.get(f"/api/foods/import-jobs/{job['id']}/")
+        self.assertEqual(response.data['progress_percent'], 100.0)
+
+    def test_reclaimed_job_resumes_after_its_last_chunk(self):
+        job = self.queue(CSV_HEADER + csv_rows(6))
+        # A worker died after committing the first three rows (CSV rows 2-4)
+        FoodImportJob.objects.filter(pk=job['id']).update(
+            status='running', last_committed_row=4, rows_processed=3, imported_count=3,
+            heartbeat_at=timezone.now() - datetime.timedelta(hours=1),
+        )
+        self.assertEqual(food_import_jobs.reclaim_stale_jobs(), 1)
+        finished = food_import_jobs.run_job(job['id'])
+        self.assertEqual((finished.status, finished.rows_processed, finished.imported_count), ('completed', 6, 6))
+        self.assertEqual(sorted(FoodItem.objects.values_list('name', flat=True)), ['Food 3', 'Food 4', 'Food 5'])
+
+    def test_lines_split_across_chunks_are_rejoined(self):
+        data = '\ufeffname\r\nDāl\r\n"Two\nlines"\r\nlast'.encode('utf-8')
+        chunks = [data[i:i + 3] for i in range(0, len(data), 3)]
+        self.assertEqual(list(iter_lines(chunks)), ['name\r\n', 'Dāl\r\n', '"Two\n', 'lines"\r\n', 'last'])
+
+
+class FoodStatsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.rice = make_food(cls.user, 'Basmati Rice', tags=['Vegan'], meal_types=['Lunch', 'Dinner'])
+        make_food(cls.user, 'Masala Chai', vata_effect='aggravates', meal_types=['Breakfast'])
+        make_food(cls.user, 'Ghee', kapha_effect='pacifies', tags=['Dairy'])
+
+    def setUp(self):
+        # Stats are cached per catalog version, and versions repeat between rolled-back tests
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def stats(self, **params):
+        response = self.client.get('/api/foods/stats/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_counts_every_group_in_one_query(self):
+        with self.assertNumQueries(1):
+            counts = food_stats_service.compute_counts()
+        self.assertEqual(counts['total'], 3)
+        self.assertEqual(counts['dosha:tridoshic'], 1)
+        self.assertEqual((counts['meal_types:Lunch'], counts['tags:Vegan']), (2, 1))
+
+    def test_counters_follow_writes(self):
+        self.rice.meal_types = ['Breakfast']
+        self.rice.save()
+        make_food(self.user, 'Oats', meal_types=['Breakfast'], tags=['Vegan'])
+        FoodCSVImporter(self.user, method='bulk').import_file(io.StringIO(CSV_HEADER + csv_rows(2)))
+        FoodItem.objects.get(name='Ghee').delete()
+
+        counters = self.stats(source='counters')
+        self.assertEqual(counters, {key: value for key, value in self.stats().items() if key != 'catalog_version'})
+        self.assertEqual(counters['total_foods'], 5)
+        self.assertEqual(counters['meal_stats']['Breakfast'], 3)
+        self.assertEqual(counters['tag_stats'], {'Vegan': 4})
+
+
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        make_food(cls.user, 'Basmati Rice')
+
+    def setUp(self):
+        # A version cached by an earlier test may match a rolled-back catalog
+        cache.delete(CATALOG_STATE_CACHE_KEY)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_unchanged_catalog_is_not_modified_and_counted(self):
+        before = get_metrics()['endpoints']['list']
+        with override_settings(FOOD_CACHE_METRICS_FLUSH_SECONDS=3600):
+            response = self.client.get('/api/foods/')
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get('/api/foods/', HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            # Counts wait in this process's batch until the next flush
+            self.assertEqual(cache.get('food_http_cache:list:requests'), before['requests'] or None)
+
+        metrics = get_metrics()
+        self.assertEqual(metrics['endpoints']['list']['requests'], before['requests'] + 2)
+        self.assertEqual(metrics['endpoints']['list']['not_modified'], before['not_modified'] + 1)
+        self.assertIsNotNone(metrics['since'])
+
+    def test_catalog_change_invalidates_the_etag(self):
+        etag = self.client.get('/api/foods/')['ETag']
+        # The cached catalog version is dropped when the write commits
+        with self.captureOnCommitCallbacks(execute=True):
+            make_food(self.user, 'Moong Dal')
+        response = self.client.get('/api/foods/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(FOOD_CATALOG_ENGINE_ENABLED=False)
+class FoodListQueryTests(TestCase):
+    """List pages cost a fixed number of queries whatever their size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Several creators, so a per-row creator lookup would show up as extra queries
+        creators = [make_user(f'doctor{i}') for i in range(3)]
+        for i in range(30):
+            make_food(
+                creators[i % 3], f'Food {i}', calories=100 + i, rasa=['Sweet', 'Sour'][:i % 3],
+                tags=['Vegan'] if i % 2 else [], vata_effect=['pacifies', 'aggravates', 'neutral'][i % 3],
+            )
+        cls.user = creators[0]
+
+    def test_projection_is_one_query_and_matches_the_serializer(self):
+        queryset = FoodItem.objects.order_by('-created_at', '-id')
+        for page_size in [1, 20, 30]:
+            with self.assertNumQueries(1):
+                results = represent(project(queryset)[:page_size])
+        expected = FoodItemSerializer(queryset.select_related('created_by'), many=True).data
+        self.assertEqual(results, [dict(item) for item in expected])
+
+    def test_endpoint_queries_do_not_grow_with_page_size(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        # Warm the cached catalog state read by the ETag check
+        client.get('/api/foods/')
+        for page_size in [1, 20, 30]:
+            # The total count and the page itself
+            with self.assertNumQueries(2):
+                response = client.get('/api/foods/', {'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), page_size)
+
+
+class SimilarFoodTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.rice = make_food(cls.user, 'Basmati Rice', calories=130, protein_g='2.7', carbs_g=28, fat_g='0.3')
+        cls.brown_rice = make_food(cls.user, 'Brown Rice', calories=125, protein_g='2.6', carbs_g=26, fat_g='0.9')
+        cls.paneer = make_food(
+            cls.user, 'Paneer', calories=265, protein_g='18.3', carbs_g='1.2', fat_g='20.8',
+            guna=['Heavy', 'Oily'], virya='Heating', kapha_effect='aggravates',
+        )
+        cls.chai = make_food(
+            cls.user, 'Masala Chai', calories=90, protein_g='3.1', carbs_g=12, fat_g='3.5',
+            rasa=['Pungent'], virya='Heating', pitta_effect='aggravates',
+        )
+
+    def setUp(self):
+        food_similarity.index = None
+        cache.delete(CATALOG_STATE_CACHE_KEY)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_nearest_foods_come_first(self):
+        neighbours = food_similarity.similar(self.rice.id, k=3)
+        self.assertEqual([food_id for food_id, _ in neighbours][0], str(self.brown_rice.id))
+        self.assertNotIn(str(self.rice.id), [food_id for food_id, _ in neighbours])
+        self.assertEqual(len(neighbours), 3)
+        self.assertEqual([score for _, score in neighbours], sorted((score for _, score in neighbours), reverse=True))
+
+    def test_index_follows_catalog_changes(self):
+        food_similarity.similar(self.rice.id)
+        # A new guna value grows the feature space, which rebuilds the index
+        with self.captureOnCommitCallbacks(execute=True):
+            ghee = make_food(self.user, 'Ghee', calories=900, fat_g=99, guna=['Unctuous'], virya='Cooling')
+            self.brown_rice.delete()
+        neighbours = [food_id for food_id, _ in food_similarity.similar(self.rice.id, k=10)]
+        self.assertIn(str(ghee.id), neighbours)
+        self.assertNotIn(str(self.brown_rice.id), neighbours)
+
+    def test_endpoint(self):
+        response = self.client.get(f'/api/foods/{self.rice.id}/similar/', {'k': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['name'], 'Brown Rice')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIn('similarity', response.data['results'][0])
+
+        self.assertEqual(self.client.get(f'/api/foods/{self.rice.id}/similar/', {'k': 0}).status_code, 400)
+        self.assertEqual(self.client.get(f'/api/foods/{uuid.uuid4()}/similar/').status_code, 404)
+
+
+class FoodSubstitutionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.poha = make_food(cls.user, 'Poha', calories=250, meal_types=['Breakfast'])
+        cls.upma = make_food(cls.user, 'Upma', calories=270, meal_types=['Breakfast'])
+        cls.idli = make_food(cls.user, 'Idli', calories=240, meal_types=['Breakfast'], vata_effect='aggravates')
+        cls.dal = make_food(cls.user, 'Moong Dal', calories=250, meal_types=['Lunch'])
+        cls.cake = make_food(cls.user, 'Carrot Cake', calories=500, meal_types=['Breakfast'])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def substitutes(self, **data):
+        response = self.client.post('/api/foods/substitutions/', {'vata_score': 10, **data}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data['results']]
+
+    def test_meal_types_come_from_the_source_food(self):
+        self.assertEqual(self.substitutes(food_id=str(self.poha.id)), ['Upma', 'Idli'])
+
+    def test_explicit_meal_type(self):
+        self.assertEqual(self.substitutes(food_id=str(self.poha.id), meal_type='lunch'), ['Moong Dal'])
+
+    def test_meal_without_meal_type_searches_every_meal(self):
+        names = self.substitutes(meal={'name': 'Poha', 'calories': 250})
+        self.assertEqual(sorted(names), ['Idli', 'Moong Dal', 'Upma'])
+
+    def test_restrictions_and_calorie_window(self):
+        self.assertEqual(self.substitutes(food_id=str(self.poha.id), calorie_tolerance=1), ['Upma', 'Carrot Cake', 'Idli'])
+        self.assertEqual(
+            self.substitutes(food_id=str(self.poha.id), exclude_food_ids=[str(self.upma.id)]), ['Idli']
+        )
+
+
+class FoodAutocompleteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.patient = UnifiedPatient.objects.create(user=make_user('patient', 'patient'), patient_id='P-1')
+        make_food(cls.user, 'Mango Lassi', food_category='Beverages')
+        make_food(cls.user, 'Mango Pickle', food_category='Condiments')
+
+    def make_chart(self, daily_meals):
+        return DietChart.objects.create(
+            patient=self.patient, created_by=self.user, chart_name='Chart', daily_meals=daily_meals,
+            start_date=datetime.date(2026, 1, 1), end_date=datetime.date(2026, 1, 1),
+        )
+
+    def names(self):
+        return [food['name'] for food in FoodAutocompleteService().complete('mango')]
+
+    def test_shorter_names_first_without_usage(self):
+        self.assertEqual(self.names(), ['Mango Lassi', 'Mango Pickle'])
+
+    def test_json_chart_meal_names_rank_foods(self):
+        self.make_chart({'day1': {'lunch': {'name': 'Rice with Mango Pickle', 'calories': 400}}})
+        self.assertEqual(self.names(), ['Mango Pickle', 'Mango Lassi'])
+
+    def test_usage_refresh_rebuilds_in_the_background(self):
+        service = FoodAutocompleteService()
+        stale = service.get_index()
+        self.make_chart({'day1': {'lunch': {'name': 'Mango Pickle', 'calories': 100}}})
+        service.usage_loaded_at = float('-inf')
+
+        # The stale index keeps serving while one rebuild runs
+        with mock.patch.object(service, '_rebuild') as rebuild:
+            self.assertIs(service.get_index(), stale)
+            service._rebuild_thread.join()
+            service.usage_loaded_at = float('-inf')
+            service._rebuild_thread = mock.Mock(is_alive=mock.Mock(return_value=True))
+            self.assertIs(service.get_index(), stale)
+        self.assertEqual(rebuild.call_count, 1)
+
+        # The rebuild thread closes its own connection, which this test still needs
+        with mock.patch('food_database.autocomplete.connection'):
+            service._rebuild()
+        self.assertIsNot(service.get_index(), stale)
+        self.assertEqual([food['name'] for food in service.complete('mango')], ['Mango Pickle', 'Mango Lassi'])
+
+    @override_settings(DIET_CHART_STORAGE='normalized')
+    def test_normalized_chart_items_rank_foods(self):
+        chart = self.make_chart({'day1': {'lunch': {
+            'name': 'Lunch', 'calories': 400, 'items': [{'name': 'Rice'}, {'name': 'Mango Pickle'}],
+        }}})
+        self.assertEqual(chart.storage, 'normalized')
+        self.assertEqual(self.names(), ['Mango Pickle', 'Mango Lassi'])
+
+
+class FoodServingWeightTests(TestCase):
+
+    def test_parse_serving_grams(self):
+        self.assertEqual(parse_serving_grams('1 cup (200g)'), Decimal('200.00'))
+        self.assertEqual(parse_serving_grams('0.5 kg'), Decimal('500.00'))
+        self.assertEqual(parse_serving_grams('1 glass (250 ml)'), Decimal('250.00'))
+        self.assertIsNone(parse_serving_grams('1 piece'))
+        self.assertIsNone(parse_serving_grams('0 g'))
+
+    def test_serving_grams_follow_serving_size(self):
+        food = make_food(make_user(), 'Khichdi', serving_size='1 bowl (150 g)')
+        self.assertEqual(food.serving_grams, Decimal('150.00'))
+        food.serving_size = '1 bowl'
+        food.save()
+        food.refresh_from_db()
+        self.assertIsNone(food.serving_grams)
+
+    def test_zero_bounds_are_applied(self):
+        user = make_user()
+        make_food(user, 'Water', calories=0)
+        make_food(user, 'Poha', calories=250)
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/foods/', {'max_calories': 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([food['name'] for food in response.data['results']], ['Water'])
+
+
+class FoodChangeFeedTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+        cls.rice = make_food(cls.user, 'Basmati Rice')
+        cls.dal = make_food(cls.user, 'Moong Dal')
+
+    def setUp(self):
+        cache.delete(CATALOG_STATE_CACHE_KEY)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def version(self):
+        return FoodCatalogState.objects.get(pk=1).version
+
+    def names(self, delta):
+        name = delta['fields'].index('name')
+        return sorted(row[name] for row in delta['upserts'])
+
+    def test_first_sync_is_a_reset(self):
+        response = self.client.get('/api/foods/changes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['reset'])
+        self.assertEqual(response.data['version'], self.version())
+        self.assertEqual(self.names(response.data), ['Basmati Rice', 'Moong Dal'])
+
+    def test_delta_has_upserts_and_tombstones(self):
+        since = self.version()
+        self.rice.calories = 180
+        self.rice.save()
+        dal_id = self.dal.id
+        self.dal.delete()
+        make_food(self.user, 'Masala Chai')
+
+        delta = food_changes.changes(since)
+        self.assertFalse(delta['reset'])
+        self.assertEqual(delta['version'], self.version())
+        self.assertEqual(self.names(delta), ['Basmati Rice', 'Masala Chai'])
+        self.assertEqual(delta['deletes'], [str(dal_id)])
+        self.assertEqual(food_changes.changes(delta['version'])['upserts'], [])
+
+    def test_pages_end_on_version_boundaries(self):
+        since = self.version()
+        for name in ['Poha', 'Upma', 'Idli']:
+            make_food(self.user, name)
+
+        first = food_changes.changes(since, limit=2)
+        self.assertTrue(first['has_more'])
+        self.assertEqual((first['version'], self.names(first)), (since + 1, ['Poha']))
+        second = food_changes.changes(first['version'], limit=2)
+        self.assertFalse(second['has_more'])
+        self.assertEqual((second['version'], self.names(second)), (since + 3, ['Idli', 'Upma']))
+
+    def test_clients_behind_the_pruned_horizon_get_a_reset(self):
+        since = self.version()
+        make_food(self.user, 'Poha')
+        FoodChange.objects.update(changed_at=timezone.now() - datetime.timedelta(days=40))
+        self.assertEqual(food_changes.prune(), 3)
+
+        delta = food_changes.changes(since)
+        self.assertTrue(delta['reset'])
+        self.assertEqual(self.names(delta), ['Basmati Rice', 'Moong Dal', 'Poha'])
+        self.assertFalse(food_changes.changes(self.version())['reset'])
+
+    def test_since_is_validated(self):
+        self.assertEqual(self.client.get('/api/foods/changes/', {'since': -1}).status_code, 400)
+        self.assertEqual(self.client.get('/api/foods/changes/', {'limit': 0}).status_code, 400)
+
+
+class FoodUpsertImportTests(TestCase):
+    """Imports keyed on the unique fingerprint (name, serving size and category)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user()
+
+    def import_csv(self, rows, mode='upsert'):
+        return FoodCSVImporter(created_by=self.user, mode=mode).import_file(io.StringIO(CSV_HEADER + rows))
+
+    def test_matching_rows_update_or_skip(self):
+        self.import_csv(csv_rows(3))
+        changed = csv_rows(1).replace('Food 0,100g,100', ' food  0,100G,150')
+        result = self.import_csv(changed + csv_rows(2, start=1))
+        self.assertEqual((result.imported_count, result.updated_count, result.unchanged_count), (0, 1, 2))
+        self.assertEqual(FoodItem.objects.count(), 3)
+        self.assertEqual(FoodItem.objects.get(name='food  0').calories, 150)
+
+    def test_food_inserted_after_the_lookup_is_updated(self):
+        make_food(self.user, 'Food 0', serving_size='100g', calories=1)
+        # Another import created the food after this chunk's lookup found nothing
+        with mock.patch.object(FoodCSVImporter, '_classify', lambda self, rows: ([food for _, food in rows], [], 0)):
+            self.import_csv(csv_rows(1))
+        self.assertEqual(list(FoodItem.objects.values_list('name', 'calories')), [('Food 0', 100)])
+
+    def test_insert_mode_rejects_existing_foods(self):
+        self.import_csv(csv_rows(1))
+        result = self.import_csv(csv_rows(2) + csv_rows(1, start=1), mode='insert')
+        self.assertEqual(result.imported_count, 1)
+        self.assertEqual(result.errors, [{'row': 2, 'errors': DUPLICATE_FOOD_ERROR}, {'row': 4, 'errors': DUPLICATE_FOOD_ERROR}])
+        self.assertEqual(FoodItem.objects.count(), 2)
+
+    def test_api_rejects_a_second_copy(self):
+        make_food(self.user, 'Basmati Rice')
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/foods/create/', {
+            'name': 'basmati  rice', 'serving_size': '1 cup (200g)', 'calories': 210, 'protein_g': 4,
+            'carbs_g': 45, 'fat_g': 1, 'fiber_g': 1, 'virya': 'Cooling', 'vata_effect': 'pacifies',
+            'pitta_effect': 'pacifies', 'kapha_effect': 'neutral', 'food_category': 'Grains',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': DUPLICATE_FOOD_ERROR})
+        self.assertEqual(FoodItem.objects.count(), 1)
+
+    def test_released_duplicates_stay_editable(self):
+        original = make_food(self.user, 'Basmati Rice')
+        copy = make_food(self.user, 'Basmati Rice (copy)')
+        # A newer copy of a food duplicated before the constraint, as migration 0010 leaves it
+        FoodItem.objects.filter(pk=copy.pk).update(name='Basmati Rice', fingerprint=None)
+        copy.refresh_from_db()
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.patch(f'/api/foods/{copy.id}/update/', {'calories': 210}, format='json')
+        self.assertEqual(response.status_code, 200)
+        copy.refresh_from_db()
+        self.assertEqual(copy.calories, 210)
+        self.assertIsNone(copy.fingerprint)
+
+        # Upserts go on updating the copy that kept the fingerprint
+        self.import_csv('Basmati Rice,1 cup (200g),230,5,30,5,2,Sweet,Light,Cooling,pacifies,pacifies,neutral,Lunch,Grains,\n')
+        original.refresh_from_db()
+        self.assertEqual(original.calories, 230)
@@ -5,14 +5,21 @@ urlpatterns = [
     # Food items CRUD
     path('', views.food_items_list, name='food_items_list'),
     path('<uuid:food_id>/', views.food_item_detail, name='food_item_detail'),
+    path('<uuid:food_id>/similar/', views.similar_food_items, name='similar_food_items'),
     path('create/', views.create_food_item, name='create_food_item'),
     path('<uuid:food_id>/update/', views.update_food_item, name='update_food_item'),
     path('<uuid:food_id>/delete/', views.delete_food_item, name='delete_food_item'),
     
     # Import and utilities
     path('import-csv/', views.import_csv_foods, name='import_csv_foods'),
+    path('import-jobs/<uuid:job_id>/', views.food_import_job_detail, name='food_import_job_detail'),
     path('categories/', views.food_categories, name='food_categories'),
     path('stats/', views.food_stats, name='food_stats'),
+    path('changes/', views.food_changes_view, name='food_changes'),
+    path('facets/', views.food_facets_view, name='food_facets'),
+    path('autocomplete/', views.food_autocomplete_view, name='food_autocomplete'),
+    path('substitutions/', views.food_substitutions_view, name='food_substitutions'),
+    path('cache-metrics/', views.food_cache_metrics, name='food_cache_metrics'),
 ]
 
 
@@ -1,18 +1,35 @@
-import csv
-import io
-from django.db.models import Q
+import codecs
 from rest_framework import status, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
 from django.http import JsonResponse
-from .models import FoodItem
-from .serializers import FoodItemSerializer, FoodItemCreateSerializer, FoodItemFilterSerializer
-from authentication.models import User
+from .models import FoodItem, FoodImportJob
+from .serializers import (
+    FoodItemSerializer, FoodItemCreateSerializer, FoodItemFilterSerializer, FoodImportJobSerializer,
+    FoodSubstitutionRequestSerializer
+)
+from .filters import apply_food_filters
+from .catalog_engine import catalog_engine
+from .search import food_search
+from .pagination import FoodCursorPaginator, InvalidCursor, estimate_count
+from .importer import FoodCSVImporter, IMPORT_MODES, DUPLICATE_FOOD_ERROR
+from .import_jobs import food_import_jobs
+from .stats import food_stats_service
+from .facets import food_facets
+from .conditional import catalog_conditional, get_metrics
+from .projection import project, represent, represent_ids
+from .similarity import food_similarity
+from .substitution import food_substitutions
+from .changes import food_changes, MAX_CHANGES
+from .autocomplete import food_autocomplete, MAX_RESULTS as MAX_AUTOCOMPLETE_RESULTS
+from authentication.models import User, UnifiedPatient
 
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@catalog_conditional('list')
 def food_items_list(request):
     """List all food items with filtering and pagination"""
     try:
@@ -21,75 +38,39 @@ def food_items_list(request):
         if not filters.is_valid():
             return Response(filters.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        # Start with all food items
-        queryset = FoodItem.objects.all()
-        
-        # Apply filters
         filter_data = filters.validated_data
         
-        # Dosha effects
-        if filter_data.get('vata_effect'):
-            queryset = queryset.filter(vata_effect=filter_data['vata_effect'])
-        if filter_data.get('pitta_effect'):
-            queryset = queryset.filter(pitta_effect=filter_data['pitta_effect'])
-        if filter_data.get('kapha_effect'):
-            queryset = queryset.filter(kapha_effect=filter_data['kapha_effect'])
-        
-        # Meal types
-        if filter_data.get('meal_types'):
-            queryset = queryset.filter(meal_types__overlap=filter_data['meal_types'])
-        
-        # Food category
-        if filter_data.get('food_category'):
-            queryset = queryset.filter(food_category__icontains=filter_data['food_category'])
-        
-        # Tags
-        if filter_data.get('tags'):
-            queryset = queryset.filter(tags__overlap=filter_data['tags'])
-        
-        # Rasa
-        if filter_data.get('rasa'):
-            queryset = queryset.filter(rasa__overlap=filter_data['rasa'])
-        
-        # Guna
-        if filter_data.get('guna'):
-            queryset = queryset.filter(guna__overlap=filter_data['guna'])
-        
-        # Virya
-        if filter_data.get('virya'):
-            queryset = queryset.filter(virya=filter_data['virya'])
-        
-        # Search
-        if filter_data.get('search'):
-            search_term = filter_data['search']
-            queryset = queryset.filter(
-                Q(name__icontains=search_term) |
-                Q(food_category__icontains=search_term) |
-                Q(tags__icontains=search_term)
-            )
-        
-        # Nutritional filters
-        if filter_data.get('min_calories'):
-            queryset = queryset.filter(calories__gte=filter_data['min_calories'])
-        if filter_data.get('max_calories'):
-            queryset = queryset.filter(calories__lte=filter_data['max_calories'])
-        if filter_data.get('min_protein'):
-            queryset = queryset.filter(protein_g__gte=filter_data['min_protein'])
-        if filter_data.get('max_protein'):
-            queryset = queryset.filter(protein_g__lte=filter_data['max_protein'])
+        # Opt-in keyset pagination
+        if request.GET.get('pagination') == 'cursor' or 'cursor' in request.GET:
+            return food_items_cursor_page(request, filter_data)
         
         # Pagination
         page = request.GET.get('page', 1)
         page_size = request.GET.get('page_size', 20)
         
-        paginator = Paginator(queryset, page_size)
-        page_obj = paginator.get_page(page)
+        queryset = apply_food_filters(FoodItem.objects.all(), filter_data)
         
-        # Serialize the results
-        serializer = FoodItemSerializer(page_obj, many=True)
+        if filter_data.get('search'):
+            # Relevance-ranked search
+            food_ids = food_search.search(queryset, filter_data['search'])
+            if not isinstance(food_ids, list):
+                queryset, food_ids = food_ids, None
+        else:
+            # Answer from the columnar snapshot when the engine is enabled
+            food_ids = catalog_engine.filter_ids(filter_data)
+        
+        # Each page is fetched with one values() query and represented without DRF fields
+        if food_ids is not None:
+            paginator = Paginator(food_ids, page_size)
+            page_obj = paginator.get_page(page)
+            results = represent_ids(page_obj.object_list, food_ids)
+        else:
+            paginator = Paginator(project(queryset), page_size)
+            page_obj = paginator.get_page(page)
+            results = represent(page_obj)
         
         return Response({
-            'results': serializer.data,
+            'results': results,
             'count': paginator.count,
             'total_pages': paginator.num_pages,
             'current_page': page_obj.number,
@@ -106,12 +87,61 @@ def food_items_list(request):
         )
 
 
+def food_items_cursor_page(request, filter_data):
+    """Keyset-paginated food list, keeping the page-number response shape"""
+    if filter_data.get('search'):
+        return Response(
+            {'error': 'Cursor pagination is not available for search results'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        page_size = int(request.GET.get('page_size', 20))
+        if page_size < 1:
+            raise ValueError
+    except ValueError:
+        return Response(
+            {'error': 'page_size must be a positive integer'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    queryset = apply_food_filters(FoodItem.objects.all(), filter_data)
+    
+    try:
+        paginator = FoodCursorPaginator(
+            project(queryset), page_size, request.GET.get('ordering'), request.GET.get('cursor')
+        )
+        items, next_token, previous_token = paginator.page()
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Counts are opt-in and come from planner estimates
+    count = None
+    if request.GET.get('include_count', '').lower() == 'true':
+        count = estimate_count(queryset)
+    
+    return Response({
+        'results': represent(items),
+        'count': count,
+        'count_is_estimate': count is not None,
+        'total_pages': None,
+        'current_page': None,
+        'next': next_token is not None,
+        'previous': previous_token is not None,
+        'next_page': next_token,
+        'previous_page': previous_token,
+        'pagination': 'cursor',
+        'ordering': paginator.ordering
+    })
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@catalog_conditional('detail')
 def food_item_detail(request, food_id):
     """Get details of a specific food item"""
     try:
-        food_item = FoodItem.objects.get(id=food_id)
+        food_item = FoodItem.objects.select_related('created_by').get(id=food_id)
         serializer = FoodItemSerializer(food_item)
         return Response(serializer.data)
     except FoodItem.DoesNotExist:
@@ -126,6 +156,166 @@ def food_item_detail(request, food_id):
         )
 
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+@catalog_conditional('similar')
+def similar_food_items(request, food_id):
+    """Get the foods most similar to a food by nutrients, rasa, guna, virya and dosha effects"""
+    try:
+        if not food_similarity.is_available:
+            return Response(
+                {'error': 'Similarity search is not available'}, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        
+        try:
+            k = int(request.GET.get('k', 10))
+            if not 1 <= k <= 50:
+                raise ValueError
+        except ValueError:
+            return Response(
+                {'error': 'k must be an integer between 1 and 50'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        neighbours = food_similarity.similar(food_id, k)
+        if neighbours is None:
+            return Response(
+                {'error': 'Food item not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        scores = dict(neighbours)
+        results = represent_ids([neighbour_id for neighbour_id, _ in neighbours])
+        for item in results:
+            item['similarity'] = scores[item['id']]
+        
+        return Response({
+            'food_id': str(food_id),
+            'k': k,
+            'results': results
+        })
+        
+    except Exception as e:
+        return Response(
+            {'error': f'Error finding similar foods: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def food_autocomplete_view(request):
+    """Complete a food name prefix for the food picker, most used foods first"""
+    try:
+        query = request.GET.get('q', '')
+        try:
+            limit = int(request.GET.get('limit', 10))
+            if not 1 <= limit <= MAX_AUTOCOMPLETE_RESULTS:
+                raise ValueError
+        except ValueError:
+            return Response(
+                {'error': f'limit must be an integer between 1 and {MAX_AUTOCOMPLETE_RESULTS}'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            'query': query,
+            'results': food_autocomplete.complete(query, limit)
+        })
+        
+    except Exception as e:
+        return Response(
+            {'error': f'Error completing food names: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def food_substitutions_view(request):
+    """Rank dosha-compatible substitutes for a food or diet chart meal"""
+    try:
+        if not food_substitutions.is_available:
+            return Response(
+                {'error': 'Food substitutions are not available'}, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        
+        serializer = FoodSubstitutionRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        
+        # The food being replaced: a catalog item, or a chart meal matched to the catalog by name
+        exclude_ids = [str(food_id) for food_id in data.get('exclude_food_ids', [])]
+        meal_type = data.get('meal_type')
+        meal_types = [meal_type] if meal_type else []
+        if data.get('food_id'):
+            try:
+                food = FoodItem.objects.only('id', 'name', 'calories', 'meal_types').get(id=data['food_id'])
+            except FoodItem.DoesNotExist:
+                return Response(
+                    {'error': 'Food item not found'}, 
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            original = {'food_id': str(food.id), 'name': food.name, 'calories': food.calories}
+            exclude_ids.append(str(food.id))
+            # Without a meal_type, substitutes are served at a meal the food itself is served at
+            if not meal_types:
+                meal_types = [value for value in food.meal_types or [] if isinstance(value, str)]
+        else:
+            meal = data['meal']
+            original = {'name': meal.get('name', ''), 'calories': meal['calories']}
+            if original['name']:
+                exclude_ids += [
+                    str(food_id) for food_id in
+                    FoodItem.objects.filter(name__iexact=original['name']).values_list('id', flat=True)
+                ]
+        
+        if data.get('patient_id'):
+            if not UnifiedPatient.objects.filter(id=data['patient_id']).exists():
+                return Response(
+                    {'error': 'Patient not found'}, 
+                    status=status.HTTP_404_NOT_FOUND
+                )
+        bucket, prakriti_source = food_substitutions.prakriti_bucket(data.get('patient_id'), data)
+        
+        matches = food_substitutions.substitutes(
+            original['calories'],
+            bucket,
+            meal_types=meal_types,
+            restrictions=data,
+            exclude_ids=exclude_ids,
+            calorie_tolerance=data['calorie_tolerance'],
+            limit=data['limit'],
+        )
+        
+        details = {match['id']: match for match in matches}
+        results = represent_ids([match['id'] for match in matches])
+        for item in results:
+            match = details[item['id']]
+            item['compatibility'] = match['compatibility']
+            item['calorie_difference'] = match['calorie_difference']
+            item['substitution_score'] = match['score']
+        
+        return Response({
+            'original': original,
+            'dosha_bucket': bucket,
+            'prakriti_source': prakriti_source,
+            'meal_type': meal_type,
+            'meal_types': meal_types,
+            'calorie_tolerance': data['calorie_tolerance'],
+            'results': results
+        })
+        
+    except Exception as e:
+        return Response(
+            {'error': f'Error finding food substitutions: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def create_food_item(request):
@@ -140,8 +330,12 @@ def create_food_item(request):
         
         serializer = FoodItemCreateSerializer(data=request.data)
         if serializer.is_valid():
-            # Set the creator
-            food_item = serializer.save(created_by=request.user)
+            # Set the creator; the unique fingerprint rejects a second copy of a food
+            try:
+                with transaction.atomic():
+                    food_item = serializer.save(created_by=request.user)
+            except IntegrityError:
+                return Response({'error': DUPLICATE_FOOD_ERROR}, status=status.HTTP_400_BAD_REQUEST)
             response_serializer = FoodItemSerializer(food_item)
             return Response(response_serializer.data, status=status.HTTP_201_CREATED)
         else:
@@ -181,7 +375,11 @@ def update_food_item(request, food_id):
         )
         
         if serializer.is_valid():
-            serializer.save()
+            try:
+                with transaction.atomic():
+                    serializer.save()
+            except IntegrityError:
+                return Response({'error': DUPLICATE_FOOD_ERROR}, status=status.HTTP_400_BAD_REQUEST)
             response_serializer = FoodItemSerializer(food_item)
             return Response(response_serializer.data)
         else:
@@ -243,51 +441,37 @@ def import_csv_foods(request):
         
         csv_file = request.FILES['csv_file']
         
-        # Read CSV content
-        csv_content = csv_file.read().decode('utf-8')
-        csv_reader = csv.DictReader(io.StringIO(csv_content))
+        # upsert (default) updates foods already in the catalog; insert always adds rows
+        mode = request.data.get('mode', request.GET.get('mode')) or None
+        if mode is not None and mode not in IMPORT_MODES:
+            return Response(
+                {'error': f"Invalid import mode: {mode}. Must be one of {', '.join(IMPORT_MODES)}"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        imported_count = 0
-        errors = []
+        # Background import: store the upload in chunks for the import worker and return a job to poll
+        if str(request.data.get('async', request.GET.get('async', ''))).lower() in ('true', '1'):
+            job = food_import_jobs.create_job(csv_file, request.user, mode=mode)
+            return Response({
+                'message': 'Food import queued',
+                'job': FoodImportJobSerializer(job).data,
+            }, status=status.HTTP_202_ACCEPTED)
         
-        for row_num, row in enumerate(csv_reader, start=2):  # Start from 2 because of header
-            try:
-                # Parse the data
-                food_data = {
-                    'name': row['name'],
-                    'serving_size': row['serving_size'],
-                    'calories': int(float(row['calories'])),
-                    'protein_g': float(row['protein_g']),
-                    'carbs_g': float(row['carbs_g']),
-                    'fat_g': float(row['fat_g']),
-                    'fiber_g': float(row['fiber_g']),
-                    'rasa': [r.strip() for r in row['rasa'].split(';') if r.strip()],
-                    'guna': [g.strip() for g in row['guna'].split(';') if g.strip()],
-                    'virya': row['virya'].strip(),
-                    'vata_effect': row['vata_effect'].strip(),
-                    'pitta_effect': row['pitta_effect'].strip(),
-                    'kapha_effect': row['kapha_effect'].strip(),
-                    'meal_types': [m.strip() for m in row['meal_type'].split(';') if m.strip()],
-                    'food_category': row['food_category'].strip(),
-                    'tags': [t.strip() for t in row['tags'].split(';') if t.strip()],
-                }
-                
-                # Create the food item
-                serializer = FoodItemCreateSerializer(data=food_data)
-                if serializer.is_valid():
-                    serializer.save(created_by=request.user)
-                    imported_count += 1
-                else:
-                    errors.append(f"Row {row_num}: {serializer.errors}")
-                    
-            except Exception as e:
-                errors.append(f"Row {row_num}: {str(e)}")
+        # Stream the upload through the bulk importer instead of reading it into memory
+        importer = FoodCSVImporter(created_by=request.user, mode=mode)
+        result = importer.import_file(codecs.iterdecode(csv_file, 'utf-8-sig'))
         
         return Response({
-            'message': f'Successfully imported {imported_count} food items',
-            'imported_count': imported_count,
-            'errors': errors[:10],  # Limit errors to first 10
-            'total_errors': len(errors)
+            'message': (
+                f'Successfully imported {result.imported_count} food items '
+                f'({result.updated_count} updated, {result.unchanged_count} unchanged)'
+            ),
+            'imported_count': result.imported_count,
+            'updated_count': result.updated_count,
+            'unchanged_count': result.unchanged_count,
+            'errors': result.error_messages(10),  # Limit errors to first 10
+            'total_errors': result.total_errors,
+            'row_errors': result.errors,
         })
         
     except Exception as e:
@@ -299,6 +483,27 @@ def import_csv_foods(request):
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+def food_import_job_detail(request, job_id):
+    """Get progress and results of a background food import"""
+    try:
+        job = FoodImportJob.objects.get(id=job_id, created_by=request.user)
+        serializer = FoodImportJobSerializer(job)
+        return Response(serializer.data)
+    except FoodImportJob.DoesNotExist:
+        return Response(
+            {'error': 'Import job not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    except Exception as e:
+        return Response(
+            {'error': f'Error fetching import job: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+@catalog_conditional('categories')
 def food_categories(request):
     """Get all unique food categories"""
     try:
@@ -313,38 +518,70 @@ def food_categories(request):
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
-def food_stats(request):
-    """Get food database statistics"""
+@catalog_conditional('facets')
+def food_facets_view(request):
+    """Get per-value counts for every filter dimension under the current filters"""
     try:
-        total_foods = FoodItem.objects.count()
+        filters = FoodItemFilterSerializer(data=request.GET)
+        if not filters.is_valid():
+            return Response(filters.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        # Dosha statistics
-        vata_pacifying = FoodItem.objects.filter(vata_effect='pacifies').count()
-        pitta_pacifying = FoodItem.objects.filter(pitta_effect='pacifies').count()
-        kapha_pacifying = FoodItem.objects.filter(kapha_effect='pacifies').count()
+        return Response(food_facets.get_facets(filters.validated_data))
         
-        # Tridoshic foods
-        tridoshic = FoodItem.objects.filter(
-            vata_effect='pacifies',
-            pitta_effect='pacifies',
-            kapha_effect='pacifies'
-        ).count()
+    except Exception as e:
+        return Response(
+            {'error': f'Error fetching facets: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+@catalog_conditional('changes')
+def food_changes_view(request):
+    """Get catalog changes since a version: compact upserted rows plus tombstones for deletes"""
+    try:
+        try:
+            since = request.GET.get('since')
+            since = int(since) if since not in (None, '') else None
+            if since is not None and since < 0:
+                raise ValueError
+        except ValueError:
+            return Response(
+                {'error': 'since must be a non-negative catalog version'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Meal type statistics
-        meal_stats = {}
-        for meal_type in ['Breakfast', 'Brunch', 'Lunch', 'Snacks', 'Dinner']:
-            meal_stats[meal_type] = FoodItem.objects.filter(meal_types__contains=[meal_type]).count()
+        try:
+            limit = int(request.GET.get('limit', 1000))
+            if not 1 <= limit <= MAX_CHANGES:
+                raise ValueError
+        except ValueError:
+            return Response(
+                {'error': f'limit must be an integer between 1 and {MAX_CHANGES}'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        return Response({
-            'total_foods': total_foods,
-            'dosha_stats': {
-                'vata_pacifying': vata_pacifying,
-                'pitta_pacifying': pitta_pacifying,
-                'kapha_pacifying': kapha_pacifying,
-                'tridoshic': tridoshic
-            },
-            'meal_stats': meal_stats
-        })
+        return Response(food_changes.changes(since, limit))
+        
+    except Exception as e:
+        return Response(
+            {'error': f'Error fetching food changes: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+@catalog_conditional('stats')
+def food_stats(request):
+    """Get food database statistics"""
+    try:
+        # Counters are maintained on every write; the default is one cached aggregation per catalog version
+        if request.GET.get('source') == 'counters':
+            return Response(food_stats_service.get_counter_stats())
+        
+        return Response(food_stats_service.get_stats())
         
     except Exception as e:
         return Response(
@@ -353,3 +590,14 @@ def food_stats(request):
         )
 
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def food_cache_metrics(request):
+    """Get conditional GET (ETag / 304) hit ratios for the food endpoints"""
+    try:
+        return Response(get_metrics())
+    except Exception as e:
+        return Response(
+            {'error': f'Error fetching cache metrics: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
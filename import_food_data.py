@@ -5,18 +5,17 @@ Script to import food data from CSV into the Django database
 
 import os
 import sys
+import argparse
 import django
-import csv
-from decimal import Decimal
 
 # Setup Django environment
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'aahaara_backend.settings')
 django.setup()
 
-from food_database.models import FoodItem
+from food_database.importer import FoodCSVImporter
 from authentication.models import User
 
-def import_food_data(csv_file_path):
+def import_food_data(csv_file_path, batch_size=None, method=None, mode=None):
     """Import food data from CSV file"""
     
     # Get or create a system user for imports
@@ -32,47 +31,22 @@ def import_food_data(csv_file_path):
         }
     )
     
-    imported_count = 0
-    errors = []
+    def report_progress(result, last_row):
+        print(
+            f"Imported {result.imported_count}, updated {result.updated_count}, "
+            f"unchanged {result.unchanged_count} food items (through row {last_row})..."
+        )
     
     try:
-        with open(csv_file_path, 'r', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            
-            for row_num, row in enumerate(reader, start=2):  # Start from 2 because of header
-                try:
-                    # Parse the data
-                    food_data = {
-                        'name': row['name'].strip(),
-                        'serving_size': row['serving_size'].strip(),
-                        'calories': int(float(row['calories'])),
-                        'protein_g': Decimal(str(row['protein_g'])),
-                        'carbs_g': Decimal(str(row['carbs_g'])),
-                        'fat_g': Decimal(str(row['fat_g'])),
-                        'fiber_g': Decimal(str(row['fiber_g'])),
-                        'rasa': [r.strip() for r in row['rasa'].split(';') if r.strip()],
-                        'guna': [g.strip() for g in row['guna'].split(';') if g.strip()],
-                        'virya': row['virya'].strip(),
-                        'vata_effect': row['vata_effect'].strip(),
-                        'pitta_effect': row['pitta_effect'].strip(),
-                        'kapha_effect': row['kapha_effect'].strip(),
-                        'meal_types': [m.strip() for m in row['meal_type'].split(';') if m.strip()],
-                        'food_category': row['food_category'].strip(),
-                        'tags': [t.strip() for t in row['tags'].split(';') if t.strip()],
-                        'created_by': system_user
-                    }
-                    
-                    # Create the food item
-                    food_item = FoodItem.objects.create(**food_data)
-                    imported_count += 1
-                    
-                    if imported_count % 50 == 0:
-                        print(f"Imported {imported_count} food items...")
-                        
-                except Exception as e:
-                    error_msg = f"Row {row_num}: {str(e)}"
-                    errors.append(error_msg)
-                    print(f"Error in row {row_num}: {str(e)}")
+        importer = FoodCSVImporter(
+            created_by=system_user,
+            batch_size=batch_size,
+            method=method,
+            mode=mode,
+            on_chunk=report_progress
+        )
+        with open(csv_file_path, 'r', encoding='utf-8-sig', newline='') as csvfile:
+            result = importer.import_file(csvfile)
     
     except FileNotFoundError:
         print(f"Error: CSV file '{csv_file_path}' not found.")
@@ -81,23 +55,32 @@ def import_food_data(csv_file_path):
         print(f"Error reading CSV file: {str(e)}")
         return
     
-    print(f"\nImport completed!")
-    print(f"Successfully imported: {imported_count} food items")
-    print(f"Errors: {len(errors)}")
+    print(f"\nImport completed in {result.elapsed_seconds:.1f}s!")
+    print(f"Successfully imported: {result.imported_count} food items")
+    print(f"Updated: {result.updated_count}, unchanged: {result.unchanged_count}")
+    print(f"Errors: {result.total_errors}")
     
-    if errors:
+    if result.errors:
         print("\nFirst 10 errors:")
-        for error in errors[:10]:
+        for error in result.error_messages(10):
             print(f"  - {error}")
 
 def main():
     """Main function"""
-    if len(sys.argv) != 2:
-        print("Usage: python import_food_data.py <csv_file_path>")
-        print("Example: python import_food_data.py 'Indian_Foods_500 (1).csv'")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description='Import food data from CSV into the Django database',
+        epilog="Example: python import_food_data.py 'Indian_Foods_500 (1).csv'"
+    )
+    parser.add_argument('csv_file_path', help='Path to the CSV file')
+    parser.add_argument('--batch-size', type=int, help='Rows validated and written per transaction')
+    parser.add_argument('--method', choices=['auto', 'copy', 'bulk'], help='Write with Postgres COPY or bulk_create')
+    parser.add_argument(
+        '--mode', choices=['upsert', 'insert'],
+        help='upsert updates foods already imported (matched on name, serving size and category); insert always adds'
+    )
+    args = parser.parse_args()
     
-    csv_file_path = sys.argv[1]
+    csv_file_path = args.csv_file_path
     
     if not os.path.exists(csv_file_path):
         print(f"Error: File '{csv_file_path}' does not exist.")
@@ -106,9 +89,7 @@ def main():
     print(f"Starting import from: {csv_file_path}")
     print("This may take a few minutes...")
     
-    import_food_data(csv_file_path)
+    import_food_data(csv_file_path, batch_size=args.batch_size, method=args.method, mode=args.mode)
 
 if __name__ == '__main__':
     main()
-
-
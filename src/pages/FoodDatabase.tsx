@@ -47,6 +47,7 @@ interface FoodItem {
   carbs_g: number;
   fat_g: number;
   fiber_g: number;
+  serving_grams?: number | null;
   rasa: string[];
   guna: string[];
   virya: string;
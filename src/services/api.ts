@@ -431,6 +431,9 @@ class ApiClient {
     chart_name: string;
     chart_type?: string;
     duration_days?: number;
+    food_restrictions?: string[];
+    dosha_focus?: string[];
+    async?: boolean;
   }) {
     return this.request("/diet-charts/generate/", {
       method: "POST",
@@ -438,6 +441,128 @@ class ApiClient {
     });
   }
 
+  async getDietChartJob(jobId: string) {
+    return this.request(`/diet-charts/jobs/${jobId}/`);
+  }
+
+  /**
+   * Stream a background diet chart generation. onEvent receives "status", "day"
+   * (one per generated day), then "completed" or "failed". Uses fetch rather than
+   * EventSource so the auth header is sent. The server ends each stream with
+   * "timeout" after a few seconds; the stream is then resumed after the last day.
+   */
+  async streamDietChartJob(
+    jobId: string,
+    onEvent: (event: string, data: any) => void,
+    signal?: AbortSignal
+  ) {
+    const headers: HeadersInit = { Accept: "text/event-stream" };
+    if (this.token) {
+      headers["Authorization"] = `Token ${this.token}`;
+    }
+
+    let lastDay = 0;
+    for (;;) {
+      const response = await fetch(
+        `${this.baseURL}/diet-charts/jobs/${jobId}/events/?last_event_id=${lastDay}`,
+        { headers, signal }
+      );
+      if (response.status === 503) {
+        // The server has no free stream slot right now; the job keeps running
+        const retryAfter = Number(response.headers.get("Retry-After")) || 2;
+        await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+        continue;
+      }
+      if (!response.ok || !response.body) {
+        throw new Error(`Failed to stream diet chart job: ${response.status}`);
+      }
+
+      const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+      let buffer = "";
+      let finished = false;
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += value;
+        let end;
+        while ((end = buffer.indexOf("\n\n")) >= 0) {
+          const message = buffer.slice(0, end);
+          buffer = buffer.slice(end + 2);
+          let event = "message";
+          const data: string[] = [];
+          for (const line of message.split("\n")) {
+            if (line.startsWith("event:")) event = line.slice(6).trim();
+            else if (line.startsWith("data:")) data.push(line.slice(5).trim());
+          }
+          if (!data.length) continue;
+          const payload = JSON.parse(data.join("\n"));
+          if (event === "day") lastDay = payload.day;
+          else if (event === "reset") lastDay = 0;
+          else if (event === "completed" || event === "failed") finished = true;
+          if (event !== "timeout") onEvent(event, payload);
+        }
+      }
+      if (finished) return;
+    }
+  }
+
+  async generateDietChartsBatch(data: {
+    patient_ids: string[];
+    chart_type?: string;
+    chart_name?: string;
+    start_date?: string;
+    food_restrictions?: string[];
+    dosha_focus?: string[];
+  }) {
+    return this.request("/diet-charts/generate/batch/", {
+      method: "POST",
+      body: JSON.stringify(data),
+    });
+  }
+
+  async regenerateDietChartDay(chartId: string, day: number, version?: number) {
+    return this.request(`/diet-charts/${chartId}/days/${day}/regenerate/`, {
+      method: "POST",
+      body: JSON.stringify(version === undefined ? {} : { version }),
+    });
+  }
+
+  async regenerateDietChartMeal(chartId: string, day: number, meal: string, version?: number) {
+    return this.request(`/diet-charts/${chartId}/days/${day}/meals/${encodeURIComponent(meal)}/regenerate/`, {
+      method: "POST",
+      body: JSON.stringify(version === undefined ? {} : { version }),
+    });
+  }
+
+  async patchDietChartMeals(
+    chartId: string,
+    operations: Array<{ op: string; path: string; value?: any; from?: string }>,
+    version?: number
+  ) {
+    const query = version === undefined ? "" : `?version=${version}`;
+    return this.request(`/diet-charts/${chartId}/daily-meals/${query}`, {
+      method: "PATCH",
+      headers: { "Content-Type": "application/json-patch+json" },
+      body: JSON.stringify(operations),
+    });
+  }
+
+  async getDietChartRevisions(chartId: string) {
+    return this.request(`/diet-charts/${chartId}/revisions/`);
+  }
+
+  async getDietChartRevision(chartId: string, version: number) {
+    return this.request(`/diet-charts/${chartId}/revisions/${version}/`);
+  }
+
+  async diffDietChartRevisions(chartId: string, fromVersion: number, toVersion?: number) {
+    const params = new URLSearchParams({ from: String(fromVersion) });
+    if (toVersion !== undefined) {
+      params.append("to", String(toVersion));
+    }
+    return this.request(`/diet-charts/${chartId}/revisions/diff/?${params.toString()}`);
+  }
+
   async saveDietChart(data: {
     patient_id: string;
     patient_name: string;
@@ -512,8 +637,24 @@ class ApiClient {
     max_calories?: number;
     min_protein?: number;
     max_protein?: number;
+    min_carbs?: number;
+    max_carbs?: number;
+    min_fat?: number;
+    max_fat?: number;
+    min_fiber?: number;
+    max_fiber?: number;
+    min_calorie_density?: number;
+    max_calorie_density?: number;
+    min_protein_density?: number;
+    max_protein_density?: number;
+    min_calories_per_protein?: number;
+    max_calories_per_protein?: number;
     page?: number;
     page_size?: number;
+    pagination?: "cursor";
+    cursor?: string;
+    ordering?: string;
+    include_count?: boolean;
   }) {
     const searchParams = new URLSearchParams();
 
@@ -533,10 +674,94 @@ class ApiClient {
     return this.request(endpoint);
   }
 
+  async getFoodFacets(params?: {
+    search?: string;
+    vata_effect?: string;
+    pitta_effect?: string;
+    kapha_effect?: string;
+    meal_types?: string[];
+    food_category?: string;
+    tags?: string[];
+    rasa?: string[];
+    guna?: string[];
+    virya?: string;
+    min_calories?: number;
+    max_calories?: number;
+    min_protein?: number;
+    max_protein?: number;
+    min_carbs?: number;
+    max_carbs?: number;
+    min_fat?: number;
+    max_fat?: number;
+    min_fiber?: number;
+    max_fiber?: number;
+    min_calorie_density?: number;
+    max_calorie_density?: number;
+    min_protein_density?: number;
+    max_protein_density?: number;
+    min_calories_per_protein?: number;
+    max_calories_per_protein?: number;
+  }) {
+    const searchParams = new URLSearchParams();
+
+    if (params) {
+      Object.entries(params).forEach(([key, value]) => {
+        if (value !== undefined && value !== null) {
+          if (Array.isArray(value)) {
+            searchParams.append(key, JSON.stringify(value));
+          } else {
+            searchParams.append(key, value.toString());
+          }
+        }
+      });
+    }
+
+    return this.request(`/foods/facets/?${searchParams.toString()}`);
+  }
+
   async getFoodItem(foodId: string) {
     return this.request(`/foods/${foodId}/`);
   }
 
+  async getSimilarFoods(foodId: string, k?: number) {
+    const query = k ? `?k=${k}` : "";
+    return this.request(`/foods/${foodId}/similar/${query}`);
+  }
+
+  async getFoodChanges(since?: number, limit?: number) {
+    const params = new URLSearchParams();
+    if (since !== undefined) params.append("since", since.toString());
+    if (limit) params.append("limit", limit.toString());
+    return this.request(`/foods/changes/?${params.toString()}`);
+  }
+
+  async getFoodAutocomplete(query: string, limit?: number) {
+    const params = new URLSearchParams({ q: query });
+    if (limit) params.append("limit", limit.toString());
+    return this.request(`/foods/autocomplete/?${params.toString()}`);
+  }
+
+  async getFoodSubstitutions(data: {
+    food_id?: string;
+    meal?: { name: string; calories: number; description?: string };
+    meal_type?: string;
+    patient_id?: string;
+    vata_score?: number;
+    pitta_score?: number;
+    kapha_score?: number;
+    exclude_tags?: string[];
+    require_tags?: string[];
+    exclude_categories?: string[];
+    exclude_food_ids?: string[];
+    calorie_tolerance?: number;
+    limit?: number;
+  }) {
+    return this.request("/foods/substitutions/", {
+      method: "POST",
+      body: JSON.stringify(data),
+    });
+  }
+
   async createFoodItem(data: {
     name: string;
     serving_size: string;
@@ -594,9 +819,14 @@ class ApiClient {
     });
   }
 
-  async importCSVFoods(csvFile: File) {
+  async importCSVFoods(
+    csvFile: File,
+    options?: { async?: boolean; mode?: "upsert" | "insert" }
+  ) {
     const formData = new FormData();
     formData.append("csv_file", csvFile);
+    if (options?.async) formData.append("async", "true");
+    if (options?.mode) formData.append("mode", options.mode);
 
     return this.request("/foods/import-csv/", {
       method: "POST",
@@ -605,6 +835,10 @@ class ApiClient {
     });
   }
 
+  async getFoodImportJob(jobId: string) {
+    return this.request(`/foods/import-jobs/${jobId}/`);
+  }
+
   async getFoodCategories() {
     return this.request("/foods/categories/");
   }
@@ -0,0 +1,73 @@
+/**
+ * Local copy of the food catalog, kept current with the /foods/changes/ delta feed
+ */
+
+import { apiClient } from "./api";
+
+const STORAGE_KEY = "food_catalog";
+
+export type CatalogFood = Record<string, unknown> & { id: string };
+
+interface StoredCatalog {
+  version: number;
+  foods: Record<string, CatalogFood>;
+}
+
+interface FoodChangesResponse {
+  version: number;
+  reset: boolean;
+  has_more: boolean;
+  fields: string[];
+  upserts: unknown[][];
+  deletes: string[];
+}
+
+function load(): StoredCatalog | null {
+  try {
+    const stored = localStorage.getItem(STORAGE_KEY);
+    return stored ? JSON.parse(stored) : null;
+  } catch {
+    return null;
+  }
+}
+
+function toFood(fields: string[], row: unknown[]): CatalogFood {
+  const food: Record<string, unknown> = {};
+  fields.forEach((field, i) => {
+    food[field] = row[i];
+  });
+  return food as CatalogFood;
+}
+
+/**
+ * Bring the local catalog up to date and return it. The first call (or a call after
+ * the server's change log has moved past our version) downloads the whole catalog;
+ * later calls only fetch what changed.
+ */
+export async function syncFoodCatalog(): Promise<Record<string, CatalogFood>> {
+  let catalog = load();
+  let hasMore = true;
+
+  while (hasMore) {
+    const response = (await apiClient.getFoodChanges(catalog?.version)) as FoodChangesResponse;
+    const foods = response.reset || !catalog ? {} : catalog.foods;
+
+    for (const row of response.upserts) {
+      const food = toFood(response.fields, row);
+      foods[food.id] = food;
+    }
+    for (const id of response.deletes) {
+      delete foods[id];
+    }
+
+    catalog = { version: response.version, foods };
+    hasMore = response.has_more;
+  }
+
+  try {
+    localStorage.setItem(STORAGE_KEY, JSON.stringify(catalog));
+  } catch (error) {
+    console.warn("Could not store the food catalog locally:", error);
+  }
+  return catalog!.foods;
+}